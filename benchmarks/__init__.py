@@ -0,0 +1,3 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
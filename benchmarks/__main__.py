@@ -0,0 +1,102 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Benchmarks the processors against an in-memory VastDB, e.g. `python -m benchmarks --filter PutVastDB`.
+
+See benchmarks/README.md.
+"""
+
+# ruff: noqa: T201
+import argparse
+import re
+import sys
+from pathlib import Path
+
+from benchmarks.imports import STARTUP_TARGETS, check_imports, format_imports_report, run_imports
+from benchmarks.runner import compare, find_cases, format_report, load_baseline, run_case, run_case_in_subprocess
+from benchmarks.runner import save_baseline as write_baseline
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--filter", help="Only run the cases matching this regular expression")
+    parser.add_argument("--list", action="store_true", help="List the cases and exit")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply the rows of every FlowFile (default 1)")
+    parser.add_argument("--iterations", type=int, help="The number of measured FlowFiles per case")
+    parser.add_argument(
+        "--latency-ms", type=float, default=0.0, help="Latency added to each VastDB data request (default 0)"
+    )
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="The baseline results file")
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="Store the results as the baseline, merged with the other cases"
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25, help="The relative change reported as a regression (default 0.25)"
+    )
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 when a case regressed")
+    parser.add_argument(
+        "--in-process", action="store_true", help="Run the cases in this process (the peak RSS is then cumulative)"
+    )
+    parser.add_argument(
+        "--imports", action="store_true", help="Measure the import time of each processor module instead"
+    )
+    return parser.parse_args(args)
+
+
+def main_imports(options):
+    names = [name for name in STARTUP_TARGETS if options.filter is None or re.search(options.filter, name)]
+    results = run_imports(names)
+    print(format_imports_report(results))
+
+    failures = check_imports(results)
+    for name, reason in failures:
+        print(f"Startup target missed: {name} {reason}")
+    return 1 if failures and options.check else 0
+
+
+def main(args=None):
+    options = parse_args(sys.argv[1:] if args is None else args)
+    if options.imports:
+        return main_imports(options)
+    cases = find_cases(options.filter)
+    if options.list:
+        print("\n".join(case.name for case in cases))
+        return 0
+
+    settings = {"scale": options.scale, "iterations": options.iterations, "latency_ms": options.latency_ms}
+    baseline = load_baseline(options.baseline) or {"settings": settings, "results": {}}
+    comparable = baseline["settings"] == settings
+    if not comparable:
+        print(f"Not comparing with {options.baseline}, which was run with {baseline['settings']}", file=sys.stderr)
+
+    run = run_case if options.in_process else run_case_in_subprocess
+    results = {}
+    for case in cases:
+        print(f"Running {case.name}", file=sys.stderr)
+        results[case.name] = run(
+            case.name,
+            scale=options.scale,
+            iterations=options.iterations,
+            request_latency=options.latency_ms / 1000,
+        )
+
+    expected = baseline["results"] if comparable else {}
+    print(format_report(results, expected))
+
+    if options.save_baseline:
+        merged = {**expected, **results}
+        write_baseline(options.baseline, dict(sorted(merged.items())), settings)
+        print(f"Saved the baseline to {options.baseline}", file=sys.stderr)
+
+    regressions = compare(results, expected, options.tolerance)
+    for name, metric, before, after in regressions:
+        print(f"Regression: {name} {metric} {before} -> {after}")
+    return 1 if regressions and options.check else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,422 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+"""
+An in-memory stand-in for a VastDB cluster, used in place of `vastdb.connect` by the benchmarks.
+
+The fake implements the part of the SDK used by the processors: transactions, buckets, schemas and tables with
+insert, update, delete, select, import_files, add_column, create_projection and drop.  Inserts, updates and deletes are sliced and
+serialized with the SDK's own helpers, and select builds the SDK's query request, so the client side work (and the
+predicate pushdown restrictions) match a real cluster.  Changes are applied immediately, transactions are not
+rolled back.
+"""
+
+# The signatures mirror the SDK's
+# ruff: noqa: ARG002, FBT002
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import ibis
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import vastdb
+from ibis.expr.operations.generic import IsNull, Literal
+from ibis.expr.operations.logical import (
+    And,
+    Between,
+    Equals,
+    Greater,
+    GreaterEqual,
+    InValues,
+    Less,
+    LessEqual,
+    Not,
+    NotEquals,
+    Or,
+)
+from ibis.expr.operations.relations import Field
+from ibis.expr.operations.strings import StartsWith, StringContains
+from vastdb import _internal, errors, util
+from vastdb.config import QueryConfig
+from vastdb.table import INTERNAL_ROW_ID, INTERNAL_ROW_ID_FIELD, MAX_INSERT_ROWS_PER_PATCH, MAX_ROWS_PER_BATCH
+
+COMPARISONS = {
+    Equals: lambda column, value: column == value,
+    NotEquals: lambda column, value: column != value,
+    Greater: lambda column, value: column > value,
+    GreaterEqual: lambda column, value: column >= value,
+    Less: lambda column, value: column < value,
+    LessEqual: lambda column, value: column <= value,
+}
+
+
+def combine_chunks(column):
+    return column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+
+
+def bad_request(message):
+    return errors.BadRequest(code="BadRequest", message=message, method="POST", url="", status=400, headers={})
+
+
+def to_arrow_expression(op):
+    """Translates an ibis predicate, as accepted by the SDK, into a pyarrow compute expression."""
+    if isinstance(op, And):
+        return to_arrow_expression(op.left) & to_arrow_expression(op.right)
+    if isinstance(op, Or):
+        return to_arrow_expression(op.left) | to_arrow_expression(op.right)
+    if isinstance(op, Not):
+        return ~to_arrow_expression(op.arg)
+    if isinstance(op, Field):
+        return pc.field(op.name)
+    if isinstance(op, Literal):
+        return op.value
+    if isinstance(op, IsNull):
+        return to_arrow_expression(op.arg).is_null()
+    if isinstance(op, InValues):
+        return to_arrow_expression(op.value).isin([option.value for option in op.options])
+    if isinstance(op, Between):
+        column = to_arrow_expression(op.arg)
+        return (column >= op.lower_bound.value) & (column <= op.upper_bound.value)
+    if isinstance(op, StringContains):
+        return pc.match_substring(to_arrow_expression(op.haystack), pattern=op.needle.value)
+    if isinstance(op, StartsWith):
+        return pc.starts_with(to_arrow_expression(op.arg), pattern=op.start.value)
+    if type(op) in COMPARISONS:
+        column, value = op.args
+        return COMPARISONS[type(op)](to_arrow_expression(column), to_arrow_expression(value))
+    raise NotImplementedError(op)
+
+
+class TableData:
+    """The rows of a table, with their internal row IDs."""
+
+    def __init__(self, arrow_schema):
+        self.arrow_schema = pa.schema([field for field in arrow_schema if field.name != INTERNAL_ROW_ID])
+        self.rows = pa.schema([*self.arrow_schema, INTERNAL_ROW_ID_FIELD]).empty_table()
+        # Inserted rows are only concatenated when the table is next read or changed
+        self.pending = []
+        self.next_row_id = 0
+        self.lock = threading.Lock()
+        # The sorted and unsorted columns of each projection, by name
+        self.projections = {}
+
+    def data(self):
+        with self.lock:
+            if self.pending:
+                self.rows = pa.concat_tables([self.rows, *self.pending]).combine_chunks()
+                self.pending = []
+            return self.rows
+
+    def insert(self, batch):
+        batch = self.conform(batch, self.arrow_schema)
+        with self.lock:
+            row_ids = pa.array(range(self.next_row_id, self.next_row_id + batch.num_rows), pa.uint64())
+            self.next_row_id += batch.num_rows
+            self.pending.append(pa.Table.from_batches([batch]).append_column(INTERNAL_ROW_ID_FIELD, row_ids))
+        return row_ids
+
+    def update(self, batch):
+        rows = self.data()
+        positions = pc.index_in(rows[INTERNAL_ROW_ID], value_set=batch[INTERNAL_ROW_ID])
+        updated = positions.is_valid()
+        with self.lock:
+            for name in batch.schema.names:
+                if name == INTERNAL_ROW_ID:
+                    continue
+                if name not in self.arrow_schema.names:
+                    error_message = f"Unknown column {name}"
+                    raise bad_request(error_message)
+                field = self.arrow_schema.field(name)
+                values = pc.cast(batch[name], field.type).take(positions)
+                column = pc.if_else(updated, values, rows[name])
+                rows = rows.set_column(rows.schema.get_field_index(name), field, column)
+            self.rows = rows
+
+    def delete(self, batch):
+        rows = self.data()
+        with self.lock:
+            self.rows = rows.filter(pc.invert(pc.is_in(rows[INTERNAL_ROW_ID], value_set=batch[INTERNAL_ROW_ID])))
+
+    def add_column(self, new_column):
+        rows = self.data()
+        with self.lock:
+            for field in new_column:
+                if field.name == INTERNAL_ROW_ID:
+                    # The internal row ID column always exists
+                    continue
+                if field.name in self.arrow_schema.names:
+                    error_message = f"Column {field.name} already exists"
+                    raise bad_request(error_message)
+                self.arrow_schema = self.arrow_schema.append(field)
+                rows = rows.add_column(rows.num_columns - 1, field, pa.nulls(rows.num_rows, field.type))
+            self.rows = rows
+
+    def conform(self, batch, arrow_schema):
+        """
+        Returns a batch with the table's columns, missing columns are null.
+
+        Like VastDB, the columns must have the table's types: a batch isn't cast, so the clients have to.
+        """
+        for name in batch.schema.names:
+            if name not in arrow_schema.names:
+                error_message = f"Unknown column {name}"
+                raise bad_request(error_message)
+        arrays = []
+        for field in arrow_schema:
+            if field.name in batch.schema.names:
+                column = batch[field.name]
+                if column.type != field.type:
+                    error_message = f"Column {field.name} is {column.type}, the table's column is {field.type}"
+                    raise bad_request(error_message)
+                arrays.append(column)
+            else:
+                arrays.append(pa.nulls(batch.num_rows, field.type))
+        return pa.RecordBatch.from_arrays(arrays, schema=arrow_schema)
+
+
+class FakeVastDB:
+    """
+    An in-memory VastDB cluster.
+
+    Args:
+        request_latency: Seconds added to every insert, update, delete, select and import request.
+        filesystem: The pyarrow filesystem holding the files imported by `import_files`, as `/<bucket>/<key>`.
+    """
+
+    def __init__(self, *, request_latency=0.0, filesystem=None):
+        self.request_latency = request_latency
+        self.filesystem = filesystem
+        self.schemas = {}
+        self.tables = {}
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+    def connect(self, endpoint=None, access=None, secret=None, **kwargs):
+        return FakeSession(self, endpoint, access, secret)
+
+    @contextmanager
+    def patched(self):
+        """Replaces `vastdb.connect` by this cluster's `connect`."""
+        connect = vastdb.connect
+        vastdb.connect = self.connect
+        try:
+            yield self
+        finally:
+            vastdb.connect = connect
+
+    def request(self, name):
+        with self.lock:
+            self.requests[name] += 1
+        if self.request_latency:
+            time.sleep(self.request_latency)
+
+    def create_table(self, bucket, schema, table, pa_table):
+        """Creates a table with rows, e.g. to set up a query benchmark."""
+        self.schemas.setdefault((bucket, schema), True)
+        data = TableData(pa_table.schema)
+        for batch in pa_table.to_batches():
+            data.insert(batch)
+        self.tables[bucket, schema, table] = data
+        return data
+
+    def table_data(self, bucket, schema, table):
+        """Returns the rows of a table, without the internal row IDs."""
+        return self.tables[bucket, schema, table].data().drop([INTERNAL_ROW_ID])
+
+
+class FakeSession:
+    def __init__(self, cluster, endpoint, access, secret):
+        self.cluster = cluster
+        self.api = SimpleNamespace(url=endpoint, access_key=access, secret_key=secret)
+
+    @contextmanager
+    def transaction(self):
+        yield FakeTransaction(self)
+
+
+class FakeTransaction:
+    def __init__(self, session):
+        self.cluster = session.cluster
+        self._rpc = SimpleNamespace(api=session.api)
+
+    def bucket(self, name):
+        return FakeBucket(self, name)
+
+
+class FakeBucket:
+    def __init__(self, tx, name):
+        self.tx = tx
+        self.name = name
+
+    def schema(self, name, fail_if_missing=True):
+        if (self.name, name) not in self.tx.cluster.schemas:
+            if fail_if_missing:
+                raise errors.MissingSchema(self.name, name)
+            return None
+        return FakeSchema(self, name)
+
+    def create_schema(self, name, fail_if_exists=True):
+        with self.tx.cluster.lock:
+            if (self.name, name) in self.tx.cluster.schemas and fail_if_exists:
+                raise errors.SchemaExists(self.name, name)
+            self.tx.cluster.schemas[self.name, name] = True
+        return FakeSchema(self, name)
+
+
+class FakeSchema:
+    def __init__(self, bucket, name):
+        self.bucket = bucket
+        self.tx = bucket.tx
+        self.name = name
+
+    def table(self, name, fail_if_missing=True):
+        key = (self.bucket.name, self.name, name)
+        if key not in self.tx.cluster.tables:
+            if fail_if_missing:
+                raise errors.MissingTable(*key)
+            return None
+        return FakeTable(self, name)
+
+    def create_table(self, table_name, columns, fail_if_exists=True):
+        key = (self.bucket.name, self.name, table_name)
+        with self.tx.cluster.lock:
+            if key in self.tx.cluster.tables and fail_if_exists:
+                raise errors.TableExists(*key)
+            self.tx.cluster.tables[key] = TableData(columns)
+        return FakeTable(self, table_name)
+
+
+class FakeTable:
+    def __init__(self, schema, name):
+        self.schema = schema
+        self.bucket = schema.bucket
+        self.tx = schema.tx
+        self.name = name
+        self.key = (self.bucket.name, schema.name, name)
+
+    @property
+    def data(self):
+        try:
+            return self.tx.cluster.tables[self.key]
+        except KeyError:
+            raise errors.MissingTable(*self.key) from None
+
+    @property
+    def arrow_schema(self):
+        return self.data.arrow_schema
+
+    def insert(self, rows):
+        row_ids = []
+        for serialized in util.iter_serialized_slices(rows, MAX_INSERT_ROWS_PER_PATCH):
+            self.tx.cluster.request("insert")
+            for batch in pa.ipc.open_stream(serialized):
+                row_ids.append(self.data.insert(batch))
+        return pa.chunked_array(row_ids, pa.uint64())
+
+    def update(self, rows, columns=None):
+        try:
+            rows_chunk = rows[INTERNAL_ROW_ID]
+        except KeyError:
+            raise errors.MissingRowIdColumn from None
+        if columns is None:
+            columns = [name for name in rows.schema.names if name != INTERNAL_ROW_ID]
+        update_rows = pa.record_batch(
+            [pc.cast(combine_chunks(rows_chunk), pa.uint64()), *(combine_chunks(rows[column]) for column in columns)],
+            schema=pa.schema([INTERNAL_ROW_ID_FIELD, *(rows.schema.field(column) for column in columns)]),
+        )
+        update_rows = util.sort_record_batch_if_needed(update_rows, INTERNAL_ROW_ID)
+        for serialized in util.iter_serialized_slices(update_rows, MAX_ROWS_PER_BATCH):
+            self.tx.cluster.request("update")
+            for batch in pa.ipc.open_stream(serialized):
+                self.data.update(batch)
+
+    def delete(self, rows):
+        try:
+            rows_chunk = rows[INTERNAL_ROW_ID]
+        except KeyError:
+            raise errors.MissingRowIdColumn from None
+        delete_rows = pa.record_batch(
+            [pc.cast(combine_chunks(rows_chunk), pa.uint64())], schema=pa.schema([INTERNAL_ROW_ID_FIELD])
+        )
+        delete_rows = util.sort_record_batch_if_needed(delete_rows, INTERNAL_ROW_ID)
+        for serialized in util.iter_serialized_slices(delete_rows, MAX_ROWS_PER_BATCH):
+            self.tx.cluster.request("delete")
+            for batch in pa.ipc.open_stream(serialized):
+                self.data.delete(batch)
+
+    def select(self, columns=None, predicate=None, config=None, *, internal_row_id=False):
+        if config is None:
+            config = QueryConfig()
+        arrow_schema = self.arrow_schema
+        columns = [field.name for field in arrow_schema] if columns is None else list(columns)
+        query_schema = arrow_schema
+        if internal_row_id:
+            query_schema = pa.schema([INTERNAL_ROW_ID_FIELD, *arrow_schema])
+            columns.append(INTERNAL_ROW_ID)
+        response_schema = _internal.get_response_schema(schema=query_schema, field_names=columns)
+
+        if predicate is True:
+            predicate = None
+        if predicate is False:
+            return pa.RecordBatchReader.from_batches(response_schema, [])
+        if isinstance(predicate, ibis.common.deferred.Deferred):
+            predicate = predicate.resolve(ibis.table(ibis.Schema.from_pyarrow(arrow_schema), self.name))
+
+        # Raises like the SDK for predicates that can't be pushed down
+        query_data_request = _internal.build_query_data_request(
+            schema=query_schema, predicate=predicate, field_names=columns
+        )
+        if len(query_data_request.serialized) > util.MAX_QUERY_DATA_REQUEST_SIZE:
+            error_message = f"{len(query_data_request.serialized)} bytes"
+            raise errors.TooLargeRequest(error_message)
+
+        self.tx.cluster.request("select")
+        rows = self.data.data()
+        if predicate is not None:
+            rows = rows.filter(to_arrow_expression(predicate.op()))
+        rows = rows.select(columns)
+
+        def batches():
+            for batch in rows.to_batches(max_chunksize=config.limit_rows_per_sub_split):
+                # Like the SDK, each batch is received over the wire
+                yield from pa.ipc.open_stream(util.serialize_record_batch(batch))
+
+        return pa.RecordBatchReader.from_batches(response_schema, batches())
+
+    def import_files(self, files_to_import, config=None):
+        for path in files_to_import:
+            self.tx.cluster.request("import")
+            try:
+                pa_table = pq.read_table(path.lstrip("/"), filesystem=self.tx.cluster.filesystem)
+            except (OSError, pa.ArrowInvalid) as e:
+                raise errors.ImportFilesError(str(e), {path: str(e)}) from e
+            for batch in pa_table.to_batches():
+                self.data.insert(batch)
+
+    def add_column(self, new_column):
+        self.tx.cluster.request("add_column")
+        self.data.add_column(new_column)
+
+    def create_projection(self, projection_name, sorted_columns, unsorted_columns):
+        self.tx.cluster.request("create_projection")
+        data = self.data
+        with data.lock:
+            unknown = [name for name in [*sorted_columns, *unsorted_columns] if name not in data.arrow_schema.names]
+            if unknown or not sorted_columns:
+                error_message = f"Invalid projection columns {sorted_columns} {unsorted_columns}"
+                raise bad_request(error_message)
+            if projection_name in data.projections:
+                error_message = f"Projection {projection_name} already exists"
+                raise bad_request(error_message)
+            data.projections[projection_name] = (list(sorted_columns), list(unsorted_columns))
+        return SimpleNamespace(name=projection_name, table=self)
+
+    def drop(self):
+        self.tx.cluster.request("drop")
+        with self.tx.cluster.lock:
+            del self.tx.cluster.tables[self.key]
@@ -0,0 +1,90 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+"""Measures how long each processor module takes to import, which NiFi does whenever it starts a Python worker."""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+# Modules the processors only import when a FlowFile needs them
+DEFERRED_MODULES = ["ibis", "pandas", "pyarrow.json", "pyarrow.parquet", "requests", "yaml"]
+
+# The most seconds each processor module may take to import, most of which is pyarrow's own import
+STARTUP_TARGETS = {
+    "AggregateVastDBTable": 1.0,
+    "DeleteVastDB": 0.25,
+    "DropVastDBTable": 0.25,
+    "ExportVastDBTable": 1.0,
+    "ImportVastDB": 1.0,
+    "LookupVastDB": 1.0,
+    "PutVastDB": 1.0,
+    "PutVastDBRecord": 1.0,
+    "QueryVastDBRecord": 1.0,
+    "QueryVastDBTable": 1.0,
+    "UpdateVastDB": 1.0,
+}
+
+IMPORT_SCRIPT = """
+import json
+import sys
+import time
+
+from benchmarks.nifi import PROCESSORS_DIR, install_nifiapi
+
+install_nifiapi()
+sys.path.insert(0, str(PROCESSORS_DIR))
+start = time.perf_counter()
+__import__(sys.argv[1])
+seconds = time.perf_counter() - start
+print(json.dumps({"seconds": seconds, "modules": sorted(set(json.loads(sys.argv[2])) & set(sys.modules))}))
+"""
+
+
+def measure_import(name):
+    """Imports a processor module in a new interpreter, returning the seconds and the deferred modules it loaded."""
+    completed = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT, name, json.dumps(DEFERRED_MODULES)],
+        capture_output=True,
+        check=True,
+        cwd=Path(__file__).resolve().parent.parent,
+        text=True,
+    )
+    return json.loads(completed.stdout)
+
+
+def run_imports(names=None, *, repeat=3):
+    """Returns the import metrics of each processor, the fastest of `repeat` imports, as the first reads the disk."""
+    results = {}
+    for name in names or STARTUP_TARGETS:
+        measurements = [measure_import(name) for _ in range(repeat)]
+        results[name] = {
+            "import_ms": round(min(measurement["seconds"] for measurement in measurements) * 1000, 1),
+            "target_ms": STARTUP_TARGETS[name] * 1000,
+            "deferred_modules": measurements[0]["modules"],
+        }
+    return results
+
+
+def check_imports(results):
+    """Returns the failures, as (processor, reason), of processors over their target or loading deferred modules."""
+    failures = []
+    for name, metrics in results.items():
+        if metrics["import_ms"] > metrics["target_ms"]:
+            failures.append((name, f"imported in {metrics['import_ms']} ms, the target is {metrics['target_ms']} ms"))
+        if metrics["deferred_modules"]:
+            failures.append((name, f"imported {', '.join(metrics['deferred_modules'])}"))
+    return failures
+
+
+def format_imports_report(results):
+    header = f"{'processor':<24} {'import ms':>10} {'target ms':>10}  deferred modules imported"
+    lines = [header, "-" * len(header)]
+    for name, metrics in results.items():
+        lines.append(
+            f"{name:<24} {metrics['import_ms']:>10.1f} {metrics['target_ms']:>10.0f}  "
+            f"{', '.join(metrics['deferred_modules']) or '-'}"
+        )
+    return "\n".join(lines)
@@ -0,0 +1,362 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Stand-ins for the NiFi process context and FlowFiles, to run the processors outside of NiFi.
+
+The `nifiapi` package ships with NiFi's Python framework rather than on PyPI.  When it isn't installed,
+`load_processor` registers a minimal `nifiapi` with the classes used by the processors.
+"""
+
+# ruff: noqa: N802, N803
+import importlib
+import importlib.util
+import json
+import logging
+import re
+import sys
+import types
+from enum import Enum
+from pathlib import Path
+
+PROCESSORS_DIR = Path(__file__).resolve().parent.parent / "src" / "vastdb_nifi" / "processors"
+
+DATA_SIZE_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([KMGT]?B)\s*$", re.IGNORECASE)
+TIME_PERIOD_PATTERN = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([a-z]+)\s*$", re.IGNORECASE)
+ATTRIBUTE_PATTERN = re.compile(r"\$\{([^}]+)\}")
+
+DATA_UNIT_BYTES = {"B": 1, "KB": 1024, "MB": 1024**2, "GB": 1024**3, "TB": 1024**4}
+TIME_UNIT_SECONDS = {
+    "NANOSECONDS": 1e-9,
+    "MICROSECONDS": 1e-6,
+    "MILLISECONDS": 1e-3,
+    "SECONDS": 1,
+    "MINUTES": 60,
+    "HOURS": 3600,
+    "DAYS": 86400,
+}
+TIME_UNIT_NAMES = {
+    "ns": "NANOSECONDS",
+    "nanos": "NANOSECONDS",
+    "ms": "MILLISECONDS",
+    "millis": "MILLISECONDS",
+    "s": "SECONDS",
+    "sec": "SECONDS",
+    "secs": "SECONDS",
+    "second": "SECONDS",
+    "seconds": "SECONDS",
+    "m": "MINUTES",
+    "min": "MINUTES",
+    "mins": "MINUTES",
+    "minute": "MINUTES",
+    "minutes": "MINUTES",
+    "h": "HOURS",
+    "hr": "HOURS",
+    "hrs": "HOURS",
+    "hour": "HOURS",
+    "hours": "HOURS",
+    "d": "DAYS",
+    "day": "DAYS",
+    "days": "DAYS",
+}
+
+
+def install_nifiapi():
+    """Registers a minimal `nifiapi` package, unless NiFi's is installed."""
+    if "nifiapi" in sys.modules or importlib.util.find_spec("nifiapi") is not None:
+        return
+
+    class FlowFileTransform:
+        def __init__(self, **kwargs):
+            pass
+
+    class FlowFileTransformResult:
+        def __init__(self, relationship, contents=None, attributes=None):
+            self.relationship = relationship
+            self.contents = contents
+            self.attributes = attributes or {}
+
+        def getRelationship(self):
+            return self.relationship
+
+        def getContents(self):
+            return self.contents
+
+        def getAttributes(self):
+            return self.attributes
+
+    class ArrayList(list):
+        def add(self, item):
+            self.append(item)
+
+    class RecordTransform:
+        def __init__(self):
+            self.arrayList = ArrayList
+
+        def setContext(self, context):
+            self.process_context = context
+
+        def transformRecord(self, jsonarray, schema, attributemap):
+            """NiFi 2.0's RecordTransform: calls transform() for each record of the batch the JVM passes as Json."""
+            results = self.arrayList()
+            for record in json.loads(jsonarray):
+                output = self.transform(self.process_context, record, schema, attributemap)
+                for result in output if isinstance(output, list) else [output]:
+                    results.add(JavaRecordTransformResult(result, json.dumps(result.getRecord())))
+            return results
+
+    class RecordTransformResult:
+        def __init__(self, record=None, schema=None, relationship="success", partition=None):
+            self.record = record
+            self.schema = schema
+            self.relationship = relationship
+            self.partition = partition
+
+        def getRecord(self):
+            return self.record
+
+        def getSchema(self):
+            return self.schema
+
+        def getRelationship(self):
+            return self.relationship
+
+        def getPartition(self):
+            return self.partition
+
+    class JavaRecordTransformResult:
+        """The result NiFi's RecordTransform passes back to the JVM, a result with its record as Json."""
+
+        def __init__(self, processor_result, recordJson):
+            self.processor_result = processor_result
+            self.recordJson = recordJson
+
+        def getRecordJson(self):
+            return self.recordJson
+
+        def getSchema(self):
+            return self.processor_result.getSchema()
+
+        def getRelationship(self):
+            return self.processor_result.getRelationship()
+
+        def getPartition(self):
+            return self.processor_result.getPartition()
+
+    class PropertyDescriptor:
+        def __init__(self, name, description="", *, required=False, default_value=None, **kwargs):
+            self.name = name
+            self.description = description
+            self.required = required
+            self.default_value = default_value
+            for key, value in kwargs.items():
+                setattr(self, key, value)
+
+    class StandardValidators:
+        def __getattr__(self, name):
+            return name
+
+    class ValidationResult:
+        def __init__(self, subject="", explanation="", valid=False, input=None):  # noqa: A002, FBT002
+            self.subject = subject
+            self.explanation = explanation
+            self.valid = valid
+            self.input = input
+
+    class Relationship:
+        def __init__(self, name, description="", *, auto_terminated=False):
+            self.name = name
+            self.description = description
+            self.auto_terminated = auto_terminated
+
+    package = types.ModuleType("nifiapi")
+    package.__path__ = []
+    modules = {
+        "flowfiletransform": {
+            "FlowFileTransform": FlowFileTransform,
+            "FlowFileTransformResult": FlowFileTransformResult,
+        },
+        "properties": {
+            "PropertyDescriptor": PropertyDescriptor,
+            "StandardValidators": StandardValidators(),
+            "ExpressionLanguageScope": Enum("ExpressionLanguageScope", "NONE ENVIRONMENT FLOWFILE_ATTRIBUTES"),
+            "DataUnit": Enum("DataUnit", list(DATA_UNIT_BYTES)),
+            "TimeUnit": Enum("TimeUnit", list(TIME_UNIT_SECONDS)),
+            "ValidationResult": ValidationResult,
+        },
+        "recordtransform": {
+            "RecordTransform": RecordTransform,
+            "RecordTransformResult": RecordTransformResult,
+            "__RecordTransformResult__": JavaRecordTransformResult,
+        },
+        "componentstate": {"Scope": Enum("Scope", "CLUSTER LOCAL")},
+        "relationship": {"Relationship": Relationship},
+    }
+    sys.modules["nifiapi"] = package
+    for name, attributes in modules.items():
+        module = types.ModuleType(f"nifiapi.{name}")
+        module.__dict__.update(attributes)
+        setattr(package, name, module)
+        sys.modules[module.__name__] = module
+
+
+def load_processor(name):
+    """Imports and creates a processor, e.g. `load_processor("PutVastDB")`, the way NiFi loads it."""
+    install_nifiapi()
+    # The processors import their helper modules by top-level name
+    if str(PROCESSORS_DIR) not in sys.path:
+        sys.path.insert(0, str(PROCESSORS_DIR))
+    module = importlib.import_module(name)
+    processor = getattr(module, name)()
+    processor.logger = logging.getLogger(name)
+    return processor
+
+
+def parse_data_size(value):
+    match = DATA_SIZE_PATTERN.match(value)
+    if not match:
+        error_message = f"Invalid data size: {value}"
+        raise ValueError(error_message)
+    return float(match.group(1)) * DATA_UNIT_BYTES[match.group(2).upper()]
+
+
+def parse_time_period(value):
+    match = TIME_PERIOD_PATTERN.match(value)
+    if not match or match.group(2).lower() not in TIME_UNIT_NAMES:
+        error_message = f"Invalid time period: {value}"
+        raise ValueError(error_message)
+    return float(match.group(1)) * TIME_UNIT_SECONDS[TIME_UNIT_NAMES[match.group(2).lower()]]
+
+
+class FlowFile:
+    def __init__(self, contents=b"", attributes=None):
+        self.contents = contents
+        self.attributes = attributes or {}
+
+    def getContentsAsBytes(self):
+        return self.contents
+
+    def getAttribute(self, name):
+        return self.attributes.get(name)
+
+    def getAttributes(self):
+        return self.attributes
+
+    def getSize(self):
+        return len(self.contents)
+
+
+class PropertyValue:
+    def __init__(self, value, controller_service=None):
+        self.value = value
+        self.controller_service = controller_service
+
+    def getValue(self):
+        return self.value
+
+    def isSet(self):
+        return self.value is not None
+
+    def isExpressionLanguagePresent(self):
+        return self.value is not None and "${" in self.value
+
+    def evaluateAttributeExpressions(self, flowfile=None):
+        """Replaces `${attribute}` references, other Expression Language functions are not supported."""
+        if self.value is None:
+            return self
+        attributes = flowfile.getAttributes() if flowfile is not None else {}
+        return PropertyValue(ATTRIBUTE_PATTERN.sub(lambda match: attributes.get(match.group(1), ""), self.value))
+
+    def asInteger(self):
+        return None if self.value is None else int(self.value)
+
+    def asFloat(self):
+        return None if self.value is None else float(self.value)
+
+    def asBoolean(self):
+        return None if self.value is None else self.value.lower() == "true"
+
+    def asDataSize(self, unit):
+        return None if self.value is None else parse_data_size(self.value) / DATA_UNIT_BYTES[unit.name]
+
+    def asTimePeriod(self, unit):
+        return None if self.value is None else parse_time_period(self.value) / TIME_UNIT_SECONDS[unit.name]
+
+    def asControllerService(self):
+        return self.controller_service
+
+
+class Credentials:
+    def __init__(self, access_key, secret_key):
+        self.access_key = access_key
+        self.secret_key = secret_key
+
+    def accessKeyId(self):
+        return self.access_key
+
+    def secretAccessKey(self):
+        return self.secret_key
+
+
+class CredentialsProviderService:
+    """Stands in for NiFi's AWSCredentialsProviderControllerService."""
+
+    def __init__(self, access_key="access", secret_key="secret"):  # noqa: S107
+        self.credentials = Credentials(access_key, secret_key)
+
+    def getAwsCredentialsProvider(self):
+        return self
+
+    def resolveCredentials(self):
+        return self.credentials
+
+
+class StateMap:
+    def __init__(self, state):
+        self.state = dict(state)
+
+    def toMap(self):
+        return dict(self.state)
+
+
+class StateManager:
+    def __init__(self):
+        self.states = {}
+
+    def getState(self, scope):
+        return StateMap(self.states.get(scope, {}))
+
+    def setState(self, state, scope):
+        self.states[scope] = dict(state)
+
+    def clear(self, scope):
+        self.states.pop(scope, None)
+
+
+class ProcessContext:
+    """
+    The process context of a processor, with the property values set by name.
+
+    Properties that aren't set take their descriptor's default value.
+    """
+
+    def __init__(self, processor, properties=None, credentials_service=None):
+        self.descriptors = {descriptor.name: descriptor for descriptor in processor.getPropertyDescriptors()}
+        self.properties = dict(properties or {})
+        unknown = set(self.properties) - set(self.descriptors)
+        if unknown:
+            error_message = f"Unknown properties {sorted(unknown)} for {type(processor).__name__}"
+            raise ValueError(error_message)
+        self.credentials_service = credentials_service or CredentialsProviderService()
+        self.state_manager = StateManager()
+
+    def getProperty(self, name):
+        descriptor = self.descriptors[getattr(name, "name", name)]
+        value = self.properties.get(descriptor.name, descriptor.default_value)
+        if getattr(descriptor, "controller_service_definition", None):
+            return PropertyValue(value, controller_service=self.credentials_service)
+        return PropertyValue(value)
+
+    def getStateManager(self):
+        return self.state_manager
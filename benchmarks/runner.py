@@ -0,0 +1,150 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+"""Runs the benchmark cases and compares their results with a stored baseline."""
+
+import gc
+import json
+import multiprocessing
+import platform
+import re
+import resource
+import sys
+import time
+
+import pyarrow as pa
+
+from benchmarks.fake_vastdb import FakeVastDB
+from benchmarks.nifi import ProcessContext, load_processor
+from benchmarks.workloads import all_cases
+
+# Metrics where lower is better, the others are higher is better
+LOWER_IS_BETTER = {"p50_ms", "p95_ms", "max_ms", "peak_rss_mb"}
+# FlowFiles per second is compared rather than rows per second, which is 0 for DropVastDBTable
+COMPARED_METRICS = ["flowfiles_per_second", "peak_rss_mb"]
+
+
+def find_cases(pattern=None):
+    return [case for case in all_cases() if pattern is None or re.search(pattern, case.name)]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(fraction * (len(ordered) - 1)))]
+
+
+def run_case(name, *, scale=1.0, iterations=None, request_latency=0.0):
+    """Runs a case in this process and returns its metrics.  The first FlowFile warms up and isn't measured."""
+    (case,) = [case for case in all_cases() if case.name == name]
+    cluster = FakeVastDB(request_latency=request_latency)
+    workload = case.setup(cluster, scale, iterations)
+
+    processor = load_processor(case.processor)
+    if case.processor in {"ImportVastDB", "ExportVastDBTable"}:
+        # The Parquet files are read from, or written to, the fake cluster's filesystem instead of S3
+        processor.get_s3_filesystem = lambda _: cluster.filesystem
+    context = ProcessContext(processor, case.properties)
+    if hasattr(processor, "onScheduled"):
+        processor.onScheduled(context)
+
+    latencies = []
+    with cluster.patched():
+        for flowfile in workload.flowfiles:
+            gc.collect()
+            start = time.perf_counter()
+            result = processor.transform(context, flowfile)
+            latencies.append(time.perf_counter() - start)
+            if result.relationship != "success":
+                error_message = f"{name} routed a FlowFile to {result.relationship}"
+                raise RuntimeError(error_message)
+
+    latencies, rows, num_bytes = latencies[1:], workload.rows[1:], workload.bytes[1:]
+    seconds = sum(latencies)
+    return {
+        "flowfiles": len(latencies),
+        "rows": sum(rows),
+        "bytes": sum(num_bytes),
+        "seconds": round(seconds, 4),
+        "flowfiles_per_second": round(len(latencies) / seconds, 2),
+        "rows_per_second": round(sum(rows) / seconds, 1),
+        "mb_per_second": round(sum(num_bytes) / 1024**2 / seconds, 2),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "requests": dict(cluster.requests),
+    }
+
+
+def run_case_in_subprocess(name, **kwargs):
+    """Runs a case in a new process, so the peak RSS is the case's own."""
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(run_case, (name,), kwargs)
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "pyarrow": pa.__version__,
+        "machine": platform.machine(),
+        "system": platform.system(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Returns the regressions, as (case, metric, baseline value, value), of more than `tolerance` (e.g. 0.2)."""
+    regressions = []
+    for name, metrics in results.items():
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        for metric in COMPARED_METRICS:
+            if not expected.get(metric):
+                continue
+            change = metrics[metric] / expected[metric] - 1
+            if metric in LOWER_IS_BETTER:
+                change = -change
+            if change < -tolerance:
+                regressions.append((name, metric, expected[metric], metrics[metric]))
+    return regressions
+
+
+def change_column(metrics, expected):
+    if not expected or not expected.get("flowfiles_per_second"):
+        return ""
+    return f"{metrics['flowfiles_per_second'] / expected['flowfiles_per_second'] - 1:+.1%}"
+
+
+def format_report(results, baseline=None):
+    baseline = baseline or {}
+    header = f"{'case':<42} {'rows/s':>12} {'MB/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'peak MB':>9} {'vs baseline':>12}"
+    lines = [header, "-" * len(header)]
+    for name, metrics in results.items():
+        lines.append(
+            f"{name:<42} {metrics['rows_per_second']:>12,.0f} {metrics['mb_per_second']:>9.1f} "
+            f"{metrics['p50_ms']:>9.1f} {metrics['p95_ms']:>9.1f} {metrics['peak_rss_mb']:>9.0f} "
+            f"{change_column(metrics, baseline.get(name)):>12}"
+        )
+    return "\n".join(lines)
+
+
+def load_baseline(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(path, results, settings):
+    with open(path, "w") as f:
+        json.dump({"settings": settings, "environment": environment(), "results": results}, f, indent=2)
+        f.write("\n")
@@ -0,0 +1,346 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+"""
+The benchmark cases: each processor across data shapes (narrow/wide), formats (Json/Parquet) and FlowFile sizes.
+
+A case sets up the fake cluster and returns the FlowFiles to transform, with the number of rows and bytes each
+FlowFile processes.  Nothing done by the setup is timed.
+"""
+
+import io
+import json
+import tempfile
+from dataclasses import dataclass, field
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.fs
+import pyarrow.parquet as pq
+
+from benchmarks.nifi import FlowFile
+
+BUCKET = "bench"
+SCHEMA = "bench"
+TABLE = "bench"
+
+# Rows per FlowFile and the number of FlowFiles for each size
+SIZES = {"small": (1_000, 20), "huge": (500_000, 3)}
+WIDE_COLUMNS = 64
+# Wide FlowFiles have fewer rows, and LookupVastDB FlowFiles fewer keys as each 1000 keys are a VastDB query
+ROW_DIVISORS = {"wide": 10, "lookup": 10}
+
+DATA_FORMATS = ["json", "parquet"]
+# The queries return the rows with a random value of at least QUERY_THRESHOLD, about half of them
+QUERY_THRESHOLD = 0.5
+
+
+@dataclass
+class Workload:
+    """The FlowFiles of a case, with the rows and bytes processed by each one."""
+
+    flowfiles: list
+    rows: list
+    bytes: list
+    resources: object = None
+
+
+@dataclass
+class Case:
+    name: str
+    processor: str
+    setup: object
+    properties: dict = field(default_factory=dict)
+
+
+def narrow_table(num_rows, start=0, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = np.arange(start, start + num_rows, dtype=np.int64)
+    return pa.table({
+        "id": ids,
+        "category": pa.array(rng.integers(0, 100, num_rows), pa.int32()),
+        "value": rng.random(num_rows),
+        "name": pa.array([f"name-{i % 10_000}" for i in ids.tolist()]),
+        "flag": rng.integers(0, 2, num_rows, dtype=bool),
+    })
+
+
+def wide_table(num_rows, start=0, seed=0):
+    rng = np.random.default_rng(seed)
+    columns = {"id": np.arange(start, start + num_rows, dtype=np.int64)}
+    names = pa.array([f"value-{i % 1_000}" for i in range(num_rows)])
+    for i in range((WIDE_COLUMNS - 1) // 4 + 1):
+        columns[f"int_{i}"] = rng.integers(0, 1_000_000, num_rows)
+        columns[f"float_{i}"] = rng.random(num_rows)
+        columns[f"str_{i}"] = names
+        columns[f"bool_{i}"] = rng.integers(0, 2, num_rows, dtype=bool)
+    return pa.table(dict(list(columns.items())[:WIDE_COLUMNS]))
+
+
+SHAPES = {"narrow": narrow_table, "wide": wide_table}
+
+
+def num_rows(shape, size, scale):
+    rows, _ = SIZES[size]
+    return max(1, int(rows // ROW_DIVISORS.get(shape, 1) * scale))
+
+
+def encode(pa_table, data_format):
+    if data_format == "parquet":
+        sink = io.BytesIO()
+        pq.write_table(pa_table, sink)
+        return sink.getvalue()
+    return pa_table.to_pandas().to_json(orient="records", lines=True).encode("utf-8")
+
+
+def num_flowfiles(size, iterations):
+    # One more FlowFile is used to warm up
+    return (iterations or SIZES[size][1]) + 1
+
+
+def put_workload(shape, data_format, size):
+    def setup(_cluster, scale, iterations):
+        rows = num_rows(shape, size, scale)
+        contents = [
+            encode(SHAPES[shape](rows, start=i * rows, seed=i), data_format)
+            for i in range(num_flowfiles(size, iterations))
+        ]
+        return Workload([FlowFile(content) for content in contents], [rows] * len(contents), list(map(len, contents)))
+
+    return setup
+
+
+def update_workload(shape, data_format, size):
+    def setup(cluster, scale, iterations):
+        rows = num_rows(shape, size, scale)
+        cluster.create_table(BUCKET, SCHEMA, TABLE, SHAPES[shape](rows))
+        contents = []
+        for i in range(num_flowfiles(size, iterations)):
+            # The same rows are updated with new values
+            updates = SHAPES[shape](rows, seed=i + 1).drop(["id"])
+            updates = updates.append_column("$row_id", pa.array(range(rows), pa.uint64()))
+            contents.append(encode(updates, data_format))
+        return Workload([FlowFile(content) for content in contents], [rows] * len(contents), list(map(len, contents)))
+
+    return setup
+
+
+def delete_workload(data_format, size):
+    def setup(cluster, scale, iterations):
+        rows = num_rows("narrow", size, scale)
+        count = num_flowfiles(size, iterations)
+        cluster.create_table(BUCKET, SCHEMA, TABLE, narrow_table(rows * count))
+        # Each FlowFile deletes different rows
+        contents = [
+            encode(pa.table({"$row_id": pa.array(range(i * rows, (i + 1) * rows), pa.uint64())}), data_format)
+            for i in range(count)
+        ]
+        return Workload([FlowFile(content) for content in contents], [rows] * count, list(map(len, contents)))
+
+    return setup
+
+
+def query_workload(shape, size):
+    def setup(cluster, scale, iterations):
+        rows = num_rows(shape, size, scale)
+        pa_table = SHAPES[shape](rows)
+        cluster.create_table(BUCKET, SCHEMA, TABLE, pa_table)
+        matching = pa_table.filter(pc.field(query_column(shape)) >= QUERY_THRESHOLD).num_rows
+        count = num_flowfiles(size, iterations)
+        # The output is about the size of the matching rows as Json
+        output_bytes = len(encode(pa_table.slice(0, matching), "json"))
+        return Workload([FlowFile() for _ in range(count)], [matching] * count, [output_bytes] * count)
+
+    return setup
+
+
+def query_column(shape):
+    return "value" if shape == "narrow" else "float_0"
+
+
+def query_predicate(shape):
+    return f"and:\n- column: {query_column(shape)}\n  op: '>='\n  value: {QUERY_THRESHOLD}\n"
+
+
+def aggregate_workload(size):
+    def setup(cluster, scale, iterations):
+        rows = num_rows("narrow", size, scale)
+        pa_table = narrow_table(rows)
+        cluster.create_table(BUCKET, SCHEMA, TABLE, pa_table)
+        count = num_flowfiles(size, iterations)
+        return Workload([FlowFile() for _ in range(count)], [rows] * count, [pa_table.nbytes] * count)
+
+    return setup
+
+
+def lookup_workload(size):
+    def setup(cluster, scale, iterations):
+        rows = num_rows("lookup", size, scale)
+        count = num_flowfiles(size, iterations)
+        cluster.create_table(BUCKET, SCHEMA, TABLE, narrow_table(rows * count))
+        # Each FlowFile looks up different keys, so the cache doesn't answer them
+        contents = [
+            encode(pa.table({"id": range(i * rows, (i + 1) * rows), "amount": range(rows)}), "json")
+            for i in range(count)
+        ]
+        return Workload([FlowFile(content) for content in contents], [rows] * count, list(map(len, contents)))
+
+    return setup
+
+
+def import_workload(shape, size, files_per_flowfile=4):
+    def setup(cluster, scale, iterations):
+        rows = num_rows(shape, size, scale)
+        rows_per_file = max(1, rows // files_per_flowfile)
+        directory = tempfile.TemporaryDirectory(prefix="vastdb-bench-")
+        filesystem = pyarrow.fs.SubTreeFileSystem(directory.name, pyarrow.fs.LocalFileSystem())
+        flowfiles, sizes = [], []
+        for i in range(num_flowfiles(size, iterations)):
+            items, num_bytes = [], 0
+            for j in range(files_per_flowfile):
+                key = f"files/{i}/{j}.parquet"
+                filesystem.create_dir(f"{BUCKET}/files/{i}")
+                pa_table = SHAPES[shape](rows_per_file, start=(i * files_per_flowfile + j) * rows_per_file, seed=j)
+                pq.write_table(pa_table, f"{BUCKET}/{key}", filesystem=filesystem)
+                num_bytes += filesystem.get_file_info(f"{BUCKET}/{key}").size
+                items.append({"bucket": BUCKET, "key": key})
+            flowfiles.append(FlowFile(json.dumps(items).encode("utf-8")))
+            sizes.append(num_bytes)
+        cluster.filesystem = filesystem
+        rows_per_flowfile = rows_per_file * files_per_flowfile
+        # The files are removed when the workload is garbage collected
+        return Workload(flowfiles, [rows_per_flowfile] * len(flowfiles), sizes, directory)
+
+    return setup
+
+
+def export_workload(size):
+    def setup(cluster, scale, iterations):
+        rows = num_rows("narrow", size, scale)
+        pa_table = narrow_table(rows)
+        cluster.create_table(BUCKET, SCHEMA, TABLE, pa_table)
+        directory = tempfile.TemporaryDirectory(prefix="vastdb-bench-")
+        # The Parquet files are written to a local directory instead of S3
+        cluster.filesystem = pyarrow.fs.SubTreeFileSystem(directory.name, pyarrow.fs.LocalFileSystem())
+        count = num_flowfiles(size, iterations)
+        return Workload([FlowFile() for _ in range(count)], [rows] * count, [pa_table.nbytes] * count, directory)
+
+    return setup
+
+
+def drop_workload():
+    def setup(cluster, _scale, iterations):
+        count = num_flowfiles("small", iterations)
+        for i in range(count):
+            cluster.create_table(BUCKET, SCHEMA, f"{TABLE}_{i}", narrow_table(10))
+        return Workload(
+            [FlowFile(attributes={"table": f"{TABLE}_{i}"}) for i in range(count)], [0] * count, [0] * count
+        )
+
+    return setup
+
+
+def data_type(processor, data_format):
+    if data_format == "parquet":
+        return "Parquet"
+    # UpdateVastDB and DeleteVastDB call line delimited Json "Json"
+    return "Json" if processor in {"UpdateVastDB", "DeleteVastDB"} else "Json Line Delimited"
+
+
+def target(table=TABLE):
+    return {"VastDB Bucket": BUCKET, "VastDB Database Schema": SCHEMA, "VastDB Table Name": table}
+
+
+def all_cases():
+    cases = []
+    for processor, workload in (("PutVastDB", put_workload), ("UpdateVastDB", update_workload)):
+        for data_format in DATA_FORMATS:
+            for shape in SHAPES:
+                for size in SIZES:
+                    cases.append(
+                        Case(
+                            f"{processor}/{data_format}/{shape}/{size}",
+                            processor,
+                            workload(shape, data_format, size),
+                            {**target(), "Data Type": data_type(processor, data_format)},
+                        )
+                    )
+    for size in SIZES:
+        # Each FlowFile is routed to a table per category
+        cases.append(
+            Case(
+                f"PutVastDB/parquet/routed/{size}",
+                "PutVastDB",
+                put_workload("narrow", "parquet", size),
+                {**target(f"{TABLE}_{{category}}"), "Data Type": "Parquet"},
+            )
+        )
+    for data_format in DATA_FORMATS:
+        for size in SIZES:
+            cases.append(
+                Case(
+                    f"DeleteVastDB/{data_format}/narrow/{size}",
+                    "DeleteVastDB",
+                    delete_workload(data_format, size),
+                    {**target(), "Data Type": data_type("DeleteVastDB", data_format)},
+                )
+            )
+    for shape, make_table in SHAPES.items():
+        for size in SIZES:
+            cases.append(
+                Case(
+                    f"QueryVastDBTable/json/{shape}/{size}",
+                    "QueryVastDBTable",
+                    query_workload(shape, size),
+                    {
+                        **target(),
+                        "Columns": ", ".join(make_table(1).column_names),
+                        "Predicates": query_predicate(shape),
+                    },
+                )
+            )
+    for size in SIZES:
+        cases.append(
+            Case(
+                f"AggregateVastDBTable/json/narrow/{size}",
+                "AggregateVastDBTable",
+                aggregate_workload(size),
+                {
+                    **target(),
+                    "Group By Columns": "category",
+                    "Aggregations": "count(*), sum(value), mean(value), approx_distinct(name)",
+                },
+            )
+        )
+    for size in SIZES:
+        cases.append(
+            Case(
+                f"LookupVastDB/json/narrow/{size}",
+                "LookupVastDB",
+                lookup_workload(size),
+                {
+                    **target(),
+                    "Data Type": data_type("LookupVastDB", "json"),
+                    "Key Column": "id",
+                    "Lookup Columns": "name, category",
+                },
+            )
+        )
+    for shape in SHAPES:
+        for size in SIZES:
+            cases.append(
+                Case(f"ImportVastDB/parquet/{shape}/{size}", "ImportVastDB", import_workload(shape, size), target())
+            )
+    for size in SIZES:
+        cases.append(
+            Case(
+                f"ExportVastDBTable/parquet/narrow/{size}",
+                "ExportVastDBTable",
+                export_workload(size),
+                {**target(), "Destination Path": f"{BUCKET}/exports", "Partition Column": "category"},
+            )
+        )
+    cases.append(Case("DropVastDBTable/none/narrow/small", "DropVastDBTable", drop_workload(), target("${table}")))
+    return cases
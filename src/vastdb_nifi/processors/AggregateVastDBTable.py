@@ -0,0 +1,213 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+from typing import TYPE_CHECKING
+
+from aggregation import GroupByAggregator, parse_aggregations
+from common_properties import (
+    arrow_memory_tracking_property,
+    connection_properties,
+    get_vastdb_session,
+    profiling_properties,
+    query_config,
+    stage_attributes,
+    stage_timer,
+    stage_timings_property,
+    transform_profiler,
+    validate_profiling,
+)
+from nifiapi.flowfiletransform import FlowFileTransform, FlowFileTransformResult
+from nifiapi.properties import ExpressionLanguageScope, PropertyDescriptor, StandardValidators
+from predicate_parser import load_content_values, parse_yaml_predicate
+
+if TYPE_CHECKING:
+    import vastdb
+
+
+class AggregateVastDBTable(FlowFileTransform):
+    class Java:
+        implements = ["org.apache.nifi.python.processor.FlowFileTransform"]
+
+    class ProcessorDetails:
+        dependencies = ["vastdb", "pyarrow"]
+        version = "{{version}}"  # auto generated - do not edit
+        tags = ["vastdb", "yaml", "aggregate"]
+        description = """Computes group-by aggregates over a Vast DB table scan."""
+
+    # ruff: noqa: ARG002
+    def __init__(self, **kwargs):
+        (
+            self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
+            self.vastdb_credentials_provider_service,
+        ) = connection_properties()
+
+        self.vastdb_bucket = PropertyDescriptor(
+            name="VastDB Bucket",
+            description="The VastDB bucket to read from",
+            required=True,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        )
+
+        self.vastdb_schema = PropertyDescriptor(
+            name="VastDB Database Schema",
+            description="The VastDB database schema to read from",
+            required=True,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        )
+
+        self.vastdb_table = PropertyDescriptor(
+            name="VastDB Table Name",
+            description="The VastDB table name to aggregate",
+            required=True,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        )
+
+        self.group_by_columns = PropertyDescriptor(
+            name="Group By Columns",
+            description="List of Columns to group by (seperated by commas), or leave blank to aggregate all rows",
+            required=False,
+            expression_language_scope=ExpressionLanguageScope.FLOWFILE_ATTRIBUTES,
+        )
+
+        self.aggregations = PropertyDescriptor(
+            name="Aggregations",
+            description=(
+                "List of aggregations (seperated by commas), e.g. count(*), sum(fare), approx_distinct(vendor_id).\n"
+                "Supported functions: count, sum, min, max, mean, approx_distinct.\n"
+                "Each aggregate is returned in a column named <function>_<column>, count(*) is returned as count."
+            ),
+            required=True,
+            default_value="count(*)",
+            expression_language_scope=ExpressionLanguageScope.FLOWFILE_ATTRIBUTES,
+        )
+
+        self.vastdb_predicates = PropertyDescriptor(
+            name="Predicates",
+            description="Predicates yaml, or leave blank to aggregate the whole table",
+            required=False,
+            expression_language_scope=ExpressionLanguageScope.FLOWFILE_ATTRIBUTES,
+        )
+
+        self.stage_timings = stage_timings_property()
+
+        self.arrow_memory_tracking = arrow_memory_tracking_property()
+
+        (
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
+        ) = profiling_properties()
+
+        self.descriptors = [
+            self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
+            self.vastdb_credentials_provider_service,
+            self.vastdb_bucket,
+            self.vastdb_schema,
+            self.vastdb_table,
+            self.group_by_columns,
+            self.aggregations,
+            self.vastdb_predicates,
+            self.stage_timings,
+            self.arrow_memory_tracking,
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
+        ]
+
+    # Processor properties
+    def getPropertyDescriptors(self):
+        return self.descriptors
+
+    def customValidate(self, context):
+        return validate_profiling(context)
+
+    def get_el_property(self, context, flowfile, property_name) -> str:
+        # Check if EL is present in the property value
+        if context.getProperty(property_name).isExpressionLanguagePresent():
+            return context.getProperty(property_name).evaluateAttributeExpressions(flowfile).getValue()
+        return context.getProperty(property_name).getValue()
+
+    def transform(self, context, flowfile):
+        with transform_profiler(context, "AggregateVastDBTable", self.logger).sample():
+            return self.transform_flowfile(context, flowfile)
+
+    def transform_flowfile(self, context, flowfile):
+        timer = stage_timer(context)
+        with timer.stage("connect"):
+            session = get_vastdb_session(context, self.logger)
+        aggregator, num_rows = self.aggregate_vastdb(context, flowfile, session, timer)
+        timer.add_rows(num_rows)
+        with timer.stage("serialize"):
+            rows = aggregator.result().to_pandas().to_json(orient="records")
+        timer.add_bytes(len(rows))
+        attributes = {"vastdb.row.count": str(num_rows), **stage_attributes(timer, self.logger)}
+        return FlowFileTransformResult(relationship="success", contents=rows, attributes=attributes)
+
+    def extract_column_list(self, context, flowfile, property_name):
+        columns_data = self.get_el_property(context, flowfile, property_name) or ""
+
+        # Split, filter out empty columns, and strip whitespace
+        return [col.strip() for col in columns_data.split(",") if col.strip()]
+
+    def aggregate_vastdb(self, context, flowfile, session, timer):
+        vastdb_bucket = context.getProperty(self.vastdb_bucket.name).getValue()
+        vastdb_schema = context.getProperty(self.vastdb_schema.name).getValue()
+        vastdb_table = context.getProperty(self.vastdb_table.name).getValue()
+        group_by = self.extract_column_list(context, flowfile, self.group_by_columns.name)
+        aggregations = parse_aggregations(self.get_el_property(context, flowfile, self.aggregations.name))
+        vastdb_predicate = self.get_el_property(context, flowfile, self.vastdb_predicates.name)
+
+        aggregator = GroupByAggregator(group_by, aggregations)
+
+        with session.transaction() as tx:
+            with timer.stage("metadata"):
+                bucket: vastdb.bucket.Bucket = tx.bucket(vastdb_bucket)
+                schema: vastdb.schema.Schema = bucket.schema(vastdb_schema, fail_if_missing=True)
+                table: vastdb.table.Table = schema.table(vastdb_table, fail_if_missing=True)
+
+            # 'isin' predicates with 'value_from: content' take their values from the FlowFile content
+            with timer.stage("predicate"):
+                ibis_expr = (
+                    parse_yaml_predicate(
+                        vastdb_predicate, content_values=lambda: load_content_values(flowfile.getContentsAsBytes())
+                    )
+                    if vastdb_predicate and vastdb_predicate.strip()
+                    else None
+                )
+
+            # Only the group by and aggregated columns are read, count(*) alone reads the internal row ID
+            columns = aggregator.columns
+            log_message = (
+                f"Aggregating table '{table.name}' columns '{columns}' with {aggregations} grouped by {group_by} "
+                f"with yaml: '{vastdb_predicate}' translated to ibis '{ibis_expr!s}'"
+            )
+            self.logger.info(log_message)
+
+            num_rows = 0
+            if ibis_expr is False:
+                self.logger.info(f"Predicate can never match, skipping the scan of table '{table.name}'")
+                return aggregator, num_rows
+
+            try:
+                reader = table.select(
+                    columns=columns, predicate=ibis_expr, config=query_config(context), internal_row_id=not columns
+                )
+                for batch in timer.timed("select", reader):
+                    with timer.stage("aggregate"):
+                        aggregator.update(batch)
+                    num_rows += batch.num_rows
+            except Exception as e:
+                error_message = (
+                    f"Error aggregating table '{table.name}' columns '{columns}' "
+                    f"with yaml: '{vastdb_predicate}' translated to ibis '{ibis_expr!s}': {e}"
+                )
+                raise RuntimeError(error_message) from e
+
+        return aggregator, num_rows
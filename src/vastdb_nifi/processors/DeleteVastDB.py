@@ -2,13 +2,27 @@
 #
 # SPDX-License-Identifier: MIT
 
-import io
+from typing import TYPE_CHECKING
 
-import pyarrow.parquet as pq
-import vastdb
+from batch_sizing import get_batch_sizer
+from common_properties import (
+    arrow_memory_tracking_property,
+    connection_properties,
+    get_vastdb_session,
+    profiling_properties,
+    stage_attributes,
+    stage_timer,
+    stage_timings_property,
+    transform_profiler,
+    validate_profiling,
+)
+from compression import content_codec, decompress, open_decompressed
+from json_schema import ROW_ID, parse_json, row_id_schema
 from nifiapi.flowfiletransform import FlowFileTransform, FlowFileTransformResult
 from nifiapi.properties import PropertyDescriptor, StandardValidators
-from pyarrow import json as pa_json
+
+if TYPE_CHECKING:
+    import vastdb
 
 
 class DeleteVastDB(FlowFileTransform):
@@ -23,20 +37,12 @@ class DeleteVastDB(FlowFileTransform):
 
     # ruff: noqa: ARG002
     def __init__(self, **kwargs):
-        self.vastdb_endpoint = PropertyDescriptor(
-            name="VastDB Endpoint",
-            description="AWS_S3_ENDPOINT_URL",
-            required=True,
-            default_value="http://vip-pool.v123-xy.VastENG.lab",
-            validators=[StandardValidators.URL_VALIDATOR],
-        )
-
-        self.vastdb_credentials_provider_service = PropertyDescriptor(
-            name="VastDB Credentials Provider Service",
-            description="The Controller Service that is used to obtain VastDB credentials.",
-            required=True,
-            controller_service_definition="org.apache.nifi.processors.aws.credentials.provider.service.AWSCredentialsProviderService",
-        )
+        (
+            self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
+            self.vastdb_credentials_provider_service,
+        ) = connection_properties()
 
         self.vastdb_bucket = PropertyDescriptor(
             name="VastDB Bucket",
@@ -63,45 +69,123 @@ class DeleteVastDB(FlowFileTransform):
             name="Data Type",
             description=(
                 "Data Type.  Parquet or Json.\n"
-                "If Json, each data row must be on one line terminated by a newline character."
+                "If Json, each data row must be on one line terminated by a newline character.\n"
+                "Only the $row_id column is read, other columns are skipped."
             ),
             allowable_values=["Parquet", "Json"],
             required=True,
             default_value="Parquet",
         )
 
+        self.compression = PropertyDescriptor(
+            name="Compression",
+            description=(
+                "The compression of the FlowFile content. Detect: gzip or zstd from the first bytes of the content, "
+                "or uncompressed. Compressed content is decompressed as the row IDs are parsed (Parquet in memory, as it's read from its footer), "
+                "instead of a CompressContent processor writing the decompressed content to the content repository."
+            ),
+            allowable_values=["Detect", "None", "gzip", "zstd"],
+            required=True,
+            default_value="Detect",
+        )
+
+        self.batch_size = PropertyDescriptor(
+            name="Batch Size",
+            description=(
+                "The number of rows sent to VastDB per request, "
+                "or the initial number of rows when Adaptive Batch Size is True."
+            ),
+            required=True,
+            default_value="65536",
+            validators=[StandardValidators.POSITIVE_INTEGER_VALIDATOR],
+        )
+
+        self.adaptive_batch_size = PropertyDescriptor(
+            name="Adaptive Batch Size",
+            description=(
+                "Learn the number of rows per request for each table: it grows while the latency per row improves, "
+                "and is halved when a request times out or is too large for VastDB."
+            ),
+            allowable_values=["True", "False"],
+            required=True,
+            default_value="True",
+        )
+
+        self.stage_timings = stage_timings_property()
+
+        self.arrow_memory_tracking = arrow_memory_tracking_property()
+
+        (
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
+        ) = profiling_properties()
+
         self.descriptors = [
             self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
             self.vastdb_credentials_provider_service,
             self.vastdb_bucket,
             self.vastdb_schema,
             self.vastdb_table,
             self.incoming_data_type,
+            self.compression,
+            self.batch_size,
+            self.adaptive_batch_size,
+            self.stage_timings,
+            self.arrow_memory_tracking,
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
         ]
 
     # Processor properties
     def getPropertyDescriptors(self):
         return self.descriptors
 
+    def customValidate(self, context):
+        return validate_profiling(context)
+
     def transform(self, context, flowfile):
-        incoming_data_type = context.getProperty(self.incoming_data_type.name).getValue()
+        with transform_profiler(context, "DeleteVastDB", self.logger).sample():
+            return self.transform_flowfile(context, flowfile)
 
-        session = self.get_vastdb_session(context)
-        pa_table = self.read_json(flowfile) if incoming_data_type == "Json" else self.read_parquet(flowfile)
+    def transform_flowfile(self, context, flowfile):
+        incoming_data_type = context.getProperty(self.incoming_data_type.name).getValue()
 
-        self.write_to_vastdb(context, session, pa_table)
-        return FlowFileTransformResult(relationship="success")
+        timer = stage_timer(context)
+        with timer.stage("connect"):
+            session = get_vastdb_session(context, self.logger)
 
-    def read_parquet(self, flowfile):
-        try:
-            # Read the FlowFile contents into a byte array
+        with timer.stage("read"):
             file_contents = flowfile.getContentsAsBytes()
+        timer.add_bytes(len(file_contents))
+        codec = content_codec(file_contents, context.getProperty(self.compression.name).getValue())
+
+        with timer.stage("parse"):
+            pa_table = (
+                self.read_json(file_contents, codec)
+                if incoming_data_type == "Json"
+                else self.read_parquet(file_contents, codec)
+            )
+
+        sizer = self.batch_sizer(context, "delete")
+        self.write_to_vastdb(context, session, pa_table, sizer, timer)
+        attributes = {**sizer.attributes(), **stage_attributes(timer, self.logger)}
+        return FlowFileTransformResult(relationship="success", attributes=attributes)
 
-            # Create a BytesIO object from the byte array
-            buffer = io.BytesIO(file_contents)
+    def read_parquet(self, file_contents, codec=None):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
 
-            # Read the Parquet data from the buffer
-            return pq.read_table(buffer)
+        try:
+            parquet_file = pq.ParquetFile(pa.BufferReader(decompress(file_contents, codec)))
+            has_row_id = ROW_ID in parquet_file.schema_arrow.names
+            # Only the row IDs are decoded, the other columns are skipped
+            pa_table = parquet_file.read(columns=[ROW_ID]) if has_row_id else None
         except Exception as e:
             error_message = (
                 f"{e}.  Ensure your parquet is valid and meets pyarrow's requirements."
@@ -109,9 +193,17 @@ class DeleteVastDB(FlowFileTransform):
             )
             raise RuntimeError(error_message) from e
 
-    def read_json(self, flowfile):
+        if not has_row_id:
+            error_message = f"The rows to delete have no {ROW_ID} column, e.g. from QueryVastDBTable's Return Row ID"
+            raise ValueError(error_message)
+        return pa_table
+
+    def read_json(self, file_contents, codec=None):
         try:
-            return pa_json.read_json(io.BytesIO(flowfile.getContentsAsBytes()))
+            # Compressed Json is parsed as it's decompressed, without holding all of it decompressed
+            content = file_contents if codec is None else open_decompressed(file_contents, codec)
+            # Only the row IDs are parsed, the other fields are skipped
+            pa_table = parse_json(content, row_id_schema(), unexpected_fields="Ignore")
         except Exception as e:
             error_message = (
                 f"{e}.  Ensure your json is valid and meets pyarrow's requirements."
@@ -119,45 +211,48 @@ class DeleteVastDB(FlowFileTransform):
             )
             raise RuntimeError(error_message) from e
 
-    def get_vastdb_session(self, context):
-        vastdb_endpoint = context.getProperty(self.vastdb_endpoint.name).getValue()
-        credentials_provider_service = context.getProperty(
-            self.vastdb_credentials_provider_service.name
-        ).asControllerService()
-        credentials = credentials_provider_service.getAwsCredentialsProvider().resolveCredentials()
+        if pa_table[ROW_ID].null_count:
+            error_message = f"{pa_table[ROW_ID].null_count} rows to delete have no {ROW_ID} field"
+            raise ValueError(error_message)
+        return pa_table
 
-        try:
-            session = vastdb.connect(
-                endpoint=vastdb_endpoint, access=credentials.accessKeyId(), secret=credentials.secretAccessKey()
-            )
-            self.logger.info("Connected to VastDB")
-        except Exception as e:
-            error_message = f"Failed to connect to VastDB: {e}"
-            raise RuntimeError(error_message) from e
-        else:
-            return session
+    def batch_sizer(self, context, operation):
+        """Returns the batch sizer learning the number of rows per request for the target table."""
+        key = (
+            context.getProperty(self.vastdb_endpoint.name).getValue(),
+            context.getProperty(self.vastdb_bucket.name).getValue(),
+            context.getProperty(self.vastdb_schema.name).getValue(),
+            context.getProperty(self.vastdb_table.name).getValue(),
+            operation,
+        )
+        batch_size = int(context.getProperty(self.batch_size.name).getValue())
+        adaptive = context.getProperty(self.adaptive_batch_size.name).getValue() == "True"
+        return get_batch_sizer(key, batch_size, adaptive=adaptive)
 
-    def write_to_vastdb(self, context, session, pa_table):
+    def write_to_vastdb(self, context, session, pa_table, sizer, timer):
         vastdb_bucket = context.getProperty(self.vastdb_bucket.name).getValue()
         vastdb_schema = context.getProperty(self.vastdb_schema.name).getValue()
         vastdb_table = context.getProperty(self.vastdb_table.name).getValue()
 
         with session.transaction() as tx:
-            bucket: vastdb.bucket.Bucket = tx.bucket(vastdb_bucket)
-            schema: vastdb.schema.Schema = bucket.schema(vastdb_schema, fail_if_missing=False)
-            if schema is None:
-                self.logger.info(f"Creating schema {vastdb_schema}")
-                schema = bucket.create_schema(vastdb_schema)
-
-            table: vastdb.table.Table = schema.table(vastdb_table, fail_if_missing=False)
-            if table is None:
-                self.logger.info(f"Creating table {vastdb_table}")
-                try:
-                    table = schema.create_table(vastdb_table, pa_table.schema)
-                except Exception as e:
-                    error_message = f"Error creating table '{vastdb_table}' with schema {pa_table.schema}: {e}"
-                    raise RuntimeError(error_message) from e
+            with timer.stage("metadata"):
+                bucket: vastdb.bucket.Bucket = tx.bucket(vastdb_bucket)
+                schema: vastdb.schema.Schema = bucket.schema(vastdb_schema, fail_if_missing=False)
+                if schema is None:
+                    self.logger.info(f"Creating schema {vastdb_schema}")
+                    schema = bucket.create_schema(vastdb_schema)
+
+                table: vastdb.table.Table = schema.table(vastdb_table, fail_if_missing=False)
+                if table is None:
+                    self.logger.info(f"Creating table {vastdb_table}")
+                    try:
+                        table = schema.create_table(vastdb_table, pa_table.schema)
+                    except Exception as e:
+                        error_message = f"Error creating table '{vastdb_table}' with schema {pa_table.schema}: {e}"
+                        raise RuntimeError(error_message) from e
 
             self.logger.info(f"Deleting '{pa_table.num_rows}' from table '{vastdb_table}'.")
-            table.delete(pa_table)
+            with timer.stage("delete"):
+                sizer.write(pa_table, table.delete)
+            timer.add_rows(pa_table.num_rows)
             self.logger.info(f"Deleted '{pa_table.num_rows}' from table '{vastdb_table}'.")
@@ -2,10 +2,25 @@
 #
 # SPDX-License-Identifier: MIT
 
-import vastdb
+from typing import TYPE_CHECKING
+
+from common_properties import (
+    arrow_memory_tracking_property,
+    connection_properties,
+    get_vastdb_session,
+    profiling_properties,
+    stage_attributes,
+    stage_timer,
+    stage_timings_property,
+    transform_profiler,
+    validate_profiling,
+)
 from nifiapi.flowfiletransform import FlowFileTransform, FlowFileTransformResult
 from nifiapi.properties import ExpressionLanguageScope, PropertyDescriptor, StandardValidators
 
+if TYPE_CHECKING:
+    import vastdb
+
 
 class DropVastDBTable(FlowFileTransform):
     class Java:
@@ -19,20 +34,12 @@ class DropVastDBTable(FlowFileTransform):
 
     # ruff: noqa: ARG002
     def __init__(self, **kwargs):
-        self.vastdb_endpoint = PropertyDescriptor(
-            name="VastDB Endpoint",
-            description="AWS_S3_ENDPOINT_URL",
-            required=True,
-            default_value="http://vip-pool.v123-xy.VastENG.lab",
-            validators=[StandardValidators.URL_VALIDATOR],
-        )
-
-        self.vastdb_credentials_provider_service = PropertyDescriptor(
-            name="VastDB Credentials Provider Service",
-            description="The Controller Service that is used to obtain VastDB credentials.",
-            required=True,
-            controller_service_definition="org.apache.nifi.processors.aws.credentials.provider.service.AWSCredentialsProviderService",
-        )
+        (
+            self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
+            self.vastdb_credentials_provider_service,
+        ) = connection_properties()
 
         self.vastdb_bucket = PropertyDescriptor(
             name="VastDB Bucket",
@@ -56,41 +63,52 @@ class DropVastDBTable(FlowFileTransform):
             validators=[StandardValidators.NON_EMPTY_VALIDATOR],
         )
 
+        self.stage_timings = stage_timings_property()
+
+        self.arrow_memory_tracking = arrow_memory_tracking_property()
+
+        (
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
+        ) = profiling_properties()
+
         self.descriptors = [
             self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
             self.vastdb_credentials_provider_service,
             self.vastdb_bucket,
             self.vastdb_schema,
             self.vastdb_table,
+            self.stage_timings,
+            self.arrow_memory_tracking,
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
         ]
 
     # Processor properties
     def getPropertyDescriptors(self):
         return self.descriptors
 
+    def customValidate(self, context):
+        return validate_profiling(context)
+
     def transform(self, context, flowfile):
-        session = self.get_vastdb_session(context)
-        self.drop_table(context, flowfile, session)
-
-        return FlowFileTransformResult(relationship="success")
-
-    def get_vastdb_session(self, context):
-        vastdb_endpoint = context.getProperty(self.vastdb_endpoint.name).getValue()
-        credentials_provider_service = context.getProperty(
-            self.vastdb_credentials_provider_service.name
-        ).asControllerService()
-        credentials = credentials_provider_service.getAwsCredentialsProvider().resolveCredentials()
-
-        try:
-            session = vastdb.connect(
-                endpoint=vastdb_endpoint, access=credentials.accessKeyId(), secret=credentials.secretAccessKey()
-            )
-            self.logger.info("Connected to VastDB")
-        except Exception as e:
-            error_message = f"Failed to connect to VastDB: {e}"
-            raise RuntimeError(error_message) from e
-        else:
-            return session
+        with transform_profiler(context, "DropVastDBTable", self.logger).sample():
+            return self.transform_flowfile(context, flowfile)
+
+    def transform_flowfile(self, context, flowfile):
+        timer = stage_timer(context)
+        with timer.stage("connect"):
+            session = get_vastdb_session(context, self.logger)
+        with timer.stage("drop"):
+            self.drop_table(context, flowfile, session)
+
+        return FlowFileTransformResult(relationship="success", attributes=stage_attributes(timer, self.logger))
 
     def drop_table(self, context, flowfile, session):
         vastdb_bucket = context.getProperty(self.vastdb_bucket.name).getValue()
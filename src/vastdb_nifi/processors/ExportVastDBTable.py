@@ -0,0 +1,313 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+# ruff: noqa: SLF001
+
+import json
+import uuid
+from typing import TYPE_CHECKING
+
+from common_properties import (
+    arrow_memory_tracking_property,
+    connection_properties,
+    get_vastdb_session,
+    profiling_properties,
+    query_config,
+    stage_attributes,
+    stage_timer,
+    stage_timings_property,
+    transform_profiler,
+    validate_profiling,
+)
+from nifiapi.flowfiletransform import FlowFileTransform, FlowFileTransformResult
+from nifiapi.properties import DataUnit, ExpressionLanguageScope, PropertyDescriptor, StandardValidators
+from parquet_export import ParquetExportWriter, write_concurrently
+from predicate_parser import parse_yaml_predicate
+
+if TYPE_CHECKING:
+    import vastdb
+
+
+class ExportVastDBTable(FlowFileTransform):
+    class Java:
+        implements = ["org.apache.nifi.python.processor.FlowFileTransform"]
+
+    class ProcessorDetails:
+        dependencies = ["vastdb", "pyarrow"]
+        version = "{{version}}"  # auto generated - do not edit
+        tags = ["vastdb", "yaml", "parquet", "export"]
+        description = """Exports a Vast DB table scan to Parquet files on Vast S3."""
+
+    # ruff: noqa: ARG002
+    def __init__(self, **kwargs):
+        (
+            self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
+            self.vastdb_credentials_provider_service,
+        ) = connection_properties()
+
+        self.vastdb_bucket = PropertyDescriptor(
+            name="VastDB Bucket",
+            description="The VastDB bucket to read from",
+            required=True,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        )
+
+        self.vastdb_schema = PropertyDescriptor(
+            name="VastDB Database Schema",
+            description="The VastDB database schema to read from",
+            required=True,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        )
+
+        self.vastdb_table = PropertyDescriptor(
+            name="VastDB Table Name",
+            description="The VastDB table name to export",
+            required=True,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        )
+
+        self.vastdb_columns = PropertyDescriptor(
+            name="Columns",
+            description="List of Columns to export (seperated by commas), or leave blank to export all columns",
+            required=False,
+            expression_language_scope=ExpressionLanguageScope.FLOWFILE_ATTRIBUTES,
+        )
+
+        self.vastdb_predicates = PropertyDescriptor(
+            name="Predicates",
+            description="Predicates yaml, or leave blank to export the whole table",
+            required=False,
+            expression_language_scope=ExpressionLanguageScope.FLOWFILE_ATTRIBUTES,
+        )
+
+        self.destination_path = PropertyDescriptor(
+            name="Destination Path",
+            description="The S3 path the Parquet files are written under, as bucket/prefix, e.g. exports/trips/2024",
+            required=True,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+            expression_language_scope=ExpressionLanguageScope.FLOWFILE_ATTRIBUTES,
+        )
+
+        self.partition_column = PropertyDescriptor(
+            name="Partition Column",
+            description=(
+                "A column to partition the files by, in a Hive style <column>=<value> directory per value, "
+                "or leave blank to write all the rows under the Destination Path"
+            ),
+            required=False,
+            expression_language_scope=ExpressionLanguageScope.FLOWFILE_ATTRIBUTES,
+        )
+
+        self.row_group_size = PropertyDescriptor(
+            name="Row Group Size",
+            description=(
+                "The rows are buffered and written in Parquet row groups of about this size, "
+                "measured in memory before encoding and compression"
+            ),
+            required=True,
+            default_value="128 MB",
+            validators=[StandardValidators.DATA_SIZE_VALIDATOR],
+        )
+
+        self.target_file_size = PropertyDescriptor(
+            name="Target File Size",
+            description="A new Parquet file is started once a file has this many (compressed) bytes written",
+            required=True,
+            default_value="512 MB",
+            validators=[StandardValidators.DATA_SIZE_VALIDATOR],
+        )
+
+        self.compression = PropertyDescriptor(
+            name="Compression",
+            description="The compression codec of the Parquet files",
+            allowable_values=["snappy", "zstd", "gzip", "lz4", "none"],
+            required=True,
+            default_value="snappy",
+        )
+
+        self.concurrent_writers = PropertyDescriptor(
+            name="Concurrent Writers",
+            description=(
+                "The number of threads encoding and uploading Parquet files in parallel, each writing its own files"
+            ),
+            required=True,
+            default_value="4",
+            validators=[StandardValidators.POSITIVE_INTEGER_VALIDATOR],
+        )
+
+        self.stage_timings = stage_timings_property()
+
+        self.arrow_memory_tracking = arrow_memory_tracking_property()
+
+        (
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
+        ) = profiling_properties()
+
+        self.descriptors = [
+            self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
+            self.vastdb_credentials_provider_service,
+            self.vastdb_bucket,
+            self.vastdb_schema,
+            self.vastdb_table,
+            self.vastdb_columns,
+            self.vastdb_predicates,
+            self.destination_path,
+            self.partition_column,
+            self.row_group_size,
+            self.target_file_size,
+            self.compression,
+            self.concurrent_writers,
+            self.stage_timings,
+            self.arrow_memory_tracking,
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
+        ]
+
+    # Processor properties
+    def getPropertyDescriptors(self):
+        return self.descriptors
+
+    def customValidate(self, context):
+        return validate_profiling(context)
+
+    def get_el_property(self, context, flowfile, property_name) -> str:
+        # Check if EL is present in the property value
+        if context.getProperty(property_name).isExpressionLanguagePresent():
+            return context.getProperty(property_name).evaluateAttributeExpressions(flowfile).getValue()
+        return context.getProperty(property_name).getValue()
+
+    def transform(self, context, flowfile):
+        with transform_profiler(context, "ExportVastDBTable", self.logger).sample():
+            return self.transform_flowfile(context, flowfile)
+
+    def transform_flowfile(self, context, flowfile):
+        timer = stage_timer(context)
+        with timer.stage("connect"):
+            session = get_vastdb_session(context, self.logger)
+        manifest = self.export_vastdb(context, flowfile, session, timer)
+        timer.add_rows(manifest["rows"])
+        timer.add_bytes(manifest["bytes"])
+        attributes = {
+            "vastdb.row.count": str(manifest["rows"]),
+            "vastdb.export.id": manifest["export_id"],
+            "vastdb.export.files": str(len(manifest["files"])),
+            "vastdb.export.bytes": str(manifest["bytes"]),
+            **stage_attributes(timer, self.logger),
+        }
+        return FlowFileTransformResult(relationship="success", contents=json.dumps(manifest), attributes=attributes)
+
+    def extract_column_list(self, context, flowfile, property_name):
+        columns_data = self.get_el_property(context, flowfile, property_name) or ""
+
+        # Split, filter out empty columns, and strip whitespace
+        column_list = [col.strip() for col in columns_data.split(",") if col.strip()]
+
+        # Return None if the list is empty, to export all the columns
+        if not column_list:
+            return None
+        return column_list
+
+    def get_s3_filesystem(self, tx):
+        import pyarrow.fs
+
+        return pyarrow.fs.S3FileSystem(
+            access_key=tx._rpc.api.access_key, secret_key=tx._rpc.api.secret_key, endpoint_override=tx._rpc.api.url
+        )
+
+    def create_writers(self, context, s3fs, destination, schema, partition_column, export_id):
+        if partition_column is not None and partition_column not in schema.names:
+            error_message = f"Partition Column '{partition_column}' is not a column of the table"
+            raise ValueError(error_message)
+        compression = context.getProperty(self.compression.name).getValue()
+        return [
+            ParquetExportWriter(
+                s3fs,
+                destination,
+                schema,
+                name=f"{export_id}-{i:03d}",
+                partition_column=partition_column,
+                row_group_bytes=int(context.getProperty(self.row_group_size.name).asDataSize(DataUnit.B)),
+                file_bytes=int(context.getProperty(self.target_file_size.name).asDataSize(DataUnit.B)),
+                compression=None if compression == "none" else compression,
+            )
+            for i in range(int(context.getProperty(self.concurrent_writers.name).getValue()))
+        ]
+
+    def export_vastdb(self, context, flowfile, session, timer):
+        vastdb_bucket = context.getProperty(self.vastdb_bucket.name).getValue()
+        vastdb_schema = context.getProperty(self.vastdb_schema.name).getValue()
+        vastdb_table = context.getProperty(self.vastdb_table.name).getValue()
+        columns = self.extract_column_list(context, flowfile, self.vastdb_columns.name)
+        vastdb_predicate = self.get_el_property(context, flowfile, self.vastdb_predicates.name)
+        partition_column = (self.get_el_property(context, flowfile, self.partition_column.name) or "").strip() or None
+        if columns is not None and partition_column is not None and partition_column not in columns:
+            # The partition column is read to route the rows, and left out of the files
+            columns.append(partition_column)
+        destination = self.get_el_property(context, flowfile, self.destination_path.name).removeprefix("s3://")
+        destination = destination.strip("/")
+        export_id = uuid.uuid4().hex[:12]
+
+        manifest = {
+            "export_id": export_id,
+            "table": f"{vastdb_bucket}/{vastdb_schema}/{vastdb_table}",
+            "destination": f"s3://{destination}",
+            "rows": 0,
+            "bytes": 0,
+            "files": [],
+        }
+
+        with session.transaction() as tx:
+            with timer.stage("metadata"):
+                bucket: vastdb.bucket.Bucket = tx.bucket(vastdb_bucket)
+                schema: vastdb.schema.Schema = bucket.schema(vastdb_schema, fail_if_missing=True)
+                table: vastdb.table.Table = schema.table(vastdb_table, fail_if_missing=True)
+
+            with timer.stage("predicate"):
+                ibis_expr = (
+                    parse_yaml_predicate(vastdb_predicate) if vastdb_predicate and vastdb_predicate.strip() else None
+                )
+
+            log_message = (
+                f"Exporting table '{table.name}' columns '{columns}' to 's3://{destination}' "
+                f"with yaml: '{vastdb_predicate}' translated to ibis '{ibis_expr!s}'"
+            )
+            self.logger.info(log_message)
+
+            if ibis_expr is False:
+                self.logger.info(f"Predicate can never match, skipping the scan of table '{table.name}'")
+                return manifest
+
+            try:
+                reader = table.select(columns=columns, predicate=ibis_expr, config=query_config(context))
+                try:
+                    writers = self.create_writers(
+                        context, self.get_s3_filesystem(tx), destination, reader.schema, partition_column, export_id
+                    )
+                    files = write_concurrently(timer.timed("select", reader), writers, timer=timer)
+                finally:
+                    # Stops the SDK worker threads when the export failed
+                    reader.close()
+            except Exception as e:
+                error_message = (
+                    f"Error exporting table '{table.name}' columns '{columns}' to 's3://{destination}' "
+                    f"with yaml: '{vastdb_predicate}' translated to ibis '{ibis_expr!s}': {e}"
+                )
+                raise RuntimeError(error_message) from e
+
+        manifest["files"] = [{**file, "path": f"s3://{file['path']}"} for file in files]
+        manifest["rows"] = sum(file["rows"] for file in files)
+        manifest["bytes"] = sum(file["bytes"] for file in files)
+        self.logger.info(
+            f"Exported {manifest['rows']} rows of table '{table.name}' to {len(files)} files in 's3://{destination}'"
+        )
+        return manifest
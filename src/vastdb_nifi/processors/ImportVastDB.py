@@ -4,14 +4,32 @@
 
 # ruff: noqa: SLF001
 
+import hashlib
 import json
+from typing import TYPE_CHECKING
 
 import pyarrow as pa
-import pyarrow.parquet as pq
-import vastdb
+from common_properties import (
+    arrow_memory_tracking_property,
+    connection_properties,
+    get_vastdb_session,
+    profiling_properties,
+    stage_attributes,
+    stage_timer,
+    stage_timings_property,
+    transform_profiler,
+    validate_profiling,
+)
+from lookup_cache import MISSING, LRUCache
 from nifiapi.flowfiletransform import FlowFileTransform, FlowFileTransformResult
 from nifiapi.properties import PropertyDescriptor, StandardValidators
 
+if TYPE_CHECKING:
+    import vastdb
+
+# The parquet file schemas kept, see ImportVastDB.file_schema
+FILE_SCHEMA_CACHE_SIZE = 10000
+
 
 class ImportVastDB(FlowFileTransform):
     class Java:
@@ -25,20 +43,12 @@ class ImportVastDB(FlowFileTransform):
 
     # ruff: noqa: ARG002
     def __init__(self, **kwargs):
-        self.vastdb_endpoint = PropertyDescriptor(
-            name="VastDB Endpoint",
-            description="AWS_S3_ENDPOINT_URL",
-            required=True,
-            default_value="http://vip-pool.v123-xy.VastENG.lab",
-            validators=[StandardValidators.URL_VALIDATOR],
-        )
-
-        self.vastdb_credentials_provider_service = PropertyDescriptor(
-            name="VastDB Credentials Provider Service",
-            description="The Controller Service that is used to obtain VastDB credentials.",
-            required=True,
-            controller_service_definition="org.apache.nifi.processors.aws.credentials.provider.service.AWSCredentialsProviderService",
-        )
+        (
+            self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
+            self.vastdb_credentials_provider_service,
+        ) = connection_properties()
 
         self.vastdb_bucket = PropertyDescriptor(
             name="VastDB Bucket",
@@ -69,119 +79,212 @@ class ImportVastDB(FlowFileTransform):
             default_value="Union",
         )
 
+        self.stage_timings = stage_timings_property()
+
+        self.arrow_memory_tracking = arrow_memory_tracking_property()
+
+        (
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
+        ) = profiling_properties()
+
         self.descriptors = [
             self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
             self.vastdb_credentials_provider_service,
             self.vastdb_bucket,
             self.vastdb_schema,
             self.vastdb_table,
             self.schema_merge_function,
+            self.stage_timings,
+            self.arrow_memory_tracking,
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
         ]
 
+        # Fingerprints of parquet file schemas already merged into a table, keyed by
+        # (bucket, schema, table).  Each fingerprint maps to the column names it contributed.
+        self.schema_fingerprints = {}
+        # The schemas and fingerprints of the parquet files, keyed by (path, ETag)
+        self.file_schemas = LRUCache(FILE_SCHEMA_CACHE_SIZE)
+
     # Processor properties
     def getPropertyDescriptors(self):
         return self.descriptors
 
+    def customValidate(self, context):
+        return validate_profiling(context)
+
     def transform(self, context, flowfile):
-        json_content = json.loads(flowfile.getContentsAsBytes())
+        with transform_profiler(context, "ImportVastDB", self.logger).sample():
+            return self.transform_flowfile(context, flowfile)
+
+    def transform_flowfile(self, context, flowfile):
+        timer = stage_timer(context)
+        with timer.stage("read"):
+            file_contents = flowfile.getContentsAsBytes()
+        timer.add_bytes(len(file_contents))
+        json_content = json.loads(file_contents)
 
         parquet_file_list = []
+        etags = {}
 
         for item in json_content:
             if "key" in item and "bucket" in item:
                 transformed_key = f"/{item['bucket']}/{item['key']}"
                 parquet_file_list.append(transformed_key)
+                if item.get("etag"):
+                    etags[transformed_key] = item["etag"]
             else:
                 error_message = "Incoming JSON must have 'key' and 'bucket'"
                 raise ValueError(error_message)
 
         self.logger.info(f"Received parquet_file_list: {parquet_file_list}")
 
-        session = self.get_vastdb_session(context)
-        self.import_tables(context, session, parquet_file_list)
-
-        return FlowFileTransformResult(relationship="success")
-
-    def get_vastdb_session(self, context):
-        vastdb_endpoint = context.getProperty(self.vastdb_endpoint.name).getValue()
-        credentials_provider_service = context.getProperty(
-            self.vastdb_credentials_provider_service.name
-        ).asControllerService()
-        credentials = credentials_provider_service.getAwsCredentialsProvider().resolveCredentials()
+        with timer.stage("connect"):
+            session = get_vastdb_session(context, self.logger)
+        self.import_tables(context, session, parquet_file_list, timer, etags)
 
-        try:
-            session = vastdb.connect(
-                endpoint=vastdb_endpoint, access=credentials.accessKeyId(), secret=credentials.secretAccessKey()
-            )
-            self.logger.info("Connected to VastDB")
-        except Exception as e:
-            error_message = f"Failed to connect to VastDB: {e}"
-            raise RuntimeError(error_message) from e
-        else:
-            return session
+        return FlowFileTransformResult(relationship="success", attributes=stage_attributes(timer, self.logger))
 
-    def import_tables(self, context, session, parquet_file_list):
+    def import_tables(self, context, session, parquet_file_list, timer, etags=None):
         vastdb_bucket = context.getProperty(self.vastdb_bucket.name).getValue()
         vastdb_schema = context.getProperty(self.vastdb_schema.name).getValue()
         vastdb_table = context.getProperty(self.vastdb_table.name).getValue()
 
         with session.transaction() as tx:
-            bucket: vastdb.bucket.Bucket = tx.bucket(vastdb_bucket)
-            schema: vastdb.schema.Schema = bucket.schema(vastdb_schema, fail_if_missing=False)
-            if schema is None:
-                self.logger.info(f"Creating schema {vastdb_schema}")
-                try:
-                    schema = bucket.create_schema(vastdb_schema)
-                except Exception as e:
-                    error_message = f"Couldn't create schema: {vastdb_schema}"
-                    raise RuntimeError(error_message) from e
-
-            table: vastdb.table.Table = schema.table(vastdb_table, fail_if_missing=False)
-            if table is None:
-                table = self.create_table_from_files(context, schema, vastdb_table, parquet_file_list)
-
-            # the following two lines are redundant and can be removed?
-            else:
-                self.create_table_from_files(context, schema, vastdb_table, parquet_file_list, table.arrow_schema)
+            with timer.stage("metadata"):
+                bucket: vastdb.bucket.Bucket = tx.bucket(vastdb_bucket)
+                schema: vastdb.schema.Schema = bucket.schema(vastdb_schema, fail_if_missing=False)
+                if schema is None:
+                    self.logger.info(f"Creating schema {vastdb_schema}")
+                    try:
+                        schema = bucket.create_schema(vastdb_schema)
+                    except Exception as e:
+                        error_message = f"Couldn't create schema: {vastdb_schema}"
+                        raise RuntimeError(error_message) from e
+
+                table: vastdb.table.Table = schema.table(vastdb_table, fail_if_missing=False)
+
+            # Reads the parquet file schemas to create or evolve the table
+            with timer.stage("add_column"):
+                if table is None:
+                    table = self.create_table_from_files(context, schema, vastdb_table, parquet_file_list, etags)
+                else:
+                    self.evolve_table_from_files(context, table, parquet_file_list, etags)
 
             num_parquet_files = len(parquet_file_list)
             self.logger.info(f"Starting import of {num_parquet_files} files to table: {vastdb_table}")
-            table.import_files(parquet_file_list)
+            with timer.stage("import"):
+                table.import_files(parquet_file_list)
             self.logger.info(f"Finished import of {num_parquet_files} files to table: {vastdb_table}")
 
-    def create_table_from_files(self, context, schema, table_name: str, parquet_file_list: list[str], pa_schema=None):
+    def get_schema_merge_function(self, context):
         vastdb_schema_merge_function = context.getProperty(self.schema_merge_function.name).getValue()
 
         if vastdb_schema_merge_function == "Strict":
-            schema_merge_function = self.strict_schema_merge
-        elif vastdb_schema_merge_function == "Child":
-            schema_merge_function = self.child_schema_merge
-        else:
-            schema_merge_function = self.union_schema_merge
+            return self.strict_schema_merge
+        if vastdb_schema_merge_function == "Child":
+            return self.child_schema_merge
+        return self.union_schema_merge
 
-        tx = schema.tx
-        current_schema = pa.schema([]) if pa_schema is None else pa_schema
-        s3fs = pa.fs.S3FileSystem(
+    def get_s3_filesystem(self, tx):
+        return pa.fs.S3FileSystem(
             access_key=tx._rpc.api.access_key, secret_key=tx._rpc.api.secret_key, endpoint_override=tx._rpc.api.url
         )
 
+    def read_file_schema(self, s3fs, prq_file: str) -> pa.Schema:
+        import pyarrow.parquet as pq
+
+        if not prq_file.startswith("/"):
+            error_message = f"Path {prq_file} must start with a '/'"
+            raise ValueError(error_message)
+        # Only the parquet footer is fetched, the row groups are left on the server
+        return pq.read_schema(prq_file.lstrip("/"), filesystem=s3fs)
+
+    def schema_fingerprint(self, pa_schema: pa.Schema) -> str:
+        return hashlib.sha256(pa_schema.remove_metadata().serialize()).hexdigest()
+
+    def file_schema(self, s3fs, prq_file: str, etag=None) -> tuple[pa.Schema, str]:
+        """
+        Returns the schema of a parquet file and its fingerprint.
+
+        Files listed with their ETag, as ListS3 writes them, are read once: their schemas are cached by path
+        and ETag, which changes when the file is overwritten.  Files without an ETag are read every time.
+        """
+        key = (prq_file, etag)
+        cached = self.file_schemas.get(key) if etag else MISSING
+        if cached is not MISSING:
+            return cached
+        file_schema = self.read_file_schema(s3fs, prq_file)
+        cached = (file_schema, self.schema_fingerprint(file_schema))
+        if etag:
+            self.file_schemas.put(key, cached)
+        return cached
+
+    def create_table_from_files(self, context, schema, table_name: str, parquet_file_list: list[str], etags=None):
+        schema_merge_function = self.get_schema_merge_function(context)
+        s3fs = self.get_s3_filesystem(schema.tx)
+        etags = etags or {}
+
+        current_schema = pa.schema([])
         for prq_file in parquet_file_list:
-            if not prq_file.startswith("/"):
-                error_message = f"Path {prq_file} must start with a '/'"
-                raise ValueError(error_message)
-            parquet_ds = pq.ParquetDataset(prq_file.lstrip("/"), filesystem=s3fs)
-            current_schema = schema_merge_function(current_schema, parquet_ds.schema)
+            file_schema, _ = self.file_schema(s3fs, prq_file, etags.get(prq_file))
+            current_schema = schema_merge_function(current_schema, file_schema)
+
+        try:
+            self.logger.info(f"Creating schema.table '{schema.name}.{table_name}'")
+            return schema.create_table(table_name, current_schema)
+        except Exception as e:
+            error_message = (
+                f"Failed to create schema.table '{schema.name}.{table_name}' with pyarrow schema '{current_schema}'"
+            )
+            raise RuntimeError(error_message) from e
+
+    def evolve_table_from_files(self, context, table, parquet_file_list: list[str], etags=None):
+        """
+        Adds the columns found in the parquet files that are missing from an existing table.
 
-        if pa_schema is None:
+        Files whose schema fingerprint has already been merged into the table aren't merged again,
+        and all missing columns are added with a single DDL call.  The footers of files listed with
+        their ETag are only fetched the first time, see `file_schema`.
+        """
+        schema_merge_function = self.get_schema_merge_function(context)
+        s3fs = self.get_s3_filesystem(table.tx)
+        etags = etags or {}
+
+        table_key = (table.bucket.name, table.schema.name, table.name)
+        known_fingerprints = self.schema_fingerprints.setdefault(table_key, {})
+        table_names = set(table.arrow_schema.names)
+
+        current_schema = table.arrow_schema
+        merged_fingerprints = {}
+        for prq_file in parquet_file_list:
+            file_schema, fingerprint = self.file_schema(s3fs, prq_file, etags.get(prq_file))
+            if fingerprint in merged_fingerprints:
+                continue
+            # The table may have been dropped and re-created, so only trust a known fingerprint
+            # while the table still contains every column the file contributed.
+            if fingerprint in known_fingerprints and known_fingerprints[fingerprint] <= table_names:
+                continue
+            current_schema = schema_merge_function(current_schema, file_schema)
+            merged_fingerprints[fingerprint] = frozenset(file_schema.names)
+
+        columns_to_add = [pa.field(field.name, field.type) for field in current_schema if field.name not in table_names]
+        if columns_to_add:
+            self.logger.info(f"Adding columns {[field.name for field in columns_to_add]} to table '{table.name}'")
             try:
-                self.logger.info(f"Creating schema.table '{schema.name}.{table_name}'")
-                return schema.create_table(table_name, current_schema)
+                table.add_column(pa.schema(columns_to_add))
             except Exception as e:
-                error_message = (
-                    f"Failed to create schema.table '{schema.name}.{table_name}' with pyarrow schema '{current_schema}'"
-                )
+                error_message = f"Failed to add columns {columns_to_add} to table '{table.name}': {e}"
                 raise RuntimeError(error_message) from e
-        return None
+
+        known_fingerprints.update(merged_fingerprints)
 
     def child_schema_merge(self, current_schema: pa.Schema, new_schema: pa.Schema) -> pa.Schema:
         """
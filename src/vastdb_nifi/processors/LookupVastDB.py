@@ -0,0 +1,362 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import io
+import json
+from typing import TYPE_CHECKING
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from common_properties import (
+    arrow_memory_tracking_property,
+    connection_properties,
+    get_vastdb_session,
+    profiling_properties,
+    stage_attributes,
+    stage_timer,
+    stage_timings_property,
+    transform_profiler,
+    validate_profiling,
+)
+from lookup_cache import MISSING, LRUCache
+from nifiapi.flowfiletransform import FlowFileTransform, FlowFileTransformResult
+from nifiapi.properties import PropertyDescriptor, StandardValidators, TimeUnit
+from predicate_parser import parse_predicate
+
+if TYPE_CHECKING:
+    import vastdb
+
+
+class LookupVastDB(FlowFileTransform):
+    class Java:
+        implements = ["org.apache.nifi.python.processor.FlowFileTransform"]
+
+    class ProcessorDetails:
+        dependencies = ["vastdb", "pyarrow"]
+        version = "{{version}}"  # auto generated - do not edit
+        tags = ["vastdb", "arrow", "lookup", "enrich"]
+        description = """Enriches Parquet or JSON records with the matching rows of a Vast DB table."""
+
+    # ruff: noqa: ARG002
+    def __init__(self, **kwargs):
+        (
+            self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
+            self.vastdb_credentials_provider_service,
+        ) = connection_properties()
+
+        self.vastdb_bucket = PropertyDescriptor(
+            name="VastDB Bucket",
+            description="The VastDB bucket of the lookup table",
+            required=True,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        )
+
+        self.vastdb_schema = PropertyDescriptor(
+            name="VastDB Database Schema",
+            description="The VastDB database schema of the lookup table",
+            required=True,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        )
+
+        self.vastdb_table = PropertyDescriptor(
+            name="VastDB Table Name",
+            description="The VastDB table name to look up rows in",
+            required=True,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        )
+
+        self.incoming_data_type = PropertyDescriptor(
+            name="Data Type",
+            description=(
+                "Data Type.  Parquet, Json Array, or Json Line Delimited.\n"
+                "If Json Line Delimited, each data row is on one line terminated by a newline character."
+            ),
+            allowable_values=["Parquet", "Json Array", "Json Line Delimited"],
+            required=True,
+            default_value="Parquet",
+        )
+
+        self.key_column = PropertyDescriptor(
+            name="Key Column",
+            description="The column holding the lookup key, in both the incoming records and the VastDB table",
+            required=True,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        )
+
+        self.lookup_columns = PropertyDescriptor(
+            name="Lookup Columns",
+            description=(
+                "List of VastDB table columns to add to each record (seperated by commas), "
+                "or leave blank to add all columns.\n"
+                "Columns that already exist in the incoming records are added with a '_lookup' suffix."
+            ),
+            required=False,
+        )
+
+        self.probe_batch_size = PropertyDescriptor(
+            name="Probe Batch Size",
+            description="The maximum number of keys in each 'isin' predicate sent to VastDB",
+            required=True,
+            default_value="1000",
+            validators=[StandardValidators.POSITIVE_INTEGER_VALIDATOR],
+        )
+
+        self.cache_size = PropertyDescriptor(
+            name="Cache Size",
+            description=(
+                "The maximum number of keys to keep in the lookup cache, including keys that were not found.\n"
+                "Set to 0 to disable the cache."
+            ),
+            required=True,
+            default_value="10000",
+            validators=[StandardValidators.NON_NEGATIVE_INTEGER_VALIDATOR],
+        )
+
+        self.cache_ttl = PropertyDescriptor(
+            name="Cache TTL",
+            description="How long a cached key is used before it is looked up in VastDB again",
+            required=True,
+            default_value="5 min",
+            validators=[StandardValidators.TIME_PERIOD_VALIDATOR],
+        )
+
+        self.stage_timings = stage_timings_property()
+
+        self.arrow_memory_tracking = arrow_memory_tracking_property()
+
+        (
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
+        ) = profiling_properties()
+
+        self.descriptors = [
+            self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
+            self.vastdb_credentials_provider_service,
+            self.vastdb_bucket,
+            self.vastdb_schema,
+            self.vastdb_table,
+            self.incoming_data_type,
+            self.key_column,
+            self.lookup_columns,
+            self.probe_batch_size,
+            self.cache_size,
+            self.cache_ttl,
+            self.stage_timings,
+            self.arrow_memory_tracking,
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
+        ]
+
+        self.cache = LRUCache(0)
+        self.lookup_schema = None
+
+    # Processor properties
+    def getPropertyDescriptors(self):
+        return self.descriptors
+
+    def customValidate(self, context):
+        return validate_profiling(context)
+
+    def onScheduled(self, context):
+        cache_size = int(context.getProperty(self.cache_size.name).getValue())
+        cache_ttl = context.getProperty(self.cache_ttl.name).asTimePeriod(TimeUnit.SECONDS)
+        # The table or the lookup columns may have changed, so start with an empty cache
+        self.cache = LRUCache(cache_size, cache_ttl)
+        self.lookup_schema = None
+
+    def transform(self, context, flowfile):
+        with transform_profiler(context, "LookupVastDB", self.logger).sample():
+            return self.transform_flowfile(context, flowfile)
+
+    def transform_flowfile(self, context, flowfile):
+        incoming_data_type = context.getProperty(self.incoming_data_type.name).getValue()
+        key_column = context.getProperty(self.key_column.name).getValue()
+
+        timer = stage_timer(context)
+        with timer.stage("read"):
+            file_contents = flowfile.getContentsAsBytes()
+        timer.add_bytes(len(file_contents))
+
+        with timer.stage("parse"):
+            if incoming_data_type == "Json Line Delimited":
+                pa_table = self.read_json(file_contents)
+            elif incoming_data_type == "Json Array":
+                pa_table = self.read_json_array(file_contents)
+            else:
+                pa_table = self.read_parquet(file_contents)
+        timer.add_rows(pa_table.num_rows)
+
+        if key_column not in pa_table.column_names:
+            error_message = f"Key column '{key_column}' not found in the incoming records: {pa_table.column_names}"
+            raise ValueError(error_message)
+
+        hits, misses = self.cache.hits, self.cache.misses
+
+        keys = pc.unique(pa_table[key_column]).drop_null().to_pylist()
+        lookup_rows = {}
+        missing_keys = []
+        for key in keys:
+            row = self.cache.get(key)
+            if row is MISSING:
+                missing_keys.append(key)
+            elif row is not None:
+                lookup_rows[key] = row
+
+        # The table is opened once for its schema, so records get the lookup columns even if no key was probed
+        if missing_keys or self.lookup_schema is None:
+            with timer.stage("connect"):
+                session = get_vastdb_session(context, self.logger)
+            found_rows = self.probe_vastdb(context, session, missing_keys, timer)
+            for key in missing_keys:
+                row = found_rows.get(key)
+                # Keys that were not found are cached too, so they are not probed again
+                self.cache.put(key, row)
+                if row is not None:
+                    lookup_rows[key] = row
+
+        with timer.stage("join"):
+            enriched = self.join(pa_table, key_column, lookup_rows)
+
+        hits, misses = self.cache.hits - hits, self.cache.misses - misses
+        self.logger.info(
+            f"Looked up {len(keys)} keys, {hits} cache hits, {misses} cache misses, "
+            f"cache hit ratio since scheduled {self.cache.hit_ratio:.2f}"
+        )
+        attributes = {
+            "lookup.keys": str(len(keys)),
+            "lookup.cache.hits": str(hits),
+            "lookup.cache.misses": str(misses),
+            "lookup.cache.hit.ratio": f"{hits / len(keys) if keys else 0.0:.4f}",
+        }
+
+        with timer.stage("serialize"):
+            rows = enriched.to_pandas().to_json(orient="records")
+        attributes.update(stage_attributes(timer, self.logger))
+        return FlowFileTransformResult(relationship="success", contents=rows, attributes=attributes)
+
+    def join(self, pa_table, key_column, lookup_rows):
+        """Left joins the lookup rows onto the incoming records, keeping the incoming record order."""
+        lookup_table = pa.Table.from_pylist(list(lookup_rows.values()), schema=self.lookup_schema)
+        # The key types must match for the join, e.g. int64 parsed from json vs an int32 table column
+        if pa.types.is_null(pa_table.schema.field(key_column).type):
+            # Json keys that are all null are parsed as nulls of no type, which take the table's key type
+            key_index = pa_table.schema.get_field_index(key_column)
+            pa_table = pa_table.set_column(
+                key_index, key_column, pc.cast(pa_table[key_column], lookup_table.schema.field(key_column).type)
+            )
+        else:
+            key_index = lookup_table.schema.get_field_index(key_column)
+            lookup_table = lookup_table.set_column(
+                key_index, key_column, pc.cast(lookup_table[key_column], pa_table.schema.field(key_column).type)
+            )
+
+        pa_table = pa_table.append_column("__row_index", pa.array(range(pa_table.num_rows), pa.int64()))
+        joined = pa_table.join(lookup_table, keys=key_column, join_type="left outer", right_suffix="_lookup")
+        return joined.sort_by("__row_index").drop(["__row_index"])
+
+    def probe_vastdb(self, context, session, keys, timer):
+        """Returns the table rows matching the keys, as a dict of key to row, probing in chunks of isin predicates."""
+        vastdb_bucket = context.getProperty(self.vastdb_bucket.name).getValue()
+        vastdb_schema = context.getProperty(self.vastdb_schema.name).getValue()
+        vastdb_table = context.getProperty(self.vastdb_table.name).getValue()
+        key_column = context.getProperty(self.key_column.name).getValue()
+        probe_batch_size = int(context.getProperty(self.probe_batch_size.name).getValue())
+
+        lookup_columns_data = context.getProperty(self.lookup_columns.name).getValue() or ""
+        columns = [col.strip() for col in lookup_columns_data.split(",") if col.strip()] or None
+        if columns is not None and key_column not in columns:
+            columns = [key_column, *columns]
+
+        found_rows = {}
+        with session.transaction() as tx:
+            with timer.stage("metadata"):
+                bucket: vastdb.bucket.Bucket = tx.bucket(vastdb_bucket)
+                schema: vastdb.schema.Schema = bucket.schema(vastdb_schema, fail_if_missing=True)
+                table: vastdb.table.Table = schema.table(vastdb_table, fail_if_missing=True)
+                if self.lookup_schema is None:
+                    self.lookup_schema = self.table_lookup_schema(table, columns)
+
+            for start in range(0, len(keys), probe_batch_size):
+                chunk = keys[start : start + probe_batch_size]
+                predicate = parse_predicate({"column": key_column, "op": "isin", "value": chunk})
+                try:
+                    with timer.stage("select"):
+                        result = table.select(columns=columns, predicate=predicate).read_all()
+                except Exception as e:
+                    error_message = (
+                        f"Error looking up {len(chunk)} keys in table '{table.name}' column '{key_column}': {e}"
+                    )
+                    raise RuntimeError(error_message) from e
+
+                for row in result.to_pylist():
+                    # Keep the first row of duplicate keys so each record is enriched once
+                    found_rows.setdefault(row[key_column], row)
+
+            if keys:
+                self.logger.info(
+                    f"Probed table '{table.name}' for {len(keys)} keys in "
+                    f"{-(-len(keys) // probe_batch_size)} scans, found {len(found_rows)}"
+                )
+
+        return found_rows
+
+    def table_lookup_schema(self, table, columns):
+        """Returns the schema of the lookup columns, or all the table's columns, as the probes select them."""
+        table_schema = table.arrow_schema
+        if columns is None:
+            return table_schema
+        missing = [column for column in columns if column not in table_schema.names]
+        if missing:
+            error_message = f"Lookup columns {missing} are not columns of table '{table.name}'"
+            raise ValueError(error_message)
+        return pa.schema([table_schema.field(column) for column in columns])
+
+    def read_parquet(self, file_contents):
+        import pyarrow.parquet as pq
+
+        try:
+            # Create a BytesIO object from the byte array
+            buffer = io.BytesIO(file_contents)
+
+            # Read the Parquet data from the buffer
+            return pq.read_table(buffer)
+        except Exception as e:
+            error_message = (
+                f"{e}.  Ensure your parquet is valid and meets pyarrow's requirements."
+                f"\nSee: https://arrow.apache.org/docs/python/json.html#reading-json-files"
+            )
+            raise RuntimeError(error_message) from e
+
+    def read_json_array(self, file_contents):
+        from pyarrow import json as pa_json
+
+        json_str = "\n".join(json.dumps(item) for item in json.loads(file_contents))
+        try:
+            return pa_json.read_json(io.BytesIO(json_str.encode("utf-8")))
+        except Exception as e:
+            error_message = (
+                f"{e}.  Ensure your json is valid and meets pyarrow's requirements."
+                f"\nSee: https://arrow.apache.org/docs/python/json.html#reading-json-files"
+            )
+            raise RuntimeError(error_message) from e
+
+    def read_json(self, file_contents):
+        from pyarrow import json as pa_json
+
+        try:
+            return pa_json.read_json(io.BytesIO(file_contents))
+        except Exception as e:
+            error_message = (
+                f"{e}.  Ensure your json is valid and meets pyarrow's requirements."
+                f"\nSee: https://arrow.apache.org/docs/python/json.html#reading-json-files"
+            )
+            raise RuntimeError(error_message) from e
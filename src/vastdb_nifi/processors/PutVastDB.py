@@ -2,15 +2,48 @@
 #
 # SPDX-License-Identifier: MIT
 
-import io
+import datetime
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from types import SimpleNamespace
+from typing import TYPE_CHECKING
 
 import pyarrow as pa
-import pyarrow.parquet as pq
-import vastdb
+from batch_sizing import get_batch_sizer, is_size_error, is_timeout_error
+from common_properties import (
+    arrow_memory_properties,
+    arrow_memory_tracking_property,
+    connection_properties,
+    get_vastdb_session,
+    profiling_properties,
+    release_memory,
+    stage_attributes,
+    stage_timer,
+    stage_timings_property,
+    transform_profiler,
+    validate_profiling,
+    worker_memory_governor,
+)
+from compression import content_codec, decompress, decompressed_lines
+from derived_columns import add_derived_columns, hash_columns, parse_yaml_derived_columns
+from endpoints import is_connection_error
+from json_schema import get_table_schema, parse_json, update_table_schema
+from key_filter import DuplicateRows, drop_duplicates, get_key_filter, null_keys, save_key_filters
 from nifiapi.flowfiletransform import FlowFileTransform, FlowFileTransformResult
-from nifiapi.properties import PropertyDescriptor, StandardValidators
-from pyarrow import json as pa_json
+from nifiapi.properties import DataUnit, ExpressionLanguageScope, PropertyDescriptor, StandardValidators, TimeUnit
+from nifiapi.relationship import Relationship
+from pipeline import pipelined, split_lines
+from predicate_parser import parse_predicate
+from row_isolation import InvalidRows, parse_isolating, write_isolating
+from table_routing import TableNameTemplate
+
+if TYPE_CHECKING:
+    import vastdb
+
+# The most keys looked up in each isin probe of the rows already inserted
+PROBE_BATCH_SIZE = 1000
 
 
 class PutVastDB(FlowFileTransform):
@@ -25,20 +58,12 @@ class PutVastDB(FlowFileTransform):
 
     # ruff: noqa: ARG002
     def __init__(self, **kwargs):
-        self.vastdb_endpoint = PropertyDescriptor(
-            name="VastDB Endpoint",
-            description="AWS_S3_ENDPOINT_URL",
-            required=True,
-            default_value="http://vip-pool.v123-xy.VastENG.lab",
-            validators=[StandardValidators.URL_VALIDATOR],
-        )
-
-        self.vastdb_credentials_provider_service = PropertyDescriptor(
-            name="VastDB Credentials Provider Service",
-            description="The Controller Service that is used to obtain VastDB credentials.",
-            required=True,
-            controller_service_definition="org.apache.nifi.processors.aws.credentials.provider.service.AWSCredentialsProviderService",
-        )
+        (
+            self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
+            self.vastdb_credentials_provider_service,
+        ) = connection_properties()
 
         self.vastdb_bucket = PropertyDescriptor(
             name="VastDB Bucket",
@@ -56,7 +81,12 @@ class PutVastDB(FlowFileTransform):
 
         self.vastdb_table = PropertyDescriptor(
             name="VastDB Table Name",
-            description="The VastDB table name to write to (or create)",
+            description=(
+                "The VastDB table name to write to (or create). The name can route the rows to several tables by "
+                "their column values, e.g. events_{tenant}_{day:%Y%m%d}: {column} is replaced by the value of the "
+                "column, and {column:format} by a date or timestamp column formatted with a strftime format. "
+                "Null values are named null."
+            ),
             required=True,
             validators=[StandardValidators.NON_EMPTY_VALIDATOR],
         )
@@ -72,6 +102,18 @@ class PutVastDB(FlowFileTransform):
             default_value="Parquet",
         )
 
+        self.compression = PropertyDescriptor(
+            name="Compression",
+            description=(
+                "The compression of the FlowFile content. Detect: gzip or zstd from the first bytes of the content, "
+                "or uncompressed. Compressed content is decompressed as it's parsed (Json lines a block at a time), "
+                "instead of a CompressContent processor writing the decompressed content to the content repository."
+            ),
+            allowable_values=["Detect", "None", "gzip", "zstd"],
+            required=True,
+            default_value="Detect",
+        )
+
         self.flatten_json = PropertyDescriptor(
             name="Flatten Nested Json",
             description=(
@@ -85,33 +127,382 @@ class PutVastDB(FlowFileTransform):
             default_value="False",
         )
 
+        self.json_schema = PropertyDescriptor(
+            name="Json Schema",
+            description=(
+                "How the column types of Json data are found. Inferred: pyarrow infers them from each FlowFile. "
+                "Table Schema: the columns of the target table are parsed as the table's types, which is faster "
+                "and keeps the types from changing between FlowFiles. The table schema is looked up once per table."
+            ),
+            allowable_values=["Inferred", "Table Schema"],
+            required=True,
+            default_value="Inferred",
+        )
+
+        self.unexpected_json_fields = PropertyDescriptor(
+            name="Unexpected Json Fields",
+            description=(
+                "With Table Schema, what to do with Json fields that aren't columns of the table: "
+                "infer their types (so they are added as columns), ignore them, or fail the FlowFile."
+            ),
+            allowable_values=["Infer", "Ignore", "Error"],
+            required=True,
+            default_value="Infer",
+        )
+
+        self.derived_columns = PropertyDescriptor(
+            name="Derived Columns",
+            description=(
+                "Derived columns yaml, or leave blank to insert the columns of the data as they are. A list of "
+                "columns computed over each block before it is sorted and inserted, e.g.\n"
+                "- {name: ingested_at, op: now}\n"
+                "- {name: tenant_key, op: hash, columns: [tenant, id]}\n"
+                "Operations: constant (value, datatype), now, cast (column, datatype), hash (columns), "
+                "strptime (column, format, unit, error_is_null), substring (column, start, length), "
+                "coalesce (columns, value), lower, upper and trim (column). "
+                "Expression Language, e.g. value: ${filename}, is evaluated with the FlowFile attributes."
+            ),
+            required=False,
+            expression_language_scope=ExpressionLanguageScope.FLOWFILE_ATTRIBUTES,
+        )
+
+        self.sort_key_columns = PropertyDescriptor(
+            name="Sort Key Columns",
+            description=(
+                "List of Columns (seperated by commas) to sort the rows by before they are inserted, e.g. the "
+                "timestamp of time series, so rows with close values are stored together and range predicates "
+                "skip more of the table. Each Pipeline Block is sorted. Leave blank to insert the rows as they arrive."
+            ),
+            required=False,
+        )
+
+        self.sorted_projection = PropertyDescriptor(
+            name="Sorted Projection",
+            description=(
+                "When the table is created, also create a semi-sorted projection of it sorted by the Sort Key "
+                "Columns, so VastDB keeps a copy of the rows sorted by them for range queries. "
+                "Requires a VastDB version with semi-sorted projections."
+            ),
+            allowable_values=["True", "False"],
+            required=True,
+            default_value="False",
+        )
+
+        self.max_concurrent_tables = PropertyDescriptor(
+            name="Max Concurrent Tables",
+            description=(
+                "When the VastDB Table Name routes the rows to several tables, "
+                "the maximum number of tables each Pipeline Block is inserted into at the same time."
+            ),
+            required=True,
+            default_value="4",
+            validators=[StandardValidators.POSITIVE_INTEGER_VALIDATOR],
+        )
+
+        self.invalid_rows = PropertyDescriptor(
+            name="Invalid Rows",
+            description=(
+                "What to do with rows that can't be parsed or inserted: fail the whole FlowFile, or insert the "
+                "other rows and route the invalid ones, with their error, to the invalid relationship. "
+                "Failed Json blocks and insert requests are split in halves until the invalid rows are found."
+            ),
+            allowable_values=["Fail FlowFile", "Route to Invalid"],
+            required=True,
+            default_value="Fail FlowFile",
+        )
+
+        self.max_invalid_rows = PropertyDescriptor(
+            name="Max Invalid Rows",
+            description=(
+                "With Route to Invalid, the FlowFile fails as a whole when it has more invalid rows than this, "
+                "as isolating each of them costs more requests."
+            ),
+            required=True,
+            default_value="1000",
+            validators=[StandardValidators.POSITIVE_INTEGER_VALIDATOR],
+        )
+
+        self.deduplication_key_columns = PropertyDescriptor(
+            name="Deduplication Key Columns",
+            description=(
+                "List of Columns (seperated by commas) identifying a row, e.g. an event ID, to drop the rows whose "
+                "key was already inserted: the duplicates within each Pipeline Block, and the rows inserted by "
+                "recent FlowFiles, which a filter of the recent keys finds and a VastDB query confirms. Leave blank "
+                "to insert every row."
+            ),
+            required=False,
+        )
+
+        self.deduplication_window = PropertyDescriptor(
+            name="Deduplication Window",
+            description="How long the inserted keys are remembered to find duplicates in later FlowFiles.",
+            required=True,
+            default_value="1 hour",
+            validators=[StandardValidators.TIME_PERIOD_VALIDATOR],
+        )
+
+        self.deduplication_capacity = PropertyDescriptor(
+            name="Deduplication Capacity",
+            description=(
+                "The number of keys remembered in each Deduplication Window for each table, which bounds the memory "
+                "of the filter: its two generations take about 2 bytes per key each at a false positive rate of 0.001, "
+                "so about 4 bytes per key, and up to twice that while the filter is saved. When more keys are "
+                "inserted, the oldest are forgotten sooner."
+            ),
+            required=True,
+            default_value="1000000",
+            validators=[StandardValidators.POSITIVE_INTEGER_VALIDATOR],
+        )
+
+        self.deduplication_false_positive_rate = PropertyDescriptor(
+            name="Deduplication False Positive Rate",
+            description=(
+                "The fraction of the new keys the filter takes for recent keys, which are then looked up in "
+                "VastDB. Lower rates take more memory."
+            ),
+            required=True,
+            default_value="0.001",
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        )
+
+        self.deduplication_state_directory = PropertyDescriptor(
+            name="Deduplication State Directory",
+            description=(
+                "A directory the filters of the recent keys are written to every minute, and read from when NiFi "
+                "restarts. Leave blank to start with empty filters."
+            ),
+            required=False,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        )
+
+        self.pipeline_block_size = PropertyDescriptor(
+            name="Pipeline Block Size",
+            description=(
+                "The incoming data is parsed and inserted in blocks of about this size, "
+                "so the next block is parsed while the previous one is being inserted.\n"
+                "Json is split at line boundaries, Parquet into batches of rows.\n"
+                "Column types are inferred per block, so Json blocks should be large enough to infer them reliably."
+            ),
+            required=True,
+            default_value="16 MB",
+            validators=[StandardValidators.DATA_SIZE_VALIDATOR],
+        )
+
+        self.pipeline_queue_size = PropertyDescriptor(
+            name="Pipeline Queue Size",
+            description="The maximum number of parsed blocks waiting to be inserted",
+            required=True,
+            default_value="2",
+            validators=[StandardValidators.POSITIVE_INTEGER_VALIDATOR],
+        )
+
+        self.batch_size = PropertyDescriptor(
+            name="Batch Size",
+            description=(
+                "The number of rows sent to VastDB per request, "
+                "or the initial number of rows when Adaptive Batch Size is True."
+            ),
+            required=True,
+            default_value="65536",
+            validators=[StandardValidators.POSITIVE_INTEGER_VALIDATOR],
+        )
+
+        self.adaptive_batch_size = PropertyDescriptor(
+            name="Adaptive Batch Size",
+            description=(
+                "Learn the number of rows per request for each table: it grows while the latency per row improves, "
+                "and is halved when a request times out or is too large for VastDB."
+            ),
+            allowable_values=["True", "False"],
+            required=True,
+            default_value="True",
+        )
+
+        self.stage_timings = stage_timings_property()
+
+        self.arrow_memory_tracking = arrow_memory_tracking_property()
+
+        (
+            self.arrow_memory_pool,
+            self.arrow_memory_budget,
+            self.release_arrow_memory,
+        ) = arrow_memory_properties(
+            "Larger FlowFiles are parsed and inserted in smaller blocks to fit the room left in it."
+        )
+
+        (
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
+        ) = profiling_properties()
+
         self.descriptors = [
             self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
             self.vastdb_credentials_provider_service,
             self.vastdb_bucket,
             self.vastdb_schema,
             self.vastdb_table,
             self.incoming_data_type,
+            self.compression,
             self.flatten_json,
+            self.json_schema,
+            self.unexpected_json_fields,
+            self.derived_columns,
+            self.sort_key_columns,
+            self.sorted_projection,
+            self.max_concurrent_tables,
+            self.invalid_rows,
+            self.max_invalid_rows,
+            self.deduplication_key_columns,
+            self.deduplication_window,
+            self.deduplication_capacity,
+            self.deduplication_false_positive_rate,
+            self.deduplication_state_directory,
+            self.pipeline_block_size,
+            self.pipeline_queue_size,
+            self.batch_size,
+            self.adaptive_batch_size,
+            self.stage_timings,
+            self.arrow_memory_tracking,
+            self.arrow_memory_pool,
+            self.arrow_memory_budget,
+            self.release_arrow_memory,
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
         ]
 
+        self.invalid = Relationship(
+            name="invalid",
+            description=(
+                "With Invalid Rows set to Route to Invalid, FlowFiles with rows that couldn't be parsed or inserted: "
+                "the invalid rows as line delimited Json, with their error in the vastdb.error field."
+            ),
+        )
+
     # Processor properties
     def getPropertyDescriptors(self):
         return self.descriptors
 
+    def customValidate(self, context):
+        return validate_profiling(context)
+
+    def getRelationships(self):
+        return [self.invalid]
+
+    def onStopped(self, context):
+        # The recent keys are kept for the next run, rather than up to a minute earlier
+        if context.getProperty(self.deduplication_state_directory.name).getValue():
+            save_key_filters()
+
+    def get_el_property(self, context, flowfile, property_name) -> str:
+        # Check if EL is present in the property value
+        if context.getProperty(property_name).isExpressionLanguagePresent():
+            return context.getProperty(property_name).evaluateAttributeExpressions(flowfile).getValue()
+        return context.getProperty(property_name).getValue()
+
+    def extract_derived_columns(self, context, flowfile):
+        derived_columns = self.get_el_property(context, flowfile, self.derived_columns.name)
+        try:
+            return parse_yaml_derived_columns(derived_columns) if derived_columns and derived_columns.strip() else []
+        except Exception as e:
+            error_message = f"Invalid Derived Columns yaml '{derived_columns}': {e}"
+            raise ValueError(error_message) from e
+
     def transform(self, context, flowfile):
+        with transform_profiler(context, "PutVastDB", self.logger).sample():
+            try:
+                return self.transform_flowfile(context, flowfile)
+            finally:
+                release_memory(context)
+
+    def transform_flowfile(self, context, flowfile):
         incoming_data_type = context.getProperty(self.incoming_data_type.name).getValue()
         flatten_json = context.getProperty(self.flatten_json.name).getValue()
+        block_size = int(context.getProperty(self.pipeline_block_size.name).asDataSize(DataUnit.B))
+        queue_size = int(context.getProperty(self.pipeline_queue_size.name).getValue())
 
-        session = self.get_vastdb_session(context)
-        if incoming_data_type == "Json Line Delimited":
-            pa_table = self.read_json(flowfile)
-        elif incoming_data_type == "Json Array":
-            pa_table = self.read_json_array(flowfile)
-        else:
-            pa_table = self.read_parquet(flowfile)
+        # The blocks queued, being parsed and being inserted have to fit in the memory budget
+        memory_governor = worker_memory_governor(context)
+        block_size = memory_governor.block_size(block_size, copies=queue_size + 2)
 
-        if flatten_json == "True":
+        timer = stage_timer(context)
+        with timer.stage("connect"):
+            session = get_vastdb_session(context, self.logger)
+
+        # The contents are read on this thread, only the parsing runs in the background
+        with timer.stage("read"):
+            file_contents = flowfile.getContentsAsBytes()
+        timer.add_bytes(len(file_contents))
+        invalid_rows = None
+        if context.getProperty(self.invalid_rows.name).getValue() == "Route to Invalid":
+            invalid_rows = InvalidRows(int(context.getProperty(self.max_invalid_rows.name).getValue()))
+        codec = content_codec(file_contents, context.getProperty(self.compression.name).getValue())
+        if incoming_data_type == "Parquet":
+            pa_tables = self.read_parquet(file_contents, block_size, codec)
+        else:
+            arrow_schema = self.json_table_schema(context, session, timer)
+            unexpected_fields = context.getProperty(self.unexpected_json_fields.name).getValue()
+            read_json = self.read_json if incoming_data_type == "Json Line Delimited" else self.read_json_array
+            pa_tables = read_json(file_contents, block_size, arrow_schema, unexpected_fields, invalid_rows, codec)
+
+        # Blocks are parsed and prepared on a background thread while the previous blocks are inserted
+        derived_columns = self.extract_derived_columns(context, flowfile)
+        sort_keys = self.extract_sort_keys(context)
+        deduplication_keys = self.extract_deduplication_keys(context)
+        duplicates = DuplicateRows() if deduplication_keys else None
+        now = datetime.datetime.now(datetime.timezone.utc)
+        prepared = (
+            self.prepare_table(
+                pa_table,
+                flatten_json=flatten_json == "True",
+                derived_columns=derived_columns,
+                sort_keys=sort_keys,
+                now=now,
+                deduplication_keys=deduplication_keys,
+                duplicates=duplicates,
+            )
+            for pa_table in pa_tables
+        )
+        blocks = pipelined(timer.timed("parse", prepared), queue_size)
+        try:
+            targets = self.write_to_vastdb(context, session, blocks, timer, invalid_rows, duplicates)
+        finally:
+            # Stops the parsing if the insert failed
+            blocks.close()
+        # With several tables, the batch size attributes are those of the table that received the most rows
+        target = max(targets, key=lambda target: target.rows, default=None)
+        sizer = target.sizer if target else self.batch_sizer(context, "insert")
+        attributes = {**sizer.attributes(), **stage_attributes(timer, self.logger)}
+        if context.getProperty(self.arrow_memory_tracking.name).getValue() == "True":
+            attributes.update(memory_governor.attributes())
+        if duplicates is not None:
+            attributes.update(duplicates.attributes())
+        if invalid_rows:
+            # The valid rows were inserted, the FlowFile continues with the invalid ones
+            self.logger.info(f"Routing {len(invalid_rows)} invalid rows to invalid")
+            attributes["vastdb.invalid.rows"] = str(len(invalid_rows))
+            return FlowFileTransformResult(
+                relationship="invalid", contents=invalid_rows.to_json(), attributes=attributes
+            )
+        return FlowFileTransformResult(relationship="success", attributes=attributes)
+
+    def prepare_table(
+        self,
+        pa_table,
+        *,
+        flatten_json,
+        derived_columns=(),
+        sort_keys=(),
+        now=None,
+        deduplication_keys=(),
+        duplicates=None,
+    ):
+        if flatten_json:
             pa_table = pa_table.flatten()
 
         schema = pa_table.schema
@@ -123,22 +514,56 @@ class PutVastDB(FlowFileTransform):
         schema_names_set = set(schema.names)
 
         # Create a new table by dropping null-typed fields
-        pa_table_without_nulls = pa_table.drop(list(schema_names_set.difference(fields_to_keep)))
-
-        # failed_batches = self.write_to_vastdb(context, session, pa_table)
-        self.write_to_vastdb(context, session, pa_table_without_nulls)
-        return FlowFileTransformResult(relationship="success")
+        pa_table = pa_table.drop(list(schema_names_set.difference(fields_to_keep)))
+
+        # The derived columns are computed over the whole block, in the same pass as the parsing
+        if derived_columns:
+            pa_table = add_derived_columns(pa_table, derived_columns, now=now)
+        # Blocks lack the key columns that were null in every row, their rows have no key
+        if deduplication_keys and all(column in pa_table.column_names for column in deduplication_keys):
+            num_rows = pa_table.num_rows
+            pa_table = drop_duplicates(pa_table, deduplication_keys)
+            if duplicates is not None:
+                duplicates.add(in_blocks=num_rows - pa_table.num_rows)
+        return self.sort_table(pa_table, sort_keys)
+
+    def extract_sort_keys(self, context):
+        sort_key_data = context.getProperty(self.sort_key_columns.name).getValue() or ""
+
+        # Split, filter out empty columns, and strip whitespace
+        return [col.strip() for col in sort_key_data.split(",") if col.strip()]
+
+    def extract_deduplication_keys(self, context):
+        key_data = context.getProperty(self.deduplication_key_columns.name).getValue() or ""
+        return [col.strip() for col in key_data.split(",") if col.strip()]
+
+    def sort_table(self, pa_table, sort_keys):
+        """Sorts the rows by the sort key columns, which blocks may lack, e.g. when they were null in every row."""
+        import pyarrow.compute as pc
+
+        sort_keys = [(column, "ascending") for column in sort_keys if column in pa_table.column_names]
+        if not sort_keys:
+            return pa_table
+        # take() gathers the columns in the sorted order, without sorting each column separately
+        return pa_table.take(pc.sort_indices(pa_table, sort_keys=sort_keys, null_placement="at_end"))
+
+    def read_parquet(self, file_contents, block_size, codec=None):
+        import pyarrow.parquet as pq
 
-    def read_parquet(self, flowfile):
         try:
-            # Read the FlowFile contents into a byte array
-            file_contents = flowfile.getContentsAsBytes()
-
-            # Create a BytesIO object from the byte array
-            buffer = io.BytesIO(file_contents)
-
-            # Read the Parquet data from the buffer
-            return pq.read_table(buffer)
+            # Parquet is read from its footer, so compressed Parquet is decompressed whole, on the parsing thread
+            file_contents = decompress(file_contents, codec)
+            # Read the Parquet data from the buffer, in batches of about block_size bytes
+            parquet_file = pq.ParquetFile(pa.BufferReader(file_contents))
+            metadata = parquet_file.metadata
+            total_byte_size = sum(metadata.row_group(i).total_byte_size for i in range(metadata.num_row_groups))
+            rows_per_block = max(1, block_size * metadata.num_rows // max(total_byte_size, 1))
+
+            if metadata.num_rows == 0:
+                # Still yield the schema, so the table is created
+                yield parquet_file.schema_arrow.empty_table()
+            for batch in parquet_file.iter_batches(batch_size=rows_per_block):
+                yield pa.Table.from_batches([batch])
         except Exception as e:
             error_message = (
                 f"{e}.  Ensure your parquet is valid and meets pyarrow's requirements."
@@ -146,73 +571,329 @@ class PutVastDB(FlowFileTransform):
             )
             raise RuntimeError(error_message) from e
 
-    def read_json_array(self, flowfile):
-        json_str = "\n".join(json.dumps(item) for item in json.loads(flowfile.getContentsAsBytes()))
-        try:
-            return pa_json.read_json(io.BytesIO(json_str.encode("utf-8")))
-        except Exception as e:
-            error_message = (
-                f"{e}.  Ensure your json is valid and meets pyarrow's requirements."
-                f"\nSee: https://arrow.apache.org/docs/python/json.html#reading-json-files"
-            )
-            raise RuntimeError(error_message) from e
-
-    def read_json(self, flowfile):
-        try:
-            return pa_json.read_json(io.BytesIO(flowfile.getContentsAsBytes()))
-        except Exception as e:
-            error_message = (
-                f"{e}.  Ensure your json is valid and meets pyarrow's requirements."
-                f"\nSee: https://arrow.apache.org/docs/python/json.html#reading-json-files"
-            )
-            raise RuntimeError(error_message) from e
+    def read_json_array(
+        self, file_contents, block_size, arrow_schema=None, unexpected_fields="Infer", invalid_rows=None, codec=None
+    ):
+        json_str = "\n".join(json.dumps(item) for item in json.loads(decompress(file_contents, codec)))
+        blocks = split_lines(json_str.encode("utf-8"), block_size)
+        yield from self.read_json_blocks(blocks, arrow_schema, unexpected_fields, invalid_rows)
+
+    def read_json(
+        self, file_contents, block_size, arrow_schema=None, unexpected_fields="Infer", invalid_rows=None, codec=None
+    ):
+        if codec is None:
+            blocks = split_lines(file_contents, block_size)
+        else:
+            # Only the block being parsed is held decompressed
+            blocks = decompressed_lines(file_contents, codec, block_size)
+        yield from self.read_json_blocks(blocks, arrow_schema, unexpected_fields, invalid_rows)
+
+    def read_json_blocks(self, blocks, arrow_schema, unexpected_fields, invalid_rows=None):
+        def parse(block):
+            return parse_json(block, arrow_schema, unexpected_fields=unexpected_fields)
+
+        for block in blocks:
+            if invalid_rows is not None:
+                # Malformed lines are diverted to the invalid rows
+                yield from parse_isolating(block, parse, invalid_rows)
+                continue
+            try:
+                yield parse(block)
+            except Exception as e:
+                error_message = (
+                    f"{e}.  Ensure your json is valid and meets pyarrow's requirements."
+                    f"\nSee: https://arrow.apache.org/docs/python/json.html#reading-json-files"
+                )
+                raise RuntimeError(error_message) from e
+
+    def table_key(self, context, table_name=None):
+        return (
+            context.getProperty(self.vastdb_endpoint.name).getValue(),
+            context.getProperty(self.vastdb_bucket.name).getValue(),
+            context.getProperty(self.vastdb_schema.name).getValue(),
+            table_name or context.getProperty(self.vastdb_table.name).getValue(),
+        )
 
-    def get_vastdb_session(self, context):
-        vastdb_endpoint = context.getProperty(self.vastdb_endpoint.name).getValue()
-        credentials_provider_service = context.getProperty(
-            self.vastdb_credentials_provider_service.name
-        ).asControllerService()
-        credentials = credentials_provider_service.getAwsCredentialsProvider().resolveCredentials()
+    def table_name_template(self, context):
+        return TableNameTemplate(context.getProperty(self.vastdb_table.name).getValue())
 
-        try:
-            session = vastdb.connect(
-                endpoint=vastdb_endpoint, access=credentials.accessKeyId(), secret=credentials.secretAccessKey()
-            )
-            self.logger.info("Connected to VastDB")
-        except Exception as e:
-            error_message = f"Failed to connect to VastDB: {e}"
-            raise RuntimeError(error_message) from e
-        else:
-            return session
+    def json_table_schema(self, context, session, timer):
+        """Returns the schema to parse Json with: the target table's with Table Schema, or None to infer the types."""
+        if context.getProperty(self.json_schema.name).getValue() != "Table Schema":
+            return None
+        # The rows routed to several tables are parsed before their table is known
+        if self.table_name_template(context).columns:
+            return None
+        return get_table_schema(self.table_key(context), lambda: self.load_table_schema(context, session, timer))
 
-    def write_to_vastdb(self, context, session, pa_table):
+    def load_table_schema(self, context, session, timer):
         vastdb_bucket = context.getProperty(self.vastdb_bucket.name).getValue()
         vastdb_schema = context.getProperty(self.vastdb_schema.name).getValue()
         vastdb_table = context.getProperty(self.vastdb_table.name).getValue()
-        # batch_size = int(context.getProperty(self.batch_size.name).getValue())
 
-        with session.transaction() as tx:
-            bucket: vastdb.bucket.Bucket = tx.bucket(vastdb_bucket)
-            schema: vastdb.schema.Schema = bucket.schema(vastdb_schema, fail_if_missing=False)
+        with timer.stage("metadata"), session.transaction() as tx:
+            schema: vastdb.schema.Schema = tx.bucket(vastdb_bucket).schema(vastdb_schema, fail_if_missing=False)
             if schema is None:
+                return None
+            table: vastdb.table.Table = schema.table(vastdb_table, fail_if_missing=False)
+            # A table that doesn't exist yet is created from the inferred types
+            return None if table is None else table.arrow_schema
+
+    def batch_sizer(self, context, operation, table_name=None):
+        """Returns the batch sizer learning the number of rows per request for a table, e.g. a routed table."""
+        key = (*self.table_key(context, table_name), operation)
+        batch_size = int(context.getProperty(self.batch_size.name).getValue())
+        adaptive = context.getProperty(self.adaptive_batch_size.name).getValue() == "True"
+        return get_batch_sizer(key, batch_size, adaptive=adaptive)
+
+    def key_filter(self, context, table_name):
+        """Returns the filter of the keys recently inserted into a table."""
+        return get_key_filter(
+            self.table_key(context, table_name),
+            int(context.getProperty(self.deduplication_capacity.name).getValue()),
+            float(context.getProperty(self.deduplication_false_positive_rate.name).getValue()),
+            context.getProperty(self.deduplication_window.name).asTimePeriod(TimeUnit.SECONDS),
+            context.getProperty(self.deduplication_state_directory.name).getValue(),
+        )
+
+    def write_to_vastdb(self, context, session, pa_tables, timer, invalid_rows=None, duplicates=None):
+        """
+        Inserts the blocks into the tables they are routed to, and returns the tables written.
+
+        Each table is written in a transaction and a session of its own, as the SDK's sessions and transactions
+        aren't safe to share between the threads inserting into several tables at once.  The transactions are
+        committed together when every block was inserted, or rolled back.
+        """
+        vastdb_bucket = context.getProperty(self.vastdb_bucket.name).getValue()
+        vastdb_schema = context.getProperty(self.vastdb_schema.name).getValue()
+        max_concurrent_tables = int(context.getProperty(self.max_concurrent_tables.name).getValue())
+        template = self.table_name_template(context)
+
+        # The tables' transactions must see the schema, so it is created in a transaction of its own
+        with timer.stage("metadata"), session.transaction() as tx:
+            bucket: vastdb.bucket.Bucket = tx.bucket(vastdb_bucket)
+            if bucket.schema(vastdb_schema, fail_if_missing=False) is None:
                 self.logger.info(f"Creating schema {vastdb_schema}")
-                schema = bucket.create_schema(vastdb_schema)
+                bucket.create_schema(vastdb_schema)
+
+        # The tables written by this FlowFile, each looked up or created once
+        tables = {}
+        tables_lock = threading.Lock()
+        sessions = [session]
+
+        with ExitStack() as transactions:
+
+            def open_schema():
+                """Returns the schema in a new transaction, of the FlowFile's session for the first table."""
+                with tables_lock:
+                    table_session = sessions.pop() if sessions else None
+                if table_session is None:
+                    with timer.stage("connect"):
+                        table_session = get_vastdb_session(context, self.logger)
+                with tables_lock:
+                    tx = transactions.enter_context(table_session.transaction())
+                return tx.bucket(vastdb_bucket).schema(vastdb_schema)
+
+            executor = None
+            try:
+                for pa_table in pa_tables:
+                    with timer.stage("route"):
+                        partitions = list(template.split(pa_table))
+                    if len(partitions) > 1 and max_concurrent_tables > 1:
+                        if executor is None:
+                            executor = ThreadPoolExecutor(max_concurrent_tables, thread_name_prefix="vastdb-put")
+                        futures = [
+                            executor.submit(
+                                self.insert_rows,
+                                context,
+                                open_schema,
+                                tables,
+                                tables_lock,
+                                name,
+                                rows,
+                                timer,
+                                invalid_rows,
+                                duplicates,
+                            )
+                            for name, rows in partitions
+                        ]
+                        for future in futures:
+                            future.result()
+                    else:
+                        for name, rows in partitions:
+                            self.insert_rows(
+                                context, open_schema, tables, tables_lock, name, rows, timer, invalid_rows, duplicates
+                            )
+            finally:
+                if executor is not None:
+                    executor.shutdown(cancel_futures=True)
+        return list(tables.values())
+
+    def insert_rows(
+        self,
+        context,
+        open_schema,
+        tables,
+        tables_lock,
+        table_name,
+        pa_table,
+        timer,
+        invalid_rows=None,
+        duplicates=None,
+    ):
+        """
+        Inserts rows into a table, creating the table or adding the columns it lacks first.
 
-            table: vastdb.table.Table = schema.table(vastdb_table, fail_if_missing=False)
+        The rows of a table are never inserted by two threads at once: the tables of a block are all different.
+        """
+        with tables_lock:
+            target = tables.get(table_name)
+        if target is None:
+            schema = open_schema()
+            with timer.stage("metadata"):
+                table = schema.table(table_name, fail_if_missing=False)
             if table is None:
-                self.logger.info(f"Creating table {vastdb_table}")
+                self.logger.info(f"Creating table {table_name}")
                 try:
-                    table = schema.create_table(vastdb_table, pa_table.schema)
+                    with timer.stage("metadata"):
+                        table = schema.create_table(table_name, pa_table.schema)
+                        self.create_sorted_projection(context, table)
                 except Exception as e:
-                    error_message = f"Error creating table '{vastdb_table}' with schema {pa_table.schema}: {e}"
+                    error_message = f"Error creating table '{table_name}' with schema {pa_table.schema}: {e}"
                     raise RuntimeError(error_message) from e
-
-            columns_to_add = self.get_columns_to_add(table.arrow_schema, pa_table.schema)
+            target = SimpleNamespace(table=table, sizer=self.batch_sizer(context, "insert", table_name), rows=0)
+            with tables_lock:
+                tables[table_name] = target
+        table, sizer = target.table, target.sizer
+
+        # Each block may bring new columns, e.g. a column that was all null in the previous blocks
+        columns_to_add = self.get_columns_to_add(table.arrow_schema, pa_table.schema)
+        with timer.stage("add_column"):
             for column in columns_to_add:
-                self.logger.info(f"Adding column {column} to table {vastdb_table}")
+                self.logger.info(f"Adding column {column} to table {table_name}")
                 table.add_column(column)
+        # The next FlowFiles parse Json with the table's current columns
+        table_schema = table.arrow_schema
+        update_table_schema(self.table_key(context, table_name), table_schema)
+
+        def insert(rows):
+            # Each block's types are inferred separately, e.g. a later block may parse an int64 column as double
+            return table.insert(self.cast_to_table(rows, table_schema, table_name))
+
+        key_hashes = None
+        if duplicates is not None:
+            pa_table, key_hashes = self.drop_inserted_rows(context, table, table_name, pa_table, duplicates, timer)
+
+        with timer.stage("insert"):
+            if invalid_rows is None:
+                sizer.write(pa_table, insert)
+            else:
+                # Rows that can't be cast, e.g. text in an integer column, are isolated like the rows VastDB rejects
+                sizer.write(pa_table, lambda rows: self.insert_isolating(insert, rows, invalid_rows))
+        timer.add_rows(pa_table.num_rows)
+        target.rows += pa_table.num_rows
+        if key_hashes is not None:
+            with timer.stage("dedup"):
+                self.key_filter(context, table_name).add(key_hashes)
+
+    def cast_to_table(self, pa_table, table_schema, table_name):
+        """Casts the rows to the types of the table's columns."""
+        arrow_schema = pa.schema([table_schema.field(name) for name in pa_table.column_names])
+        if pa_table.schema.equals(arrow_schema):
+            return pa_table
+        try:
+            return pa_table.cast(arrow_schema)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            error_message = f"Error casting the rows to the columns of table '{table_name}' {arrow_schema}: {e}"
+            raise RuntimeError(error_message) from e
 
-            table.insert(pa_table)
+    def drop_inserted_rows(self, context, table, table_name, pa_table, duplicates, timer):
+        """
+        Drops the rows whose key was inserted by a recent FlowFile, returning the rows left and their key hashes.
+
+        The key filter finds the rows that may have been inserted, and only their keys are looked up in the table,
+        so new keys cost no VastDB request.  FlowFiles inserting the same new key concurrently may both insert it.
+        """
+        import numpy as np
+
+        key_columns = self.extract_deduplication_keys(context)
+        if pa_table.num_rows == 0 or not all(column in pa_table.column_names for column in key_columns):
+            return pa_table, None
+        with timer.stage("dedup"):
+            key_hashes = hash_columns(pa_table, key_columns).to_numpy()
+            candidates = self.key_filter(context, table_name).might_contain(key_hashes)
+            candidates &= ~null_keys(pa_table, key_columns).to_numpy(zero_copy_only=False)
+        if not candidates.any():
+            return pa_table, key_hashes
+
+        candidate_rows = np.flatnonzero(candidates)
+        candidate_keys = [tuple(row.values()) for row in pa_table.select(key_columns).take(candidate_rows).to_pylist()]
+        with timer.stage("probe"):
+            inserted = self.find_inserted_keys(table, key_columns, set(candidate_keys))
+        keep = np.ones(pa_table.num_rows, bool)
+        for row, key in zip(candidate_rows, candidate_keys):
+            if key in inserted:
+                keep[row] = False
+        num_inserted = pa_table.num_rows - int(keep.sum())
+        duplicates.add(inserted=num_inserted, probed=len(candidate_rows))
+        if num_inserted:
+            self.logger.info(f"Dropping {num_inserted} rows already inserted into table '{table_name}'")
+            pa_table = pa_table.filter(pa.array(keep))
+        return pa_table, key_hashes[keep]
+
+    def find_inserted_keys(self, table, key_columns, keys):
+        """
+        Returns the keys found in the table, looked up with an isin predicate per key column in chunks.
+
+        A chunk of dense integer keys, e.g. sequential IDs, is looked up as a range instead, which costs less to
+        send than the list of its values and reads at most twice as many rows.
+        """
+        keys = sorted(keys)
+        inserted = set()
+        for start in range(0, len(keys), PROBE_BATCH_SIZE):
+            chunk = keys[start : start + PROBE_BATCH_SIZE]
+            first, last = chunk[0][0], chunk[-1][0]
+            if len(key_columns) == 1 and type(first) is int and last - first < 2 * len(chunk):
+                leaves = [{"column": key_columns[0], "op": "between", "value": [first, last]}]
+            else:
+                leaves = [
+                    {"column": column, "op": "isin", "value": sorted({key[index] for key in chunk})}
+                    for index, column in enumerate(key_columns)
+                ]
+            predicate = parse_predicate({"and": leaves})
+            found = table.select(columns=key_columns, predicate=predicate).read_all()
+            # Ranges, and isin predicates on several key columns, also match keys that aren't in the chunk
+            inserted.update(tuple(row[column] for column in key_columns) for row in found.to_pylist())
+        return inserted & set(keys)
+
+    def insert_isolating(self, insert, pa_table, invalid_rows):
+        """Inserts rows, splitting the requests that fail until the invalid rows are found."""
+        from vastdb.util import MAX_RECORD_BATCH_SLICE_SIZE
+
+        write_isolating(
+            pa_table,
+            insert,
+            invalid_rows,
+            # Requests too large or timed out are retried by the batch sizer, and an unavailable endpoint fails the
+            # FlowFile, rather than sending its good rows to invalid
+            isolate=lambda error: not (is_size_error(error) or is_timeout_error(error) or is_connection_error(error)),
+            # With room for the serialization overhead, so the SDK sends each part as one request
+            max_request_bytes=MAX_RECORD_BATCH_SLICE_SIZE // 2,
+        )
+
+    def create_sorted_projection(self, context, table):
+        """Creates a semi-sorted projection of a new table, sorted by the sort key columns."""
+        sort_keys = [column for column in self.extract_sort_keys(context) if column in table.arrow_schema.names]
+        if context.getProperty(self.sorted_projection.name).getValue() != "True" or not sort_keys:
+            return
+        projection_name = f"sorted_by_{'_'.join(sort_keys)}"
+        unsorted_columns = [column for column in table.arrow_schema.names if column not in sort_keys]
+        self.logger.info(f"Creating projection {projection_name} of table {table.name} sorted by {sort_keys}")
+        try:
+            table.create_projection(projection_name, sort_keys, unsorted_columns)
+        except Exception as e:
+            error_message = f"Error creating projection '{projection_name}' of table '{table.name}': {e}"
+            raise RuntimeError(error_message) from e
 
     def get_columns_to_add(self, existing_schema, desired_schema):
         """
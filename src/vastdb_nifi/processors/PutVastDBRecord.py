@@ -0,0 +1,221 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import json
+from typing import TYPE_CHECKING
+
+import pyarrow as pa
+from batch_sizing import get_batch_sizer
+from common_properties import (
+    connection_properties,
+    get_vastdb_session,
+    profiling_properties,
+    stage_timer,
+    stage_timings_property,
+    transform_profiler,
+    validate_profiling,
+)
+from nifiapi.properties import PropertyDescriptor, StandardValidators
+from nifiapi.recordtransform import RecordTransform, RecordTransformResult
+from record_schema import get_arrow_schema, records_to_table
+
+if TYPE_CHECKING:
+    import vastdb
+
+# transformRecord() is overridden as it is in NiFi 2.0.0's RecordTransform, which wraps each result with
+# __RecordTransformResult__.  NiFi versions without it fall back to its transformRecord(), calling transform().
+try:
+    from nifiapi.recordtransform import __RecordTransformResult__
+except ImportError:
+    __RecordTransformResult__ = None
+
+
+class PutVastDBRecord(RecordTransform):
+    class Java:
+        implements = ["org.apache.nifi.python.processor.RecordTransform"]
+
+    class ProcessorDetails:
+        dependencies = ["vastdb", "pyarrow"]
+        version = "{{version}}"  # auto generated - do not edit
+        tags = ["vastdb", "arrow", "record"]
+        description = """Writes the records read by a Record Reader, e.g. Avro or CSV, to a Vast DB table."""
+
+    # ruff: noqa: ARG002
+    def __init__(self, **kwargs):
+        super().__init__()
+        (
+            self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
+            self.vastdb_credentials_provider_service,
+        ) = connection_properties()
+
+        self.vastdb_bucket = PropertyDescriptor(
+            name="VastDB Bucket",
+            description="The VastDB bucket to write to",
+            required=True,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        )
+
+        self.vastdb_schema = PropertyDescriptor(
+            name="VastDB Database Schema",
+            description="The VastDB database schema to write to",
+            required=True,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        )
+
+        self.vastdb_table = PropertyDescriptor(
+            name="VastDB Table Name",
+            description="The VastDB table name to write to",
+            required=True,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        )
+
+        self.batch_size = PropertyDescriptor(
+            name="Batch Size",
+            description=(
+                "The number of rows sent to VastDB per request, "
+                "or the initial number of rows when Adaptive Batch Size is True."
+            ),
+            required=True,
+            default_value="65536",
+            validators=[StandardValidators.POSITIVE_INTEGER_VALIDATOR],
+        )
+
+        self.adaptive_batch_size = PropertyDescriptor(
+            name="Adaptive Batch Size",
+            description=(
+                "Learn the number of rows per request for each table: it grows while the latency per row improves, "
+                "and is halved when a request times out or is too large for VastDB."
+            ),
+            allowable_values=["True", "False"],
+            required=True,
+            default_value="True",
+        )
+
+        self.stage_timings = stage_timings_property(
+            description=(
+                "Time each processing stage (e.g. converting the records, connecting and the VastDB requests) "
+                "and log the timings in milliseconds, with the rows processed, at the info level."
+            )
+        )
+
+        (
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
+        ) = profiling_properties("record batches", "batch")
+
+        self.descriptors = [
+            self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
+            self.vastdb_credentials_provider_service,
+            self.vastdb_bucket,
+            self.vastdb_schema,
+            self.vastdb_table,
+            self.batch_size,
+            self.adaptive_batch_size,
+            self.stage_timings,
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
+        ]
+
+    # Processor properties
+    def getPropertyDescriptors(self):
+        return self.descriptors
+
+    def customValidate(self, context):
+        return validate_profiling(context)
+
+    def transformRecord(self, jsonarray, schema, attributemap):
+        """
+        Inserts a batch of records, as NiFi passes them from the Record Reader, with one Arrow conversion.
+
+        NiFi's RecordTransform would call transform() for each record, and insert them one at a time.  The
+        records are passed on unchanged to the Record Writer.  This relies on the internals of NiFi 2.0.0's
+        RecordTransform, and other versions insert the records one at a time, see `__RecordTransformResult__`.
+        """
+        if __RecordTransformResult__ is None:
+            return super().transformRecord(jsonarray, schema, attributemap)
+
+        context = self.process_context
+        with transform_profiler(context, "PutVastDBRecord", self.logger).sample():
+            records = json.loads(jsonarray)
+            self.insert_records(context, records, schema)
+
+            results = self.arrayList()
+            result = RecordTransformResult(schema=schema, relationship="success")
+            for record in records:
+                results.add(__RecordTransformResult__(result, json.dumps(record)))
+            return results
+
+    def transform(self, context, record, schema, attributemap):
+        self.insert_records(context, [record], schema)
+        return RecordTransformResult(record=record, schema=schema, relationship="success")
+
+    def insert_records(self, context, records, schema):
+        timer = stage_timer(context, track_memory=False)
+        with timer.stage("convert"):
+            pa_table = records_to_table(records, get_arrow_schema(schema))
+
+        with timer.stage("connect"):
+            session = get_vastdb_session(context, self.logger)
+        sizer = self.batch_sizer(context, "insert")
+        self.write_to_vastdb(context, session, pa_table, sizer, timer)
+        if timer.enabled:
+            self.logger.info(f"Stage timings: {timer.summary()}")
+
+    def batch_sizer(self, context, operation):
+        """Returns the batch sizer learning the number of rows per request for the target table."""
+        key = (
+            context.getProperty(self.vastdb_endpoint.name).getValue(),
+            context.getProperty(self.vastdb_bucket.name).getValue(),
+            context.getProperty(self.vastdb_schema.name).getValue(),
+            context.getProperty(self.vastdb_table.name).getValue(),
+            operation,
+        )
+        batch_size = int(context.getProperty(self.batch_size.name).getValue())
+        adaptive = context.getProperty(self.adaptive_batch_size.name).getValue() == "True"
+        return get_batch_sizer(key, batch_size, adaptive=adaptive)
+
+    def write_to_vastdb(self, context, session, pa_table, sizer, timer):
+        vastdb_bucket = context.getProperty(self.vastdb_bucket.name).getValue()
+        vastdb_schema = context.getProperty(self.vastdb_schema.name).getValue()
+        vastdb_table = context.getProperty(self.vastdb_table.name).getValue()
+
+        with session.transaction() as tx:
+            with timer.stage("metadata"):
+                bucket: vastdb.bucket.Bucket = tx.bucket(vastdb_bucket)
+                schema: vastdb.schema.Schema = bucket.schema(vastdb_schema, fail_if_missing=False)
+                if schema is None:
+                    self.logger.info(f"Creating schema {vastdb_schema}")
+                    schema = bucket.create_schema(vastdb_schema)
+
+                table: vastdb.table.Table = schema.table(vastdb_table, fail_if_missing=False)
+                if table is None:
+                    self.logger.info(f"Creating table {vastdb_table}")
+                    try:
+                        table = schema.create_table(vastdb_table, pa_table.schema)
+                    except Exception as e:
+                        error_message = f"Error creating table '{vastdb_table}' with schema {pa_table.schema}: {e}"
+                        raise RuntimeError(error_message) from e
+
+            with timer.stage("add_column"):
+                for field in pa_table.schema:
+                    if field.name not in table.arrow_schema.names:
+                        self.logger.info(f"Adding column {field.name} to table {vastdb_table}")
+                        table.add_column(pa.schema([pa.field(field.name, field.type)]))
+
+            # The records' types may differ from the columns', e.g. an INT field written to an int64 column
+            table_schema = table.arrow_schema
+            pa_table = pa_table.cast(pa.schema([table_schema.field(name) for name in pa_table.column_names]))
+
+            self.logger.info(f"Inserting '{pa_table.num_rows}' records into table '{vastdb_table}'.")
+            with timer.stage("insert"):
+                sizer.write(pa_table, table.insert)
+            timer.add_rows(pa_table.num_rows)
@@ -0,0 +1,246 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import json
+from typing import TYPE_CHECKING
+
+import pyarrow as pa
+from common_properties import (
+    connection_properties,
+    get_vastdb_session,
+    profiling_properties,
+    query_config,
+    stage_timer,
+    stage_timings_property,
+    transform_profiler,
+    validate_profiling,
+)
+from nifiapi.properties import ExpressionLanguageScope, PropertyDescriptor, StandardValidators
+from nifiapi.recordtransform import RecordTransform, RecordTransformResult, __RecordTransformResult__
+from predicate_parser import parse_yaml_predicate
+from record_schema import table_to_records
+
+if TYPE_CHECKING:
+    import vastdb
+
+
+class QueryVastDBRecord(RecordTransform):
+    class Java:
+        implements = ["org.apache.nifi.python.processor.RecordTransform"]
+
+    class ProcessorDetails:
+        dependencies = ["vastdb", "pyarrow"]
+        version = "{{version}}"  # auto generated - do not edit
+        tags = ["vastdb", "arrow", "record", "query"]
+        description = """Queries a Vast DB table for each batch of incoming records, and writes the matching rows with a Record Writer."""
+
+    # ruff: noqa: ARG002
+    def __init__(self, **kwargs):
+        super().__init__()
+        (
+            self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
+            self.vastdb_credentials_provider_service,
+        ) = connection_properties()
+
+        self.vastdb_bucket = PropertyDescriptor(
+            name="VastDB Bucket",
+            description="The VastDB bucket to query",
+            required=True,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        )
+
+        self.vastdb_schema = PropertyDescriptor(
+            name="VastDB Database Schema",
+            description="The VastDB database schema to query",
+            required=True,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        )
+
+        self.vastdb_table = PropertyDescriptor(
+            name="VastDB Table Name",
+            description="The VastDB table name to query",
+            required=True,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        )
+
+        self.vastdb_columns = PropertyDescriptor(
+            name="Columns",
+            description="List of Columns to select (seperated by commas), or leave blank to select all columns",
+            required=False,
+            expression_language_scope=ExpressionLanguageScope.FLOWFILE_ATTRIBUTES,
+        )
+
+        self.vastdb_predicates = PropertyDescriptor(
+            name="Predicates",
+            description=(
+                "Predicates yaml, as QueryVastDBTable's. The values of 'isin' predicates with "
+                "'value_from: content' are the Value Field of the incoming records."
+            ),
+            required=True,
+            expression_language_scope=ExpressionLanguageScope.FLOWFILE_ATTRIBUTES,
+        )
+
+        self.value_field = PropertyDescriptor(
+            name="Value Field",
+            description=(
+                "The incoming record field whose values, of all the records of a batch, are the values of the "
+                "'isin' predicates with 'value_from: content'. The batch is then queried at once."
+            ),
+            required=False,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        )
+
+        self.max_rows = PropertyDescriptor(
+            name="Max Rows",
+            description=(
+                "Maximum number of rows to return for each batch of incoming records.  The scan is stopped as soon "
+                "as this many matching rows have been read.  Leave blank to return all matching rows."
+            ),
+            required=False,
+            validators=[StandardValidators.POSITIVE_INTEGER_VALIDATOR],
+        )
+
+        self.stage_timings = stage_timings_property(
+            description=(
+                "Time each processing stage (e.g. connecting, the VastDB query and converting the rows to records) "
+                "and log the timings in milliseconds, with the rows processed, at the info level."
+            )
+        )
+
+        (
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
+        ) = profiling_properties("record batches", "batch")
+
+        self.descriptors = [
+            self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
+            self.vastdb_credentials_provider_service,
+            self.vastdb_bucket,
+            self.vastdb_schema,
+            self.vastdb_table,
+            self.vastdb_columns,
+            self.vastdb_predicates,
+            self.value_field,
+            self.max_rows,
+            self.stage_timings,
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
+        ]
+
+    # Processor properties
+    def getPropertyDescriptors(self):
+        return self.descriptors
+
+    def customValidate(self, context):
+        return validate_profiling(context)
+
+    def get_el_property(self, context, attributemap, property_name) -> str:
+        # Check if EL is present in the property value
+        if context.getProperty(property_name).isExpressionLanguagePresent():
+            return context.getProperty(property_name).evaluateAttributeExpressions(attributemap).getValue()
+        return context.getProperty(property_name).getValue()
+
+    def transformRecord(self, jsonarray, schema, attributemap):
+        """
+        Queries the table once for a batch of records, as NiFi passes them from the Record Reader.
+
+        NiFi's RecordTransform would call transform() for each record, which returns a single record rather
+        than the rows matching it.  The matching rows are passed to the Record Writer.
+        """
+        context = self.process_context
+        with transform_profiler(context, "QueryVastDBRecord", self.logger).sample():
+            timer = stage_timer(context, track_memory=False)
+            value_field = context.getProperty(self.value_field.name).getValue()
+            records = json.loads(jsonarray)
+            values = [record.get(value_field) for record in records] if value_field else None
+
+            with timer.stage("connect"):
+                session = get_vastdb_session(context, self.logger)
+            pa_table = self.query_vastdb(context, attributemap, session, values, timer)
+            timer.add_rows(pa_table.num_rows)
+
+            with timer.stage("serialize"):
+                rows = table_to_records(pa_table)
+            if timer.enabled:
+                self.logger.info(f"Stage timings: {timer.summary()}")
+
+            results = self.arrayList()
+            result = RecordTransformResult(relationship="success")
+            for row in rows:
+                results.add(__RecordTransformResult__(result, row))
+            return results
+
+    def transform(self, context, record, schema, attributemap):
+        error_message = "QueryVastDBRecord queries batches of records in transformRecord()"
+        raise NotImplementedError(error_message)
+
+    def extract_column_list(self, context, attributemap):
+        vastdb_columns_data = self.get_el_property(context, attributemap, self.vastdb_columns.name) or ""
+        column_list = [col.strip() for col in vastdb_columns_data.split(",") if col.strip()]
+        return column_list or None
+
+    def read_rows(self, reader, max_rows=None):
+        """Reads the query result, stopping as soon as max_rows rows have been read."""
+        batches = []
+        num_rows = 0
+        try:
+            for batch in reader:
+                if max_rows is not None and num_rows + batch.num_rows >= max_rows:
+                    batches.append(batch.slice(0, max_rows - num_rows))
+                    break
+                batches.append(batch)
+                num_rows += batch.num_rows
+        finally:
+            reader.close()
+        return pa.Table.from_batches(batches, schema=reader.schema)
+
+    def query_vastdb(self, context, attributemap, session, values, timer):
+        vastdb_bucket = context.getProperty(self.vastdb_bucket.name).getValue()
+        vastdb_schema = context.getProperty(self.vastdb_schema.name).getValue()
+        vastdb_table = context.getProperty(self.vastdb_table.name).getValue()
+        vastdb_column_list = self.extract_column_list(context, attributemap)
+        vastdb_predicate = self.get_el_property(context, attributemap, self.vastdb_predicates.name)
+        max_rows = context.getProperty(self.max_rows.name).getValue()
+        max_rows = int(max_rows) if max_rows else None
+
+        with session.transaction() as tx:
+            with timer.stage("metadata"):
+                bucket: vastdb.bucket.Bucket = tx.bucket(vastdb_bucket)
+                schema: vastdb.schema.Schema = bucket.schema(vastdb_schema, fail_if_missing=True)
+                table: vastdb.table.Table = schema.table(vastdb_table, fail_if_missing=True)
+
+            with timer.stage("predicate"):
+                ibis_expr = parse_yaml_predicate(
+                    vastdb_predicate, content_values=None if values is None else lambda: values
+                )
+
+            log_message = (
+                f"Selecting from table '{table.name}' columns '{vastdb_column_list}' "
+                f"with yaml: '{vastdb_predicate}' translated to ibis '{ibis_expr!s}'"
+            )
+            self.logger.info(log_message)
+
+            if ibis_expr is False:
+                self.logger.info(f"Predicate can never match, skipping the scan of table '{table.name}'")
+                return pa.table({})
+
+            config = query_config(context)
+            try:
+                with timer.stage("select"):
+                    reader = table.select(columns=vastdb_column_list, predicate=ibis_expr, config=config)
+                    return self.read_rows(reader, max_rows)
+            except Exception as e:
+                error_message = (
+                    f"Error from table '{table.name}' columns '{vastdb_column_list}' "
+                    f"with yaml: '{vastdb_predicate}' translated to ibis '{ibis_expr!s}': {e}"
+                )
+                raise RuntimeError(error_message) from e
@@ -2,10 +2,34 @@
 #
 # SPDX-License-Identifier: MIT
 
-import vastdb
+import json
+from typing import TYPE_CHECKING
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from common_properties import (
+    arrow_memory_properties,
+    arrow_memory_tracking_property,
+    connection_properties,
+    get_vastdb_session,
+    profiling_properties,
+    query_config,
+    release_memory,
+    stage_attributes,
+    stage_timer,
+    stage_timings_property,
+    transform_profiler,
+    validate_profiling,
+    worker_memory_governor,
+)
+from instrumentation import NULL_STAGE_TIMER
+from nifiapi.componentstate import Scope
 from nifiapi.flowfiletransform import FlowFileTransform, FlowFileTransformResult
-from nifiapi.properties import ExpressionLanguageScope, PropertyDescriptor, StandardValidators
-from predicate_parser import parse_yaml_predicate
+from nifiapi.properties import ExpressionLanguageScope, PropertyDescriptor, StandardValidators, ValidationResult
+from predicate_parser import load_content_values, parse_yaml_predicate
+
+if TYPE_CHECKING:
+    import vastdb
 
 
 class QueryVastDBTable(FlowFileTransform):
@@ -20,20 +44,12 @@ class QueryVastDBTable(FlowFileTransform):
 
     # ruff: noqa: ARG002
     def __init__(self, **kwargs):
-        self.vastdb_endpoint = PropertyDescriptor(
-            name="VastDB Endpoint",
-            description="AWS_S3_ENDPOINT_URL",
-            required=True,
-            default_value="http://vip-pool.v123-xy.VastENG.lab",
-            validators=[StandardValidators.URL_VALIDATOR],
-        )
-
-        self.vastdb_credentials_provider_service = PropertyDescriptor(
-            name="VastDB Credentials Provider Service",
-            description="The Controller Service that is used to obtain VastDB credentials.",
-            required=True,
-            controller_service_definition="org.apache.nifi.processors.aws.credentials.provider.service.AWSCredentialsProviderService",
-        )
+        (
+            self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
+            self.vastdb_credentials_provider_service,
+        ) = connection_properties()
 
         self.vastdb_bucket = PropertyDescriptor(
             name="VastDB Bucket",
@@ -89,8 +105,76 @@ class QueryVastDBTable(FlowFileTransform):
             default_value="False",
         )
 
+        self.watermark_column = PropertyDescriptor(
+            name="Watermark Column",
+            description=(
+                "Monotonically increasing column (e.g. a timestamp or sequence) used for incremental queries.\n"
+                "When set, only rows with a value greater than the largest value previously emitted are returned.\n"
+                "The largest emitted value is kept in the processor state.  Leave blank to query the full table."
+            ),
+            required=False,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        )
+
+        self.max_rows = PropertyDescriptor(
+            name="Max Rows",
+            description=(
+                "Maximum number of rows to return.  The scan is stopped and the remaining splits are cancelled\n"
+                "as soon as this many matching rows have been read.  Leave blank to return all matching rows.\n"
+                "Can't be used with a Watermark Column in the Rows Query Mode, as the rows read first are in no\n"
+                "particular order: advancing the watermark past rows that weren't read would skip them."
+            ),
+            required=False,
+            validators=[StandardValidators.POSITIVE_INTEGER_VALIDATOR],
+        )
+
+        self.limit_pushdown = PropertyDescriptor(
+            name="Limit Pushdown",
+            description=(
+                "When Max Rows is set, also limit the number of rows the VastDB server returns per request,\n"
+                "so the first response does not carry far more rows than needed."
+            ),
+            allowable_values=["True", "False"],
+            required=True,
+            default_value="True",
+        )
+
+        self.query_mode = PropertyDescriptor(
+            name="Query Mode",
+            description=(
+                "Rows: return the matching rows.\n"
+                'Count: return a single row {"count": <number of matching rows>}, counting at most Max Rows.\n'
+                'Exists: return a single row {"exists": <true|false>}, stopping at the first matching row.\n'
+                "Count and Exists do not read any table columns."
+            ),
+            allowable_values=["Rows", "Count", "Exists"],
+            required=True,
+            default_value="Rows",
+        )
+
+        self.stage_timings = stage_timings_property()
+
+        self.arrow_memory_tracking = arrow_memory_tracking_property()
+
+        (
+            self.arrow_memory_pool,
+            self.arrow_memory_budget,
+            self.release_arrow_memory,
+        ) = arrow_memory_properties(
+            "Results are serialized in slices fitting the room left in it, and a query whose result exceeds it fails the FlowFile rather than the worker."
+        )
+
+        (
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
+        ) = profiling_properties()
+
         self.descriptors = [
             self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
             self.vastdb_credentials_provider_service,
             self.vastdb_bucket,
             self.vastdb_schema,
@@ -98,12 +182,45 @@ class QueryVastDBTable(FlowFileTransform):
             self.vastdb_columns,
             self.vastdb_predicates,
             self.return_row_id,
+            self.watermark_column,
+            self.max_rows,
+            self.limit_pushdown,
+            self.query_mode,
+            self.stage_timings,
+            self.arrow_memory_tracking,
+            self.arrow_memory_pool,
+            self.arrow_memory_budget,
+            self.release_arrow_memory,
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
         ]
 
     # Processor properties
     def getPropertyDescriptors(self):
         return self.descriptors
 
+    def customValidate(self, context):
+        results = validate_profiling(context)
+        explanation = self.watermark_conflict(context)
+        if explanation is not None:
+            results.append(ValidationResult(subject=self.max_rows.name, explanation=explanation, valid=False))
+        return results
+
+    def watermark_conflict(self, context):
+        """Returns why Max Rows can't be used with the Watermark Column, or None when they aren't both used."""
+        if (
+            context.getProperty(self.watermark_column.name).getValue()
+            and context.getProperty(self.max_rows.name).getValue()
+            and context.getProperty(self.query_mode.name).getValue() == "Rows"
+        ):
+            return (
+                "Max Rows can't be used with a Watermark Column in the Rows Query Mode: the rows read are in no "
+                "particular order, so the watermark would skip the matching rows that weren't read"
+            )
+        return None
+
     def get_el_property(self, context, flowfile, property_name) -> str:
         # Check if EL is present in the property value
         if context.getProperty(property_name).isExpressionLanguagePresent():
@@ -111,27 +228,112 @@ class QueryVastDBTable(FlowFileTransform):
         return context.getProperty(property_name).getValue()
 
     def transform(self, context, flowfile):
-        session = self.get_vastdb_session(context)
-        rows = self.query_vastdb(context, flowfile, session)
-        return FlowFileTransformResult(relationship="success", contents=rows)
+        with transform_profiler(context, "QueryVastDBTable", self.logger).sample():
+            try:
+                return self.transform_flowfile(context, flowfile)
+            finally:
+                release_memory(context)
+
+    def transform_flowfile(self, context, flowfile):
+        query_mode = context.getProperty(self.query_mode.name).getValue()
+        timer = stage_timer(context)
+        if query_mode != "Rows":
+            with timer.stage("connect"):
+                session = get_vastdb_session(context, self.logger)
+            num_rows = self.query_vastdb(context, flowfile, session, count_only=True, timer=timer)
+            summary = {"count": num_rows} if query_mode == "Count" else {"exists": num_rows > 0}
+            timer.add_rows(num_rows)
+            attributes = {"vastdb.row.count": str(num_rows), **stage_attributes(timer, self.logger)}
+            return FlowFileTransformResult(
+                relationship="success", contents=json.dumps([summary]), attributes=attributes
+            )
 
-    def get_vastdb_session(self, context):
-        vastdb_endpoint = context.getProperty(self.vastdb_endpoint.name).getValue()
-        credentials_provider_service = context.getProperty(
-            self.vastdb_credentials_provider_service.name
-        ).asControllerService()
-        credentials = credentials_provider_service.getAwsCredentialsProvider().resolveCredentials()
+        # NiFi doesn't schedule an invalid processor, this also guards the processor outside of NiFi
+        conflict = self.watermark_conflict(context)
+        if conflict is not None:
+            raise ValueError(conflict)
 
+        watermark_column = context.getProperty(self.watermark_column.name).getValue()
+        with timer.stage("state"):
+            watermark_value = self.get_watermark(context, watermark_column) if watermark_column else None
+
+        with timer.stage("connect"):
+            session = get_vastdb_session(context, self.logger)
+        memory_governor = worker_memory_governor(context)
+        pa_table = self.query_vastdb(
+            context, flowfile, session, watermark_column, watermark_value, timer=timer, memory_governor=memory_governor
+        )
+        timer.add_rows(pa_table.num_rows)
+
+        attributes = {}
+        new_watermark_value = None
+        if watermark_column:
+            new_watermark_value = self.max_watermark(pa_table, watermark_column)
+            column_list = self.extract_column_list(context, flowfile)
+            if column_list is not None and watermark_column not in column_list:
+                # The column was only selected to track the watermark
+                pa_table = pa_table.drop([watermark_column])
+
+        with timer.stage("serialize"):
+            rows = self.serialize_rows(pa_table, memory_governor)
+        timer.add_bytes(len(rows))
+
+        if new_watermark_value is not None:
+            # FlowFileTransform has no post-commit hook, so the state is only advanced once the output
+            # has been fully built.  A failure before this point re-reads the rows instead of losing them.
+            with timer.stage("state"):
+                self.set_watermark(context, watermark_column, new_watermark_value)
+            attributes["vastdb.watermark"] = new_watermark_value
+
+        attributes.update(stage_attributes(timer, self.logger))
+        if context.getProperty(self.arrow_memory_tracking.name).getValue() == "True":
+            attributes.update(memory_governor.attributes())
+        return FlowFileTransformResult(relationship="success", contents=rows, attributes=attributes)
+
+    def serialize_rows(self, pa_table, memory_governor):
+        """Serializes the rows as a Json array, in slices of rows fitting the memory budget with their pandas copy."""
+        slice_bytes = memory_governor.block_size(pa_table.nbytes, copies=2)
+        if slice_bytes >= pa_table.nbytes or pa_table.num_rows == 0:
+            return pa_table.to_pandas().to_json(orient="records")
+        rows_per_slice = max(1, pa_table.num_rows * slice_bytes // pa_table.nbytes)
+        slices = (
+            pa_table.slice(offset, rows_per_slice).to_pandas().to_json(orient="records")[1:-1]
+            for offset in range(0, pa_table.num_rows, rows_per_slice)
+        )
+        return f"[{','.join(slices)}]"
+
+    def get_watermark(self, context, watermark_column):
+        state = context.getStateManager().getState(Scope.CLUSTER).toMap()
+        if state.get("watermark.column") != watermark_column:
+            # The watermark column was changed, start again from the beginning of the table
+            return None
+        return state.get("watermark.value")
+
+    def set_watermark(self, context, watermark_column, watermark_value):
+        context.getStateManager().setState(
+            {"watermark.column": watermark_column, "watermark.value": watermark_value}, Scope.CLUSTER
+        )
+
+    def max_watermark(self, pa_table, watermark_column):
+        """Returns the largest value of the watermark column as a string, or None if there are no values."""
+        max_value = pc.max(pa_table[watermark_column])
+        if not max_value.is_valid:
+            return None
+        return max_value.cast(pa.string()).as_py()
+
+    def build_watermark_predicate(self, table, watermark_column, watermark_value):
+        """Builds a `watermark_column > watermark_value` ibis expression typed from the table column."""
         try:
-            session = vastdb.connect(
-                endpoint=vastdb_endpoint, access=credentials.accessKeyId(), secret=credentials.secretAccessKey()
-            )
-            self.logger.info("Connected to VastDB")
-        except Exception as e:
-            error_message = f"Failed to connect to VastDB: {e}"
-            raise RuntimeError(error_message) from e
-        else:
-            return session
+            field = table.arrow_schema.field(watermark_column)
+        except KeyError as e:
+            error_message = f"Watermark column '{watermark_column}' not found in table '{table.name}'"
+            raise ValueError(error_message) from e
+
+        import ibis
+        from ibis import _
+
+        value = pa.scalar(watermark_value).cast(field.type).as_py()
+        return _[watermark_column] > ibis.literal(value, type=ibis.dtype(field.type))
 
     def extract_column_list(self, context, flowfile):
         vastdb_columns_data = self.get_el_property(context, flowfile, self.vastdb_columns.name)
@@ -162,24 +364,112 @@ class QueryVastDBTable(FlowFileTransform):
         error_message = f"Invalid bool string: {s}"
         raise ValueError(error_message)
 
-    def query_vastdb(self, context, flowfile, session):
+    def get_max_rows(self, context, *, count_only=False):
+        if count_only and context.getProperty(self.query_mode.name).getValue() == "Exists":
+            return 1
+        max_rows = context.getProperty(self.max_rows.name).getValue()
+        return int(max_rows) if max_rows else None
+
+    def get_query_config(self, context, max_rows):
+        limit_pushdown = self.parse_bool_string(context.getProperty(self.limit_pushdown.name).getValue())
+        return query_config(context, max_rows, limit_pushdown=limit_pushdown)
+
+    def read_rows(self, reader, max_rows=None, memory_governor=None):
+        """Reads the query result, stopping as soon as max_rows rows have been read.
+
+        Closing the reader stops the SDK worker threads, so the remaining splits are not scanned.
+        """
+        batches = []
+        num_rows = 0
+        num_bytes = 0
+        try:
+            for batch in reader:
+                num_bytes += batch.nbytes
+                if memory_governor is not None and memory_governor.exceeds_budget(num_bytes):
+                    error_message = (
+                        f"The query result exceeds the Arrow Memory Budget after {num_rows} rows, "
+                        "set Max Rows or narrow the Predicates"
+                    )
+                    raise MemoryError(error_message)
+                if max_rows is not None and num_rows + batch.num_rows >= max_rows:
+                    batches.append(batch.slice(0, max_rows - num_rows))
+                    break
+                batches.append(batch)
+                num_rows += batch.num_rows
+        finally:
+            reader.close()
+        return pa.Table.from_batches(batches, schema=reader.schema)
+
+    def count_rows(self, reader, max_rows=None):
+        """Counts the query result rows without keeping them, stopping as soon as max_rows rows have been read."""
+        num_rows = 0
+        try:
+            for batch in reader:
+                num_rows += batch.num_rows
+                if max_rows is not None and num_rows >= max_rows:
+                    return max_rows
+        finally:
+            reader.close()
+        return num_rows
+
+    def empty_result(self, table, columns):
+        """Returns an empty table with the selected columns, for queries that are known to return no rows."""
+        table_schema = table.arrow_schema
+        if columns is None:
+            return table_schema.empty_table()
+        return pa.schema([table_schema.field(column) for column in columns]).empty_table()
+
+    def query_vastdb(
+        self,
+        context,
+        flowfile,
+        session,
+        watermark_column=None,
+        watermark_value=None,
+        *,
+        count_only=False,
+        timer=NULL_STAGE_TIMER,
+        memory_governor=None,
+    ):
         vastdb_bucket = context.getProperty(self.vastdb_bucket.name).getValue()
         vastdb_schema = context.getProperty(self.vastdb_schema.name).getValue()
         vastdb_table = context.getProperty(self.vastdb_table.name).getValue()
         vastdb_column_list = self.extract_column_list(context, flowfile)
         vastdb_predicate = self.get_el_property(context, flowfile, self.vastdb_predicates.name)
         vastdb_ret_row_id = self.parse_bool_string(context.getProperty(self.return_row_id.name).getValue())
+        max_rows = self.get_max_rows(context, count_only=count_only)
+
+        if count_only:
+            # Only the internal row ID is fetched, no table columns are read
+            vastdb_column_list = []
+            vastdb_ret_row_id = True
 
         self.logger.info(f"Received predicate {vastdb_predicate}")
 
         with session.transaction() as tx:
-            bucket: vastdb.bucket.Bucket = tx.bucket(vastdb_bucket)
-            schema: vastdb.schema.Schema = bucket.schema(vastdb_schema, fail_if_missing=True)
-            table: vastdb.table.Table = schema.table(vastdb_table, fail_if_missing=True)
+            with timer.stage("metadata"):
+                bucket: vastdb.bucket.Bucket = tx.bucket(vastdb_bucket)
+                schema: vastdb.schema.Schema = bucket.schema(vastdb_schema, fail_if_missing=True)
+                table: vastdb.table.Table = schema.table(vastdb_table, fail_if_missing=True)
 
             # FUTURE: retrieve datatype from table column definition so
             #         so the user doesn't have to manually specify.
-            ibis_expr = parse_yaml_predicate(vastdb_predicate)
+            # 'isin' predicates with 'value_from: content' take their values from the FlowFile content
+            with timer.stage("predicate"):
+                ibis_expr = parse_yaml_predicate(
+                    vastdb_predicate, content_values=lambda: load_content_values(flowfile.getContentsAsBytes())
+                )
+
+            if watermark_column:
+                if vastdb_column_list is not None and watermark_column not in vastdb_column_list:
+                    vastdb_column_list = [*vastdb_column_list, watermark_column]
+                if watermark_value is not None:
+                    watermark_expr = self.build_watermark_predicate(table, watermark_column, watermark_value)
+                    # The parsed predicate is True when it matches every row, and False when it matches none
+                    if ibis_expr is True:
+                        ibis_expr = watermark_expr
+                    elif ibis_expr is not False:
+                        ibis_expr = ibis_expr & watermark_expr
 
             log_message = (
                 f"Selecting from table '{table.name}' columns '{vastdb_column_list}' "
@@ -187,13 +477,23 @@ class QueryVastDBTable(FlowFileTransform):
             )
             self.logger.info(log_message)
 
+            if ibis_expr is False:
+                self.logger.info(f"Predicate can never match, skipping the scan of table '{table.name}'")
+                if count_only:
+                    return 0
+                return self.empty_result(table, vastdb_column_list)
+
             try:
-                reader = table.select(
-                    columns=vastdb_column_list, predicate=ibis_expr, internal_row_id=vastdb_ret_row_id
-                )
-                table = reader.read_all()
-                df = table.to_pandas()
-                return df.to_json(orient="records")
+                with timer.stage("select"):
+                    reader = table.select(
+                        columns=vastdb_column_list,
+                        predicate=ibis_expr,
+                        config=self.get_query_config(context, max_rows),
+                        internal_row_id=vastdb_ret_row_id,
+                    )
+                    if count_only:
+                        return self.count_rows(reader, max_rows)
+                    return self.read_rows(reader, max_rows, memory_governor)
             except Exception as e:
                 error_message = (
                     f"Error from table '{table.name}' columns '{vastdb_column_list}' "
@@ -2,14 +2,29 @@
 #
 # SPDX-License-Identifier: MIT
 
-import io
+from typing import TYPE_CHECKING
 
 import pyarrow as pa
-import pyarrow.parquet as pq
-import vastdb
+from batch_sizing import get_batch_sizer
+from common_properties import (
+    arrow_memory_tracking_property,
+    connection_properties,
+    get_vastdb_session,
+    profiling_properties,
+    stage_attributes,
+    stage_timer,
+    stage_timings_property,
+    transform_profiler,
+    validate_profiling,
+)
+from compression import content_codec, decompress, open_decompressed
+from derived_columns import add_derived_columns, parse_yaml_derived_columns
+from json_schema import drop_missing_fields, get_table_schema, parse_json, update_table_schema, with_row_id
 from nifiapi.flowfiletransform import FlowFileTransform, FlowFileTransformResult
-from nifiapi.properties import PropertyDescriptor, StandardValidators
-from pyarrow import json as pa_json
+from nifiapi.properties import ExpressionLanguageScope, PropertyDescriptor, StandardValidators
+
+if TYPE_CHECKING:
+    import vastdb
 
 
 class UpdateVastDB(FlowFileTransform):
@@ -24,20 +39,12 @@ class UpdateVastDB(FlowFileTransform):
 
     # ruff: noqa: ARG002
     def __init__(self, **kwargs):
-        self.vastdb_endpoint = PropertyDescriptor(
-            name="VastDB Endpoint",
-            description="AWS_S3_ENDPOINT_URL",
-            required=True,
-            default_value="http://vip-pool.v123-xy.VastENG.lab",
-            validators=[StandardValidators.URL_VALIDATOR],
-        )
-
-        self.vastdb_credentials_provider_service = PropertyDescriptor(
-            name="VastDB Credentials Provider Service",
-            description="The Controller Service that is used to obtain VastDB credentials.",
-            required=True,
-            controller_service_definition="org.apache.nifi.processors.aws.credentials.provider.service.AWSCredentialsProviderService",
-        )
+        (
+            self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
+            self.vastdb_credentials_provider_service,
+        ) = connection_properties()
 
         self.vastdb_bucket = PropertyDescriptor(
             name="VastDB Bucket",
@@ -71,38 +78,186 @@ class UpdateVastDB(FlowFileTransform):
             default_value="Parquet",
         )
 
+        self.compression = PropertyDescriptor(
+            name="Compression",
+            description=(
+                "The compression of the FlowFile content. Detect: gzip or zstd from the first bytes of the content, "
+                "or uncompressed. Compressed Json is decompressed as it's parsed, instead of a CompressContent processor "
+                "writing the decompressed content to the content repository. Json parsed with the table's schema, whose "
+                "text is scanned for the fields it has, and Parquet, read from its footer, are decompressed in memory."
+            ),
+            allowable_values=["Detect", "None", "gzip", "zstd"],
+            required=True,
+            default_value="Detect",
+        )
+
+        self.json_schema = PropertyDescriptor(
+            name="Json Schema",
+            description=(
+                "How the column types of Json data are found. Inferred: pyarrow infers them from each FlowFile. "
+                "Table Schema: the columns of the target table are parsed as the table's types, which is faster "
+                "and keeps the types from changing between FlowFiles. The table schema is looked up once per table."
+            ),
+            allowable_values=["Inferred", "Table Schema"],
+            required=True,
+            default_value="Inferred",
+        )
+
+        self.unexpected_columns = PropertyDescriptor(
+            name="Unexpected Columns",
+            description=(
+                "What to do with columns of the data that aren't columns of the table: Add them to the table, "
+                "Ignore them, or fail the FlowFile (Error). With Ignore and Error, only the row IDs and the table's "
+                "columns are read from the data, and Json is parsed with the table's types."
+            ),
+            allowable_values=["Add", "Ignore", "Error"],
+            required=True,
+            default_value="Add",
+        )
+
+        self.derived_columns = PropertyDescriptor(
+            name="Derived Columns",
+            description=(
+                "Derived columns yaml, or leave blank to insert the columns of the data as they are. A list of "
+                "columns computed over all the rows before they are updated, e.g.\n"
+                "- {name: ingested_at, op: now}\n"
+                "- {name: tenant_key, op: hash, columns: [tenant, id]}\n"
+                "Operations: constant (value, datatype), now, cast (column, datatype), hash (columns), "
+                "strptime (column, format, unit, error_is_null), substring (column, start, length), "
+                "coalesce (columns, value), lower, upper and trim (column). "
+                "Expression Language, e.g. value: ${filename}, is evaluated with the FlowFile attributes."
+            ),
+            required=False,
+            expression_language_scope=ExpressionLanguageScope.FLOWFILE_ATTRIBUTES,
+        )
+
+        self.batch_size = PropertyDescriptor(
+            name="Batch Size",
+            description=(
+                "The number of rows sent to VastDB per request, "
+                "or the initial number of rows when Adaptive Batch Size is True."
+            ),
+            required=True,
+            default_value="65536",
+            validators=[StandardValidators.POSITIVE_INTEGER_VALIDATOR],
+        )
+
+        self.adaptive_batch_size = PropertyDescriptor(
+            name="Adaptive Batch Size",
+            description=(
+                "Learn the number of rows per request for each table: it grows while the latency per row improves, "
+                "and is halved when a request times out or is too large for VastDB."
+            ),
+            allowable_values=["True", "False"],
+            required=True,
+            default_value="True",
+        )
+
+        self.stage_timings = stage_timings_property()
+
+        self.arrow_memory_tracking = arrow_memory_tracking_property()
+
+        (
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
+        ) = profiling_properties()
+
         self.descriptors = [
             self.vastdb_endpoint,
+            self.endpoint_selection,
+            self.resolve_endpoint_addresses,
             self.vastdb_credentials_provider_service,
             self.vastdb_bucket,
             self.vastdb_schema,
             self.vastdb_table,
             self.incoming_data_type,
+            self.compression,
+            self.json_schema,
+            self.unexpected_columns,
+            self.derived_columns,
+            self.batch_size,
+            self.adaptive_batch_size,
+            self.stage_timings,
+            self.arrow_memory_tracking,
+            self.profiling_sample_rate,
+            self.profiler_type,
+            self.profiling_directory,
+            self.profiling_max_files,
         ]
 
     # Processor properties
     def getPropertyDescriptors(self):
         return self.descriptors
 
-    def transform(self, context, flowfile):
-        incoming_data_type = context.getProperty(self.incoming_data_type.name).getValue()
-
-        session = self.get_vastdb_session(context)
-        pa_table = self.read_json(flowfile) if incoming_data_type == "Json" else self.read_parquet(flowfile)
+    def customValidate(self, context):
+        return validate_profiling(context)
 
-        self.write_to_vastdb(context, session, pa_table)
-        return FlowFileTransformResult(relationship="success")
+    def get_el_property(self, context, flowfile, property_name) -> str:
+        # Check if EL is present in the property value
+        if context.getProperty(property_name).isExpressionLanguagePresent():
+            return context.getProperty(property_name).evaluateAttributeExpressions(flowfile).getValue()
+        return context.getProperty(property_name).getValue()
 
-    def read_parquet(self, flowfile):
+    def extract_derived_columns(self, context, flowfile):
+        derived_columns = self.get_el_property(context, flowfile, self.derived_columns.name)
         try:
-            # Read the FlowFile contents into a byte array
-            file_contents = flowfile.getContentsAsBytes()
+            return parse_yaml_derived_columns(derived_columns) if derived_columns and derived_columns.strip() else []
+        except Exception as e:
+            error_message = f"Invalid Derived Columns yaml '{derived_columns}': {e}"
+            raise ValueError(error_message) from e
+
+    def transform(self, context, flowfile):
+        with transform_profiler(context, "UpdateVastDB", self.logger).sample():
+            return self.transform_flowfile(context, flowfile)
 
-            # Create a BytesIO object from the byte array
-            buffer = io.BytesIO(file_contents)
+    def transform_flowfile(self, context, flowfile):
+        incoming_data_type = context.getProperty(self.incoming_data_type.name).getValue()
+
+        timer = stage_timer(context)
+        with timer.stage("connect"):
+            session = get_vastdb_session(context, self.logger)
 
-            # Read the Parquet data from the buffer
-            return pq.read_table(buffer)
+        with timer.stage("read"):
+            file_contents = flowfile.getContentsAsBytes()
+        timer.add_bytes(len(file_contents))
+        codec = content_codec(file_contents, context.getProperty(self.compression.name).getValue())
+
+        unexpected_columns = context.getProperty(self.unexpected_columns.name).getValue()
+        arrow_schema = None
+        if unexpected_columns != "Add" or (
+            incoming_data_type == "Json" and context.getProperty(self.json_schema.name).getValue() == "Table Schema"
+        ):
+            arrow_schema = self.table_schema(context, session, timer)
+
+        with timer.stage("parse"):
+            if incoming_data_type == "Json":
+                pa_table = self.read_json(file_contents, arrow_schema, unexpected_columns, codec)
+            else:
+                pa_table = self.read_parquet(file_contents, arrow_schema, unexpected_columns, codec)
+            derived_columns = self.extract_derived_columns(context, flowfile)
+            if derived_columns:
+                pa_table = add_derived_columns(pa_table, derived_columns)
+
+        sizer = self.batch_sizer(context, "update")
+        self.write_to_vastdb(context, session, pa_table, sizer, timer)
+        attributes = {**sizer.attributes(), **stage_attributes(timer, self.logger)}
+        return FlowFileTransformResult(relationship="success", attributes=attributes)
+
+    def read_parquet(self, file_contents, arrow_schema=None, unexpected_columns="Add", codec=None):
+        import pyarrow.parquet as pq
+
+        unexpected = []
+        try:
+            parquet_file = pq.ParquetFile(pa.BufferReader(decompress(file_contents, codec)))
+            columns = None
+            if arrow_schema is not None and unexpected_columns != "Add":
+                # Only the row IDs and the table's columns are decoded
+                table_columns = set(with_row_id(arrow_schema).names)
+                columns = [name for name in parquet_file.schema_arrow.names if name in table_columns]
+                unexpected = [name for name in parquet_file.schema_arrow.names if name not in table_columns]
+            pa_table = parquet_file.read(columns=columns)
         except Exception as e:
             error_message = (
                 f"{e}.  Ensure your parquet is valid and meets pyarrow's requirements."
@@ -110,9 +265,23 @@ class UpdateVastDB(FlowFileTransform):
             )
             raise RuntimeError(error_message) from e
 
-    def read_json(self, flowfile):
+        if unexpected and unexpected_columns == "Error":
+            error_message = f"Columns {unexpected} are not columns of the table"
+            raise ValueError(error_message)
+        return pa_table
+
+    def read_json(self, file_contents, arrow_schema=None, unexpected_columns="Add", codec=None):
         try:
-            return pa_json.read_json(io.BytesIO(flowfile.getContentsAsBytes()))
+            if arrow_schema is None:
+                # Compressed Json is parsed as it's decompressed, without holding all of it decompressed
+                return parse_json(file_contents if codec is None else open_decompressed(file_contents, codec))
+            # The text is scanned for the fields it has below, so it's decompressed in memory
+            file_contents = decompress(file_contents, codec)
+            # The row IDs are parsed with the table's columns, other fields are inferred to be added as columns
+            unexpected_fields = "Infer" if unexpected_columns == "Add" else unexpected_columns
+            pa_table = parse_json(file_contents, with_row_id(arrow_schema), unexpected_fields=unexpected_fields)
+            # Only the columns in the Json are updated, not every column of the table
+            return drop_missing_fields(pa_table, file_contents)
         except Exception as e:
             error_message = (
                 f"{e}.  Ensure your json is valid and meets pyarrow's requirements."
@@ -120,53 +289,79 @@ class UpdateVastDB(FlowFileTransform):
             )
             raise RuntimeError(error_message) from e
 
-    def get_vastdb_session(self, context):
-        vastdb_endpoint = context.getProperty(self.vastdb_endpoint.name).getValue()
-        credentials_provider_service = context.getProperty(
-            self.vastdb_credentials_provider_service.name
-        ).asControllerService()
-        credentials = credentials_provider_service.getAwsCredentialsProvider().resolveCredentials()
+    def table_key(self, context):
+        return (
+            context.getProperty(self.vastdb_endpoint.name).getValue(),
+            context.getProperty(self.vastdb_bucket.name).getValue(),
+            context.getProperty(self.vastdb_schema.name).getValue(),
+            context.getProperty(self.vastdb_table.name).getValue(),
+        )
 
-        try:
-            session = vastdb.connect(
-                endpoint=vastdb_endpoint, access=credentials.accessKeyId(), secret=credentials.secretAccessKey()
-            )
-            self.logger.info("Connected to VastDB")
-        except Exception as e:
-            error_message = f"Failed to connect to VastDB: {e}"
-            raise RuntimeError(error_message) from e
-        else:
-            return session
+    def table_schema(self, context, session, timer):
+        """Returns the target table's schema, to read only its columns or parse Json with its types."""
+        return get_table_schema(self.table_key(context), lambda: self.load_table_schema(context, session, timer))
 
-    def write_to_vastdb(self, context, session, pa_table):
+    def load_table_schema(self, context, session, timer):
         vastdb_bucket = context.getProperty(self.vastdb_bucket.name).getValue()
         vastdb_schema = context.getProperty(self.vastdb_schema.name).getValue()
         vastdb_table = context.getProperty(self.vastdb_table.name).getValue()
 
-        with session.transaction() as tx:
-            bucket: vastdb.bucket.Bucket = tx.bucket(vastdb_bucket)
-            schema: vastdb.schema.Schema = bucket.schema(vastdb_schema, fail_if_missing=False)
+        with timer.stage("metadata"), session.transaction() as tx:
+            schema: vastdb.schema.Schema = tx.bucket(vastdb_bucket).schema(vastdb_schema, fail_if_missing=False)
             if schema is None:
-                self.logger.info(f"Creating schema {vastdb_schema}")
-                schema = bucket.create_schema(vastdb_schema)
-
+                return None
             table: vastdb.table.Table = schema.table(vastdb_table, fail_if_missing=False)
-            if table is None:
-                self.logger.info(f"Creating table {vastdb_table}")
-                try:
-                    table = schema.create_table(vastdb_table, pa_table.schema)
-                except Exception as e:
-                    error_message = f"Error creating table '{vastdb_table}' with schema {pa_table.schema}: {e}"
-                    raise RuntimeError(error_message) from e
+            # A table that doesn't exist yet is created from the inferred types
+            return None if table is None else table.arrow_schema
+
+    def batch_sizer(self, context, operation):
+        """Returns the batch sizer learning the number of rows per request for the target table."""
+        key = (
+            context.getProperty(self.vastdb_endpoint.name).getValue(),
+            context.getProperty(self.vastdb_bucket.name).getValue(),
+            context.getProperty(self.vastdb_schema.name).getValue(),
+            context.getProperty(self.vastdb_table.name).getValue(),
+            operation,
+        )
+        batch_size = int(context.getProperty(self.batch_size.name).getValue())
+        adaptive = context.getProperty(self.adaptive_batch_size.name).getValue() == "True"
+        return get_batch_sizer(key, batch_size, adaptive=adaptive)
 
-            columns_to_add = self.get_columns_to_add(table.arrow_schema, pa_table.schema)
-            for column in columns_to_add:
-                self.logger.info(f"Adding column {column} to table {vastdb_table}")
-                table.add_column(column)
+    def write_to_vastdb(self, context, session, pa_table, sizer, timer):
+        vastdb_bucket = context.getProperty(self.vastdb_bucket.name).getValue()
+        vastdb_schema = context.getProperty(self.vastdb_schema.name).getValue()
+        vastdb_table = context.getProperty(self.vastdb_table.name).getValue()
+
+        with session.transaction() as tx:
+            with timer.stage("metadata"):
+                bucket: vastdb.bucket.Bucket = tx.bucket(vastdb_bucket)
+                schema: vastdb.schema.Schema = bucket.schema(vastdb_schema, fail_if_missing=False)
+                if schema is None:
+                    self.logger.info(f"Creating schema {vastdb_schema}")
+                    schema = bucket.create_schema(vastdb_schema)
+
+                table: vastdb.table.Table = schema.table(vastdb_table, fail_if_missing=False)
+                if table is None:
+                    self.logger.info(f"Creating table {vastdb_table}")
+                    try:
+                        table = schema.create_table(vastdb_table, pa_table.schema)
+                    except Exception as e:
+                        error_message = f"Error creating table '{vastdb_table}' with schema {pa_table.schema}: {e}"
+                        raise RuntimeError(error_message) from e
 
-            self.logger.info(f"Deleting '{pa_table.num_rows}' from table '{vastdb_table}'.")
-            table.update(pa_table)
-            self.logger.info(f"Deleted '{pa_table.num_rows}' from table '{vastdb_table}'.")
+            columns_to_add = self.get_columns_to_add(table.arrow_schema, pa_table.schema)
+            with timer.stage("add_column"):
+                for column in columns_to_add:
+                    self.logger.info(f"Adding column {column} to table {vastdb_table}")
+                    table.add_column(column)
+            # The next FlowFiles parse Json with the table's current columns
+            update_table_schema(self.table_key(context), table.arrow_schema)
+
+            self.logger.info(f"Updating '{pa_table.num_rows}' rows of table '{vastdb_table}'.")
+            with timer.stage("update"):
+                sizer.write(pa_table, table.update)
+            timer.add_rows(pa_table.num_rows)
+            self.logger.info(f"Updated '{pa_table.num_rows}' rows of table '{vastdb_table}'.")
 
     def get_columns_to_add(self, existing_schema, desired_schema):
         """
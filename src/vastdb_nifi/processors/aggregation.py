@@ -0,0 +1,258 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import re
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+ALLOWED_FUNCTIONS = ["count", "sum", "min", "max", "mean", "approx_distinct"]
+
+# HyperLogLog precision used by approx_distinct: 2**12 registers per group, ~1.6% standard error
+HLL_PRECISION = 12
+
+AGGREGATION_PATTERN = re.compile(r"^\s*(\w+)\s*\(\s*([^()]*?)\s*\)\s*$")
+
+
+def parse_aggregations(spec):
+    """Parses a comma separated list of aggregations, e.g. "count(*), sum(fare), approx_distinct(vendor_id)".
+
+    Returns:
+        A list of (function, column) tuples.  The column is None for count(*).
+    """
+    aggregations = []
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+
+        match = AGGREGATION_PATTERN.match(item)
+        if match is None:
+            error_message = f"Invalid aggregation: '{item.strip()}'.  Expected <function>(<column>)."
+            raise ValueError(error_message)
+
+        function = match.group(1).lower()
+        column = match.group(2)
+        if function not in ALLOWED_FUNCTIONS:
+            error_message = f"Unsupported aggregation function: {function}.  Supported: {ALLOWED_FUNCTIONS}"
+            raise ValueError(error_message)
+        if not column:
+            error_message = f"Missing column for aggregation: '{item.strip()}'"
+            raise ValueError(error_message)
+
+        if column == "*":
+            if function != "count":
+                error_message = f"Only count supports '*': '{item.strip()}'"
+                raise ValueError(error_message)
+            column = None
+
+        aggregations.append((function, column))
+
+    if not aggregations:
+        error_message = "At least one aggregation is required"
+        raise ValueError(error_message)
+
+    return aggregations
+
+
+def output_name(function, column):
+    return "count" if column is None else f"{function}_{column}"
+
+
+def key_placeholder(data_type):
+    """Returns a value of a type standing in for the nulls of a group key, which are told apart by their null flag."""
+    if pa.types.is_boolean(data_type):
+        return pa.scalar(False)
+    if pa.types.is_string(data_type) or pa.types.is_large_string(data_type):
+        return pa.scalar("", data_type)
+    if pa.types.is_binary(data_type) or pa.types.is_large_binary(data_type):
+        return pa.scalar(b"", data_type)
+    try:
+        byte_width = data_type.byte_width
+    except ValueError as e:
+        error_message = f"Can't group by a column of type {data_type}"
+        raise ValueError(error_message) from e
+    # Zero bytes are a value of every other fixed width type, e.g. numbers, decimals, dates and timestamps
+    return pa.Array.from_buffers(data_type, 1, [None, pa.py_buffer(bytes(byte_width))])[0]
+
+
+class GroupByAggregator:
+    """
+    Computes group-by aggregates incrementally over a stream of record batches.
+
+    Each batch is reduced to one partial row per group, which is merged into the running
+    state, so memory is bounded by the number of groups rather than the number of rows.
+    """
+
+    def __init__(self, group_by, aggregations, precision=HLL_PRECISION):
+        self.group_by = list(group_by)
+        self.aggregations = list(aggregations)
+        self.precision = precision
+        # Each group by column is grouped on as its values, with nulls replaced, and a flag of the nulls
+        self.keys = [name for i in range(len(self.group_by)) for name in (f"__key{i}", f"__null{i}")]
+
+        # Partial state column name -> (aggregation applied to a batch, aggregation combining partial states).
+        # pyarrow names each aggregate "<column>_<function>", which is also the partial state name.
+        self.partials = {}
+        self.count_partials = set()
+        for function, column in self.aggregations:
+            if column is None:
+                self.partials["count_all"] = (([], "count_all"), "sum")
+                self.count_partials.add("count_all")
+            elif function in {"count", "mean"}:
+                self.partials[f"{column}_count"] = ((column, "count"), "sum")
+                self.count_partials.add(f"{column}_count")
+            if function in {"sum", "mean"}:
+                self.partials[f"{column}_sum"] = ((column, "sum"), "sum")
+            elif function in {"min", "max"}:
+                self.partials[f"{column}_{function}"] = ((column, function), function)
+
+        self.distinct_columns = sorted({
+            column for function, column in self.aggregations if function == "approx_distinct"
+        })
+
+        self.state = None
+        self.distinct_states = {}
+
+    @property
+    def columns(self):
+        """The table columns needed to compute the aggregates."""
+        columns = list(self.group_by)
+        for _, column in self.aggregations:
+            if column is not None and column not in columns:
+                columns.append(column)
+        return columns
+
+    def with_group_keys(self, table):
+        """
+        Returns the table with the typed key columns its rows are grouped on.
+
+        The keys have no nulls, as pyarrow 16 returns incorrect groups for several keys where a string key
+        has nulls.  A null is replaced by a placeholder value of the column's type, and flagged.
+        """
+        for i, key in enumerate(self.group_by):
+            column = table[key]
+            if pa.types.is_dictionary(column.type):
+                column = column.cast(column.type.value_type)
+            elif pa.types.is_null(column.type):
+                column = column.cast(pa.int8())
+            table = table.append_column(f"__key{i}", pc.fill_null(column, key_placeholder(column.type)))
+            table = table.append_column(f"__null{i}", pc.is_null(column))
+        return table
+
+    def aggregate(self, table, aggregations, keys):
+        result = table.group_by(keys, use_threads=False).aggregate(aggregations)
+        # The position of the key columns in the output differs between pyarrow versions
+        return result.select([*keys, *[name for name in result.column_names if name not in keys]])
+
+    def update(self, batch):
+        table = pa.Table.from_batches([batch]) if isinstance(batch, pa.RecordBatch) else batch
+        if table.num_rows == 0:
+            return
+
+        table = self.with_group_keys(table)
+
+        partial = self.aggregate(table, [aggregation for aggregation, _ in self.partials.values()], self.keys)
+        if self.state is not None:
+            combined = pa.concat_tables([self.state, partial])
+            partial = self.aggregate(
+                combined, [(name, combine) for name, (_, combine) in self.partials.items()], self.keys
+            )
+            partial = partial.rename_columns([*self.keys, *self.partials])
+        self.state = partial
+
+        for column in self.distinct_columns:
+            sketch = self.hll_sketch(table, column)
+            if column in self.distinct_states:
+                sketch = pa.concat_tables([self.distinct_states[column], sketch])
+                sketch = self.aggregate(sketch, [("__rank", "max")], [*self.keys, "__register"])
+                sketch = sketch.rename_columns([*self.keys, "__register", "__rank"])
+            self.distinct_states[column] = sketch
+
+    def hll_sketch(self, table, column):
+        """Reduces a column to HyperLogLog (group, register, rank) rows, keeping the largest rank per register."""
+        # pandas is only needed for approximate distinct counts, and is slow to import
+        import pandas as pd
+
+        table = table.filter(pc.is_valid(table[column]))
+
+        hashes = pd.util.hash_array(table[column].to_numpy(zero_copy_only=False))
+        remaining_bits = 64 - self.precision
+        registers = (hashes >> np.uint64(remaining_bits)).astype(np.int64)
+        # The remaining bits fit exactly in a float64 mantissa, so frexp gives their exact bit length
+        _, bit_length = np.frexp((hashes & np.uint64((1 << remaining_bits) - 1)).astype(np.float64))
+        ranks = (remaining_bits - bit_length + 1).astype(np.int64)
+
+        sketch = table.select(self.keys)
+        sketch = sketch.append_column("__register", pa.array(registers, pa.int64()))
+        sketch = sketch.append_column("__rank", pa.array(ranks, pa.int64()))
+        sketch = self.aggregate(sketch, [("__rank", "max")], [*self.keys, "__register"])
+        return sketch.rename_columns([*self.keys, "__register", "__rank"])
+
+    def hll_estimates(self, sketch):
+        """Returns the group keys and their HyperLogLog cardinality estimates, as `__estimate`."""
+        num_registers = 1 << self.precision
+        alpha = 0.7213 / (1 + 1.079 / num_registers)
+
+        sketch = sketch.append_column("__inverse", pc.power(2.0, pc.negate(pc.cast(sketch["__rank"], pa.float64()))))
+        totals = self.aggregate(sketch, [("__inverse", "sum"), ([], "count_all")], self.keys)
+
+        zero_registers = num_registers - totals["count_all"].to_numpy()
+        estimate = alpha * num_registers * num_registers / (totals["__inverse_sum"].to_numpy() + zero_registers)
+
+        # Small range correction (linear counting)
+        linear_counting = num_registers * np.log(num_registers / np.maximum(zero_registers, 1))
+        estimate = np.where((estimate <= 2.5 * num_registers) & (zero_registers > 0), linear_counting, estimate)
+
+        return totals.select(self.keys).append_column("__estimate", pa.array(np.rint(estimate).astype(np.int64)))
+
+    def result(self):
+        """Returns the final aggregates as a pyarrow Table, one row per group."""
+        state = self.state
+        if state is None:
+            if self.group_by:
+                return pa.table({name: pa.array([]) for name in self.output_names})
+            # A global aggregate over no rows still returns one row, like SQL
+            state = pa.table({
+                "__row": [0],
+                **{name: [0 if name in self.count_partials else None] for name in self.partials},
+            })
+
+        columns = {
+            key: pc.if_else(state[f"__null{i}"], pa.scalar(None, state[f"__key{i}"].type), state[f"__key{i}"])
+            for i, key in enumerate(self.group_by)
+        }
+        for function, column in self.aggregations:
+            name = output_name(function, column)
+            if column is None:
+                columns[name] = state["count_all"]
+            elif function == "mean":
+                counts = state[f"{column}_count"]
+                mean = pc.divide(pc.cast(state[f"{column}_sum"], pa.float64()), pc.cast(counts, pa.float64()))
+                columns[name] = pc.if_else(pc.greater(counts, 0), mean, pa.scalar(None, pa.float64()))
+            elif function == "approx_distinct":
+                columns[name] = self.distinct_estimates(state, column)
+            else:
+                columns[name] = state[f"{column}_{function}"]
+
+        return pa.table(columns)
+
+    def distinct_estimates(self, state, column):
+        sketch = self.distinct_states.get(column)
+        # Groups without any non-null value have no registers set
+        if sketch is None or sketch.num_rows == 0:
+            return pa.array([0] * state.num_rows, pa.int64())
+
+        estimates = self.hll_estimates(sketch)
+        if not self.keys:
+            return estimates["__estimate"]
+
+        # The joined rows are put back in the order of the state's groups
+        groups = state.select(self.keys).append_column("__row", pa.array(np.arange(state.num_rows)))
+        joined = groups.join(estimates, keys=self.keys, join_type="left outer", use_threads=False).sort_by("__row")
+        return pc.fill_null(joined["__estimate"], 0)
+
+    @property
+    def output_names(self):
+        return [*self.group_by, *[output_name(function, column) for function, column in self.aggregations]]
@@ -0,0 +1,176 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import threading
+import time
+from collections import deque
+
+# The VastDB SDK splits larger requests itself, so there is nothing to gain above this many rows
+MAX_BATCH_SIZE = 512 * 1024
+
+# A batch is considered faster when its latency per row is within this fraction of the previous batch
+LATENCY_TOLERANCE = 0.1
+
+# Requests made at a reduced size before trying to grow it again
+HOLD_REQUESTS = 10
+
+HISTORY_SIZE = 20
+
+_sizers = {}
+_sizers_lock = threading.Lock()
+
+
+def is_size_error(error):
+    """Returns True for errors caused by a request that was too large, which are safe to retry smaller."""
+    # Imported on the first error, as requests is slow to import and the SDK loads it when connecting
+    from vastdb import errors
+
+    return isinstance(error, errors.TooLargeRequest)
+
+
+def is_timeout_error(error):
+    from requests.exceptions import Timeout
+    from vastdb import errors
+
+    return isinstance(error, (errors.RequestTimeout, Timeout))
+
+
+class AdaptiveBatchSizer:
+    """
+    Learns the number of rows to send per request with additive increase, multiplicative decrease.
+
+    The batch size grows by `step` rows while the latency per row keeps improving.  When it gets
+    worse the size steps back and is held for a while before growing again.  The size is halved
+    when a request times out or is too large, and growth stays below the smallest size that was
+    too large.  With adaptive=False the size stays fixed.
+    """
+
+    def __init__(self, initial_size, *, adaptive=True, min_size=1, max_size=MAX_BATCH_SIZE, clock=time.monotonic):
+        self.requested_size = initial_size
+        self.initial_size = min(max(initial_size, min_size), max_size)
+        self.adaptive = adaptive
+        self.min_size = min_size if adaptive else self.initial_size
+        self.max_size = max_size if adaptive else self.initial_size
+        self.step = self.initial_size
+        self.clock = clock
+        self.size = self.initial_size
+        self.lock = threading.Lock()
+        self.last_seconds_per_row = None
+        self.hold = 0
+        self.ceiling = None
+        self.requests = 0
+        self.rows = 0
+        self.seconds = 0.0
+        self.increases = 0
+        self.decreases = 0
+        # (batch size, rows, seconds, outcome) of the most recent requests
+        self.history = deque(maxlen=HISTORY_SIZE)
+
+    def record_success(self, rows, seconds):
+        with self.lock:
+            self.requests += 1
+            self.rows += rows
+            self.seconds += seconds
+            self.history.append((self.size, rows, seconds, "ok"))
+
+            # A partial batch, e.g. the last rows of a FlowFile, says nothing about the batch size
+            if rows < self.size or rows == 0:
+                return
+
+            seconds_per_row = seconds / rows
+            previous = self.last_seconds_per_row
+            self.last_seconds_per_row = seconds_per_row
+            if self.hold > 0:
+                self.hold -= 1
+            elif previous is None or seconds_per_row <= previous * (1 + LATENCY_TOLERANCE):
+                self.resize(self.size + self.step)
+            else:
+                self.resize(self.size - self.step)
+                self.hold = HOLD_REQUESTS
+
+    def resize(self, new_size):
+        new_size = min(max(new_size, self.min_size), self.max_size)
+        if self.ceiling is not None:
+            # Approach the smallest size that was too large by halving the distance
+            new_size = min(new_size, (self.size + self.ceiling) // 2)
+        if new_size == self.size:
+            return
+        if new_size > self.size:
+            self.increases += 1
+        else:
+            self.decreases += 1
+            # Latencies measured at the larger size are not comparable
+            self.last_seconds_per_row = None
+        self.size = new_size
+
+    def record_failure(self, rows, outcome):
+        """Halves the batch size, returning False if it can't be decreased any further."""
+        with self.lock:
+            self.requests += 1
+            self.history.append((self.size, rows, None, outcome))
+            if outcome == "too large" and self.adaptive:
+                self.ceiling = rows if self.ceiling is None else min(self.ceiling, rows)
+            size = self.size
+            self.resize(min(size, rows) // 2)
+            return self.size < size
+
+    def write(self, pa_table, write_batch):
+        """
+        Writes a table in batches of the learned size using write_batch(batch).
+
+        Batches rejected as too large are retried smaller.  Timeouts shrink the batch size for the
+        following requests but are re-raised, since the timed out request may have been applied.
+        """
+        offset = 0
+        while offset < pa_table.num_rows:
+            batch = pa_table.slice(offset, self.size)
+            start = self.clock()
+            try:
+                write_batch(batch)
+            except Exception as e:
+                if is_size_error(e):
+                    if self.record_failure(batch.num_rows, "too large"):
+                        continue
+                elif is_timeout_error(e):
+                    self.record_failure(batch.num_rows, "timeout")
+                raise
+            self.record_success(batch.num_rows, self.clock() - start)
+            offset += batch.num_rows
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "size": self.size,
+                "requests": self.requests,
+                "increases": self.increases,
+                "decreases": self.decreases,
+                "rows.per.second": self.rows / self.seconds if self.seconds else 0.0,
+                "history": [size for size, _, _, _ in self.history],
+            }
+
+    def attributes(self, prefix="vastdb.batch"):
+        """Returns the metrics as FlowFile attributes."""
+        return {f"{prefix}.{name}": self.format_metric(value) for name, value in self.metrics().items()}
+
+    def format_metric(self, value):
+        if isinstance(value, list):
+            return ",".join(str(v) for v in value)
+        if isinstance(value, float):
+            return f"{value:.1f}"
+        return str(value)
+
+
+def get_batch_sizer(key, initial_size, *, adaptive=True):
+    """
+    Returns the batch sizer of a target, e.g. (endpoint, bucket, schema, table, operation).
+
+    Sizers are shared by the processors of this python process, so the learned size outlives a
+    single FlowFile.  A new sizer is started when the batch size properties change.
+    """
+    with _sizers_lock:
+        sizer = _sizers.get(key)
+        if sizer is None or sizer.requested_size != initial_size or sizer.adaptive != adaptive:
+            sizer = AdaptiveBatchSizer(initial_size, adaptive=adaptive)
+            _sizers[key] = sizer
+        return sizer
@@ -0,0 +1,285 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+"""
+The properties shared by the VastDB processors, and the helpers reading them from the process context.
+
+Processors keep the descriptors as attributes and list them in their descriptors, e.g.
+`self.vastdb_endpoint, self.endpoint_selection, ... = connection_properties()`.
+"""
+
+import vastdb
+from endpoints import get_endpoint_pool
+from instrumentation import create_stage_timer
+from memory_governor import get_memory_governor
+from nifiapi.properties import DataUnit, PropertyDescriptor, StandardValidators, ValidationResult
+from profiling import PROFILERS, get_transform_profiler
+from vastdb.config import QueryConfig
+
+VASTDB_ENDPOINT = "VastDB Endpoint"
+ENDPOINT_SELECTION = "Endpoint Selection"
+RESOLVE_ENDPOINT_ADDRESSES = "Resolve Endpoint Addresses"
+VASTDB_CREDENTIALS_PROVIDER_SERVICE = "VastDB Credentials Provider Service"
+STAGE_TIMINGS = "Stage Timings"
+ARROW_MEMORY_TRACKING = "Arrow Memory Tracking"
+ARROW_MEMORY_POOL = "Arrow Memory Pool"
+ARROW_MEMORY_BUDGET = "Arrow Memory Budget"
+RELEASE_ARROW_MEMORY = "Release Arrow Memory"
+PROFILING_SAMPLE_RATE = "Profiling Sample Rate"
+PROFILER = "Profiler"
+PROFILING_DIRECTORY = "Profiling Directory"
+PROFILING_MAX_FILES = "Profiling Max Files"
+
+STAGE_TIMINGS_DESCRIPTION = (
+    "Time each processing stage (e.g. reading, parsing, connecting and the VastDB requests) "
+    "and write the timings in milliseconds to FlowFile attributes such as vastdb.insert.ms, "
+    "with the rows and bytes processed in vastdb.rows and vastdb.bytes."
+)
+
+
+def connection_properties():
+    """Returns the VastDB Endpoint, Endpoint Selection, Resolve Endpoint Addresses and credentials properties."""
+    return [
+        PropertyDescriptor(
+            name=VASTDB_ENDPOINT,
+            description=(
+                "The VastDB endpoint URL (AWS_S3_ENDPOINT_URL). Several URLs, e.g. of the VIPs of a VIP pool, "
+                "can be separated by commas to spread the sessions over them."
+            ),
+            required=True,
+            default_value="http://vip-pool.v123-xy.VastENG.lab",
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        ),
+        PropertyDescriptor(
+            name=ENDPOINT_SELECTION,
+            description=(
+                "How each FlowFile's session picks one of the VastDB endpoints: in turn (Round Robin), or the "
+                "endpoint with the fewest sessions in use (Least Loaded). Endpoints that can't be connected to are "
+                "left out for 30 seconds, and the next endpoint is tried."
+            ),
+            allowable_values=["Round Robin", "Least Loaded"],
+            required=True,
+            default_value="Round Robin",
+        ),
+        PropertyDescriptor(
+            name=RESOLVE_ENDPOINT_ADDRESSES,
+            description=(
+                "Resolve the host names of the http VastDB endpoints, and use each of their addresses as an "
+                "endpoint, e.g. every VIP of a VIP pool behind one DNS name. The names are resolved again every "
+                "minute. https endpoints are used as they are, as TLS verifies the certificate against the host name."
+            ),
+            allowable_values=["True", "False"],
+            required=True,
+            default_value="False",
+        ),
+        PropertyDescriptor(
+            name=VASTDB_CREDENTIALS_PROVIDER_SERVICE,
+            description="The Controller Service that is used to obtain VastDB credentials.",
+            required=True,
+            controller_service_definition="org.apache.nifi.processors.aws.credentials.provider.service.AWSCredentialsProviderService",
+        ),
+    ]
+
+
+def stage_timings_property(description=STAGE_TIMINGS_DESCRIPTION):
+    return PropertyDescriptor(
+        name=STAGE_TIMINGS,
+        description=description,
+        allowable_values=["True", "False"],
+        required=True,
+        default_value="False",
+    )
+
+
+def arrow_memory_tracking_property():
+    return PropertyDescriptor(
+        name=ARROW_MEMORY_TRACKING,
+        description=(
+            "Track the bytes allocated from the Arrow memory pool by each processing stage, and write them "
+            "to FlowFile attributes such as vastdb.insert.arrow.bytes along with the stage timings."
+        ),
+        allowable_values=["True", "False"],
+        required=True,
+        default_value="False",
+    )
+
+
+def arrow_memory_properties(budget_description):
+    """Returns the Arrow Memory Pool, Arrow Memory Budget and Release Arrow Memory properties."""
+    return [
+        PropertyDescriptor(
+            name=ARROW_MEMORY_POOL,
+            description=(
+                "The Arrow memory pool of the Python worker: pyarrow's Default, jemalloc, mimalloc or the system "
+                "allocator. The pool is used by every processor of the worker."
+            ),
+            allowable_values=["Default", "jemalloc", "mimalloc", "system"],
+            required=True,
+            default_value="Default",
+        ),
+        PropertyDescriptor(
+            name=ARROW_MEMORY_BUDGET,
+            description=(
+                "The most bytes the Python worker should allocate from the Arrow memory pool, shared by its "
+                f"concurrent FlowFiles, or leave blank for no limit. {budget_description}"
+            ),
+            required=False,
+            validators=[StandardValidators.DATA_SIZE_VALIDATOR],
+        ),
+        PropertyDescriptor(
+            name=RELEASE_ARROW_MEMORY,
+            description=(
+                "Return the memory cached by the Arrow memory pool to the operating system after each FlowFile, "
+                "so a large FlowFile doesn't leave the worker holding its memory."
+            ),
+            allowable_values=["True", "False"],
+            required=True,
+            default_value="False",
+        ),
+    ]
+
+
+def profiling_properties(units="FlowFiles", unit="FlowFile"):
+    """Returns the Profiling Sample Rate, Profiler, Profiling Directory and Profiling Max Files properties."""
+    return [
+        PropertyDescriptor(
+            name=PROFILING_SAMPLE_RATE,
+            description=(
+                f"The fraction of the {units} to profile, between 0 and 1, e.g. 0.01 to profile 1 {unit} in "
+                "100. The profiles are written to the Profiling Directory. 0 disables profiling."
+            ),
+            required=True,
+            default_value="0",
+            validators=[StandardValidators.NUMBER_VALIDATOR],
+        ),
+        PropertyDescriptor(
+            name=PROFILER,
+            description=(
+                "cProfile records every Python function call into pstats files. Sampling records the Python "
+                "stacks every 5 milliseconds into folded stack files for flame graphs, and costs less."
+            ),
+            allowable_values=PROFILERS,
+            required=True,
+            default_value="cProfile",
+        ),
+        PropertyDescriptor(
+            name=PROFILING_DIRECTORY,
+            description="The directory the profiles are written to. Required when profiling.",
+            required=False,
+            validators=[StandardValidators.NON_EMPTY_VALIDATOR],
+        ),
+        PropertyDescriptor(
+            name=PROFILING_MAX_FILES,
+            description="The number of profile files kept in the Profiling Directory, the oldest are deleted.",
+            required=True,
+            default_value="20",
+            validators=[StandardValidators.POSITIVE_INTEGER_VALIDATOR],
+        ),
+    ]
+
+
+def validate_profiling(context):
+    """Returns the validation results of the profiling properties: the sample rate is a fraction from 0 to 1."""
+    sample_rate = context.getProperty(PROFILING_SAMPLE_RATE).getValue()
+    try:
+        valid = 0 <= float(sample_rate) <= 1
+    except (TypeError, ValueError):
+        valid = False
+    if valid:
+        return []
+    return [
+        ValidationResult(
+            subject=PROFILING_SAMPLE_RATE,
+            explanation=f"{PROFILING_SAMPLE_RATE} must be a number between 0 and 1, not '{sample_rate}'",
+            valid=False,
+            input=sample_rate,
+        )
+    ]
+
+
+def transform_profiler(context, name, logger):
+    """Returns the profiler of the transform() calls of the processor `name`."""
+    return get_transform_profiler(
+        name,
+        context.getProperty(PROFILING_DIRECTORY).getValue(),
+        profiler=context.getProperty(PROFILER).getValue(),
+        sample_rate=context.getProperty(PROFILING_SAMPLE_RATE).asFloat(),
+        max_files=context.getProperty(PROFILING_MAX_FILES).asInteger(),
+        logger=logger,
+    )
+
+
+def stage_timer(context, *, track_memory=True):
+    """
+    Returns the stage timer of a FlowFile, disabled unless Stage Timings is set.
+
+    `track_memory` is False for processors without the Arrow Memory Tracking property.
+    """
+    return create_stage_timer(
+        context.getProperty(STAGE_TIMINGS).getValue() == "True",
+        track_memory=track_memory and context.getProperty(ARROW_MEMORY_TRACKING).getValue() == "True",
+    )
+
+
+def stage_attributes(timer, logger):
+    """Returns the FlowFile attributes of the stage timings, logging their summary."""
+    if timer.enabled:
+        logger.info(f"Stage timings: {timer.summary()}")
+    return timer.attributes()
+
+
+def endpoint_pool(context):
+    """Returns the pool spreading the sessions over the VastDB endpoints."""
+    return get_endpoint_pool(
+        context.getProperty(VASTDB_ENDPOINT).getValue(),
+        selection=context.getProperty(ENDPOINT_SELECTION).getValue(),
+        resolve=context.getProperty(RESOLVE_ENDPOINT_ADDRESSES).getValue() == "True",
+    )
+
+
+def query_config(context, max_rows=None, *, limit_pushdown=False):
+    """
+    Returns the QueryConfig of a select, spreading its splits over the healthy VastDB endpoints.
+
+    With `limit_pushdown`, each sub-split returns at most `max_rows` rows.
+    """
+    config = QueryConfig()
+    if max_rows is not None and limit_pushdown:
+        config.limit_rows_per_sub_split = min(config.limit_rows_per_sub_split, max_rows)
+    config.data_endpoints = endpoint_pool(context).data_endpoints()
+    return config
+
+
+def get_vastdb_session(context, logger):
+    """Returns a VastDB session on one of the endpoints, with the credentials of the credentials provider."""
+    credentials_provider_service = context.getProperty(VASTDB_CREDENTIALS_PROVIDER_SERVICE).asControllerService()
+    credentials = credentials_provider_service.getAwsCredentialsProvider().resolveCredentials()
+
+    try:
+        session = endpoint_pool(context).connect(
+            lambda endpoint: vastdb.connect(
+                endpoint=endpoint, access=credentials.accessKeyId(), secret=credentials.secretAccessKey()
+            )
+        )
+        logger.info("Connected to VastDB")
+    except Exception as e:
+        error_message = f"Failed to connect to VastDB: {e}"
+        raise RuntimeError(error_message) from e
+    else:
+        return session
+
+
+def worker_memory_governor(context):
+    """Returns the memory governor of the Python worker, selecting its Arrow memory pool."""
+    budget = context.getProperty(ARROW_MEMORY_BUDGET)
+    return get_memory_governor(
+        context.getProperty(ARROW_MEMORY_POOL).getValue(),
+        int(budget.asDataSize(DataUnit.B)) if budget.getValue() else None,
+    )
+
+
+def release_memory(context):
+    """Returns the memory cached by the Arrow memory pool to the system, when Release Arrow Memory is set."""
+    if context.getProperty(RELEASE_ARROW_MEMORY).getValue() == "True":
+        worker_memory_governor(context).release()
@@ -0,0 +1,59 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+# pyarrow is imported when content is decompressed, so that importing the processors stays fast
+
+# The first bytes of each supported codec's streams
+MAGIC_BYTES = {"gzip": b"\x1f\x8b", "zstd": b"\x28\xb5\x2f\xfd"}
+
+# The Compression property values, as Arrow codecs
+CODECS = {"None": None, "gzip": "gzip", "zstd": "zstd"}
+
+
+def detect_codec(content):
+    """Returns the codec of compressed content from its first bytes, or None for uncompressed content."""
+    for codec, magic in MAGIC_BYTES.items():
+        if content[: len(magic)] == magic:
+            return codec
+    return None
+
+
+def content_codec(content, compression):
+    """Returns the codec of the content for a Compression property value: Detect, None, gzip or zstd."""
+    if compression == "Detect":
+        return detect_codec(content)
+    return CODECS[compression]
+
+
+def open_decompressed(content, codec):
+    """Returns a stream of the decompressed content, which is decompressed as it's read."""
+    import pyarrow as pa
+
+    return pa.CompressedInputStream(pa.BufferReader(content), codec)
+
+
+def decompress(content, codec):
+    """Returns the whole decompressed content, for readers that need all of it, e.g. Parquet's footer."""
+    if codec is None:
+        return content
+    with open_decompressed(content, codec) as stream:
+        return stream.read()
+
+
+def decompressed_lines(content, codec, block_size):
+    """
+    Decompresses line delimited content into blocks of about block_size bytes, each ending at a line boundary.
+
+    Only a block at a time is held decompressed, a line longer than a block is added to the next block.
+    """
+    remainder = b""
+    with open_decompressed(content, codec) as stream:
+        while chunk := stream.read(max(block_size, 1)):
+            block = remainder + chunk
+            end = block.rfind(b"\n") + 1
+            if end:
+                yield block[:end]
+            remainder = block[end:]
+    if remainder:
+        yield remainder
@@ -0,0 +1,250 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+# pyarrow, pandas and yaml are imported when the columns are derived, so that importing the processors stays fast
+
+# The operations of a derived column, with the keys each one requires
+DERIVED_OPS = {
+    "constant": ["value"],
+    "now": [],
+    "cast": ["column", "datatype"],
+    "hash": ["columns"],
+    "strptime": ["column", "format"],
+    "substring": ["column", "start"],
+    "coalesce": ["columns"],
+    "lower": ["column"],
+    "upper": ["column"],
+    "trim": ["column"],
+}
+
+# Combines the hashes of the columns of a row, in order
+HASH_MULTIPLIER = 0x100000001B3
+
+# The hash of a null value, of any type
+NULL_HASH = 0x6A09E667F3BCC908
+
+# Distinguishes the bits of fractional floats from integers
+FLOAT_TAG = 0x3C6EF372FE94F82B
+
+# Floats from this magnitude don't fit in an int64, and hash as floats
+INTEGRAL_FLOAT_LIMIT = 2.0**63
+
+# The operations on string columns, as pyarrow compute functions
+STRING_OPS = {"lower": "utf8_lower", "upper": "utf8_upper", "trim": "utf8_trim_whitespace"}
+
+
+def parse_yaml_derived_columns(yaml_str):
+    import yaml
+
+    return parse_derived_columns(yaml.safe_load(yaml_str))
+
+
+def parse_derived_columns(data):
+    """
+    Validates a list of derived columns, as parsed from yaml, e.g.
+
+    - name: ingested_at
+      op: now
+    - name: tenant_key
+      op: hash
+      columns: [tenant, id]
+    """
+    if data is None:
+        return []
+    if isinstance(data, dict):
+        data = [data]
+    if not isinstance(data, list):
+        error_message = f"Derived columns must be a list, not {type(data)}"
+        raise TypeError(error_message)
+
+    derived_columns = []
+    for derived in data:
+        if not isinstance(derived, dict):
+            error_message = f"Unsupported derived column type: {type(derived)}"
+            raise TypeError(error_message)
+        if not derived.get("name"):
+            error_message = f"Missing name. Derived column: {derived}"
+            raise ValueError(error_message)
+        op = str(derived.get("op", "")).strip().lower()
+        if op not in DERIVED_OPS:
+            error_message = f"Unsupported operation: {op}. Derived column: {derived}"
+            raise ValueError(error_message)
+        missing = [key for key in DERIVED_OPS[op] if key not in derived]
+        if missing:
+            error_message = f"Missing {', '.join(missing)} for operation: {op}. Derived column: {derived}"
+            raise ValueError(error_message)
+        if "columns" in derived and not (isinstance(derived["columns"], list) and derived["columns"]):
+            error_message = f"'columns' must be a non empty list. Derived column: {derived}"
+            raise ValueError(error_message)
+        if op == "constant" and derived["value"] is None and not derived.get("datatype"):
+            error_message = f"A null constant needs a datatype. Derived column: {derived}"
+            raise ValueError(error_message)
+        derived_columns.append({**derived, "op": op})
+    return derived_columns
+
+
+def arrow_type(datatype):
+    """Returns the Arrow type of a datatype name, e.g. int64, utf8, date32 or timestamp[ms]."""
+    import pyarrow as pa
+
+    try:
+        return pa.type_for_alias(str(datatype))
+    except ValueError as e:
+        error_message = f"Unsupported datatype: {datatype}"
+        raise ValueError(error_message) from e
+
+
+def source_column(pa_table, name, default_type=None):
+    """Returns a column of the rows, or nulls when the rows lack it, e.g. as it was null in every row of the block."""
+    import pyarrow as pa
+
+    if name in pa_table.column_names:
+        return pa_table[name]
+    return pa.nulls(pa_table.num_rows, default_type or pa.null())
+
+
+def hash_columns(pa_table, names):
+    """
+    Returns a 64 bit hash of the values of the columns in each row, which is the same across blocks and processes.
+
+    The Arrow values are hashed by their kind rather than their exact type, so a key hashes the same whether a
+    block infers its column as int64 or double, or its timestamps in seconds or milliseconds.
+    """
+    import numpy as np
+    import pyarrow as pa
+
+    hashes = np.zeros(pa_table.num_rows, np.uint64)
+    for name in names:
+        with np.errstate(over="ignore"):
+            hashes = mix_hashes(hashes * np.uint64(HASH_MULTIPLIER) + value_hashes(source_column(pa_table, name)))
+    return pa.array(hashes, pa.uint64())
+
+
+def value_hashes(column):
+    """Returns a numpy uint64 hash of each value of a column, and NULL_HASH for its nulls."""
+    import numpy as np
+    import pandas as pd
+    import pyarrow as pa
+
+    column = column.combine_chunks() if isinstance(column, pa.ChunkedArray) else column
+    if pa.types.is_dictionary(column.type):
+        column = column.dictionary_decode()
+    column_type = column.type
+    text_types = (pa.types.is_string, pa.types.is_large_string, pa.types.is_binary, pa.types.is_large_binary)
+    valid = column.is_valid().to_numpy(zero_copy_only=False)
+
+    if pa.types.is_null(column_type):
+        return np.full(len(column), NULL_HASH, np.uint64)
+    if pa.types.is_floating(column_type):
+        values = column.cast(pa.float64()).fill_null(0).to_numpy(zero_copy_only=False)
+        # Whole numbers hash as the integers they equal, as a block may infer an integer column as double
+        integral = (np.floor(values) == values) & (np.abs(values) < INTEGRAL_FLOAT_LIMIT)
+        hashes = np.where(
+            integral,
+            np.where(integral, values, 0).astype(np.int64).view(np.uint64),
+            values.view(np.uint64) ^ np.uint64(FLOAT_TAG),
+        )
+    elif any(is_type(column_type) for is_type in text_types):
+        values = column.fill_null(pa.scalar("", column_type))
+        hashes = pd.util.hash_array(values.to_numpy(zero_copy_only=False).astype(object), categorize=False)
+    else:
+        integers = temporal_integers(column)
+        if integers is None:
+            # Decimals and nested values hash as their text
+            strings = pa.array([None if value is None else str(value) for value in column.to_pylist()], pa.string())
+            hashes = pd.util.hash_array(strings.fill_null("").to_numpy(zero_copy_only=False), categorize=False)
+        else:
+            hashes = integers.fill_null(0).to_numpy(zero_copy_only=False).view(np.uint64)
+    return np.where(valid, mix_hashes(np.asarray(hashes, np.uint64)), np.uint64(NULL_HASH))
+
+
+def temporal_integers(column):
+    """Returns the int64 values of integer, boolean and temporal columns in a fixed unit, or None for other types."""
+    import pyarrow as pa
+
+    column_type = column.type
+    if pa.types.is_integer(column_type) or pa.types.is_boolean(column_type):
+        return column.cast(pa.int64(), safe=False)
+    if pa.types.is_timestamp(column_type):
+        column = column.cast(pa.timestamp("us", column_type.tz), safe=False)
+    elif pa.types.is_date(column_type):
+        column = column.cast(pa.date32())
+    elif pa.types.is_time(column_type):
+        column = column.cast(pa.time64("us"), safe=False)
+    elif pa.types.is_duration(column_type):
+        column = column.cast(pa.duration("us"), safe=False)
+    else:
+        return None
+    return column.view(pa.int32() if pa.types.is_date(column.type) else pa.int64()).cast(pa.int64())
+
+
+def mix_hashes(hashes):
+    """Mixes the bits of numpy uint64 values (the splitmix64 finalizer), so close values hash far apart."""
+    import numpy as np
+
+    with np.errstate(over="ignore"):
+        hashes = hashes ^ (hashes >> np.uint64(30))
+        hashes = hashes * np.uint64(0xBF58476D1CE4E5B9)
+        hashes = hashes ^ (hashes >> np.uint64(27))
+        hashes = hashes * np.uint64(0x94D049BB133111EB)
+        return hashes ^ (hashes >> np.uint64(31))
+
+
+def evaluate(pa_table, derived, now):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    op = derived["op"]
+    num_rows = pa_table.num_rows
+    if op == "constant":
+        datatype = arrow_type(derived["datatype"]) if derived.get("datatype") else None
+        return pa.repeat(pa.scalar(derived["value"], datatype), num_rows)
+    if op == "now":
+        return pa.repeat(pa.scalar(now, pa.timestamp("us", tz="UTC")), num_rows)
+    if op == "cast":
+        return source_column(pa_table, derived["column"]).cast(arrow_type(derived["datatype"]))
+    if op == "hash":
+        return hash_columns(pa_table, derived["columns"])
+    if op == "coalesce":
+        values = [pa_table[name] for name in derived["columns"] if name in pa_table.column_names]
+        if "value" in derived:
+            values.append(pa.scalar(derived["value"]))
+        return pc.coalesce(*values) if values else pa.nulls(num_rows)
+
+    strings = source_column(pa_table, derived["column"], pa.string())
+    if op == "strptime":
+        return pc.strptime(
+            strings,
+            format=derived["format"],
+            unit=derived.get("unit", "s"),
+            error_is_null=bool(derived.get("error_is_null", False)),
+        )
+    if op == "substring":
+        start = int(derived["start"])
+        stop = start + int(derived["length"]) if derived.get("length") is not None else None
+        return pc.utf8_slice_codeunits(strings, start=start, stop=stop)
+    return pc.call_function(STRING_OPS[op], [strings])
+
+
+def add_derived_columns(pa_table, derived_columns, *, now=None):
+    """
+    Adds the derived columns to a table, each computed over all the rows at once with pyarrow compute.
+
+    A derived column replaces the column of the same name, and later derived columns can use the earlier ones.
+    `now` is the value of the `now` operation, so every block of a FlowFile gets the same ingest time.
+    """
+    import datetime
+
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    for derived in derived_columns:
+        try:
+            values = evaluate(pa_table, derived, now)
+        except Exception as e:
+            error_message = f"Error deriving column '{derived['name']}' with {derived}: {e}"
+            raise ValueError(error_message) from e
+        if derived["name"] in pa_table.column_names:
+            pa_table = pa_table.set_column(pa_table.column_names.index(derived["name"]), derived["name"], values)
+        else:
+            pa_table = pa_table.append_column(derived["name"], values)
+    return pa_table
@@ -0,0 +1,194 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import itertools
+import re
+import socket
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit, urlunsplit
+
+SELECTIONS = ["Round Robin", "Least Loaded"]
+
+# Seconds an endpoint that couldn't be reached is left out of the rotation
+UNHEALTHY_SECONDS = 30
+
+# Seconds before the addresses of resolved endpoints are looked up again
+RESOLVE_SECONDS = 60
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def parse_endpoints(value):
+    """Splits an endpoint property value, e.g. `http://vip1, http://vip2`, into its URLs."""
+    endpoints = [endpoint for endpoint in re.split(r"[,\s]+", value or "") if endpoint]
+    if not endpoints:
+        error_message = "At least one VastDB endpoint is required"
+        raise ValueError(error_message)
+    for endpoint in endpoints:
+        parts = urlsplit(endpoint)
+        if parts.scheme not in {"http", "https"} or not parts.hostname:
+            error_message = f"Invalid VastDB endpoint '{endpoint}', expected an http or https URL"
+            raise ValueError(error_message)
+    return endpoints
+
+
+def resolve_endpoint(endpoint, getaddrinfo=socket.getaddrinfo):
+    """
+    Returns an endpoint URL for each address its host name resolves to, e.g. each VIP of a VIP pool.
+
+    Only http endpoints are resolved.  https endpoints are returned as they are, as TLS verifies the certificate
+    against the host name of the URL, which an address wouldn't match.
+    """
+    parts = urlsplit(endpoint)
+    if parts.scheme != "http":
+        return [endpoint]
+    addresses = sorted({info[4][0] for info in getaddrinfo(parts.hostname, parts.port or 80, type=socket.SOCK_STREAM)})
+    netloc_port = f":{parts.port}" if parts.port else ""
+    return [
+        urlunsplit(parts._replace(netloc=f"[{address}]{netloc_port}" if ":" in address else f"{address}{netloc_port}"))
+        for address in addresses
+    ]
+
+
+def is_connection_error(error):
+    """Returns True for errors caused by an endpoint that can't serve requests, which are worth retrying elsewhere."""
+    from vastdb import errors
+
+    # requests' connection errors and timeouts are OSErrors
+    return isinstance(error, (errors.ConnectionError, errors.ServiceUnavailable, OSError))
+
+
+class EndpointPool:
+    """
+    Spreads the VastDB sessions over several endpoints, e.g. the VIPs of a VIP pool.
+
+    Sessions are given the endpoints in turn (Round Robin) or the endpoint with the fewest sessions in use
+    (Least Loaded).  A session is in use until it is garbage collected, which CPython does as soon as the
+    FlowFile that opened it is processed.  Endpoints that can't be connected to are left out of the rotation
+    for `unhealthy_seconds`, unless all of them are unhealthy.
+    """
+
+    def __init__(
+        self,
+        endpoints,
+        *,
+        selection="Round Robin",
+        resolve=False,
+        unhealthy_seconds=UNHEALTHY_SECONDS,
+        resolve_seconds=RESOLVE_SECONDS,
+        clock=time.monotonic,
+        getaddrinfo=socket.getaddrinfo,
+    ):
+        if selection not in SELECTIONS:
+            error_message = f"Unsupported endpoint selection '{selection}', expected one of {SELECTIONS}"
+            raise ValueError(error_message)
+        self.configured = list(endpoints)
+        self.selection = selection
+        self.resolve = resolve
+        self.unhealthy_seconds = unhealthy_seconds
+        self.resolve_seconds = resolve_seconds
+        self.clock = clock
+        self.getaddrinfo = getaddrinfo
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+        self.unhealthy_until = {}
+        self.in_use = {}
+        self.endpoints = []
+        self.resolved_at = None
+
+    def current_endpoints(self):
+        if not self.resolve:
+            return self.configured
+        now = self.clock()
+        if self.resolved_at is None or now - self.resolved_at >= self.resolve_seconds:
+            try:
+                resolved = [url for endpoint in self.configured for url in resolve_endpoint(endpoint, self.getaddrinfo)]
+            except OSError:
+                # Keep the previous addresses, or use the names when they were never resolved
+                resolved = self.endpoints or self.configured
+            self.endpoints = list(dict.fromkeys(resolved)) or self.configured
+            self.resolved_at = now
+        return self.endpoints
+
+    def candidates(self):
+        """Returns the endpoints in the order they should be tried, healthy ones first."""
+        with self.lock:
+            endpoints = self.current_endpoints()
+            now = self.clock()
+            start = next(self.counter) % len(endpoints)
+            ordered = endpoints[start:] + endpoints[:start]
+            if self.selection == "Least Loaded":
+                # Stable, so endpoints with as many sessions keep the round robin order
+                ordered.sort(key=lambda endpoint: self.in_use.get(endpoint, 0))
+            healthy = [endpoint for endpoint in ordered if self.unhealthy_until.get(endpoint, 0) <= now]
+            unhealthy = sorted(
+                (endpoint for endpoint in ordered if endpoint not in healthy),
+                key=lambda endpoint: self.unhealthy_until[endpoint],
+            )
+            return healthy + unhealthy
+
+    def healthy_endpoints(self):
+        with self.lock:
+            now = self.clock()
+            return [endpoint for endpoint in self.current_endpoints() if self.unhealthy_until.get(endpoint, 0) <= now]
+
+    def data_endpoints(self):
+        """Returns the endpoints the SDK should split queries over, or None to let it use the table's."""
+        endpoints = self.healthy_endpoints()
+        return endpoints if len(endpoints) > 1 else None
+
+    def mark_unhealthy(self, endpoint):
+        with self.lock:
+            self.unhealthy_until[endpoint] = self.clock() + self.unhealthy_seconds
+
+    def mark_healthy(self, endpoint):
+        with self.lock:
+            self.unhealthy_until.pop(endpoint, None)
+
+    def release(self, endpoint):
+        with self.lock:
+            self.in_use[endpoint] -= 1
+
+    def connect(self, connect):
+        """
+        Returns `connect(endpoint)` for the selected endpoint, e.g. a VastDB session.
+
+        Endpoints that fail with connection errors are marked unhealthy and the next endpoint is tried,
+        the last error is raised when no endpoint can be connected to.
+        """
+        for endpoint in self.candidates():
+            try:
+                session = connect(endpoint)
+            except Exception as e:
+                if not is_connection_error(e):
+                    raise
+                self.mark_unhealthy(endpoint)
+                last_error = e
+                continue
+
+            self.mark_healthy(endpoint)
+            with self.lock:
+                self.in_use[endpoint] = self.in_use.get(endpoint, 0) + 1
+            weakref.finalize(session, self.release, endpoint)
+            return session
+        raise last_error
+
+
+def get_endpoint_pool(value, *, selection="Round Robin", resolve=False):
+    """
+    Returns the pool of the endpoints in an endpoint property value, e.g. `http://vip1,http://vip2`.
+
+    Pools are shared by the processors of this python process, so the endpoint health and load is
+    known across FlowFiles.  A new pool is started when the endpoint properties change.
+    """
+    key = (value, selection, resolve)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = EndpointPool(parse_endpoints(value), selection=selection, resolve=resolve)
+            _pools[key] = pool
+        return pool
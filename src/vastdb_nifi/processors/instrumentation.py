@@ -0,0 +1,157 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import threading
+import time
+
+
+class _Stage:
+    __slots__ = ("allocated", "name", "start", "timer")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+        self.start = None
+        self.allocated = None
+
+    def __enter__(self):
+        if self.timer.memory is not None:
+            self.allocated = self.timer.memory()
+        self.start = self.timer.clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timer.add_time(self.name, self.timer.clock() - self.start)
+        if self.timer.memory is not None:
+            allocated = self.timer.memory()
+            self.timer.add_allocation(self.name, allocated - self.allocated, allocated)
+
+
+class StageTimer:
+    """
+    Accumulates the time spent in each processing stage of a FlowFile, with the rows and bytes processed.
+
+    Stages may be timed from several threads, e.g. parsing on a pipeline thread while inserting, so
+    the stage times can add up to more than the total time.
+
+    With `memory`, e.g. `pa.total_allocated_bytes`, the bytes allocated by each stage are tracked too, as the
+    change in allocated bytes between the start and the end of the stage, with the most allocated at a stage
+    boundary.  The memory pool is shared by all the threads, so concurrent stages see each other's allocations.
+    """
+
+    enabled = True
+
+    def __init__(self, prefix="vastdb", clock=time.perf_counter, *, memory=None):
+        self.prefix = prefix
+        self.clock = clock
+        self.memory = memory
+        self.allocated = {}
+        self.max_allocated = 0
+        self.started = clock()
+        self.seconds = {}
+        self.rows = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def stage(self, name):
+        """Returns a context manager timing a stage, e.g. `with timer.stage("insert"): ...`."""
+        return _Stage(self, name)
+
+    def timed(self, name, iterable):
+        """Iterates over an iterable, timing the production of each item as a stage."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+    def add_allocation(self, name, num_bytes, allocated):
+        with self.lock:
+            self.allocated[name] = self.allocated.get(name, 0) + num_bytes
+            self.max_allocated = max(self.max_allocated, allocated)
+
+    def add_rows(self, rows):
+        with self.lock:
+            self.rows += rows
+
+    def add_bytes(self, num_bytes):
+        with self.lock:
+            self.bytes += num_bytes
+
+    def attributes(self):
+        """Returns the timings in milliseconds, rows and bytes as FlowFile attributes."""
+        with self.lock:
+            attributes = {f"{self.prefix}.{name}.ms": f"{seconds * 1000:.1f}" for name, seconds in self.seconds.items()}
+            attributes[f"{self.prefix}.total.ms"] = f"{(self.clock() - self.started) * 1000:.1f}"
+            attributes[f"{self.prefix}.rows"] = str(self.rows)
+            attributes[f"{self.prefix}.bytes"] = str(self.bytes)
+            if self.memory is not None:
+                for name, num_bytes in self.allocated.items():
+                    attributes[f"{self.prefix}.{name}.arrow.bytes"] = str(num_bytes)
+                attributes[f"{self.prefix}.arrow.max.bytes"] = str(self.max_allocated)
+            return attributes
+
+    def summary(self):
+        return ", ".join(f"{name}={value}" for name, value in self.attributes().items())
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+# ruff: noqa: ARG002
+class NullStageTimer:
+    """A StageTimer that records nothing, so timing costs next to nothing when it is disabled."""
+
+    enabled = False
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def timed(self, name, iterable):
+        return iterable
+
+    def add_time(self, name, seconds):
+        pass
+
+    def add_allocation(self, name, num_bytes, allocated):
+        pass
+
+    def add_rows(self, rows):
+        pass
+
+    def add_bytes(self, num_bytes):
+        pass
+
+    def attributes(self):
+        return {}
+
+    def summary(self):
+        return ""
+
+
+NULL_STAGE_TIMER = NullStageTimer()
+
+
+def create_stage_timer(enabled, *, track_memory=False):
+    """Returns a timer, which also tracks the Arrow memory pool allocations of each stage with `track_memory`."""
+    if track_memory:
+        import pyarrow as pa
+
+        return StageTimer(memory=pa.total_allocated_bytes)
+    return StageTimer() if enabled else NULL_STAGE_TIMER
@@ -0,0 +1,122 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import re
+import threading
+
+# The SDK's internal row ID column, sent with the rows to update or delete
+ROW_ID = "$row_id"
+
+# The Unexpected Json Fields property values, as pyarrow's unexpected_field_behavior
+UNEXPECTED_FIELDS = {"Infer": "infer", "Ignore": "ignore", "Error": "error"}
+
+# pyarrow's JSON reader parses in blocks of at least its default size, a Json line must fit in a block
+MIN_BLOCK_SIZE = 1024**2
+MAX_BLOCK_SIZE = 16 * 1024**2
+
+_table_schemas = {}
+_table_schemas_lock = threading.Lock()
+
+
+def get_table_schema(key, load):
+    """
+    Returns the Arrow schema of a table, e.g. for the key (endpoint, bucket, schema, table).
+
+    The schemas are kept for the processors of this python process, `load()` is only called the first time,
+    and returns None when the table doesn't exist yet.
+    """
+    with _table_schemas_lock:
+        arrow_schema = _table_schemas.get(key)
+    if arrow_schema is None:
+        arrow_schema = load()
+        if arrow_schema is not None:
+            update_table_schema(key, arrow_schema)
+    return arrow_schema
+
+
+def update_table_schema(key, arrow_schema):
+    """Replaces the kept schema of a table, e.g. after columns were added to it."""
+    with _table_schemas_lock:
+        _table_schemas[key] = arrow_schema
+
+
+def row_id_schema():
+    """Returns the schema of the internal row ID column alone, all that deletes need."""
+    import pyarrow as pa
+
+    return pa.schema([pa.field(ROW_ID, pa.uint64())])
+
+
+def with_row_id(arrow_schema):
+    """Returns a table schema with the internal row ID column, to parse the rows to update."""
+    if ROW_ID in arrow_schema.names:
+        return arrow_schema
+    return arrow_schema.insert(0, row_id_schema().field(0))
+
+
+def parse_type(arrow_type):
+    """Returns the type pyarrow's JSON reader parses a column of a type as, strings for dates and fixed size binary."""
+    import pyarrow as pa
+
+    if pa.types.is_date(arrow_type) or pa.types.is_fixed_size_binary(arrow_type):
+        return pa.string()
+    return arrow_type
+
+
+def json_block_size(num_bytes):
+    """Returns the JSON reader block size, so the blocks of larger content are parsed by all the CPUs."""
+    return min(max(num_bytes // (os.cpu_count() or 1), MIN_BLOCK_SIZE), MAX_BLOCK_SIZE)
+
+
+def parse_json(content, arrow_schema=None, *, unexpected_fields="Infer"):
+    """
+    Parses line delimited Json, with the types of an Arrow schema, e.g. the target table's.
+
+    The columns of the schema are parsed as its types rather than inferred, which is faster and keeps the types
+    from changing between FlowFiles.  Fields that aren't in the schema are inferred, ignored or raise an error,
+    as `unexpected_fields` is Infer, Ignore or Error.  Fields of the schema that are missing from the Json are
+    null columns.  Without a schema, pyarrow infers every type.  The content can also be a stream, e.g. of
+    decompressed content, which is parsed as it's read.
+    """
+    import pyarrow as pa
+    from pyarrow import json as pa_json
+
+    # The size of a stream isn't known, it's parsed in the largest blocks
+    num_bytes = MAX_BLOCK_SIZE * (os.cpu_count() or 1) if isinstance(content, pa.NativeFile) else len(content)
+    source = content if isinstance(content, pa.NativeFile) else pa.BufferReader(content)
+    if arrow_schema is None:
+        return pa_json.read_json(source)
+
+    read_options = pa_json.ReadOptions(block_size=json_block_size(num_bytes), use_threads=num_bytes > MIN_BLOCK_SIZE)
+    parse_schema = pa.schema([field.with_type(parse_type(field.type)) for field in arrow_schema])
+    parse_options = pa_json.ParseOptions(
+        explicit_schema=parse_schema, unexpected_field_behavior=UNEXPECTED_FIELDS[unexpected_fields]
+    )
+    pa_table = pa_json.read_json(source, read_options=read_options, parse_options=parse_options)
+
+    for field in arrow_schema:
+        if field.type != parse_type(field.type):
+            index = pa_table.schema.get_field_index(field.name)
+            column = pa_table.column(index)
+            if pa.types.is_fixed_size_binary(field.type):
+                column = column.cast(pa.binary())
+            pa_table = pa_table.set_column(index, field, column.cast(field.type))
+    return pa_table
+
+
+def drop_missing_fields(pa_table, content):
+    """
+    Drops the columns of fields that are in none of the Json rows, which parse_json() adds as null columns.
+
+    pyarrow can't tell missing fields from null values, so only the columns without a single value are
+    checked, and kept when their field is in the Json, e.g. to set a column to null in every row.
+    """
+    missing = [
+        field.name
+        for field, column in zip(pa_table.schema, pa_table.columns)
+        if column.null_count == len(column)
+        and not re.search(rb'"' + re.escape(field.name.encode("utf-8")) + rb'"\s*:', content)
+    ]
+    return pa_table.drop_columns(missing)
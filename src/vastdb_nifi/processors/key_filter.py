@@ -0,0 +1,241 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import hashlib
+import math
+import threading
+import time
+from pathlib import Path
+
+# How often a key filter with a state directory is written to it
+PERSIST_INTERVAL_SECONDS = 60
+
+# Spreads the second hash of each key, from which the bit positions after the first are derived
+GOLDEN_RATIO = 0x9E3779B97F4A7C15
+
+_filters = {}
+_filters_lock = threading.Lock()
+
+
+class BloomFilter:
+    """
+    A Bloom filter of 64 bit key hashes, which are added and looked up as numpy arrays.
+
+    Each key sets `num_hashes` bits, at positions derived from its hash by double hashing.  Keys that were added
+    are always found, keys that weren't are found with about the false positive rate the filter was sized for.
+    """
+
+    def __init__(self, num_bits, num_hashes, bits=None, count=0):
+        import numpy as np
+
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = np.zeros(-(-num_bits // 8), np.uint8) if bits is None else bits
+        self.count = count
+
+    @classmethod
+    def for_capacity(cls, capacity, false_positive_rate):
+        """Returns a filter holding `capacity` keys with at most the false positive rate, in the fewest bits."""
+        num_bits = max(math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2), 64)
+        num_hashes = max(round(num_bits / max(capacity, 1) * math.log(2)), 1)
+        return cls(num_bits, num_hashes)
+
+    def positions(self, hashes):
+        import numpy as np
+
+        hashes = np.asarray(hashes, np.uint64)
+        with np.errstate(over="ignore"):
+            step = ((hashes >> np.uint64(32)) * np.uint64(GOLDEN_RATIO)) | np.uint64(1)
+            rounds = np.arange(self.num_hashes, dtype=np.uint64)[:, None]
+            return (hashes + rounds * step) % np.uint64(self.num_bits)
+
+    def add(self, hashes):
+        import numpy as np
+
+        positions = self.positions(hashes).ravel()
+        masks = np.left_shift(np.uint8(1), (positions & np.uint64(7)).astype(np.uint8))
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3), masks)
+        self.count += len(hashes)
+
+    def might_contain(self, hashes):
+        """Returns a numpy bool array, True for the hashes that may have been added."""
+        import numpy as np
+
+        positions = self.positions(hashes)
+        found = (self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return found.all(axis=0).astype(bool)
+
+
+class KeyFilter:
+    """
+    The keys inserted into a table recently, in two generations of Bloom filters to bound their memory.
+
+    Keys are added to the current generation.  When it holds `capacity` keys, or is older than the window, it
+    becomes the previous generation and the oldest keys are forgotten.  Keys are so remembered for at least the
+    window, unless more than `capacity` keys are inserted in it.  Each generation is sized for half the false
+    positive rate, so a lookup in both has about the false positive rate.
+    """
+
+    def __init__(
+        self, capacity, false_positive_rate, window_seconds, *, path=None, clock=time.time, persist_interval=None
+    ):
+        self.capacity = capacity
+        self.false_positive_rate = false_positive_rate
+        self.window_seconds = window_seconds
+        self.path = path
+        self.clock = clock
+        self.persist_interval = PERSIST_INTERVAL_SECONDS if persist_interval is None else persist_interval
+        self.lock = threading.Lock()
+        self.current = self.new_generation()
+        self.previous = None
+        self.created_at = clock()
+        self.saved_at = self.created_at
+        if path is not None and Path(path).exists():
+            self.load()
+
+    def new_generation(self):
+        return BloomFilter.for_capacity(self.capacity, self.false_positive_rate / 2)
+
+    def rotate(self, num_keys=0):
+        """Starts a new generation when the window is over, or when adding num_keys keys would overfill it."""
+        now = self.clock()
+        full = self.current.count and self.current.count + num_keys > self.capacity
+        if full or now - self.created_at >= self.window_seconds:
+            # The previous generation is older than the window, or more than capacity keys ago
+            self.previous = self.current if now - self.created_at < 2 * self.window_seconds else None
+            self.current = self.new_generation()
+            self.created_at = now
+
+    def might_contain(self, hashes):
+        with self.lock:
+            self.rotate()
+            found = self.current.might_contain(hashes)
+            if self.previous is not None:
+                found |= self.previous.might_contain(hashes)
+            return found
+
+    def add(self, hashes):
+        with self.lock:
+            self.rotate(len(hashes))
+            self.current.add(hashes)
+            if self.path is not None and self.clock() - self.saved_at >= self.persist_interval:
+                self.save()
+
+    def save(self):
+        """Writes the filter to its path, replacing the previous file at once so a crash never leaves half of it."""
+        import numpy as np
+
+        generations = [self.current] if self.previous is None else [self.current, self.previous]
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "wb") as file:
+            np.savez(
+                file,
+                params=np.array([self.capacity, self.false_positive_rate, self.window_seconds, self.created_at]),
+                counts=np.array([generation.count for generation in generations], np.int64),
+                **{f"bits{index}": generation.bits for index, generation in enumerate(generations)},
+            )
+        Path(temp_path).replace(self.path)
+        self.saved_at = self.clock()
+
+    def load(self):
+        """Reads the filter saved by a previous run, unless it was sized differently."""
+        import numpy as np
+
+        with np.load(self.path) as saved:
+            capacity, false_positive_rate, window_seconds, created_at = saved["params"].tolist()
+            if (capacity, false_positive_rate, window_seconds) != (
+                self.capacity,
+                self.false_positive_rate,
+                self.window_seconds,
+            ):
+                return
+            generations = [
+                BloomFilter(self.current.num_bits, self.current.num_hashes, saved[f"bits{index}"].copy(), int(count))
+                for index, count in enumerate(saved["counts"].tolist())
+            ]
+        self.current = generations[0]
+        self.previous = generations[1] if len(generations) > 1 else None
+        self.created_at = created_at
+
+
+def get_key_filter(key, capacity, false_positive_rate, window_seconds, directory=None):
+    """
+    Returns the key filter of a table, e.g. for the key (endpoint, bucket, schema, table).
+
+    The filters are kept for the processors of this python process.  With a directory, each filter is written to
+    it every minute, and read back when the process restarts.
+    """
+    with _filters_lock:
+        key_filter = _filters.get((key, capacity, false_positive_rate, window_seconds, directory))
+        if key_filter is None:
+            path = None
+            if directory:
+                Path(directory).mkdir(parents=True, exist_ok=True)
+                name = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()[:32]
+                path = str(Path(directory) / f"{name}.npz")
+            key_filter = KeyFilter(capacity, false_positive_rate, window_seconds, path=path)
+            _filters[key, capacity, false_positive_rate, window_seconds, directory] = key_filter
+        return key_filter
+
+
+def save_key_filters():
+    """Writes the key filters with a state directory, e.g. when the processor is stopped."""
+    with _filters_lock:
+        key_filters = list(_filters.values())
+    for key_filter in key_filters:
+        if key_filter.path is not None:
+            with key_filter.lock:
+                key_filter.save()
+
+
+def drop_duplicates(pa_table, columns):
+    """
+    Drops the rows whose key columns repeat those of an earlier row, keeping the first row of each key.
+
+    Rows with a null key column are never duplicates.  The keys are grouped in one vectorized pass.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    index = pa.array(range(pa_table.num_rows), pa.int64())
+    keys = pa_table.select(columns).append_column("__index", index)
+    has_null = null_keys(pa_table, columns)
+    first = keys.filter(pc.invert(has_null)).group_by(columns, use_threads=False).aggregate([("__index", "min")])
+    if first.num_rows + pc.sum(has_null).as_py() == pa_table.num_rows:
+        return pa_table
+    kept = pa.chunked_array([first["__index_min"], index.filter(has_null)]).combine_chunks()
+    return pa_table.take(kept.sort())
+
+
+def null_keys(pa_table, columns):
+    """Returns a bool array, True for the rows with a null key column, which have no key."""
+    import pyarrow.compute as pc
+
+    has_null = pc.is_null(pa_table[columns[0]])
+    for column in columns[1:]:
+        has_null = pc.or_(has_null, pc.is_null(pa_table[column]))
+    return has_null.combine_chunks()
+
+
+class DuplicateRows:
+    """Counts the duplicate rows a FlowFile dropped, from the threads inserting its blocks."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_blocks = 0
+        self.inserted = 0
+        self.probed = 0
+
+    def add(self, *, in_blocks=0, inserted=0, probed=0):
+        with self.lock:
+            self.in_blocks += in_blocks
+            self.inserted += inserted
+            self.probed += probed
+
+    def attributes(self):
+        return {
+            "vastdb.duplicates.in.blocks": str(self.in_blocks),
+            "vastdb.duplicates.inserted": str(self.inserted),
+            "vastdb.duplicates.probed": str(self.probed),
+        }
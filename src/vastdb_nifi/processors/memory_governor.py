@@ -0,0 +1,99 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import threading
+
+# The Arrow Memory Pool property values, as the pyarrow functions returning the pools
+MEMORY_POOLS = {
+    "jemalloc": "jemalloc_memory_pool",
+    "mimalloc": "mimalloc_memory_pool",
+    "system": "system_memory_pool",
+}
+
+# Blocks aren't made smaller than this to fit the budget, below it the per block costs dominate
+MIN_BLOCK_BYTES = 1024**2
+
+_governors = {}
+_governors_lock = threading.Lock()
+
+
+class MemoryGovernor:
+    """
+    Keeps the Arrow allocations of a Python worker within a byte budget, measured with its memory pool.
+
+    The budget is shared by the FlowFiles processed concurrently by the worker, which size their blocks to the
+    room left in it rather than waiting for it, as memory kept by e.g. caches may never be released.  Without
+    `max_bytes` nothing is limited.
+    """
+
+    def __init__(self, pool, max_bytes=None):
+        self.pool = pool
+        self.max_bytes = max_bytes
+
+    def allocated(self):
+        return self.pool.bytes_allocated()
+
+    def available(self):
+        """Returns the bytes left in the budget, or None without a budget."""
+        if self.max_bytes is None:
+            return None
+        return max(self.max_bytes - self.allocated(), 0)
+
+    def block_size(self, requested, copies=1):
+        """
+        Returns the block size fitting `copies` blocks in the room left in the budget, at most the requested one.
+
+        Data larger than the budget is then processed in more, smaller blocks rather than exhausting the memory.
+        """
+        available = self.available()
+        if available is None:
+            return requested
+        return max(min(requested, available // max(copies, 1)), min(requested, MIN_BLOCK_BYTES))
+
+    def exceeds_budget(self, num_bytes):
+        """Returns whether data of `num_bytes`, e.g. a query result, can't fit in the budget even on its own."""
+        return self.max_bytes is not None and num_bytes > self.max_bytes
+
+    def release(self):
+        """Returns the memory cached by the pool to the operating system, e.g. after a large FlowFile."""
+        self.pool.release_unused()
+
+    def metrics(self):
+        return {
+            "pool": self.pool.backend_name,
+            "allocated.bytes": self.allocated(),
+            "max.bytes": self.pool.max_memory(),
+            **({"budget.bytes": self.max_bytes} if self.max_bytes is not None else {}),
+        }
+
+    def attributes(self, prefix="vastdb.memory"):
+        return {f"{prefix}.{name}": str(value) for name, value in self.metrics().items()}
+
+
+def get_memory_governor(pool_name="Default", max_bytes=None):
+    """
+    Returns the memory governor of this Python worker, with the memory pool named e.g. jemalloc or mimalloc.
+
+    A pool other than Default becomes pyarrow's default memory pool, used by every allocation of the worker.
+    """
+    import pyarrow as pa
+
+    with _governors_lock:
+        governor = _governors.get((pool_name, max_bytes))
+        if governor is None:
+            if pool_name == "Default":
+                pool = pa.default_memory_pool()
+            else:
+                try:
+                    pool = getattr(pa, MEMORY_POOLS[pool_name])()
+                except NotImplementedError as e:
+                    error_message = f"The {pool_name} memory pool isn't available in this pyarrow build"
+                    raise ValueError(error_message) from e
+                pa.set_memory_pool(pool)
+            governor = MemoryGovernor(pool, max_bytes)
+            _governors[pool_name, max_bytes] = governor
+        elif pool_name != "Default" and pa.default_memory_pool().backend_name != governor.pool.backend_name:
+            # Another processor of the worker selected a different pool
+            pa.set_memory_pool(governor.pool)
+        return governor
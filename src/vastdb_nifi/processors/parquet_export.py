@@ -0,0 +1,221 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import contextlib
+import queue
+import threading
+from collections import OrderedDict
+from urllib.parse import quote
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# The directory of null partition values, as named by Hive
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+# The files each writer keeps open, the least recently written one is closed beyond it
+MAX_OPEN_FILES = 64
+
+
+def partition_directory(column, value):
+    """Returns the Hive style directory of a partition, e.g. `vendor_id=1`."""
+    return f"{column}={NULL_PARTITION if value is None else quote(str(value), safe='')}"
+
+
+def split_partitions(table, column):
+    """Yields the value of each partition of a table, with its rows without the partition column."""
+    keys = table[column]
+    rows = table.drop_columns([column])
+    for value in pc.unique(keys):
+        mask = pc.equal(keys, value) if value.is_valid else pc.is_null(keys)
+        yield value.as_py(), rows.filter(mask)
+
+
+class _ParquetFile:
+    __slots__ = ("partition", "path", "pending", "pending_bytes", "rows", "sink", "writer")
+
+    def __init__(self, filesystem, path, schema, partition, compression):
+        import pyarrow.parquet as pq
+
+        self.path = path
+        self.partition = partition
+        self.sink = filesystem.open_output_stream(path)
+        self.writer = pq.ParquetWriter(self.sink, schema, compression=compression)
+        self.pending = []
+        self.pending_bytes = 0
+        self.rows = 0
+
+    def flush(self):
+        """Writes the pending rows as one row group."""
+        if self.pending:
+            table = pa.concat_tables(self.pending)
+            self.writer.write_table(table, row_group_size=table.num_rows)
+            self.rows += table.num_rows
+            self.pending = []
+            self.pending_bytes = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        size = self.sink.tell()
+        self.sink.close()
+        return size
+
+
+class ParquetExportWriter:
+    """
+    Writes record batches to Parquet files under a base path, e.g. `bucket/exports/trips`.
+
+    With a partition column, the rows of each value are written in a Hive style `column=value` directory,
+    without the partition column.  Batches are buffered into row groups of about `row_group_bytes` (of Arrow
+    memory, before encoding and compression), and a new file is started once a file has `file_bytes` written.
+    Files are named `<name>-<sequence>.parquet`, so writers with different names can share the base path.
+    """
+
+    def __init__(
+        self,
+        filesystem,
+        base_path,
+        schema,
+        *,
+        name,
+        partition_column=None,
+        row_group_bytes=128 * 1024**2,
+        file_bytes=512 * 1024**2,
+        compression="snappy",
+    ):
+        self.filesystem = filesystem
+        self.base_path = base_path.strip("/")
+        self.name = name
+        self.partition_column = partition_column
+        self.schema = schema if partition_column is None else schema.remove(schema.get_field_index(partition_column))
+        self.row_group_bytes = row_group_bytes
+        self.file_bytes = file_bytes
+        self.compression = compression
+        self.open_files = OrderedDict()
+        self.sequence = 0
+        self.created_dirs = set()
+        self.files = []
+        self.paths = []
+
+    def write(self, batch):
+        table = batch if isinstance(batch, pa.Table) else pa.Table.from_batches([batch])
+        if self.partition_column is None:
+            self.add(None, table)
+            return
+        for value, rows in split_partitions(table, self.partition_column):
+            self.add(value, rows)
+
+    def add(self, partition, rows):
+        if rows.num_rows == 0:
+            return
+        parquet_file = self.open_files.get(partition)
+        if parquet_file is None:
+            if len(self.open_files) >= MAX_OPEN_FILES:
+                self.close_file(next(iter(self.open_files)))
+            parquet_file = self.open_file(partition)
+        self.open_files.move_to_end(partition)
+
+        parquet_file.pending.append(rows)
+        parquet_file.pending_bytes += rows.nbytes
+        if parquet_file.pending_bytes >= self.row_group_bytes:
+            parquet_file.flush()
+            if parquet_file.sink.tell() >= self.file_bytes:
+                self.close_file(partition)
+
+    def open_file(self, partition):
+        directory = self.base_path
+        if self.partition_column is not None:
+            directory = f"{directory}/{partition_directory(self.partition_column, partition)}"
+        # S3 has no directories, they would be created as empty marker objects
+        if self.filesystem.type_name != "s3" and directory not in self.created_dirs:
+            self.filesystem.create_dir(directory, recursive=True)
+            self.created_dirs.add(directory)
+
+        self.sequence += 1
+        path = f"{directory}/{self.name}-{self.sequence:05d}.parquet"
+        self.paths.append(path)
+        parquet_file = _ParquetFile(self.filesystem, path, self.schema, partition, self.compression)
+        self.open_files[partition] = parquet_file
+        return parquet_file
+
+    def close_file(self, partition):
+        parquet_file = self.open_files.pop(partition)
+        size = parquet_file.close()
+        manifest = {"path": parquet_file.path, "rows": parquet_file.rows, "bytes": size}
+        if self.partition_column is not None:
+            manifest["partition"] = {self.partition_column: parquet_file.partition}
+        self.files.append(manifest)
+
+    def close(self):
+        """Writes the pending rows and closes the files, returning the manifest of each file written."""
+        while self.open_files:
+            self.close_file(next(iter(self.open_files)))
+        return self.files
+
+    def abort(self):
+        """Closes the files and deletes everything written, e.g. when the export failed."""
+        for parquet_file in self.open_files.values():
+            with contextlib.suppress(Exception):
+                parquet_file.sink.close()
+        self.open_files.clear()
+        for path in self.paths:
+            with contextlib.suppress(Exception):
+                self.filesystem.delete_file(path)
+
+
+def write_concurrently(batches, writers, *, timer=None):
+    """
+    Writes the batches with the writers, each on its own thread, and returns the manifests of the files written.
+
+    Parquet encoding, compression and the S3 uploads release the GIL, so the writers run in parallel.  The
+    files of all the writers are deleted when the batches or a writer fail.
+    """
+    work = queue.Queue(maxsize=2 * len(writers))
+    failed = threading.Event()
+    errors = []
+
+    def stage():
+        return timer.stage("write") if timer is not None else contextlib.nullcontext()
+
+    def run(writer):
+        try:
+            while (batch := work.get()) is not None:
+                with stage():
+                    writer.write(batch)
+            with stage():
+                writer.close()
+        except Exception as e:  # noqa: BLE001
+            errors.append(e)
+            failed.set()
+            # Keep taking batches, so the producer isn't blocked
+            while work.get() is not None:
+                pass
+
+    threads = [
+        threading.Thread(target=run, args=(writer,), name=f"vastdb-export-{i}", daemon=True)
+        for i, writer in enumerate(writers)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for batch in batches:
+            if failed.is_set():
+                break
+            work.put(batch)
+    except BaseException:
+        failed.set()
+        raise
+    finally:
+        for _ in threads:
+            work.put(None)
+        for thread in threads:
+            thread.join()
+        if failed.is_set():
+            for writer in writers:
+                writer.abort()
+
+    if errors:
+        raise errors[0]
+    return [manifest for writer in writers for manifest in writer.files]
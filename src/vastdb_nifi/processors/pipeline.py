@@ -0,0 +1,80 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import queue
+import threading
+
+import pyarrow as pa
+
+# How often a blocked producer checks whether the consumer has stopped
+POLL_INTERVAL_SECONDS = 0.1
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def pipelined(iterable, queue_size=2):
+    """
+    Iterates over an iterable while it is produced on a background thread.
+
+    The producer runs at most queue_size items ahead of the consumer, so memory stays bounded
+    while e.g. the next block is parsed as the previous one is inserted.  An exception raised by
+    the producer is re-raised in the consumer, and the producer is stopped if the consumer stops
+    iterating early.
+    """
+    items = queue.Queue(maxsize=queue_size)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=POLL_INTERVAL_SECONDS)
+            except queue.Full:
+                continue
+            else:
+                return True
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:  # noqa: BLE001
+            put(_Failure(e))
+        else:
+            put(_DONE)
+
+    producer = threading.Thread(target=produce, name="vastdb-pipeline", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+        producer.join()
+
+
+def split_lines(content, block_size):
+    """
+    Splits newline delimited content into zero-copy blocks of about block_size bytes.
+
+    Each block ends at a line boundary, so a line is never split across blocks.
+    """
+    buffer = pa.py_buffer(content)
+    start = 0
+    while start < len(content):
+        newline = content.find(b"\n", start + max(block_size, 1) - 1)
+        end = len(content) if newline == -1 else newline + 1
+        yield buffer.slice(start, end - start)
+        start = end
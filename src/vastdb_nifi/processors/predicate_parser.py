@@ -2,10 +2,50 @@
 #
 # SPDX-License-Identifier: MIT
 
-import ibis
-import yaml
+# ibis and yaml are imported when a predicate is parsed, so that importing the processors stays fast
+import json
+import math
 
-ALLOWED_OPS = ["<", "<=", "==", ">", ">=", "!=", "isin", "isnull", "contains"]
+ALLOWED_OPS = [
+    "<",
+    "<=",
+    "==",
+    ">",
+    ">=",
+    "!=",
+    "isin",
+    "isnull",
+    "notnull",
+    "contains",
+    "startswith",
+    "between",
+]
+
+# Operators that do not take a value
+VALUELESS_OPS = ["isnull", "notnull"]
+
+# Operators whose negation is another single operator on the same value
+NEGATED_OPS = {
+    "<": ">=",
+    "<=": ">",
+    ">": "<=",
+    ">=": "<",
+    "==": "!=",
+    "!=": "==",
+    "isnull": "notnull",
+    "notnull": "isnull",
+}
+
+# Upper bound on the number of clauses when distributing an 'or' over an 'and'
+MAX_CNF_CLAUSES = 1000
+
+# Operators folded into a single range or set of values per column by the optimizer
+RANGE_OPS = ["<", "<=", ">", ">=", "between"]
+EQUALITY_OPS = ["==", "isin"]
+
+# Datatypes whose values are compared the same way by python and VastDB, so ranges on them can be folded.
+# Strings are only folded when the column is declared utf8, as they may otherwise be e.g. timestamps.
+FOLDABLE_DATATYPES = [None, "int8", "int16", "int32", "int64", "float32", "float64", "utf8"]
 
 
 def cast_to_ibis_type(value, type_str):
@@ -30,68 +70,436 @@ def cast_to_ibis_type(value, type_str):
         error_message = f"Unsupported type: {type_str}"
         raise ValueError(error_message)
 
+    import ibis
+
     ibis_type = ibis.dtype(type_map[type_str])
     return ibis.literal(value, type=ibis_type)
 
 
-def parse_yaml_predicate(yaml_str):
-    data = yaml.safe_load(yaml_str)
+def load_content_values(content):
+    """Loads the values of a content based 'isin' predicate.
 
-    if isinstance(data, list) and len(data) == 1 and isinstance(data[0], dict):
-        data = data[0]
+    The content is either a json array of values, or one value per line.
+    """
+    text = content.decode("utf-8") if isinstance(content, bytes) else content
+    stripped = text.strip()
+    if stripped.startswith("["):
+        values = json.loads(stripped)
+        if not isinstance(values, list):
+            error_message = "Content 'isin' values must be a json array or one value per line"
+            raise ValueError(error_message)
+        return values
+    return [line.strip() for line in stripped.splitlines() if line.strip()]
 
-    def build_expression(predicate):
-        from ibis import _
 
-        if isinstance(predicate, dict):
-            if "and" in predicate:
-                return ibis.and_(*[build_expression(p) for p in predicate["and"]])
-            if "or" in predicate:
-                return ibis.or_(*[build_expression(p) for p in predicate["or"]])
+def parse_yaml_predicate(yaml_str, content_values=None):
+    import yaml
 
-            column = predicate["column"]
-            op = predicate.get("op")
-            value = predicate["value"]
-            datatype = predicate.get("datatype")
+    return parse_predicate(yaml.safe_load(yaml_str), content_values)
 
-            if datatype:
-                value = cast_to_ibis_type(value, datatype)
 
-            if op is None:
-                error_message = f"Missing or empty operator for column: {column}. Predicate: {predicate}"
-                raise ValueError(error_message)
+def parse_predicate(data, content_values=None):
+    """Translates an already loaded predicate structure (dicts and lists, as parsed from yaml) to an ibis expression.
 
-            op = op.strip().lower()
+    Args:
+        data: The predicate structure.
+        content_values: Optional callable returning the values of 'isin' predicates with 'value_from: content'.
 
-            if not op:
-                error_message = f"Missing or empty operator for column: {column}. Predicate: {predicate}"
-                raise ValueError(error_message)
+    Returns:
+        An ibis expression the VastDB SDK can push down, True if the predicate matches every row,
+        or False if it can never match.
+    """
+    predicate = normalize_predicate(data, content_values)
+    return build_expression(optimize_clauses(to_cnf(predicate)))
 
-            if op not in [a.lower() for a in ALLOWED_OPS]:
-                error_message = f"Unsupported operator: {op}. Predicate: {predicate}"
-                raise ValueError(error_message)
 
-            column_expr = _[column]
+def normalize_predicate(predicate, content_values=None, *, negate=False):
+    """
+    Validates a predicate and rewrites it to 'and', 'or' and leaf predicates.
+
+    Lists are treated as an 'and' of their items, and 'not' is pushed down to the leaves by
+    negating their operators, because the VastDB SDK can only push down 'not isnull'.
+    An empty 'and' matches every row and an empty 'or' matches no row.
+    """
+    if isinstance(predicate, list):
+        if len(predicate) == 1:
+            return normalize_predicate(predicate[0], content_values, negate=negate)
+        predicate = {"and": predicate}
+
+    if not isinstance(predicate, dict):
+        error_message = f"Unsupported predicate type: {type(predicate)}"
+        raise TypeError(error_message)
+
+    if "not" in predicate:
+        return normalize_predicate(predicate["not"], content_values, negate=not negate)
+
+    for logical_op, negated_op in (("and", "or"), ("or", "and")):
+        if logical_op in predicate:
+            items = predicate[logical_op]
+            if not isinstance(items, list):
+                items = [items]
+            children = [normalize_predicate(item, content_values, negate=negate) for item in items]
+            return {negated_op if negate else logical_op: children}
+
+    leaf = normalize_leaf(predicate, content_values)
+    return negate_leaf(leaf) if negate else leaf
+
+
+def normalize_leaf(predicate, content_values):
+    column = predicate.get("column")
+    op = predicate.get("op")
+
+    if op is None:
+        error_message = f"Missing or empty operator for column: {column}. Predicate: {predicate}"
+        raise ValueError(error_message)
+
+    op = str(op).strip().lower()
+
+    if not op:
+        error_message = f"Missing or empty operator for column: {column}. Predicate: {predicate}"
+        raise ValueError(error_message)
+
+    if op not in [a.lower() for a in ALLOWED_OPS]:
+        error_message = f"Unsupported operator: {op}. Predicate: {predicate}"
+        raise ValueError(error_message)
 
-            if op == "isin":
-                return column_expr.isin(value)
-            if op == "isnull":
-                return column_expr.isnull()
-            if op == "contains":
-                return column_expr.contains(value)
+    if not column:
+        error_message = f"Missing column. Predicate: {predicate}"
+        raise ValueError(error_message)
+
+    leaf = {"column": column, "op": op}
+    if predicate.get("datatype"):
+        leaf["datatype"] = predicate["datatype"]
 
-            op_map = {">": "__gt__", ">=": "__ge__", "<": "__lt__", "<=": "__le__", "==": "__eq__", "!=": "__ne__"}
-            if op in op_map:
-                return getattr(column_expr, op_map[op])(value)
+    if op in VALUELESS_OPS:
+        return leaf
 
-            error_message = f"Unhandled operator: {op}.  Predicate: {predicate}"
+    if predicate.get("value_from") == "content":
+        if op != "isin":
+            error_message = f"'value_from: content' is only supported by 'isin'. Predicate: {predicate}"
+            raise ValueError(error_message)
+        if content_values is None:
+            error_message = f"'value_from: content' used without FlowFile content. Predicate: {predicate}"
             raise ValueError(error_message)
+        leaf["value"] = list(content_values())
+        return leaf
 
-        if isinstance(predicate, list):
-            error_message = f"Unexpected list encountered in predicate: {predicate}"
-            raise TypeError(error_message)
+    if "value" not in predicate:
+        error_message = f"Missing value for operator: {op}. Predicate: {predicate}"
+        raise ValueError(error_message)
 
-        error_message = f"Unsupported predicate type: {type(predicate)}"
+    value = predicate["value"]
+    if op == "isin" and not isinstance(value, list):
+        error_message = f"'isin' value must be a list. Predicate: {predicate}"
+        raise ValueError(error_message)
+    if op == "between" and not (isinstance(value, list) and len(value) == 2):  # noqa: PLR2004
+        error_message = f"'between' value must be a [lower, upper] list. Predicate: {predicate}"
         raise ValueError(error_message)
 
-    return build_expression(data)
+    leaf["value"] = value
+    return leaf
+
+
+def negate_leaf(leaf):
+    op = leaf["op"]
+    if op in NEGATED_OPS:
+        return {**leaf, "op": NEGATED_OPS[op]}
+    if op == "between":
+        lower, upper = leaf["value"]
+        return {"or": [{**leaf, "op": "<", "value": lower}, {**leaf, "op": ">", "value": upper}]}
+    if op == "isin":
+        if not leaf["value"]:
+            # No value is in an empty list, not even null, so its negation matches every row
+            return {"and": []}
+        return {"and": [{**leaf, "op": "!=", "value": value} for value in leaf["value"]]}
+
+    error_message = f"'not' is not supported for operator: {op}. Predicate: {leaf}"
+    raise ValueError(error_message)
+
+
+def to_cnf(predicate):
+    """
+    Converts a normalized predicate to conjunctive normal form: a list of clauses that are
+    and-ed together, each clause being a list of leaves that are or-ed together.
+
+    This is the only shape the VastDB SDK pushes down, so an 'or' containing an 'and' is
+    distributed, and each clause must only reference a single column.
+    """
+    if "and" in predicate:
+        clauses = []
+        for child in predicate["and"]:
+            clauses.extend(to_cnf(child))
+        return clauses
+
+    if "or" in predicate:
+        clauses = [[]]
+        for child in predicate["or"]:
+            clauses = [clause + child_clause for clause in clauses for child_clause in to_cnf(child)]
+            if len(clauses) > MAX_CNF_CLAUSES:
+                error_message = f"Predicate is too complex to push down, it expands to over {MAX_CNF_CLAUSES} clauses"
+                raise ValueError(error_message)
+        return clauses
+
+    return [[predicate]]
+
+
+def leaf_key(leaf):
+    """A hashable key identifying a leaf predicate."""
+    value = leaf.get("value")
+    if isinstance(value, list):
+        value = tuple(value_key(v) for v in value)
+    elif "value" in leaf:
+        value = value_key(value)
+    return (leaf["column"], leaf["op"], leaf.get("datatype"), value)
+
+
+def value_key(value):
+    # The type is part of the key, so e.g. True and 1 are not merged
+    return (type(value).__name__, value)
+
+
+def unique_values(values):
+    """Returns the values without duplicates, sorted when they are comparable."""
+    values = list({value_key(v): v for v in values}.values())
+    try:
+        return sorted(values)
+    except TypeError:
+        return values
+
+
+def equality_leaf(column, datatype, values):
+    """Builds an '==' leaf for a single value, or an 'isin' leaf for several."""
+    leaf = {"column": column, "op": "==" if len(values) == 1 else "isin"}
+    if datatype:
+        leaf["datatype"] = datatype
+    leaf["value"] = values[0] if len(values) == 1 else values
+    return leaf
+
+
+def value_kind(value, datatype):
+    """Returns the kind of values that can be ordered together, or None if the value can't be folded."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return None if isinstance(value, float) and math.isnan(value) else "number"
+    if isinstance(value, str) and datatype == "utf8":
+        return "str"
+    return None
+
+
+def optimize_clauses(clauses):
+    """
+    Simplifies conjunctive normal form clauses before the ibis expression is built.
+
+    Duplicate leaves and clauses are dropped, equalities or-ed on the same column become a
+    single sorted 'isin', ranges and-ed on the same column are folded into one, and clauses
+    that always match are dropped.  A contradiction, e.g. `a > 5 and a < 2`, returns a single
+    empty clause so the predicate is known to never match.
+    """
+    optimized = []
+    seen = set()
+    for clause in clauses:
+        simplified = optimize_or_clause(clause)
+        if simplified is None:
+            continue
+        if not simplified:
+            return [[]]
+        key = frozenset(leaf_key(leaf) for leaf in simplified)
+        if key not in seen:
+            seen.add(key)
+            optimized.append(simplified)
+
+    # Fold the single leaf clauses of each column, keeping the position of the first one
+    groups = {}
+    for clause in optimized:
+        if len(clause) == 1:
+            groups.setdefault((clause[0]["column"], clause[0].get("datatype")), []).append(clause[0])
+
+    result = []
+    for clause in optimized:
+        if len(clause) != 1:
+            result.append(clause)
+            continue
+        group = groups.pop((clause[0]["column"], clause[0].get("datatype")), None)
+        if group is not None:
+            folded = fold_and_leaves(group)
+            if folded is None:
+                return [[]]
+            result.extend([leaf] for leaf in folded)
+
+    # An 'or' clause is redundant when one of its leaves must already be true
+    unit_keys = {leaf_key(clause[0]) for clause in result if len(clause) == 1}
+    return [clause for clause in result if len(clause) == 1 or not any(leaf_key(leaf) in unit_keys for leaf in clause)]
+
+
+def optimize_or_clause(clause):
+    """Simplifies the leaves of an 'or' clause, returning None if the clause always matches."""
+    null_ops = {(leaf["column"], leaf["op"]) for leaf in clause if leaf["op"] in VALUELESS_OPS}
+    if any((column, "isnull") in null_ops and (column, "notnull") in null_ops for column, _ in null_ops):
+        return None
+
+    equalities = {}
+    for leaf in clause:
+        if leaf["op"] in EQUALITY_OPS:
+            values = leaf["value"] if leaf["op"] == "isin" else [leaf["value"]]
+            equalities.setdefault((leaf["column"], leaf.get("datatype")), []).extend(values)
+
+    result = []
+    seen = set()
+    for leaf in clause:
+        simplified = leaf
+        if leaf["op"] in EQUALITY_OPS:
+            group = (leaf["column"], leaf.get("datatype"))
+            if group not in equalities:
+                continue
+            values = unique_values(equalities.pop(group))
+            # An empty 'isin' never matches, so it is dropped from the 'or'
+            if not values:
+                continue
+            simplified = equality_leaf(*group, values)
+
+        key = leaf_key(simplified)
+        if key not in seen:
+            seen.add(key)
+            result.append(simplified)
+
+    return result
+
+
+def fold_and_leaves(leaves):
+    """Folds leaves that are and-ed on the same column, returning None if they can never all match."""
+    column = leaves[0]["column"]
+    datatype = leaves[0].get("datatype")
+    ops = {leaf["op"] for leaf in leaves}
+
+    # Every operator other than isnull fails on null values
+    if "isnull" in ops:
+        return None if len(ops) > 1 else [leaves[0]]
+    if "notnull" in ops and len(ops) > 1:
+        leaves = [leaf for leaf in leaves if leaf["op"] != "notnull"]
+        ops.discard("notnull")
+
+    values = []
+    for leaf in leaves:
+        if leaf["op"] in [*RANGE_OPS, *EQUALITY_OPS, "!="]:
+            values.extend(leaf["value"] if leaf["op"] in {"isin", "between"} else [leaf["value"]])
+    kinds = {value_kind(v, datatype) for v in values}
+    if datatype not in FOLDABLE_DATATYPES or len(kinds) != 1 or None in kinds:
+        return leaves
+
+    lower = upper = None
+    equal = None
+    not_equal = []
+    others = []
+    for leaf in leaves:
+        op = leaf["op"]
+        if op in EQUALITY_OPS:
+            leaf_values = leaf["value"] if op == "isin" else [leaf["value"]]
+            equal = leaf_values if equal is None else [v for v in equal if v in leaf_values]
+        elif op == "!=":
+            not_equal.append(leaf["value"])
+        elif op in {">", ">=", "between"}:
+            bound = (leaf["value"][0], True) if op == "between" else (leaf["value"], op == ">=")
+            if lower is None or bound[0] > lower[0] or (bound[0] == lower[0] and not bound[1]):
+                lower = bound
+        if op in {"<", "<=", "between"}:
+            bound = (leaf["value"][1], True) if op == "between" else (leaf["value"], op == "<=")
+            if upper is None or bound[0] < upper[0] or (bound[0] == upper[0] and not bound[1]):
+                upper = bound
+        if op not in [*RANGE_OPS, *EQUALITY_OPS, "!="]:
+            others.append(leaf)
+
+    def in_range(value):
+        if lower is not None and (value < lower[0] or (value == lower[0] and not lower[1])):
+            return False
+        return upper is None or value < upper[0] or (value == upper[0] and upper[1])
+
+    if equal is None and lower is not None and upper is not None and lower[0] == upper[0]:
+        # e.g. `a >= 3 and a <= 3` is `a == 3`, and `a > 3 and a <= 3` never matches
+        if not (lower[1] and upper[1]):
+            return None
+        equal = [lower[0]]
+
+    if equal is not None:
+        equal = unique_values(v for v in equal if in_range(v) and v not in not_equal)
+        if not equal:
+            return None
+        return [equality_leaf(column, datatype, equal), *others]
+
+    if lower is not None and upper is not None and lower[0] > upper[0]:
+        return None
+
+    def range_leaf(op, value):
+        leaf = {"column": column, "op": op}
+        if datatype:
+            leaf["datatype"] = datatype
+        leaf["value"] = value
+        return leaf
+
+    folded = []
+    if lower is not None and upper is not None and lower[1] and upper[1]:
+        folded.append(range_leaf("between", [lower[0], upper[0]]))
+    else:
+        if lower is not None:
+            folded.append(range_leaf(">=" if lower[1] else ">", lower[0]))
+        if upper is not None:
+            folded.append(range_leaf("<=" if upper[1] else "<", upper[0]))
+    folded.extend(range_leaf("!=", v) for v in unique_values(not_equal) if in_range(v))
+    return [*folded, *others]
+
+
+def build_leaf(leaf):
+    from ibis import _
+
+    column_expr = _[leaf["column"]]
+    op = leaf["op"]
+
+    if op == "isnull":
+        return column_expr.isnull()
+    if op == "notnull":
+        # The SDK pushes down 'not isnull', but not ibis' notnull operation
+        return ~column_expr.isnull()
+
+    value = leaf["value"]
+    datatype = leaf.get("datatype")
+    if datatype:
+        if op in {"isin", "between"}:
+            value = [cast_to_ibis_type(v, datatype) for v in value]
+        else:
+            value = cast_to_ibis_type(value, datatype)
+
+    if op == "isin":
+        return column_expr.isin(value)
+    if op == "between":
+        return column_expr.between(*value)
+    if op == "contains":
+        return column_expr.contains(value)
+    if op == "startswith":
+        return column_expr.startswith(value)
+
+    op_map = {">": "__gt__", ">=": "__ge__", "<": "__lt__", "<=": "__le__", "==": "__eq__", "!=": "__ne__"}
+    if op in op_map:
+        return getattr(column_expr, op_map[op])(value)
+
+    error_message = f"Unhandled operator: {op}.  Predicate: {leaf}"
+    raise ValueError(error_message)
+
+
+def build_expression(clauses):
+    if not clauses:
+        return True
+    if any(not clause for clause in clauses):
+        return False
+
+    import ibis
+
+    expressions = []
+    for clause in clauses:
+        columns = {leaf["column"] for leaf in clause}
+        if len(columns) > 1:
+            error_message = f"An 'or' can only reference a single column to be pushed down, found: {sorted(columns)}"
+            raise ValueError(error_message)
+        leaves = [build_leaf(leaf) for leaf in clause]
+        expressions.append(leaves[0] if len(leaves) == 1 else ibis.or_(*leaves))
+
+    return expressions[0] if len(expressions) == 1 else ibis.and_(*expressions)
@@ -0,0 +1,235 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import contextlib
+import cProfile
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+PROFILERS = ["cProfile", "Sampling"]
+# The number of profiled transform() calls aggregated into each profile file
+SAMPLES_PER_FILE = 100
+# The seconds between the stack samples of the Sampling profiler
+SAMPLING_INTERVAL = 0.005
+# Threads sampled with the transform() thread, e.g. the parsing thread of PutVastDB
+SAMPLED_THREAD_PREFIX = "vastdb-"
+
+_profilers = {}
+_profilers_lock = threading.Lock()
+
+
+class CProfileCollector:
+    """Profiles the calling thread with cProfile, aggregating the calls into a pstats file."""
+
+    suffix = "pstats"
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def __enter__(self):
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+
+    def aggregate(self, stats):
+        if stats is None:
+            return pstats.Stats(self.profile)
+        stats.add(self.profile)
+        return stats
+
+    @staticmethod
+    def write(stats, path):
+        stats.dump_stats(path)
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of the calling thread and the `vastdb-` threads on a background thread.
+
+    The stacks are aggregated as folded stacks, a `frame;frame;... count` line per stack from the thread down
+    to the sampled frame, which flamegraph.pl and speedscope draw as flame graphs.
+    """
+
+    suffix = "folded"
+
+    def __init__(self, interval=SAMPLING_INTERVAL):
+        self.interval = interval
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.run, name="profiling-sampler", daemon=True)
+
+    def __enter__(self):
+        self.sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.sampler.join()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():  # noqa: SLF001
+            name = names.get(thread_id, "")
+            if thread_id == self.thread_id or name.startswith(SAMPLED_THREAD_PREFIX):
+                self.stacks[folded_stack(name, frame)] += 1
+
+    def aggregate(self, stacks):
+        if stacks is None:
+            return self.stacks
+        stacks.update(self.stacks)
+        return stacks
+
+    @staticmethod
+    def write(stacks, path):
+        with open(path, "w") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def folded_stack(thread_name, frame):
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+        frame = frame.f_back
+    frames.append(thread_name)
+    return ";".join(reversed(frames))
+
+
+class TransformProfiler:
+    """
+    Profiles a sample of the transform() calls of a processor into files in a directory.
+
+    With cProfile, the files are pstats files, e.g. for `python -m pstats` or snakeviz.  The Sampling profiler
+    costs less: it samples the stacks every few milliseconds and writes folded stacks for flame graphs.  Each
+    file aggregates up to `samples_per_file` calls, and is rewritten after each one so it can be read while
+    the flow runs.  The oldest files of the processor are deleted to keep `max_files`.
+
+    One call is profiled at a time, since cProfile can't profile several threads at once, so calls running
+    concurrently with a profiled call aren't sampled.
+    """
+
+    def __init__(
+        self,
+        name,
+        directory,
+        *,
+        profiler="cProfile",
+        sample_rate=0.0,
+        max_files=20,
+        samples_per_file=SAMPLES_PER_FILE,
+        logger=None,
+        rng=random.random,  # noqa: S311
+    ):
+        if not 0 <= sample_rate <= 1:
+            error_message = f"The profiling sample rate must be between 0 and 1, got {sample_rate}"
+            raise ValueError(error_message)
+        if profiler not in PROFILERS:
+            error_message = f"Unsupported profiler '{profiler}', expected one of {PROFILERS}"
+            raise ValueError(error_message)
+        self.name = name
+        self.directory = Path(directory)
+        self.profiler = profiler
+        self.sample_rate = sample_rate
+        self.max_files = max_files
+        self.samples_per_file = samples_per_file
+        self.logger = logger
+        self.rng = rng
+        self.collector_class = CProfileCollector if profiler == "cProfile" else StackSampler
+        self.active = threading.Lock()
+        self.aggregated = None
+        self.samples = 0
+        self.files = 0
+        self.path = None
+
+    def sample(self):
+        """Returns a context manager profiling the code it wraps when the call is sampled."""
+        if self.sample_rate <= 0 or self.rng() >= self.sample_rate:
+            return contextlib.nullcontext()
+        if not self.active.acquire(blocking=False):
+            return contextlib.nullcontext()
+        return self._profiled()
+
+    @contextlib.contextmanager
+    def _profiled(self):
+        try:
+            collector = self.collector_class()
+            try:
+                with collector:
+                    yield
+            finally:
+                self.add(collector)
+        finally:
+            self.active.release()
+
+    def add(self, collector):
+        if self.samples % self.samples_per_file == 0:
+            self.aggregated = None
+            self.files += 1
+            timestamp = time.strftime("%Y%m%d-%H%M%S")
+            self.path = self.directory / f"{self.name}-{timestamp}-{os.getpid()}-{self.files}.{collector.suffix}"
+        self.aggregated = collector.aggregate(self.aggregated)
+        self.samples += 1
+
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            collector.write(self.aggregated, self.path)
+            self.rotate(collector.suffix)
+        except OSError as e:
+            # Profiling must not fail the FlowFile, and NiFi's logger has no exception()
+            if self.logger is not None:
+                self.logger.error(f"Failed to write the profile {self.path}: {e}")  # noqa: TRY400
+
+    def rotate(self, suffix):
+        paths = sorted(self.directory.glob(f"{self.name}-[0-9]*.{suffix}"), key=lambda path: path.stat().st_mtime)
+        for path in paths[: max(0, len(paths) - self.max_files)]:
+            path.unlink(missing_ok=True)
+
+
+class NullTransformProfiler:
+    """A TransformProfiler that profiles nothing, when profiling is disabled."""
+
+    sample_rate = 0.0
+
+    def sample(self):
+        return contextlib.nullcontext()
+
+
+NULL_TRANSFORM_PROFILER = NullTransformProfiler()
+
+
+def get_transform_profiler(name, directory, *, profiler="cProfile", sample_rate=0.0, max_files=20, logger=None):
+    """
+    Returns the profiler of a processor, e.g. `get_transform_profiler("PutVastDB", "/tmp/profiles", ...)`.
+
+    Profilers are kept between FlowFiles so their files aggregate several calls.  A new profiler is started
+    when the profiling properties change.
+    """
+    if sample_rate == 0:
+        return NULL_TRANSFORM_PROFILER
+    if not directory:
+        error_message = "Profiling Directory must be set to profile transform() calls"
+        raise ValueError(error_message)
+
+    key = (name, str(directory), profiler, sample_rate, max_files)
+    with _profilers_lock:
+        transform_profiler = _profilers.get(key)
+        if transform_profiler is None:
+            transform_profiler = TransformProfiler(
+                name, directory, profiler=profiler, sample_rate=sample_rate, max_files=max_files, logger=logger
+            )
+            _profilers[key] = transform_profiler
+        return transform_profiler
@@ -0,0 +1,124 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import datetime
+import json
+import threading
+
+# NiFi RecordFieldType names, as the pyarrow functions returning their Arrow types.  BIGINT is unbounded, it's
+# kept as a 38 digits decimal, and CHOICE fields, which may be of several types, as strings.
+RECORD_FIELD_TYPES = {
+    "BOOLEAN": ("bool_",),
+    "BYTE": ("int8",),
+    "SHORT": ("int16",),
+    "INT": ("int32",),
+    "LONG": ("int64",),
+    "BIGINT": ("decimal128", 38, 0),
+    "FLOAT": ("float32",),
+    "DOUBLE": ("float64",),
+    "STRING": ("string",),
+    "CHAR": ("string",),
+    "ENUM": ("string",),
+    "UUID": ("string",),
+    "CHOICE": ("string",),
+    "DATE": ("date32",),
+    "TIME": ("time32", "ms"),
+    "TIMESTAMP": ("timestamp", "ms"),
+}
+
+_arrow_schemas = {}
+_arrow_schemas_lock = threading.Lock()
+
+
+def arrow_type(data_type):
+    """
+    Returns the Arrow type of a NiFi DataType, e.g. of a RecordField's getDataType().
+
+    Arrays of bytes, NiFi's binary values, are binary.  Records are structs and maps have string keys.
+    """
+    import pyarrow as pa
+
+    field_type = data_type.getFieldType().name()
+    if field_type == "DECIMAL":
+        return pa.decimal128(data_type.getPrecision(), data_type.getScale())
+    if field_type == "ARRAY":
+        element_type = data_type.getElementType()
+        if element_type.getFieldType().name() == "BYTE":
+            return pa.binary()
+        return pa.list_(arrow_type(element_type))
+    if field_type == "RECORD":
+        return pa.struct(arrow_fields(data_type.getChildSchema()))
+    if field_type == "MAP":
+        return pa.map_(pa.string(), arrow_type(data_type.getValueType()))
+    if field_type not in RECORD_FIELD_TYPES:
+        error_message = f"Unsupported NiFi record field type: {field_type}"
+        raise ValueError(error_message)
+    name, *args = RECORD_FIELD_TYPES[field_type]
+    return getattr(pa, name)(*args)
+
+
+def arrow_fields(record_schema):
+    import pyarrow as pa
+
+    return [
+        pa.field(field.getFieldName(), arrow_type(field.getDataType()), nullable=field.isNullable())
+        for field in record_schema.getFields()
+    ]
+
+
+def get_arrow_schema(record_schema):
+    """
+    Returns the Arrow schema of a NiFi RecordSchema.
+
+    Each call on a RecordSchema is a call to the NiFi JVM, so the schemas are translated once and kept for the
+    processors of this python process, by the schema's text, which lists its fields and their types.
+    """
+    import pyarrow as pa
+
+    key = record_schema.toString()
+    with _arrow_schemas_lock:
+        arrow_schema = _arrow_schemas.get(key)
+    if arrow_schema is None:
+        arrow_schema = pa.schema(arrow_fields(record_schema))
+        with _arrow_schemas_lock:
+            _arrow_schemas[key] = arrow_schema
+    return arrow_schema
+
+
+def records_to_table(records, arrow_schema):
+    """
+    Converts records, as parsed from the Json NiFi passes them as, to an Arrow table of a schema.
+
+    The records are converted a column at a time, which is much faster than converting each record.  The
+    columns are cast to the schema's types, e.g. from timestamps as text or epoch milliseconds, the forms NiFi
+    writes them in.
+    """
+    import pyarrow as pa
+
+    columns = []
+    for field in arrow_schema:
+        values = [record.get(field.name) for record in records]
+        if pa.types.is_binary(field.type):
+            # Bytes are passed as arrays of numbers
+            values = [None if value is None else bytes(value) for value in values]
+        column = pa.array(values)
+        columns.append(column if column.type == field.type else column.cast(field.type))
+    return pa.Table.from_arrays(columns, schema=arrow_schema)
+
+
+def json_value(value):
+    """Serializes the values Json doesn't have, in the forms NiFi's record readers parse by default."""
+    if isinstance(value, bytes):
+        # NiFi's binary values are arrays of bytes
+        return list(value)
+    if isinstance(value, datetime.datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def table_to_records(pa_table):
+    """Returns the rows of an Arrow table as Json records, the form NiFi passes records to and from Python in."""
+    return [json.dumps(row, default=json_value) for row in pa_table.to_pylist()]
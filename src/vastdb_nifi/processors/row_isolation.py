@@ -0,0 +1,105 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import json
+import threading
+
+# The columns of the invalid rows, with the error of each row, and the text of Json lines that couldn't be parsed
+ERROR_COLUMN = "vastdb.error"
+LINE_COLUMN = "vastdb.line"
+
+
+class InvalidRows:
+    """
+    Collects the rows that couldn't be parsed or written, with their error, to route them to the invalid relationship.
+
+    More than `max_rows` invalid rows raise a ValueError, so mostly invalid data fails as a whole rather than
+    being isolated one row at a time.
+    """
+
+    def __init__(self, max_rows):
+        self.max_rows = max_rows
+        self.rows = []
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.rows)
+
+    def add(self, rows):
+        with self.lock:
+            self.rows.extend(rows)
+            if len(self.rows) > self.max_rows:
+                error_message = f"More than {self.max_rows} invalid rows, the last one: {self.rows[-1]}"
+                raise ValueError(error_message)
+
+    def add_table(self, pa_table, error):
+        self.add([{**row, ERROR_COLUMN: str(error)} for row in pa_table.to_pylist()])
+
+    def add_line(self, line, error):
+        self.add([{LINE_COLUMN: line.decode("utf-8", errors="replace"), ERROR_COLUMN: str(error)}])
+
+    def to_json(self):
+        """Returns the invalid rows as line delimited Json."""
+        with self.lock:
+            return "".join(json.dumps(row, default=str) + "\n" for row in self.rows).encode("utf-8")
+
+
+def parse_isolating(content, parse, invalid_rows):
+    """
+    Yields the tables parsed from line delimited Json content with parse(content).
+
+    Content that fails to parse is split in halves at a line boundary, and the halves parsed again, until the
+    malformed lines are found and added to the invalid rows.  A malformed line in n lines costs about 2 log2(n)
+    more parses of ever smaller blocks.
+    """
+    pending = [content]
+    while pending:
+        block = pending.pop()
+        try:
+            pa_table = parse(block)
+        except Exception as e:  # noqa: BLE001
+            # The blocks may be Arrow buffers, only the failed ones are copied
+            body = bytes(block).rstrip(b"\r\n")
+            if b"\n" not in body:
+                if body.strip():
+                    invalid_rows.add_line(body, e)
+                continue
+            middle = body.rfind(b"\n", 0, len(body) // 2 + 1)
+            if middle == -1:
+                middle = body.find(b"\n")
+            # The first half is parsed first, so the rows keep their order
+            pending.extend([body[middle + 1 :], body[: middle + 1]])
+            continue
+        yield pa_table
+
+
+def write_isolating(pa_table, write_batch, invalid_rows, *, isolate=lambda _error: True, max_request_bytes=None):
+    """
+    Writes rows with write_batch(rows), isolating the rows that fail.
+
+    Rows that fail are split in halves and written again, until the failing rows are found and added to the
+    invalid rows, so one invalid row in n costs about 2 log2(n) more requests.  Errors for which isolate(error)
+    is False, e.g. timeouts, are raised.  The rows are sent in parts of at most `max_request_bytes`, so each part
+    is one request, that wasn't partly applied when it failed.
+    """
+    parts = 1
+    if max_request_bytes and pa_table.nbytes > max_request_bytes:
+        parts = -(-pa_table.nbytes // max_request_bytes)
+    rows_per_part = max(1, -(-pa_table.num_rows // parts))
+    pending = [pa_table.slice(offset, rows_per_part) for offset in range(0, pa_table.num_rows, rows_per_part)]
+    pending.reverse()
+
+    while pending:
+        rows = pending.pop()
+        try:
+            write_batch(rows)
+        except Exception as e:
+            if not isolate(e):
+                raise
+            if rows.num_rows == 1:
+                invalid_rows.add_table(rows, e)
+                continue
+            half = rows.num_rows // 2
+            pending.extend([rows.slice(half), rows.slice(0, half)])
@@ -0,0 +1,76 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import re
+
+# A placeholder of a table name template, {column} or {column:strftime format}
+PLACEHOLDER = re.compile(r"\{([^{}:]+)(?::([^{}]+))?\}")
+
+# The table name part of null values
+NULL_VALUE = "null"
+
+# Joins the values of the placeholders into one grouping key
+SEPARATOR = "\x1f"
+
+
+class TableNameTemplate:
+    """
+    Routes the rows of a table to the tables named after their column values, e.g. `events_{tenant}_{day:%Y%m%d}`.
+
+    `{column}` is replaced by the value of the column, and `{column:format}` by the value of a date or timestamp
+    column formatted with a strftime format.  A name without placeholders routes all the rows to that table.
+    """
+
+    def __init__(self, template):
+        self.template = template
+        self.placeholders = [(match.group(1).strip(), match.group(2)) for match in PLACEHOLDER.finditer(template)]
+
+    @property
+    def columns(self):
+        return list(dict.fromkeys(column for column, _ in self.placeholders))
+
+    def render(self, values):
+        parts = iter(values)
+        return PLACEHOLDER.sub(lambda _: next(parts), self.template)
+
+    def key_column(self, pa_table, column, date_format):
+        import pyarrow as pa
+        import pyarrow.compute as pc
+
+        if column not in pa_table.column_names:
+            error_message = f"Table name template '{self.template}' uses column '{column}', which the rows lack"
+            raise ValueError(error_message)
+        values = pa_table[column]
+        values = pc.strftime(values, format=date_format) if date_format else values.cast(pa.string())
+        return values.fill_null(NULL_VALUE)
+
+    def split(self, pa_table):
+        """
+        Yields the table name and rows of each table the rows are routed to.
+
+        The rows are grouped with a dictionary encoding of the placeholder values and gathered with one take(),
+        so the cost doesn't grow with the number of tables as filtering each one would.
+        """
+        import pyarrow.compute as pc
+
+        if not self.placeholders:
+            yield self.template, pa_table
+            return
+        if pa_table.num_rows == 0:
+            return
+
+        keys = [self.key_column(pa_table, column, date_format) for column, date_format in self.placeholders]
+        key = keys[0] if len(keys) == 1 else pc.binary_join_element_wise(*keys, SEPARATOR)
+        encoded = key.combine_chunks().dictionary_encode()
+        order = pc.sort_indices(encoded.indices)
+        grouped = pa_table.take(order)
+
+        counts = pc.value_counts(encoded.indices)
+        rows_per_index = dict(zip(counts.field("values").to_pylist(), counts.field("counts").to_pylist()))
+        offset = 0
+        for index, value in enumerate(encoded.dictionary.to_pylist()):
+            num_rows = rows_per_index.get(index, 0)
+            if num_rows:
+                yield self.render(value.split(SEPARATOR) if len(keys) > 1 else [value]), grouped.slice(offset, num_rows)
+            offset += num_rows
@@ -0,0 +1,104 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import pyarrow as pa
+import pytest
+from ibis import _
+from vastdb import errors
+
+from benchmarks.fake_vastdb import FakeVastDB
+from benchmarks.imports import STARTUP_TARGETS, check_imports, run_imports
+from benchmarks.nifi import parse_data_size, parse_time_period
+from benchmarks.runner import compare, run_case
+from benchmarks.workloads import all_cases
+
+
+def fake_table():
+    cluster = FakeVastDB()
+    cluster.create_table("b", "s", "t", pa.table({"a": [1, 2, 3, None], "s": ["x", "xy", "y", "z"]}))
+    with cluster.connect().transaction() as tx:
+        yield cluster, tx.bucket("b").schema("s").table("t")
+
+
+def test_fake_table_changes():
+    cluster, table = next(fake_table())
+    row_ids = table.insert(pa.table({"a": [4]}))
+    assert row_ids.to_pylist() == [4]
+
+    table.update(pa.table({"$row_id": pa.array([0, 4], pa.uint64()), "s": ["u", "v"]}))
+    table.delete(pa.table({"$row_id": pa.array([1], pa.uint64())}))
+    table.add_column(pa.schema([("c", pa.bool_())]))
+
+    assert cluster.table_data("b", "s", "t").to_pydict() == {
+        "a": [1, 3, None, 4],
+        "s": ["u", "y", "z", "v"],
+        "c": [None] * 4,
+    }
+    assert cluster.requests == {"insert": 1, "update": 1, "delete": 1, "add_column": 1}
+
+
+def test_fake_table_select():
+    table = next(fake_table())[1]
+
+    def select(predicate, **kwargs):
+        return table.select(predicate=predicate, **kwargs).read_all().to_pydict()
+
+    assert select(_.a > 1) == {"a": [2, 3], "s": ["xy", "y"]}
+    assert select((_.a.isin([1, 3]) | _.a.isnull()) & _.s.startswith("x"), columns=["s"]) == {"s": ["x"]}
+    assert select(_.a.between(2, 3), columns=["a"], internal_row_id=True) == {"a": [2, 3], "$row_id": [1, 2]}
+    assert select(False) == {"a": [], "s": []}
+    # Like VastDB, OR is only pushed down within a column
+    with pytest.raises(NotImplementedError):
+        select((_.a > 1) | (_.s == "x"))
+
+
+def test_fake_cluster_metadata():
+    cluster = FakeVastDB()
+    with cluster.connect().transaction() as tx:
+        bucket = tx.bucket("b")
+        assert bucket.schema("s", fail_if_missing=False) is None
+        with pytest.raises(errors.MissingSchema):
+            bucket.schema("s")
+        schema = bucket.create_schema("s")
+        schema.create_table("t", pa.schema([("a", pa.int64())]))
+        with pytest.raises(errors.TableExists):
+            schema.create_table("t", pa.schema([("a", pa.int64())]))
+        schema.table("t").drop()
+        assert schema.table("t", fail_if_missing=False) is None
+
+
+def test_property_values():
+    assert parse_data_size("16 MB") == 16 * 1024**2
+    assert parse_data_size("512B") == 512
+    assert parse_time_period("5 min") == 300
+    assert parse_time_period("250 ms") == 0.25
+    with pytest.raises(ValueError, match="Invalid data size"):
+        parse_data_size("lots")
+
+
+@pytest.mark.parametrize("name", [case.name for case in all_cases()])
+def test_cases_run(name):
+    metrics = run_case(name, scale=0.002, iterations=1)
+    assert metrics["flowfiles"] == 1
+    assert metrics["flowfiles_per_second"] > 0
+
+
+def test_compare_with_baseline():
+    baseline = {"put": {"flowfiles_per_second": 10.0, "peak_rss_mb": 100.0}}
+    assert compare({"put": {"flowfiles_per_second": 9.0, "peak_rss_mb": 110.0}}, baseline, 0.2) == []
+    assert compare({"put": {"flowfiles_per_second": 7.0, "peak_rss_mb": 130.0}}, baseline, 0.2) == [
+        ("put", "flowfiles_per_second", 10.0, 7.0),
+        ("put", "peak_rss_mb", 100.0, 130.0),
+    ]
+    assert compare({"new": {"flowfiles_per_second": 1.0, "peak_rss_mb": 1.0}}, baseline, 0.2) == []
+
+
+def test_processor_imports_defer_heavy_modules():
+    results = run_imports(repeat=1)
+    assert set(results) == set(STARTUP_TARGETS)
+    assert all(not metrics["deferred_modules"] for metrics in results.values())
+    assert check_imports({"PutVastDB": {"import_ms": 1500.0, "target_ms": 1000.0, "deferred_modules": ["ibis"]}}) == [
+        ("PutVastDB", "imported in 1500.0 ms, the target is 1000.0 ms"),
+        ("PutVastDB", "imported ibis"),
+    ]
@@ -0,0 +1,23 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import re
+
+import pytest
+
+from benchmarks.fake_vastdb import FakeVastDB
+
+
+@pytest.fixture
+def cluster():
+    """An in-memory VastDB cluster, in place of `vastdb.connect`."""
+    fake = FakeVastDB()
+    with fake.patched():
+        yield fake
+
+
+@pytest.fixture
+def table_name(request):
+    """A table name of its own for each test, as the processors cache the tables' schemas and batch sizes."""
+    return re.sub(r"\W", "_", request.node.name)
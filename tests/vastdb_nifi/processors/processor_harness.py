@@ -0,0 +1,32 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+"""Runs the processors on FlowFiles against the in-memory VastDB of the benchmarks."""
+
+import json
+
+from benchmarks.nifi import FlowFile, ProcessContext, load_processor
+
+BUCKET = "bucket"
+SCHEMA = "schema"
+
+
+def target(table_name):
+    return {"VastDB Bucket": BUCKET, "VastDB Database Schema": SCHEMA, "VastDB Table Name": table_name}
+
+
+def json_lines(rows):
+    return "\n".join(json.dumps(row) for row in rows).encode("utf-8")
+
+
+def run_processor(name, properties, *flowfiles):
+    """Runs a processor on FlowFiles, given as contents or FlowFile objects, and returns its results."""
+    processor = load_processor(name)
+    context = ProcessContext(processor, properties)
+    if hasattr(processor, "onScheduled"):
+        processor.onScheduled(context)
+    return [
+        processor.transform(context, flowfile if isinstance(flowfile, FlowFile) else FlowFile(flowfile))
+        for flowfile in flowfiles
+    ]
@@ -0,0 +1,51 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import json
+
+import pyarrow as pa
+
+from benchmarks.nifi import FlowFile
+from tests.vastdb_nifi.processors.processor_harness import BUCKET, SCHEMA, run_processor, target
+
+CONTENT_PREDICATE = """
+- column: v
+  op: isin
+  value_from: content
+  datatype: int64
+"""
+
+
+def aggregate(table_name, flowfile, **properties):
+    (result,) = run_processor("AggregateVastDBTable", {**target(table_name), **properties}, flowfile)
+    return json.loads(result.getContents()), result.getAttributes()
+
+
+def test_groups_of_typed_keys_with_nulls(cluster, table_name):
+    pa_table = pa.table({"k": ["a", None, "None", "a", None], "j": [1, 1, 1, 2, 1], "v": [1, 2, 3, 4, 5]})
+    cluster.create_table(BUCKET, SCHEMA, table_name, pa_table)
+
+    rows, attributes = aggregate(
+        table_name, FlowFile(), **{"Group By Columns": "k, j", "Aggregations": "count(*), sum(v)"}
+    )
+
+    assert attributes["vastdb.row.count"] == "5"
+    assert sorted(rows, key=lambda row: (row["k"] is None, str(row["k"]), row["j"])) == [
+        {"k": "None", "j": 1, "count": 1, "sum_v": 3},
+        {"k": "a", "j": 1, "count": 1, "sum_v": 1},
+        {"k": "a", "j": 2, "count": 1, "sum_v": 4},
+        {"k": None, "j": 1, "count": 2, "sum_v": 7},
+    ]
+
+
+def test_predicate_values_from_the_content(cluster, table_name):
+    cluster.create_table(BUCKET, SCHEMA, table_name, pa.table({"k": ["a", "b", "a"], "v": [1, 2, 3]}))
+
+    rows, _ = aggregate(
+        table_name,
+        FlowFile(b"[1, 2]"),
+        **{"Group By Columns": "k", "Aggregations": "sum(v)", "Predicates": CONTENT_PREDICATE},
+    )
+
+    assert sorted(rows, key=lambda row: row["k"]) == [{"k": "a", "sum_v": 1}, {"k": "b", "sum_v": 2}]
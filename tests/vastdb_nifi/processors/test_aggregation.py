@@ -0,0 +1,137 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+from collections import Counter
+
+import numpy as np
+import pyarrow as pa
+import pytest
+
+from vastdb_nifi.processors.aggregation import GroupByAggregator, parse_aggregations
+
+
+def test_parse_aggregations():
+    actual = parse_aggregations("count(*), sum(fare), approx_distinct( vendor_id )")
+    assert actual == [("count", None), ("sum", "fare"), ("approx_distinct", "vendor_id")]
+
+
+def test_parse_unsupported_function():
+    with pytest.raises(ValueError, match="Unsupported aggregation function: median"):
+        parse_aggregations("median(fare)")
+
+
+def test_parse_star_only_for_count():
+    with pytest.raises(ValueError, match="Only count supports"):
+        parse_aggregations("sum(*)")
+
+
+def test_group_by_across_batches():
+    aggregator = GroupByAggregator(["k"], parse_aggregations("count(*), count(v), sum(v), min(v), max(v), mean(v)"))
+    aggregator.update(pa.record_batch({"k": ["a", "b", None], "v": [1, 2, 3]}))
+    aggregator.update(pa.record_batch({"k": ["a", None, "a"], "v": [4, None, 7]}))
+
+    actual = aggregator.result().sort_by("count_v").to_pylist()
+    assert actual == [
+        {"k": "b", "count": 1, "count_v": 1, "sum_v": 2, "min_v": 2, "max_v": 2, "mean_v": 2.0},
+        {"k": None, "count": 2, "count_v": 1, "sum_v": 3, "min_v": 3, "max_v": 3, "mean_v": 3.0},
+        {"k": "a", "count": 3, "count_v": 3, "sum_v": 12, "min_v": 1, "max_v": 7, "mean_v": 4.0},
+    ]
+
+
+def test_multiple_group_by_keys_with_nulls():
+    aggregator = GroupByAggregator(["k", "j"], parse_aggregations("count(*)"))
+    for _ in range(3):
+        aggregator.update(pa.record_batch({"k": ["a", None] * 500, "j": [1, 2, 3, 4] * 250}))
+
+    actual = aggregator.result().sort_by([("k", "ascending"), ("j", "ascending")]).to_pylist()
+    assert actual == [
+        {"k": "a", "j": 1, "count": 750},
+        {"k": "a", "j": 3, "count": 750},
+        {"k": None, "j": 2, "count": 750},
+        {"k": None, "j": 4, "count": 750},
+    ]
+
+
+def test_approx_distinct():
+    aggregator = GroupByAggregator(["k"], parse_aggregations("approx_distinct(v)"))
+    for start in range(0, 20000, 5000):
+        values = list(range(start, start + 5000))
+        aggregator.update(pa.record_batch({"k": [v % 2 for v in values], "v": values}))
+    # Values seen again must not be counted twice
+    aggregator.update(pa.record_batch({"k": [0, 1], "v": [0, 1]}))
+
+    for row in aggregator.result().to_pylist():
+        assert row["approx_distinct_v"] == pytest.approx(10000, rel=0.05)
+
+
+def test_global_aggregate_without_rows():
+    aggregator = GroupByAggregator([], parse_aggregations("count(*), sum(v), approx_distinct(v)"))
+    assert aggregator.result().to_pylist() == [{"count": 0, "sum_v": None, "approx_distinct_v": 0}]
+
+    aggregator = GroupByAggregator([], parse_aggregations("approx_distinct(v)"))
+    assert aggregator.result().to_pylist() == [{"approx_distinct_v": 0}]
+
+
+def test_group_keys_dont_collide():
+    aggregator = GroupByAggregator(["k", "j"], parse_aggregations("count(*)"))
+    # Joined as text, with a separator, these keys would be the same group
+    aggregator.update(pa.record_batch({"k": ["x\x1f=y", "x", None, "None", ""], "j": ["z", "y\x1f=z", "a", "a", "a"]}))
+
+    actual = aggregator.result().sort_by([("k", "ascending"), ("j", "ascending")]).to_pylist()
+    assert actual == [
+        {"k": "", "j": "a", "count": 1},
+        {"k": "None", "j": "a", "count": 1},
+        {"k": "x", "j": "y\x1f=z", "count": 1},
+        {"k": "x\x1f=y", "j": "z", "count": 1},
+        {"k": None, "j": "a", "count": 1},
+    ]
+
+
+def test_group_keys_keep_their_types():
+    aggregator = GroupByAggregator(["day", "id", "flag"], parse_aggregations("sum(v)"))
+    batch = pa.record_batch({
+        "day": pa.array([0, 0, None], pa.date32()),
+        "id": pa.array([1, None, 1], pa.decimal128(10, 2)),
+        "flag": pa.array(["a", "a", None]).dictionary_encode(),
+        "v": [1, 2, 3],
+    })
+    aggregator.update(batch)
+    aggregator.update(batch)
+
+    actual = aggregator.result().sort_by("sum_v")
+    assert actual.schema.field("day").type == pa.date32()
+    assert actual.schema.field("id").type == pa.decimal128(10, 2)
+    assert [row["sum_v"] for row in actual.to_pylist()] == [2, 4, 6]
+    assert actual["id"].to_pylist() == [1, None, 1]
+
+
+def test_several_keys_with_nulls_in_large_batches():
+    rng = np.random.default_rng(7)
+    k = [None if i % 3 == 0 else f"k{i % 5}" for i in rng.integers(0, 100, 5000)]
+    j = [None if i == 0 else int(i) for i in rng.integers(0, 4, 5000)]
+    aggregator = GroupByAggregator(["k", "j"], parse_aggregations("count(*)"))
+    aggregator.update(pa.record_batch({"k": k[:2500], "j": j[:2500]}))
+    aggregator.update(pa.record_batch({"k": k[2500:], "j": j[2500:]}))
+
+    actual = {(row["k"], row["j"]): row["count"] for row in aggregator.result().to_pylist()}
+    assert actual == dict(Counter(zip(k, j)))
+
+
+def test_approx_distinct_with_several_keys():
+    aggregator = GroupByAggregator(["k", "j"], parse_aggregations("approx_distinct(v)"))
+    values = list(range(4000))
+    aggregator.update(pa.record_batch({"k": [None, "a"] * 2000, "j": [v % 4 for v in values], "v": values}))
+    aggregator.update(pa.record_batch({"k": ["b"], "j": [0], "v": pa.array([None], pa.int64())}))
+
+    actual = {(row["k"], row["j"]): row["approx_distinct_v"] for row in aggregator.result().to_pylist()}
+    assert actual.pop(("b", 0)) == 0
+    assert set(actual) == {(None, 0), ("a", 1), (None, 2), ("a", 3)}
+    for estimate in actual.values():
+        assert estimate == pytest.approx(1000, rel=0.05)
+
+
+def test_global_approx_distinct_of_nulls():
+    aggregator = GroupByAggregator([], parse_aggregations("count(*), approx_distinct(v)"))
+    aggregator.update(pa.record_batch({"v": pa.array([None, None], pa.int64())}))
+    assert aggregator.result().to_pylist() == [{"count": 2, "approx_distinct_v": 0}]
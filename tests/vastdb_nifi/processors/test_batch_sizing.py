@@ -0,0 +1,114 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import pyarrow as pa
+import pytest
+from vastdb import errors
+
+from vastdb_nifi.processors.batch_sizing import AdaptiveBatchSizer, get_batch_sizer
+
+
+class FakeTable:
+    """Records the batches written to it, taking `seconds_per_row(size)` per row on a fake clock."""
+
+    def __init__(self, seconds_per_row, max_rows=None):
+        self.now = 0.0
+        self.seconds_per_row = seconds_per_row
+        self.max_rows = max_rows
+        self.batches = []
+
+    def clock(self):
+        return self.now
+
+    def write(self, batch):
+        if self.max_rows is not None and batch.num_rows > self.max_rows:
+            error_message = f"{batch.num_rows} rows"
+            raise errors.TooLargeRequest(error_message)
+        self.now += batch.num_rows * self.seconds_per_row(batch.num_rows)
+        self.batches.append(batch.num_rows)
+
+
+def rows(n):
+    return pa.table({"id": range(n)})
+
+
+def test_grows_while_latency_per_row_improves():
+    table = FakeTable(lambda size: 1.0 / size)
+    sizer = AdaptiveBatchSizer(100, clock=table.clock)
+    sizer.write(rows(1000), table.write)
+    assert table.batches == [100, 200, 300, 400]
+    assert sizer.size == 500
+    assert sizer.metrics()["increases"] == 4
+
+
+def test_steps_back_and_holds_when_latency_per_row_gets_worse():
+    # Latency per row is flat up to 200 rows and then grows quickly
+    table = FakeTable(lambda size: 1.0 if size <= 200 else 2.0)
+    sizer = AdaptiveBatchSizer(100, clock=table.clock)
+    sizer.write(rows(2600), table.write)
+    assert table.batches == [100, 200, 300] + [200] * 10
+    assert sizer.size == 200
+
+    # After holding, growing is tried again
+    sizer.write(rows(200), table.write)
+    assert sizer.size == 300
+
+
+def test_too_large_requests_are_halved_and_retried():
+    table = FakeTable(lambda _: 1.0, max_rows=300)
+    sizer = AdaptiveBatchSizer(1000, clock=table.clock)
+    sizer.write(rows(1000), table.write)
+    assert sum(table.batches) == 1000
+    assert sizer.metrics()["history"][:4] == [1000, 500, 250, 375]
+    # Growth bisects towards the smallest size that was too large
+    assert table.batches == [250, 187, 281, 282]
+
+    sizer.write(rows(20000), table.write)
+    assert sizer.size == 300
+    assert table.batches[-9:-1] == [300] * 8
+
+
+def test_timeouts_shrink_and_are_raised():
+    def write(_):
+        raise errors.RequestTimeout(code="", message="timeout", method="PUT", url="", status=408, headers={})
+
+    sizer = AdaptiveBatchSizer(1000)
+    with pytest.raises(errors.RequestTimeout):
+        sizer.write(rows(10), write)
+    assert sizer.size == 5
+
+
+def test_fixed_size_is_not_adapted():
+    table = FakeTable(lambda size: 1.0 / size, max_rows=50)
+    sizer = AdaptiveBatchSizer(100, adaptive=False, clock=table.clock)
+    with pytest.raises(errors.TooLargeRequest):
+        sizer.write(rows(1000), table.write)
+
+    table.max_rows = None
+    sizer.write(rows(1000), table.write)
+    assert table.batches == [100] * 10
+
+
+def test_sizers_are_kept_per_target():
+    key = ("endpoint", "bucket", "schema", "table", "insert")
+    sizer = get_batch_sizer(key, 100)
+    sizer.size = 400
+    assert get_batch_sizer(key, 100) is sizer
+    assert get_batch_sizer((*key[:4], "delete"), 100) is not sizer
+    # Changing the configured batch size starts learning again
+    assert get_batch_sizer(key, 200).size == 200
+
+
+def test_attributes():
+    table = FakeTable(lambda _: 0.001)
+    sizer = AdaptiveBatchSizer(10, clock=table.clock)
+    sizer.write(rows(25), table.write)
+    assert sizer.attributes() == {
+        "vastdb.batch.size": "20",
+        "vastdb.batch.requests": "2",
+        "vastdb.batch.increases": "1",
+        "vastdb.batch.decreases": "0",
+        "vastdb.batch.rows.per.second": "1000.0",
+        "vastdb.batch.history": "10,20",
+    }
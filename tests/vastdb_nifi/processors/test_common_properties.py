@@ -0,0 +1,40 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import pytest
+
+from benchmarks.nifi import PROCESSORS_DIR, ProcessContext, load_processor
+
+PROCESSORS = sorted(path.stem for path in PROCESSORS_DIR.glob("[A-Z]*.py"))
+
+
+@pytest.mark.parametrize("name", PROCESSORS)
+def test_processors_share_the_common_properties(name):
+    processor = load_processor(name)
+    names = [descriptor.name for descriptor in processor.getPropertyDescriptors()]
+
+    for common in ["VastDB Endpoint", "Resolve Endpoint Addresses", "Stage Timings", "Profiling Sample Rate"]:
+        assert common in names
+    assert len(names) == len(set(names))
+
+
+@pytest.mark.parametrize("name", PROCESSORS)
+@pytest.mark.parametrize("sample_rate", ["0", "0.01", "1"])
+def test_profiling_sample_rate_is_a_fraction(name, sample_rate):
+    processor = load_processor(name)
+    context = ProcessContext(processor, {"Profiling Sample Rate": sample_rate})
+
+    assert processor.customValidate(context) == []
+
+
+@pytest.mark.parametrize("name", PROCESSORS)
+@pytest.mark.parametrize("sample_rate", ["-0.5", "2", "often"])
+def test_profiling_sample_rate_outside_0_to_1_is_invalid(name, sample_rate):
+    processor = load_processor(name)
+    context = ProcessContext(processor, {"Profiling Sample Rate": sample_rate})
+
+    (result,) = processor.customValidate(context)
+    assert not result.valid
+    assert result.subject == "Profiling Sample Rate"
+    assert result.input == sample_rate
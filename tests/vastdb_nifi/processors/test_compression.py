@@ -0,0 +1,49 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import gzip
+
+import pyarrow as pa
+import pytest
+
+from vastdb_nifi.processors.compression import content_codec, decompress, decompressed_lines, detect_codec
+
+LINES = b"".join(b'{"id": %d, "name": "%s"}\n' % (i, b"x" * (i % 50)) for i in range(10_000))
+
+
+def compress(content, codec):
+    if codec == "gzip":
+        return gzip.compress(content)
+    sink = pa.BufferOutputStream()
+    with pa.CompressedOutputStream(sink, codec) as stream:
+        stream.write(content)
+    return sink.getvalue().to_pybytes()
+
+
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+def test_detect_codec(codec):
+    assert detect_codec(compress(LINES, codec)) == codec
+    assert content_codec(compress(LINES, codec), "Detect") == codec
+    assert detect_codec(LINES) is None
+    assert detect_codec(b"PAR1") is None
+    assert content_codec(LINES, "None") is None
+
+
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+def test_decompressed_lines(codec):
+    blocks = list(decompressed_lines(compress(LINES, codec), codec, 64 * 1024))
+    assert len(blocks) > 1
+    assert all(block.endswith(b"\n") for block in blocks)
+    assert b"".join(blocks) == LINES
+
+
+def test_decompressed_lines_longer_than_block():
+    content = b"a" * 100 + b"\n" + b"b" * 10
+    assert list(decompressed_lines(compress(content, "gzip"), "gzip", 16)) == [b"a" * 100 + b"\n", b"b" * 10]
+
+
+def test_decompress():
+    # Concatenated gzip members, as written by e.g. appending to a .gz file
+    assert decompress(gzip.compress(LINES) + gzip.compress(LINES), "gzip") == LINES + LINES
+    assert decompress(LINES, None) is LINES
@@ -0,0 +1,111 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import datetime
+
+import pyarrow as pa
+import pytest
+
+from vastdb_nifi.processors.derived_columns import add_derived_columns, parse_yaml_derived_columns
+
+NOW = datetime.datetime(2024, 5, 6, 7, 8, 9, tzinfo=datetime.timezone.utc)
+
+
+def events():
+    return pa.table({
+        "id": [1, 2, 3],
+        "tenant": [" Acme ", "Globex", None],
+        "day": ["2024-01-02", "2024-01-03", "bad"],
+        "amount": ["1.5", "2", None],
+    })
+
+
+def derive(yaml_str, table=None):
+    return add_derived_columns(table or events(), parse_yaml_derived_columns(yaml_str), now=NOW)
+
+
+def test_constant_and_now():
+    table = derive("""
+- {name: source, op: constant, value: sensor-7}
+- {name: version, op: constant, value: 2, datatype: int16}
+- {name: ingested_at, op: now}
+""")
+    assert table["source"].to_pylist() == ["sensor-7"] * 3
+    assert table["version"].type == pa.int16()
+    assert table["ingested_at"].to_pylist() == [NOW] * 3
+
+
+def test_cast_replaces_column():
+    table = derive("[{name: amount, op: cast, column: amount, datatype: float64}]")
+    assert table.column_names == ["id", "tenant", "day", "amount"]
+    assert table["amount"].to_pylist() == [1.5, 2.0, None]
+
+
+def test_string_operations():
+    table = derive("""
+- {name: tenant, op: trim, column: tenant}
+- {name: tenant_lower, op: lower, column: tenant}
+- {name: prefix, op: substring, column: tenant, start: 0, length: 3}
+- {name: region, op: coalesce, columns: [region, tenant], value: unknown}
+""")
+    assert table["tenant_lower"].to_pylist() == ["acme", "globex", None]
+    assert table["prefix"].to_pylist() == ["Acm", "Glo", None]
+    assert table["region"].to_pylist() == ["Acme", "Globex", "unknown"]
+
+
+def test_strptime():
+    table = derive("[{name: day, op: strptime, column: day, format: '%Y-%m-%d', error_is_null: true}]")
+    assert table["day"].to_pylist()[2] is None
+    assert table["day"].cast(pa.string()).to_pylist()[:2] == ["2024-01-02 00:00:00", "2024-01-03 00:00:00"]
+    with pytest.raises(ValueError, match="Error deriving column 'day'"):
+        derive("[{name: day, op: strptime, column: day, format: '%Y-%m-%d'}]")
+
+
+def test_hash_is_stable_per_row():
+    table = derive("[{name: key, op: hash, columns: [tenant, id]}]")
+    again = derive("[{name: key, op: hash, columns: [tenant, id]}]", events().slice(1))
+    assert table["key"].type == pa.uint64()
+    assert len(set(table["key"].to_pylist())) == 3
+    assert again["key"].to_pylist() == table["key"].to_pylist()[1:]
+
+
+def test_hash_is_stable_across_block_types():
+    key = derive("[{name: key, op: hash, columns: [t, id]}]", pa.table({"t": [1, 2], "id": [5, 6]}))["key"][0]
+    # The same row in blocks where t has nulls, or was inferred as double, or timestamps in another unit
+    with_null = pa.table({"t": [1, None], "id": [5, 6]})
+    as_double = pa.table({"t": [1.0, 2.5], "id": pa.array([5, 6], pa.int32())})
+    for block in (with_null, as_double):
+        assert derive("[{name: key, op: hash, columns: [t, id]}]", block)["key"][0] == key
+
+    seconds = pa.table({"t": pa.array([datetime.datetime(2024, 1, 2)], pa.timestamp("s"))})  # noqa: DTZ001
+    milliseconds = seconds.cast(pa.schema([("t", pa.timestamp("ms"))]))
+    assert (
+        derive("[{name: key, op: hash, columns: [t]}]", seconds)["key"]
+        == derive("[{name: key, op: hash, columns: [t]}]", milliseconds)["key"]
+    )
+
+
+def test_hash_tells_nulls_from_text():
+    table = derive("[{name: key, op: hash, columns: [s]}]", pa.table({"s": [None, "None", ""]}))
+    assert len(set(table["key"].to_pylist())) == 3
+
+
+def test_missing_source_column_is_null():
+    table = derive("[{name: country, op: upper, column: country}]")
+    assert table["country"].to_pylist() == [None] * 3
+
+
+@pytest.mark.parametrize(
+    ("yaml_str", "match"),
+    [
+        ("[{op: now}]", "Missing name"),
+        ("[{name: x, op: explode}]", "Unsupported operation"),
+        ("[{name: x, op: cast, column: id}]", "Missing datatype"),
+        ("[{name: x, op: hash, columns: []}]", "non empty list"),
+        ("[{name: x, op: constant, value: null}]", "needs a datatype"),
+    ],
+)
+def test_invalid_derived_columns(yaml_str, match):
+    with pytest.raises(ValueError, match=match):
+        parse_yaml_derived_columns(yaml_str)
@@ -0,0 +1,130 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import gc
+import socket
+
+import pytest
+from vastdb import errors
+
+from vastdb_nifi.processors.endpoints import EndpointPool, get_endpoint_pool, parse_endpoints, resolve_endpoint
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Session:
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+
+
+def test_parse_endpoints():
+    assert parse_endpoints("http://vip1") == ["http://vip1"]
+    assert parse_endpoints("http://vip1, http://vip2:8080,\nhttps://vip3") == [
+        "http://vip1",
+        "http://vip2:8080",
+        "https://vip3",
+    ]
+    with pytest.raises(ValueError, match="Invalid VastDB endpoint 'vip1'"):
+        parse_endpoints("vip1")
+    with pytest.raises(ValueError, match="At least one"):
+        parse_endpoints(" , ")
+
+
+def test_resolve_endpoint():
+    def getaddrinfo(host, port, type):  # noqa: A002
+        assert (host, port, type) == ("pool.lab", 80, socket.SOCK_STREAM)
+        return [(None, None, None, "", (address, port)) for address in ["10.0.0.2", "10.0.0.1", "10.0.0.2", "fe80::1"]]
+
+    assert resolve_endpoint("http://pool.lab", getaddrinfo) == [
+        "http://10.0.0.1",
+        "http://10.0.0.2",
+        "http://[fe80::1]",
+    ]
+
+
+def test_https_endpoints_keep_their_host_names():
+    def getaddrinfo(host, port, type):  # noqa: A002
+        pytest.fail(f"https endpoint {host}:{port} was resolved ({type})")
+
+    assert resolve_endpoint("https://pool.lab:8443", getaddrinfo) == ["https://pool.lab:8443"]
+
+    def vip_addresses(host, port, type):  # noqa: A002
+        assert (host, type) == ("vip", socket.SOCK_STREAM)
+        return [(None, None, None, "", ("10.0.0.1", port))]
+
+    pool = EndpointPool(["https://pool.lab", "http://vip"], resolve=True, getaddrinfo=vip_addresses)
+    assert pool.current_endpoints() == ["https://pool.lab", "http://10.0.0.1"]
+
+
+def test_round_robin():
+    pool = EndpointPool(["http://vip1", "http://vip2", "http://vip3"])
+    sessions = [pool.connect(Session) for _ in range(4)]
+    assert [session.endpoint for session in sessions] == ["http://vip1", "http://vip2", "http://vip3", "http://vip1"]
+
+
+def test_least_loaded():
+    pool = EndpointPool(["http://vip1", "http://vip2"], selection="Least Loaded")
+    first = pool.connect(Session)
+    second = pool.connect(Session)
+    third = pool.connect(Session)
+    assert [first.endpoint, second.endpoint, third.endpoint] == ["http://vip1", "http://vip2", "http://vip1"]
+
+    # Sessions are released when they are garbage collected
+    del first, third
+    gc.collect()
+    fourth = pool.connect(Session)
+    assert fourth.endpoint == "http://vip1"
+    assert pool.in_use == {"http://vip1": 1, "http://vip2": 1}
+
+
+def test_unhealthy_endpoints_are_skipped():
+    clock = FakeClock()
+    pool = EndpointPool(["http://vip1", "http://vip2"], unhealthy_seconds=30, clock=clock)
+    down = {"http://vip1"}
+
+    def connect(endpoint):
+        if endpoint in down:
+            raise errors.ConnectionError(cause=OSError("refused"), may_retry=True)
+        return Session(endpoint)
+
+    assert [pool.connect(connect).endpoint for _ in range(3)] == ["http://vip2"] * 3
+    assert pool.healthy_endpoints() == ["http://vip2"]
+    assert pool.data_endpoints() is None
+
+    # The endpoint is tried again once it was out of the rotation long enough
+    down.clear()
+    clock.now += 30
+    assert {pool.connect(connect).endpoint for _ in range(2)} == {"http://vip1", "http://vip2"}
+    assert pool.data_endpoints() == ["http://vip1", "http://vip2"]
+
+
+def test_all_endpoints_down():
+    pool = EndpointPool(["http://vip1", "http://vip2"])
+
+    def connect(endpoint):
+        raise errors.ConnectionError(cause=OSError(endpoint), may_retry=True)
+
+    with pytest.raises(errors.ConnectionError):
+        pool.connect(connect)
+    assert pool.healthy_endpoints() == []
+
+    # Other errors aren't the endpoint's fault
+    def forbidden(endpoint):
+        raise errors.Forbidden(code="AccessDenied", message="", method="GET", url=endpoint, status=403, headers={})
+
+    with pytest.raises(errors.Forbidden):
+        EndpointPool(["http://vip1"]).connect(forbidden)
+
+
+def test_get_endpoint_pool():
+    pool = get_endpoint_pool("http://vip1,http://vip2")
+    assert pool.configured == ["http://vip1", "http://vip2"]
+    assert get_endpoint_pool("http://vip1,http://vip2") is pool
+    assert get_endpoint_pool("http://vip1,http://vip2", selection="Least Loaded") is not pool
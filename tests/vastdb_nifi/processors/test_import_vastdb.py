@@ -0,0 +1,131 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import json
+
+import pyarrow as pa
+import pyarrow.fs
+import pyarrow.parquet as pq
+import pytest
+
+from benchmarks.nifi import FlowFile, ProcessContext, load_processor
+from tests.vastdb_nifi.processors.processor_harness import BUCKET, SCHEMA, target
+
+
+@pytest.fixture
+def files(cluster, tmp_path):
+    """Writes parquet files to the filesystem the fake cluster imports from, returning their keys."""
+    cluster.filesystem = pyarrow.fs.SubTreeFileSystem(str(tmp_path), pyarrow.fs.LocalFileSystem())
+    cluster.filesystem.create_dir(BUCKET)
+
+    def write(key, pa_table):
+        pq.write_table(pa_table, f"{BUCKET}/{key}", filesystem=cluster.filesystem)
+        return key
+
+    return write
+
+
+def import_context(cluster, table_name, **properties):
+    processor = load_processor("ImportVastDB")
+    processor.get_s3_filesystem = lambda _: cluster.filesystem
+    reads = []
+    read_file_schema = processor.read_file_schema
+    processor.read_file_schema = lambda s3fs, path: reads.append(path) or read_file_schema(s3fs, path)
+    return processor, ProcessContext(processor, {**target(table_name), **properties}), reads
+
+
+def import_files(processor, context, *keys, etag=None):
+    listing = [{"bucket": BUCKET, "key": key, **({"etag": etag} if etag else {})} for key in keys]
+    return processor.transform(context, FlowFile(json.dumps(listing).encode("utf-8")))
+
+
+def test_new_table_has_the_union_of_the_file_schemas(cluster, table_name, files):
+    first = files("a.parquet", pa.table({"a": [1]}))
+    second = files("b.parquet", pa.table({"a": [2], "b": ["x"]}))
+    processor, context, _ = import_context(cluster, table_name)
+
+    assert import_files(processor, context, first, second).getRelationship() == "success"
+    rows = cluster.table_data(BUCKET, SCHEMA, table_name)
+    assert rows.column_names == ["a", "b"]
+    assert rows.to_pylist() == [{"a": 1, "b": None}, {"a": 2, "b": "x"}]
+
+
+def test_existing_table_gains_the_missing_columns_at_once(cluster, table_name, files):
+    cluster.create_table(BUCKET, SCHEMA, table_name, pa.table({"a": [0]}))
+    first = files("a.parquet", pa.table({"a": [1], "b": ["x"]}))
+    second = files("b.parquet", pa.table({"a": [2], "c": [1.5]}))
+    processor, context, _ = import_context(cluster, table_name)
+
+    import_files(processor, context, first, second)
+
+    assert cluster.requests["add_column"] == 1
+    rows = cluster.table_data(BUCKET, SCHEMA, table_name).to_pylist()
+    assert rows == [
+        {"a": 0, "b": None, "c": None},
+        {"a": 1, "b": "x", "c": None},
+        {"a": 2, "b": None, "c": 1.5},
+    ]
+
+
+def test_merged_schemas_dont_add_columns_again(cluster, table_name, files):
+    cluster.create_table(BUCKET, SCHEMA, table_name, pa.table({"a": [0]}))
+    key = files("a.parquet", pa.table({"a": [1], "b": ["x"]}))
+    processor, context, _ = import_context(cluster, table_name)
+
+    import_files(processor, context, key)
+    import_files(processor, context, key)
+
+    assert cluster.requests["add_column"] == 1
+    assert cluster.requests["import"] == 2
+
+
+def test_file_schemas_are_read_once_per_etag(cluster, table_name, files):
+    cluster.create_table(BUCKET, SCHEMA, table_name, pa.table({"a": [0]}))
+    keys = [files("a.parquet", pa.table({"a": [1]})), files("b.parquet", pa.table({"a": [2], "b": ["x"]}))]
+    processor, context, reads = import_context(cluster, table_name)
+
+    import_files(processor, context, *keys, etag="v1")
+    assert len(reads) == 2
+    import_files(processor, context, *keys, etag="v1")
+    assert len(reads) == 2
+
+    # An overwritten file has a new ETag, and its footer is read again
+    files("b.parquet", pa.table({"a": [3], "b": ["y"], "c": [True]}))
+    import_files(processor, context, keys[1], etag="v2")
+    assert reads[2:] == [f"/{BUCKET}/b.parquet"]
+    assert cluster.table_data(BUCKET, SCHEMA, table_name).column_names == ["a", "b", "c"]
+
+
+def test_files_without_etags_are_read_every_time(cluster, table_name, files):
+    cluster.create_table(BUCKET, SCHEMA, table_name, pa.table({"a": [0]}))
+    key = files("a.parquet", pa.table({"a": [1]}))
+    processor, context, reads = import_context(cluster, table_name)
+
+    import_files(processor, context, key)
+    import_files(processor, context, key)
+
+    assert len(reads) == 2
+
+
+def test_recreated_table_gains_the_columns_of_known_schemas(cluster, table_name, files):
+    cluster.create_table(BUCKET, SCHEMA, table_name, pa.table({"a": [0]}))
+    key = files("a.parquet", pa.table({"a": [1], "b": ["x"]}))
+    processor, context, _ = import_context(cluster, table_name)
+    import_files(processor, context, key, etag="v1")
+
+    # The table is dropped and re-created without the column the file added
+    cluster.create_table(BUCKET, SCHEMA, table_name, pa.table({"a": [0]}))
+    import_files(processor, context, key, etag="v1")
+
+    assert cluster.table_data(BUCKET, SCHEMA, table_name).to_pylist() == [{"a": 0, "b": None}, {"a": 1, "b": "x"}]
+
+
+def test_strict_merge_rejects_different_schemas(cluster, table_name, files):
+    cluster.create_table(BUCKET, SCHEMA, table_name, pa.table({"a": [0]}))
+    key = files("a.parquet", pa.table({"a": [1], "b": ["x"]}))
+    processor, context, _ = import_context(cluster, table_name, **{"Schema Merge": "Strict"})
+
+    with pytest.raises(ValueError, match="Schemas are not identical"):
+        import_files(processor, context, key)
+    assert cluster.requests["import"] == 0
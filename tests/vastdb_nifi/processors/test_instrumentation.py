@@ -0,0 +1,103 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import pytest
+
+from vastdb_nifi.processors.instrumentation import NULL_STAGE_TIMER, StageTimer, create_stage_timer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_stages_are_accumulated():
+    clock = FakeClock()
+    timer = StageTimer(clock=clock)
+    for _ in range(2):
+        with timer.stage("insert"):
+            clock.now += 0.25
+    with timer.stage("connect"):
+        clock.now += 0.01
+    timer.add_rows(10)
+    timer.add_rows(5)
+    timer.add_bytes(1024)
+
+    assert timer.attributes() == {
+        "vastdb.insert.ms": "500.0",
+        "vastdb.connect.ms": "10.0",
+        "vastdb.total.ms": "510.0",
+        "vastdb.rows": "15",
+        "vastdb.bytes": "1024",
+    }
+
+
+def test_failed_stages_are_timed():
+    clock = FakeClock()
+    timer = StageTimer(clock=clock)
+
+    def select():
+        with timer.stage("select"):
+            clock.now += 1
+            error_message = "scan failed"
+            raise RuntimeError(error_message)
+
+    with pytest.raises(RuntimeError):
+        select()
+    assert timer.attributes()["vastdb.select.ms"] == "1000.0"
+
+
+def test_timed_iteration():
+    clock = FakeClock()
+    timer = StageTimer(clock=clock)
+
+    def produce():
+        for i in range(3):
+            clock.now += 0.1
+            yield i
+
+    consumed = []
+    for item in timer.timed("parse", produce()):
+        # Time spent by the consumer is not part of the stage
+        clock.now += 1
+        consumed.append(item)
+
+    assert consumed == [0, 1, 2]
+    assert timer.attributes()["vastdb.parse.ms"] == "300.0"
+
+
+def test_disabled_timer_records_nothing():
+    timer = create_stage_timer(False)
+    assert timer is NULL_STAGE_TIMER
+    assert not timer.enabled
+
+    items = [1, 2]
+    assert timer.timed("parse", items) is items
+    with timer.stage("insert"):
+        timer.add_rows(10)
+    assert timer.attributes() == {}
+
+    assert create_stage_timer(True).enabled
+
+
+def test_arrow_allocations_are_tracked():
+    allocated = [1000]
+    timer = StageTimer(clock=FakeClock(), memory=lambda: allocated[0])
+    with timer.stage("parse"):
+        allocated[0] += 500
+    with timer.stage("insert"):
+        allocated[0] -= 300
+    with timer.stage("parse"):
+        allocated[0] += 100
+
+    attributes = timer.attributes()
+    assert attributes["vastdb.parse.arrow.bytes"] == "600"
+    assert attributes["vastdb.insert.arrow.bytes"] == "-300"
+    assert attributes["vastdb.arrow.max.bytes"] == "1500"
+
+    assert "vastdb.arrow.max.bytes" not in StageTimer().attributes()
+    assert create_stage_timer(False, track_memory=True).memory is not None
@@ -0,0 +1,98 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import datetime
+
+import pyarrow as pa
+import pytest
+
+from vastdb_nifi.processors.json_schema import (
+    drop_missing_fields,
+    get_table_schema,
+    parse_json,
+    row_id_schema,
+    update_table_schema,
+    with_row_id,
+)
+
+TABLE_SCHEMA = pa.schema([
+    ("id", pa.int32()),
+    ("fare", pa.float64()),
+    ("day", pa.date32()),
+    ("code", pa.binary(2)),
+    ("tags", pa.list_(pa.string())),
+])
+
+CONTENT = b"""{"id": 1, "fare": 2, "day": "2024-01-02", "code": "ab", "tags": ["x"], "extra": true}
+{"id": 2, "fare": null, "day": null, "code": "cd", "tags": []}
+"""
+
+
+def test_parse_json_with_table_schema():
+    pa_table = parse_json(CONTENT, TABLE_SCHEMA)
+    assert pa_table.schema == TABLE_SCHEMA.append(pa.field("extra", pa.bool_()))
+    assert pa_table.to_pylist()[0] == {
+        "id": 1,
+        "fare": 2.0,
+        "day": datetime.date(2024, 1, 2),
+        "code": b"ab",
+        "tags": ["x"],
+        "extra": True,
+    }
+
+
+def test_parse_json_unexpected_fields():
+    assert parse_json(CONTENT, TABLE_SCHEMA, unexpected_fields="Ignore").schema == TABLE_SCHEMA
+    with pytest.raises(pa.ArrowInvalid, match="unexpected field"):
+        parse_json(CONTENT, TABLE_SCHEMA, unexpected_fields="Error")
+
+
+def test_parse_json_infers_without_schema():
+    pa_table = parse_json(CONTENT)
+    assert pa_table.schema.field("id").type == pa.int64()
+    assert pa_table.schema.field("day").type == pa.timestamp("s")
+
+
+def test_drop_missing_fields():
+    content = b'{"$row_id": 1, "fare" : null}\n{"$row_id": 2, "id": 3}\n'
+    pa_table = parse_json(content, with_row_id(TABLE_SCHEMA))
+    # fare is null in every row but is in the Json, the other table columns aren't
+    assert drop_missing_fields(pa_table, content).column_names == ["$row_id", "id", "fare"]
+
+
+def test_parse_json_row_ids_only():
+    content = b'{"$row_id": 7, "id": 1, "tags": ["x"]}\n{"$row_id": 8}\n'
+    assert parse_json(content, row_id_schema(), unexpected_fields="Ignore") == pa.table({
+        "$row_id": pa.array([7, 8], pa.uint64())
+    })
+
+
+def test_with_row_id():
+    assert with_row_id(TABLE_SCHEMA).field("$row_id").type == pa.uint64()
+    assert with_row_id(with_row_id(TABLE_SCHEMA)) == with_row_id(TABLE_SCHEMA)
+
+
+def test_get_table_schema_loads_once():
+    key = ("http://vip", "bucket", "schema", "test_get_table_schema_loads_once")
+    loads = []
+
+    def load():
+        loads.append(key)
+        return TABLE_SCHEMA
+
+    assert get_table_schema(key, load) == TABLE_SCHEMA
+    assert get_table_schema(key, load) == TABLE_SCHEMA
+    assert len(loads) == 1
+
+    update_table_schema(key, with_row_id(TABLE_SCHEMA))
+    assert get_table_schema(key, load) == with_row_id(TABLE_SCHEMA)
+    # Tables that don't exist yet aren't kept
+    assert get_table_schema((*key[:3], "missing"), lambda: None) is None
+
+
+def test_parse_json_stream():
+    stream = pa.BufferReader(CONTENT)
+    assert parse_json(stream, TABLE_SCHEMA, unexpected_fields="Ignore") == parse_json(
+        CONTENT, TABLE_SCHEMA, unexpected_fields="Ignore"
+    )
@@ -0,0 +1,94 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import numpy as np
+import pyarrow as pa
+
+from vastdb_nifi.processors.key_filter import (
+    BloomFilter,
+    KeyFilter,
+    drop_duplicates,
+    get_key_filter,
+    null_keys,
+    save_key_filters,
+)
+
+
+def random_hashes(num_keys, seed):
+    return np.random.default_rng(seed).integers(0, 2**63, num_keys, dtype=np.uint64)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bloom_filter_false_positive_rate():
+    bloom_filter = BloomFilter.for_capacity(100_000, 0.01)
+    added = random_hashes(100_000, seed=0)
+    bloom_filter.add(added)
+    assert bloom_filter.might_contain(added).all()
+    assert bloom_filter.might_contain(random_hashes(100_000, seed=1)).mean() < 0.015
+
+
+def test_key_filter_forgets_keys_after_the_window():
+    clock = FakeClock()
+    key_filter = KeyFilter(1000, 0.01, 60, clock=clock)
+    keys = random_hashes(10, seed=0)
+    key_filter.add(keys)
+
+    clock.now += 90
+    assert key_filter.might_contain(keys).all()
+    clock.now += 60
+    assert not key_filter.might_contain(keys).any()
+
+
+def test_key_filter_rotates_when_full():
+    key_filter = KeyFilter(100, 0.01, 3600, clock=FakeClock())
+    first, second, third = (random_hashes(100, seed=seed) for seed in range(3))
+    key_filter.add(first)
+    key_filter.add(second)
+    assert key_filter.might_contain(first).all()
+    key_filter.add(third)
+    assert key_filter.might_contain(second).all()
+    assert key_filter.might_contain(first).mean() < 0.1
+
+
+def test_key_filter_is_persisted(tmp_path):
+    path = str(tmp_path / "keys.npz")
+    clock = FakeClock()
+    keys = random_hashes(100, seed=0)
+    key_filter = KeyFilter(1000, 0.01, 3600, path=path, clock=clock, persist_interval=0)
+    key_filter.add(keys)
+
+    assert KeyFilter(1000, 0.01, 3600, path=path, clock=clock).might_contain(keys).all()
+    # A filter sized differently starts empty
+    assert not KeyFilter(2000, 0.01, 3600, path=path, clock=clock).might_contain(keys).any()
+
+
+def test_get_key_filter(tmp_path):
+    key_filter = get_key_filter(("endpoint", "b", "s", "t"), 1000, 0.01, 60, str(tmp_path / "state"))
+    assert get_key_filter(("endpoint", "b", "s", "t"), 1000, 0.01, 60, str(tmp_path / "state")) is key_filter
+    assert key_filter.path.startswith(str(tmp_path / "state"))
+
+    key_filter.add(random_hashes(10, seed=0))
+    save_key_filters()
+    assert KeyFilter(1000, 0.01, 60, path=key_filter.path).might_contain(random_hashes(10, seed=0)).all()
+
+
+def test_drop_duplicates():
+    pa_table = pa.table({"a": [1, 1, 2, None, None, 2, 3], "b": ["x", "x", "y", "z", "z", "q", "r"]})
+    assert drop_duplicates(pa_table, ["a"]).to_pydict() == {"a": [1, 2, None, None, 3], "b": ["x", "y", "z", "z", "r"]}
+    assert drop_duplicates(pa_table, ["a", "b"])["b"].to_pylist() == ["x", "y", "z", "z", "q", "r"]
+    unique = pa_table.slice(4)
+    assert drop_duplicates(unique, ["a"]) is unique
+
+
+def test_null_keys():
+    pa_table = pa.table({"a": [1, None, 3], "b": ["x", "y", None]})
+    assert null_keys(pa_table, ["a"]).to_pylist() == [False, True, False]
+    assert null_keys(pa_table, ["a", "b"]).to_pylist() == [False, True, True]
@@ -0,0 +1,60 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import pytest
+
+from vastdb_nifi.processors.lookup_cache import MISSING, LRUCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_and_hit_ratio():
+    cache = LRUCache(10)
+    cache.put("a", {"id": "a"})
+    assert cache.get("a") == {"id": "a"}
+    assert cache.get("b") is MISSING
+    assert cache.hits == 1
+    assert cache.misses == 1
+    assert cache.hit_ratio == pytest.approx(0.5)
+
+
+def test_cached_none_is_not_missing():
+    cache = LRUCache(10)
+    cache.put("not-found", None)
+    assert cache.get("not-found") is None
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+
+
+def test_ttl_expiry():
+    clock = FakeClock()
+    cache = LRUCache(10, ttl_seconds=60, clock=clock)
+    cache.put("a", 1)
+    clock.now = 59
+    assert cache.get("a") == 1
+    clock.now = 61
+    assert cache.get("a") is MISSING
+    assert len(cache) == 0
+
+
+def test_zero_size_disables_cache():
+    cache = LRUCache(0)
+    cache.put("a", 1)
+    assert cache.get("a") is MISSING
@@ -0,0 +1,44 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import json
+
+import pyarrow as pa
+import pytest
+
+from tests.vastdb_nifi.processors.processor_harness import BUCKET, SCHEMA, json_lines, run_processor, target
+
+
+def lookup(table_name, *contents, **properties):
+    properties = {**target(table_name), "Data Type": "Json Line Delimited", "Key Column": "id", **properties}
+    return [json.loads(result.getContents()) for result in run_processor("LookupVastDB", properties, *contents)]
+
+
+def create_customers(cluster, table_name):
+    cluster.create_table(BUCKET, SCHEMA, table_name, pa.table({"id": [1, 2], "name": ["a", "b"], "tier": [1, 2]}))
+
+
+def test_records_are_enriched(cluster, table_name):
+    create_customers(cluster, table_name)
+    (records,) = lookup(
+        table_name, json_lines([{"id": 2, "x": "p"}, {"id": 3, "x": "q"}]), **{"Lookup Columns": "name"}
+    )
+
+    assert records == [{"id": 2, "x": "p", "name": "b"}, {"id": 3, "x": "q", "name": None}]
+
+
+def test_records_without_keys_get_the_lookup_columns(cluster, table_name):
+    create_customers(cluster, table_name)
+    # The first FlowFile has no key to probe, and its records get the same columns as the next ones
+    first, second = lookup(table_name, json_lines([{"id": None, "x": "p"}]), json_lines([{"id": 1, "x": "q"}]))
+
+    assert first == [{"id": None, "x": "p", "name": None, "tier": None}]
+    assert second == [{"id": 1, "x": "q", "name": "a", "tier": 1}]
+    assert cluster.requests["select"] == 1
+
+
+def test_missing_lookup_columns(cluster, table_name):
+    create_customers(cluster, table_name)
+    with pytest.raises(ValueError, match=r"Lookup columns \['email'\] are not columns"):
+        lookup(table_name, json_lines([{"id": None}]), **{"Lookup Columns": "name, email"})
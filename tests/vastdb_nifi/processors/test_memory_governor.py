@@ -0,0 +1,62 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import pyarrow as pa
+import pytest
+
+from vastdb_nifi.processors.memory_governor import MIN_BLOCK_BYTES, MemoryGovernor, get_memory_governor
+
+
+class FakePool:
+    backend_name = "fake"
+
+    def __init__(self, allocated=0):
+        self.allocated = allocated
+        self.released = 0
+
+    def bytes_allocated(self):
+        return self.allocated
+
+    def max_memory(self):
+        return self.allocated
+
+    def release_unused(self):
+        self.released += 1
+
+
+def test_block_size_fits_budget():
+    pool = FakePool(allocated=60 * MIN_BLOCK_BYTES)
+    governor = MemoryGovernor(pool, max_bytes=100 * MIN_BLOCK_BYTES)
+    assert governor.block_size(16 * MIN_BLOCK_BYTES, copies=4) == 10 * MIN_BLOCK_BYTES
+    assert governor.block_size(4 * MIN_BLOCK_BYTES, copies=4) == 4 * MIN_BLOCK_BYTES
+    pool.allocated = 200 * MIN_BLOCK_BYTES
+    assert governor.block_size(16 * MIN_BLOCK_BYTES, copies=4) == MIN_BLOCK_BYTES
+    assert governor.exceeds_budget(101 * MIN_BLOCK_BYTES)
+    assert not governor.exceeds_budget(100 * MIN_BLOCK_BYTES)
+    assert MemoryGovernor(pool).block_size(16 * MIN_BLOCK_BYTES, copies=4) == 16 * MIN_BLOCK_BYTES
+
+
+def test_metrics_and_release():
+    pool = FakePool(allocated=5)
+    governor = MemoryGovernor(pool, max_bytes=100)
+    assert governor.attributes() == {
+        "vastdb.memory.pool": "fake",
+        "vastdb.memory.allocated.bytes": "5",
+        "vastdb.memory.max.bytes": "5",
+        "vastdb.memory.budget.bytes": "100",
+    }
+    governor.release()
+    assert pool.released == 1
+
+
+@pytest.mark.parametrize("pool_name", ["system", "mimalloc"])
+def test_get_memory_governor_selects_pool(pool_name):
+    default_pool = pa.default_memory_pool()
+    try:
+        governor = get_memory_governor(pool_name, 1024**3)
+        assert governor.pool.backend_name == pool_name
+        assert pa.default_memory_pool().backend_name == pool_name
+        assert get_memory_governor(pool_name, 1024**3) is governor
+    finally:
+        pa.set_memory_pool(default_pool)
@@ -0,0 +1,114 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.fs
+import pyarrow.parquet as pq
+import pytest
+
+from vastdb_nifi.processors.parquet_export import (
+    ParquetExportWriter,
+    partition_directory,
+    split_partitions,
+    write_concurrently,
+)
+
+
+def local_filesystem(tmp_path):
+    return pyarrow.fs.SubTreeFileSystem(str(tmp_path), pyarrow.fs.LocalFileSystem())
+
+
+def trips(num_rows, start=0):
+    return pa.table({
+        "id": range(start, start + num_rows),
+        "vendor": [["a", "b c", None][i % 3] for i in range(start, start + num_rows)],
+        "fare": [float(i) for i in range(start, start + num_rows)],
+    })
+
+
+def test_partition_directory():
+    assert partition_directory("vendor", 1) == "vendor=1"
+    assert partition_directory("vendor", "b c/d") == "vendor=b%20c%2Fd"
+    assert partition_directory("vendor", None) == "vendor=__HIVE_DEFAULT_PARTITION__"
+
+
+def test_split_partitions():
+    partitions = dict(split_partitions(trips(6), "vendor"))
+    assert set(partitions) == {"a", "b c", None}
+    assert partitions["a"].column_names == ["id", "fare"]
+    assert partitions["a"]["id"].to_pylist() == [0, 3]
+    assert partitions[None]["id"].to_pylist() == [2, 5]
+
+
+def test_writer_rolls_row_groups_and_files(tmp_path):
+    filesystem = local_filesystem(tmp_path)
+    table = trips(1000)
+    # Each batch fills a row group
+    writer = ParquetExportWriter(filesystem, "bucket/groups", table.schema, name="w", row_group_bytes=1)
+    for batch in table.to_batches(max_chunksize=100):
+        writer.write(batch)
+    (file,) = writer.close()
+    assert file == {
+        "path": "bucket/groups/w-00001.parquet",
+        "rows": 1000,
+        "bytes": filesystem.get_file_info(file["path"]).size,
+    }
+    assert pq.ParquetFile(str(tmp_path / file["path"])).metadata.num_row_groups == 10
+
+    # Each row group fills a file past the 1 byte target
+    writer = ParquetExportWriter(filesystem, "bucket/files", table.schema, name="w", row_group_bytes=1, file_bytes=1)
+    for batch in table.to_batches(max_chunksize=100):
+        writer.write(batch)
+    files = writer.close()
+    assert [file["rows"] for file in files] == [100] * 10
+    assert ds.dataset("bucket/files", filesystem=filesystem).to_table().sort_by("id").equals(table)
+
+
+def test_writer_partitions_hive_style(tmp_path):
+    filesystem = local_filesystem(tmp_path)
+    table = trips(30)
+    writer = ParquetExportWriter(filesystem, "bucket/export", table.schema, name="w", partition_column="vendor")
+    writer.write(table.to_batches()[0])
+    files = writer.close()
+
+    assert sorted(file["path"] for file in files) == [
+        "bucket/export/vendor=__HIVE_DEFAULT_PARTITION__/w-00003.parquet",
+        "bucket/export/vendor=a/w-00001.parquet",
+        "bucket/export/vendor=b%20c/w-00002.parquet",
+    ]
+    assert {file["partition"]["vendor"]: file["rows"] for file in files} == {"a": 10, "b c": 10, None: 10}
+    exported = pq.read_table(str(tmp_path / "bucket/export/vendor=a/w-00001.parquet"))
+    assert exported.column_names == ["id", "fare"]
+    assert exported["id"].to_pylist() == list(range(0, 30, 3))
+
+
+def test_write_concurrently(tmp_path):
+    filesystem = local_filesystem(tmp_path)
+    table = trips(10_000)
+    writers = [
+        ParquetExportWriter(filesystem, "bucket/export", table.schema, name=f"w{i}", partition_column="vendor")
+        for i in range(3)
+    ]
+    files = write_concurrently(table.to_batches(max_chunksize=500), writers)
+
+    assert sum(file["rows"] for file in files) == 10_000
+    assert len({file["path"] for file in files}) == len(files)
+    exported = ds.dataset("bucket/export", filesystem=filesystem, partitioning="hive").to_table()
+    assert sorted(exported["id"].to_pylist()) == list(range(10_000))
+
+
+def test_write_concurrently_deletes_files_on_failure(tmp_path):
+    filesystem = local_filesystem(tmp_path)
+    table = trips(1000)
+    writers = [ParquetExportWriter(filesystem, "bucket/export", table.schema, name=f"w{i}") for i in range(2)]
+
+    def batches():
+        yield from table.to_batches(max_chunksize=100)
+        error_message = "scan failed"
+        raise RuntimeError(error_message)
+
+    with pytest.raises(RuntimeError, match="scan failed"):
+        write_concurrently(batches(), writers)
+    assert filesystem.get_file_info(pyarrow.fs.FileSelector("bucket/export", recursive=True)) == []
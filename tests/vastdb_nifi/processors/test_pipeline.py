@@ -0,0 +1,79 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import threading
+import time
+
+import pyarrow as pa
+import pytest
+from pyarrow import json as pa_json
+
+from vastdb_nifi.processors.pipeline import pipelined, split_lines
+
+
+def test_pipelined_yields_all_items_in_order():
+    assert list(pipelined(range(100), queue_size=3)) == list(range(100))
+
+
+def test_pipelined_reraises_producer_errors():
+    def produce():
+        yield 1
+        error_message = "bad block"
+        raise ValueError(error_message)
+
+    items = pipelined(produce())
+    assert next(items) == 1
+    with pytest.raises(ValueError, match="bad block"):
+        next(items)
+
+
+def test_pipelined_is_bounded_and_stops_when_closed():
+    produced = []
+    finished = threading.Event()
+
+    def produce():
+        try:
+            for i in range(1000):
+                produced.append(i)
+                yield i
+        finally:
+            finished.set()
+
+    items = pipelined(produce(), queue_size=2)
+    assert next(items) == 0
+    time.sleep(0.2)
+    # One item consumed, two queued and one waiting to be queued
+    assert len(produced) <= 4
+    items.close()
+    assert finished.wait(1)
+    assert len(produced) <= 4
+
+
+def test_pipelined_overlaps_producer_and_consumer():
+    def produce():
+        for i in range(5):
+            time.sleep(0.05)
+            yield i
+
+    start = time.monotonic()
+    for _ in pipelined(produce()):
+        time.sleep(0.05)
+    # Run in sequence this takes 0.5 seconds
+    assert time.monotonic() - start < 0.45
+
+
+def test_split_lines_keeps_lines_whole():
+    content = b"".join(f'{{"id": {i}, "name": "row {i}"}}\n'.encode() for i in range(100))
+    blocks = list(split_lines(content, 64))
+    assert len(blocks) > 1
+    assert b"".join(block.to_pybytes() for block in blocks) == content
+    assert all(block.to_pybytes().endswith(b"\n") for block in blocks)
+
+    tables = [pa_json.read_json(pa.BufferReader(block)) for block in blocks]
+    assert pa.concat_tables(tables)["id"].to_pylist() == list(range(100))
+
+
+def test_split_lines_without_trailing_newline():
+    assert [block.to_pybytes() for block in split_lines(b"a\nb\nc", 1)] == [b"a\n", b"b\n", b"c"]
+    assert list(split_lines(b"", 10)) == []
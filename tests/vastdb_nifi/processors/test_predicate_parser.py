@@ -2,11 +2,22 @@
 #
 # SPDX-License-Identifier: MIT
 
+import itertools
+
 import ibis
 import pytest
+from hypothesis import assume, given
+from hypothesis import strategies as st
 from ibis import _
 
-from vastdb_nifi.processors.predicate_parser import parse_yaml_predicate
+from vastdb_nifi.processors.predicate_parser import (
+    load_content_values,
+    normalize_predicate,
+    optimize_clauses,
+    parse_predicate,
+    parse_yaml_predicate,
+    to_cnf,
+)
 
 
 def test_datestring():
@@ -74,5 +85,260 @@ def test_missing_operator():
         parse_yaml_predicate(yaml_predicate)
 
 
+def test_parse_predicate_isin():
+    ibis_expr = parse_predicate({"column": "id", "op": "isin", "value": [1, 2, 3]})
+    assert repr(ibis_expr) == repr(_["id"].isin([1, 2, 3]))
+
+
+def test_not_is_pushed_to_operators():
+    yaml_predicate = """
+    not:
+      and:
+      - column: a
+        op: "<"
+        value: 1
+      - column: b
+        op: isnull
+    """
+    # not (a < 1 and b is null) can't be pushed down as a single column 'or'
+    with pytest.raises(ValueError, match="single column"):
+        parse_yaml_predicate(yaml_predicate)
+
+    ibis_expr = parse_predicate({"not": {"column": "b", "op": "isnull"}})
+    assert repr(ibis_expr) == repr(~_["b"].isnull())
+
+    ibis_expr = parse_predicate({"not": {"column": "a", "op": "between", "value": [1, 5]}})
+    assert repr(ibis_expr) == repr(ibis.or_(_["a"] < 1, _["a"] > 5))
+
+    ibis_expr = parse_predicate({"not": {"column": "a", "op": "isin", "value": [1, 2]}})
+    assert repr(ibis_expr) == repr(ibis.and_(_["a"] != 1, _["a"] != 2))
+
+    # Every row, null or not, is not in an empty list
+    assert parse_predicate({"not": {"column": "a", "op": "isin", "value": []}}) is True
+    ibis_expr = parse_predicate({
+        "or": [{"not": {"column": "a", "op": "isin", "value": []}}, {"column": "b", "op": "isnull"}]
+    })
+    assert ibis_expr is True
+
+    with pytest.raises(ValueError, match="'not' is not supported"):
+        parse_predicate({"not": {"column": "s", "op": "contains", "value": "x"}})
+
+
+def test_nested_predicates_are_converted_to_cnf():
+    yaml_predicate = """
+    or:
+    - and:
+      - column: a
+        op: ">"
+        value: 10
+      - column: b
+        op: notnull
+    - and:
+      - column: a
+        op: "<"
+        value: 0
+      - column: b
+        op: startswith
+        value: x
+    """
+    # (a > 10 and b not null) or (a < 0 and b startswith x), distributed to an 'and' of 'or's:
+    # the mixed column clauses can't be pushed down
+    with pytest.raises(ValueError, match="single column"):
+        parse_yaml_predicate(yaml_predicate)
+
+    yaml_predicate = """
+    and:
+    - or:
+      - and:
+        - column: a
+          op: ">"
+          value: 10
+      - column: a
+        op: between
+        value: [1, 2]
+    - [{column: b, op: startswith, value: x}]
+    """
+    ibis_expr = parse_yaml_predicate(yaml_predicate)
+    expected = ibis.and_(ibis.or_(_["a"] > 10, _["a"].between(1, 2)), _["b"].startswith("x"))
+    assert repr(ibis_expr) == repr(expected)
+
+
+def test_constant_predicates():
+    assert parse_predicate({"and": []}) is True
+    assert parse_predicate({"or": []}) is False
+    assert parse_predicate({"and": [{"or": []}, {"column": "a", "op": "isnull"}]}) is False
+
+
+def test_isin_from_content():
+    yaml_predicate = """
+    column: id
+    op: isin
+    value_from: content
+    datatype: int32
+    """
+    ibis_expr = parse_yaml_predicate(yaml_predicate, content_values=lambda: load_content_values(b"[1, 2]"))
+    values = [ibis.literal(v, type=ibis.dtype("int32")) for v in [1, 2]]
+    assert repr(ibis_expr) == repr(_["id"].isin(values))
+
+    assert load_content_values(b"a\n\nb \n") == ["a", "b"]
+
+    with pytest.raises(ValueError, match="without FlowFile content"):
+        parse_yaml_predicate(yaml_predicate)
+
+
+def test_optimizer_folds_ranges_and_equalities():
+    ibis_expr = parse_predicate([
+        {"column": "a", "op": ">", "value": 1},
+        {"column": "a", "op": ">=", "value": 3},
+        {"column": "a", "op": "<=", "value": 9},
+        {"column": "a", "op": "<", "value": 20},
+    ])
+    assert repr(ibis_expr) == repr(_["a"].between(3, 9))
+
+    ibis_expr = parse_predicate({"column": "a", "op": "isin", "value": [3, 1, 3]})
+    assert repr(ibis_expr) == repr(_["a"].isin([1, 3]))
+
+    ibis_expr = parse_predicate({"column": "a", "op": "isin", "value": [2]})
+    assert repr(ibis_expr) == repr(_["a"] == 2)
+
+    ibis_expr = parse_predicate({"or": [{"column": "a", "op": "==", "value": v} for v in [5, 2, 5]]})
+    assert repr(ibis_expr) == repr(_["a"].isin([2, 5]))
+
+    ibis_expr = parse_predicate([
+        {"column": "a", "op": "isin", "value": [1, 4, 7]},
+        {"column": "a", "op": ">", "value": 2},
+        {"column": "a", "op": "!=", "value": 7},
+    ])
+    assert repr(ibis_expr) == repr(_["a"] == 4)
+
+
+def test_optimizer_detects_always_false():
+    assert parse_predicate([{"column": "a", "op": ">", "value": 5}, {"column": "a", "op": "<", "value": 2}]) is False
+    assert parse_predicate([{"column": "a", "op": "==", "value": 1}, {"column": "a", "op": "==", "value": 2}]) is False
+    assert parse_predicate([{"column": "a", "op": "isnull"}, {"column": "a", "op": ">", "value": 2}]) is False
+    assert parse_predicate({"or": [{"column": "a", "op": "isnull"}, {"column": "a", "op": "notnull"}]}) is True
+
+
+def test_optimizer_does_not_fold_unordered_types():
+    # Timestamps given as strings can't be compared as python values
+    predicate = [
+        {"column": "t", "op": ">", "value": "2019-01-02", "datatype": "timestamp"},
+        {"column": "t", "op": "<", "value": "2019-01-01T12:00:00", "datatype": "timestamp"},
+    ]
+    assert optimize_clauses(to_cnf(normalize_predicate(predicate))) == [[predicate[0]], [predicate[1]]]
+
+
+COLUMNS = ["a", "b"]
+VALUES = st.integers(min_value=0, max_value=5)
+
+leaf_predicates = st.one_of(
+    st.builds(
+        lambda column, op, value, datatype: {"column": column, "op": op, "value": value, **datatype},
+        st.sampled_from(COLUMNS),
+        st.sampled_from(["<", "<=", "==", ">", ">=", "!="]),
+        VALUES,
+        st.sampled_from([{}, {"datatype": "int64"}]),
+    ),
+    st.builds(
+        lambda column, op: {"column": column, "op": op},
+        st.sampled_from(COLUMNS),
+        st.sampled_from(["isnull", "notnull"]),
+    ),
+    st.builds(
+        lambda column, value: {"column": column, "op": "isin", "value": value},
+        st.sampled_from(COLUMNS),
+        st.lists(VALUES, max_size=4),
+    ),
+    st.builds(
+        lambda column, lower, upper: {"column": column, "op": "between", "value": [lower, upper]},
+        st.sampled_from(COLUMNS),
+        VALUES,
+        VALUES,
+    ),
+)
+
+predicates = st.recursive(
+    leaf_predicates,
+    lambda children: st.one_of(
+        st.builds(lambda items: {"and": items}, st.lists(children, max_size=3)),
+        st.builds(lambda items: {"or": items}, st.lists(children, max_size=3)),
+        st.builds(lambda child: {"not": child}, children),
+        st.lists(children, min_size=2, max_size=3),
+    ),
+    max_leaves=8,
+)
+
+ROWS = [dict(zip(COLUMNS, values)) for values in itertools.product([None, *range(7)], repeat=len(COLUMNS))]
+
+
+def evaluate(predicate, row):
+    """Evaluates a predicate with SQL three-valued logic, None being unknown."""
+    if isinstance(predicate, list):
+        predicate = {"and": predicate}
+    if "not" in predicate:
+        result = evaluate(predicate["not"], row)
+        return None if result is None else not result
+    for logical_op, short_circuit in (("and", False), ("or", True)):
+        if logical_op in predicate:
+            results = [evaluate(item, row) for item in predicate[logical_op]]
+            if short_circuit in results:
+                return short_circuit
+            return None if None in results else not short_circuit
+
+    value = row[predicate["column"]]
+    op = predicate["op"]
+    if op in {"isnull", "notnull"}:
+        return (value is None) == (op == "isnull")
+    if op == "isin" and not predicate["value"]:
+        # `NULL IN ()` is false rather than unknown, so `NULL NOT IN ()` is true
+        return False
+    if value is None:
+        return None
+    if op == "isin":
+        return value in predicate["value"]
+    if op == "between":
+        return predicate["value"][0] <= value <= predicate["value"][1]
+    return {
+        "<": value < predicate["value"],
+        "<=": value <= predicate["value"],
+        "==": value == predicate["value"],
+        ">": value > predicate["value"],
+        ">=": value >= predicate["value"],
+        "!=": value != predicate["value"],
+    }[op]
+
+
+def evaluate_clauses(clauses, row):
+    return all(any(evaluate(leaf, row) is True for leaf in clause) for clause in clauses)
+
+
+def optimize(predicate):
+    try:
+        return optimize_clauses(to_cnf(normalize_predicate(predicate)))
+    except ValueError:
+        # The predicate expands to too many clauses
+        assume(False)
+
+
+@given(predicates)
+def test_optimizer_keeps_predicate_semantics(predicate):
+    clauses = optimize(predicate)
+    for row in ROWS:
+        assert evaluate_clauses(clauses, row) == (evaluate(predicate, row) is True), row
+
+
+@given(predicates)
+def test_optimizer_output_is_simplified(predicate):
+    clauses = optimize(predicate)
+    assert optimize_clauses(clauses) == clauses
+    for clause in clauses:
+        for leaf in clause:
+            if leaf["op"] == "isin":
+                assert len(leaf["value"]) > 1
+                assert leaf["value"] == sorted(set(leaf["value"]))
+        # An always-false predicate is a single empty clause
+        assert clause or clauses == [[]]
+
+
 if __name__ == "__main__":
     pytest.main()
@@ -0,0 +1,87 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import pstats
+import threading
+import time
+
+import pytest
+
+from vastdb_nifi.processors.profiling import (
+    NULL_TRANSFORM_PROFILER,
+    TransformProfiler,
+    get_transform_profiler,
+)
+
+
+def busy(seconds=0.05):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_sampled_calls_are_aggregated_into_pstats(tmp_path):
+    samples = iter([0.5, 0.05, 0.01])
+    profiler = TransformProfiler("PutVastDB", tmp_path, sample_rate=0.1, rng=lambda: next(samples))
+    for _ in range(3):
+        with profiler.sample():
+            busy(0.001)
+
+    (path,) = tmp_path.glob("PutVastDB-*.pstats")
+    stats = pstats.Stats(str(path))
+    (calls,) = [stat[1] for function, stat in stats.stats.items() if function[2] == "busy"]
+    assert calls == 2
+
+
+def test_sampling_profiler_writes_folded_stacks(tmp_path):
+    profiler = TransformProfiler("QueryVastDBTable", tmp_path, profiler="Sampling", sample_rate=1)
+    with profiler.sample():
+        busy()
+
+    (path,) = tmp_path.glob("QueryVastDBTable-*.folded")
+    lines = path.read_text().splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert stack.startswith(threading.current_thread().name + ";")
+    assert int(count) > 0
+    assert any("busy (test_profiling.py:" in line for line in lines)
+
+
+def test_files_are_rotated(tmp_path):
+    (tmp_path / "PutVastDBRecord-1.pstats").touch()
+    profiler = TransformProfiler("PutVastDB", tmp_path, sample_rate=1, max_files=2, samples_per_file=1)
+    for _ in range(4):
+        with profiler.sample():
+            busy(0.001)
+
+    assert len(list(tmp_path.glob("PutVastDB-*.pstats"))) == 2
+    # Other processors' files are kept
+    assert (tmp_path / "PutVastDBRecord-1.pstats").exists()
+
+
+def test_failed_calls_are_profiled(tmp_path):
+    profiler = TransformProfiler("DeleteVastDB", tmp_path, sample_rate=1)
+
+    def transform():
+        with profiler.sample():
+            error_message = "delete failed"
+            raise RuntimeError(error_message)
+
+    with pytest.raises(RuntimeError):
+        transform()
+    assert len(list(tmp_path.glob("DeleteVastDB-*.pstats"))) == 1
+    # The next call can be profiled
+    assert not profiler.active.locked()
+
+
+def test_profiler_settings(tmp_path):
+    assert get_transform_profiler("PutVastDB", None, sample_rate=0) is NULL_TRANSFORM_PROFILER
+    profiler = get_transform_profiler("PutVastDB", tmp_path, sample_rate=0.5)
+    assert get_transform_profiler("PutVastDB", tmp_path, sample_rate=0.5) is profiler
+    assert get_transform_profiler("PutVastDB", tmp_path, sample_rate=0.25) is not profiler
+
+    with pytest.raises(ValueError, match="Profiling Directory"):
+        get_transform_profiler("PutVastDB", None, sample_rate=0.5)
+    with pytest.raises(ValueError, match="between 0 and 1"):
+        TransformProfiler("PutVastDB", tmp_path, sample_rate=2)
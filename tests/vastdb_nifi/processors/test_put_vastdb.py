@@ -0,0 +1,133 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import json
+import sys
+
+import pyarrow as pa
+import pytest
+from vastdb import errors
+
+from benchmarks.fake_vastdb import FakeTable
+from benchmarks.nifi import FlowFile, ProcessContext, load_processor
+from tests.vastdb_nifi.processors.processor_harness import BUCKET, SCHEMA, json_lines, run_processor, target
+
+
+def put(table_name, *contents, **properties):
+    return run_processor(
+        "PutVastDB", {**target(table_name), "Data Type": "Json Line Delimited", **properties}, *contents
+    )
+
+
+def test_deduplication_finds_keys_of_blocks_with_nulls(cluster, table_name):
+    # The second FlowFile's t column has a null, which must not change the hash of (1, 5)
+    first = json_lines([{"t": 1, "id": 5}, {"t": 2, "id": 6}])
+    second = json_lines([{"t": 1, "id": 5}, {"t": None, "id": 7}])
+    results = put(table_name, first, second, **{"Deduplication Key Columns": "t, id"})
+
+    assert results[1].getAttributes()["vastdb.duplicates.inserted"] == "1"
+    rows = cluster.table_data(BUCKET, SCHEMA, table_name).sort_by("id").to_pylist()
+    assert rows == [{"t": 1, "id": 5}, {"t": 2, "id": 6}, {"t": None, "id": 7}]
+
+
+def test_blocks_are_cast_to_the_table_columns(cluster, table_name):
+    # Each line is a block of its own, and the second one's x is parsed as double
+    contents = json_lines([{"x": 1}, {"x": 2.0}, {"x": None, "y": "a"}])
+    (result,) = put(table_name, contents, **{"Pipeline Block Size": "1 B"})
+
+    assert result.getRelationship() == "success"
+    rows = cluster.table_data(BUCKET, SCHEMA, table_name)
+    assert rows.schema.field("x").type == pa.int64()
+    assert rows.to_pylist() == [{"x": 1, "y": None}, {"x": 2, "y": None}, {"x": None, "y": "a"}]
+
+
+def test_rows_that_cant_be_cast_are_invalid(cluster, table_name):
+    contents = json_lines([{"x": 1}, {"x": "one"}, {"x": 2}])
+    (result,) = put(table_name, contents, **{"Pipeline Block Size": "1 B", "Invalid Rows": "Route to Invalid"})
+
+    assert result.getRelationship() == "invalid"
+    assert json.loads(result.getContents())["x"] == "one"
+    assert cluster.table_data(BUCKET, SCHEMA, table_name)["x"].to_pylist() == [1, 2]
+
+
+def test_unavailable_endpoints_fail_the_flowfile_without_invalid_rows(cluster, table_name, monkeypatch):
+    def unavailable(self, _rows):
+        self.tx.cluster.request("insert")
+        raise errors.ServiceUnavailable(
+            code="ServiceUnavailable", message="", method="POST", url="", status=503, headers={}
+        )
+
+    monkeypatch.setattr(FakeTable, "insert", unavailable)
+    processor = load_processor("PutVastDB")
+    invalid = []
+    monkeypatch.setattr(sys.modules["row_isolation"].InvalidRows, "add", lambda _, rows: invalid.append(rows))
+    context = ProcessContext(
+        processor,
+        {**target(table_name), "Data Type": "Json Line Delimited", "Invalid Rows": "Route to Invalid"},
+    )
+    with cluster.patched(), pytest.raises(errors.ServiceUnavailable):
+        processor.transform(context, FlowFile(json_lines([{"x": x} for x in range(64)])))
+
+    # The rows aren't split up to find invalid ones
+    assert cluster.requests["insert"] == 1
+    assert invalid == []
+
+
+def test_routed_tables_have_their_own_sessions_and_batch_sizes(cluster, table_name, monkeypatch):
+    sessions = []
+    connect = cluster.connect
+
+    def counting_connect(*args, **kwargs):
+        sessions.append(connect(*args, **kwargs))
+        return sessions[-1]
+
+    monkeypatch.setattr(cluster, "connect", counting_connect)
+    processor = load_processor("PutVastDB")
+    context = ProcessContext(
+        processor,
+        {
+            **target(f"{table_name}_{{tenant}}"),
+            "Data Type": "Json Line Delimited",
+            "Batch Size": "1",
+            "Adaptive Batch Size": "False",
+        },
+    )
+    contents = json_lines([{"tenant": tenant, "x": x} for x in range(3) for tenant in "abc"])
+    with cluster.patched():
+        result = processor.transform(context, FlowFile(contents))
+
+    assert result.getRelationship() == "success"
+    for tenant in "abc":
+        assert cluster.table_data(BUCKET, SCHEMA, f"{table_name}_{tenant}")["x"].to_pylist() == [0, 1, 2]
+        assert processor.batch_sizer(context, "insert", f"{table_name}_{tenant}").metrics()["requests"] == 3
+    # The first table is written with the FlowFile's session
+    assert len(sessions) == 3
+
+
+def test_rows_are_sorted_by_the_sort_key_columns(cluster, table_name):
+    contents = json_lines([{"t": 3, "x": "c"}, {"t": None, "x": "n"}, {"t": 1, "x": "a"}, {"t": 2, "x": "b"}])
+    put(table_name, contents, **{"Sort Key Columns": "t, missing"})
+
+    # The missing sort key column is ignored, nulls come last
+    assert cluster.table_data(BUCKET, SCHEMA, table_name)["x"].to_pylist() == ["a", "b", "c", "n"]
+
+
+def test_sorted_projection_of_new_tables(cluster, table_name):
+    properties = {"Sort Key Columns": "missing, t", "Sorted Projection": "True"}
+    put(table_name, json_lines([{"t": 1, "x": "a"}]), json_lines([{"t": 2, "x": "b"}]), **properties)
+
+    # Created once with the table, without the sort key columns the table lacks
+    assert cluster.tables[BUCKET, SCHEMA, table_name].projections == {"sorted_by_t": (["t"], ["x"])}
+    assert cluster.requests["create_projection"] == 1
+
+
+def test_sorted_projection_is_optional(cluster, table_name):
+    put(table_name, json_lines([{"t": 1, "x": "a"}]), **{"Sort Key Columns": "t"})
+    assert cluster.tables[BUCKET, SCHEMA, table_name].projections == {}
+
+
+def test_sorted_projection_isnt_created_for_existing_tables(cluster, table_name):
+    cluster.create_table(BUCKET, SCHEMA, table_name, pa.table({"t": [0], "x": ["z"]}))
+    put(table_name, json_lines([{"t": 1, "x": "a"}]), **{"Sort Key Columns": "t", "Sorted Projection": "True"})
+    assert cluster.tables[BUCKET, SCHEMA, table_name].projections == {}
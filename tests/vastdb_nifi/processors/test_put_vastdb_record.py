@@ -0,0 +1,40 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import json
+import sys
+
+from benchmarks.nifi import ProcessContext, load_processor
+from tests.vastdb_nifi.processors.processor_harness import BUCKET, SCHEMA, target
+from tests.vastdb_nifi.processors.test_record_schema import DataType, RecordField, RecordSchema
+
+RECORD_SCHEMA = RecordSchema(RecordField("id", DataType("LONG")), RecordField("name", DataType("STRING")))
+RECORDS = [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}, {"id": 3, "name": None}]
+
+
+def put_records(table_name, records):
+    processor = load_processor("PutVastDBRecord")
+    processor.setContext(ProcessContext(processor, {**target(table_name), "Adaptive Batch Size": "False"}))
+    return processor.transformRecord(json.dumps(records), RECORD_SCHEMA, {})
+
+
+def test_records_are_inserted_in_one_batch(cluster, table_name):
+    results = put_records(table_name, RECORDS)
+
+    assert cluster.requests["insert"] == 1
+    assert cluster.table_data(BUCKET, SCHEMA, table_name).to_pylist() == RECORDS
+    # The records are passed on unchanged, the way NiFi 2.0.0's RecordTransform returns them to the JVM
+    assert [json.loads(result.getRecordJson()) for result in results] == RECORDS
+    assert {result.getRelationship() for result in results} == {"success"}
+    assert {result.getSchema() for result in results} == {RECORD_SCHEMA}
+
+
+def test_records_are_inserted_one_at_a_time_without_the_batch_api(cluster, table_name, monkeypatch):
+    load_processor("PutVastDBRecord")
+    monkeypatch.setattr(sys.modules["PutVastDBRecord"], "__RecordTransformResult__", None)
+    results = put_records(table_name, RECORDS)
+
+    assert cluster.requests["insert"] == len(RECORDS)
+    assert cluster.table_data(BUCKET, SCHEMA, table_name).to_pylist() == RECORDS
+    assert [json.loads(result.getRecordJson()) for result in results] == RECORDS
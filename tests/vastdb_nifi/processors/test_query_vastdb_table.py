@@ -0,0 +1,96 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import json
+
+import pyarrow as pa
+import pytest
+
+from benchmarks.nifi import FlowFile, ProcessContext, load_processor
+from tests.vastdb_nifi.processors.processor_harness import BUCKET, SCHEMA, target
+
+
+def query_context(table_name, **properties):
+    processor = load_processor("QueryVastDBTable")
+    # Every column and every row, unless the test narrows them
+    return processor, ProcessContext(processor, {**target(table_name), "Columns": "", "Predicates": "[]", **properties})
+
+
+def query(processor, context):
+    result = processor.transform(context, FlowFile())
+    return json.loads(result.getContents()), result.getAttributes()
+
+
+def test_watermark_returns_only_new_rows(cluster, table_name):
+    data = cluster.create_table(BUCKET, SCHEMA, table_name, pa.table({"seq": [1, 2, 3], "x": ["a", "b", "c"]}))
+    processor, context = query_context(table_name, **{"Watermark Column": "seq", "Columns": "x"})
+
+    rows, attributes = query(processor, context)
+    assert rows == [{"x": "a"}, {"x": "b"}, {"x": "c"}]
+    assert attributes["vastdb.watermark"] == "3"
+
+    # No new rows leave the watermark where it was
+    rows, attributes = query(processor, context)
+    assert rows == []
+    assert "vastdb.watermark" not in attributes
+
+    for batch in pa.table({"seq": [4, 5], "x": ["d", "e"]}).to_batches():
+        data.insert(batch)
+    rows, attributes = query(processor, context)
+    assert rows == [{"x": "d"}, {"x": "e"}]
+    assert attributes["vastdb.watermark"] == "5"
+
+
+def test_changing_the_watermark_column_restarts(cluster, table_name):
+    cluster.create_table(BUCKET, SCHEMA, table_name, pa.table({"seq": [1, 2], "other": [2, 1]}))
+    processor, context = query_context(table_name, **{"Watermark Column": "seq"})
+    assert len(query(processor, context)[0]) == 2
+
+    context.properties["Watermark Column"] = "other"
+    rows, attributes = query(processor, context)
+    assert rows == [{"seq": 1, "other": 2}, {"seq": 2, "other": 1}]
+    assert attributes["vastdb.watermark"] == "2"
+
+
+def test_max_rows(cluster, table_name):
+    cluster.create_table(BUCKET, SCHEMA, table_name, pa.table({"x": list(range(100))}))
+    processor, context = query_context(table_name, **{"Max Rows": "10"})
+    assert len(query(processor, context)[0]) == 10
+
+    for mode, expected in (("Count", [{"count": 10}]), ("Exists", [{"exists": True}])):
+        context.properties["Query Mode"] = mode
+        assert query(processor, context)[0] == expected
+
+
+def test_count_without_max_rows(cluster, table_name):
+    cluster.create_table(BUCKET, SCHEMA, table_name, pa.table({"x": list(range(100))}))
+    processor, context = query_context(
+        table_name, **{"Query Mode": "Count", "Predicates": "{column: x, op: '<', value: 30}"}
+    )
+    assert query(processor, context)[0] == [{"count": 30}]
+
+
+def test_max_rows_with_a_watermark_is_invalid(cluster, table_name):
+    cluster.create_table(BUCKET, SCHEMA, table_name, pa.table({"seq": [1, 2, 3]}))
+    processor, context = query_context(table_name, **{"Watermark Column": "seq", "Max Rows": "2"})
+
+    (result,) = processor.customValidate(context)
+    assert not result.valid
+    assert result.subject == "Max Rows"
+    with pytest.raises(ValueError, match="Max Rows can't be used"):
+        processor.transform(context, FlowFile())
+    # The watermark wasn't advanced
+    assert context.getStateManager().getState(None).toMap() == {}
+
+    # Counting doesn't use the watermark
+    context.properties["Query Mode"] = "Count"
+    assert processor.customValidate(context) == []
+
+
+def test_limit_pushdown(table_name):
+    processor, context = query_context(table_name, **{"Max Rows": "10"})
+    assert processor.get_query_config(context, 10).limit_rows_per_sub_split == 10
+
+    context.properties["Limit Pushdown"] = "False"
+    assert processor.get_query_config(context, 10).limit_rows_per_sub_split > 10
@@ -0,0 +1,141 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+# ruff: noqa: N802
+import datetime
+import json
+from decimal import Decimal
+
+import pyarrow as pa
+import pytest
+
+from vastdb_nifi.processors.record_schema import arrow_type, get_arrow_schema, records_to_table, table_to_records
+
+
+class FieldType:
+    def __init__(self, name):
+        self._name = name
+
+    def name(self):
+        return self._name
+
+
+class DataType:
+    """Stands in for NiFi's DataType and its Decimal, Array, Record and Map subclasses."""
+
+    def __init__(self, field_type, **details):
+        self.field_type = FieldType(field_type)
+        self.details = details
+
+    def getFieldType(self):
+        return self.field_type
+
+    def getPrecision(self):
+        return self.details["precision"]
+
+    def getScale(self):
+        return self.details["scale"]
+
+    def getElementType(self):
+        return self.details["element"]
+
+    def getChildSchema(self):
+        return self.details["schema"]
+
+    def getValueType(self):
+        return self.details["value"]
+
+
+class RecordField:
+    def __init__(self, name, data_type, *, nullable=True):
+        self.name = name
+        self.data_type = data_type
+        self.nullable = nullable
+
+    def getFieldName(self):
+        return self.name
+
+    def getDataType(self):
+        return self.data_type
+
+    def isNullable(self):
+        return self.nullable
+
+
+class RecordSchema:
+    def __init__(self, *fields):
+        self.fields = fields
+        self.calls = 0
+
+    def getFields(self):
+        self.calls += 1
+        return self.fields
+
+    def toString(self):
+        return repr([(field.name, field.data_type.field_type.name(), field.nullable) for field in self.fields])
+
+
+def test_arrow_type():
+    assert arrow_type(DataType("LONG")) == pa.int64()
+    assert arrow_type(DataType("DECIMAL", precision=12, scale=3)) == pa.decimal128(12, 3)
+    assert arrow_type(DataType("ARRAY", element=DataType("BYTE"))) == pa.binary()
+    assert arrow_type(DataType("ARRAY", element=DataType("STRING"))) == pa.list_(pa.string())
+    assert arrow_type(DataType("MAP", value=DataType("DOUBLE"))) == pa.map_(pa.string(), pa.float64())
+    child = RecordSchema(RecordField("x", DataType("INT"), nullable=False))
+    assert arrow_type(DataType("RECORD", schema=child)) == pa.struct([pa.field("x", pa.int32(), nullable=False)])
+    with pytest.raises(ValueError, match="Unsupported"):
+        arrow_type(DataType("UNKNOWN"))
+
+
+def test_get_arrow_schema_is_cached():
+    record_schema = RecordSchema(
+        RecordField("id", DataType("LONG"), nullable=False), RecordField("t", DataType("TIMESTAMP"))
+    )
+    arrow_schema = get_arrow_schema(record_schema)
+    assert arrow_schema == pa.schema([pa.field("id", pa.int64(), nullable=False), ("t", pa.timestamp("ms"))])
+    assert get_arrow_schema(record_schema) is arrow_schema
+    assert record_schema.calls == 1
+
+
+def test_records_to_table():
+    arrow_schema = pa.schema([("id", pa.int64()), ("price", pa.decimal128(10, 2)), ("missing", pa.string())])
+    assert records_to_table([{"id": 1, "price": Decimal("1.50")}], arrow_schema).to_pylist() == [
+        {"id": 1, "price": Decimal("1.50"), "missing": None}
+    ]
+
+
+def test_records_to_table_casts_nifi_values():
+    arrow_schema = pa.schema([
+        ("t", pa.timestamp("ms")),
+        ("ms", pa.timestamp("ms")),
+        ("d", pa.date32()),
+        ("b", pa.binary()),
+        ("x", pa.decimal128(10, 2)),
+    ])
+    records = [
+        {"t": "2024-01-02 03:04:05", "ms": 1700000000000, "d": "2024-01-02", "b": [1, 2], "x": 1.5},
+        {"t": None, "ms": None, "d": None, "b": None, "x": None},
+    ]
+    pa_table = records_to_table(records, arrow_schema)
+    assert pa_table.schema == arrow_schema
+    assert pa_table.to_pylist()[0] == {
+        "t": datetime.datetime(2024, 1, 2, 3, 4, 5),  # noqa: DTZ001
+        "ms": datetime.datetime(2023, 11, 14, 22, 13, 20),  # noqa: DTZ001
+        "d": datetime.date(2024, 1, 2),
+        "b": b"\x01\x02",
+        "x": Decimal("1.50"),
+    }
+
+
+def test_table_to_records():
+    pa_table = pa.table({
+        "id": [1, None],
+        "t": pa.array([datetime.datetime(2024, 1, 2, 3, 4, 5), None], pa.timestamp("ms")),  # noqa: DTZ001
+        "b": [b"\x01", None],
+    })
+    assert [json.loads(record) for record in table_to_records(pa_table)] == [
+        {"id": 1, "t": "2024-01-02 03:04:05.000", "b": [1]},
+        {"id": None, "t": None, "b": None},
+    ]
+    assert table_to_records(pa_table.slice(0, 0)) == []
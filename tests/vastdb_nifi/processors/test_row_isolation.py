@@ -0,0 +1,85 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import json
+
+import pyarrow as pa
+import pytest
+
+from vastdb_nifi.processors.json_schema import parse_json
+from vastdb_nifi.processors.row_isolation import InvalidRows, parse_isolating, write_isolating
+
+
+class FakeTable:
+    """Rejects the requests with a negative value, like VastDB rejecting an invalid value."""
+
+    def __init__(self):
+        self.requests = 0
+        self.inserted = []
+
+    def insert(self, rows):
+        self.requests += 1
+        if any(value < 0 for value in rows["value"].to_pylist()):
+            error_message = "invalid value"
+            raise ValueError(error_message)
+        self.inserted.extend(rows["id"].to_pylist())
+
+
+def test_write_isolating_finds_invalid_rows():
+    values = list(range(1024))
+    values[100] = values[700] = -1
+    table = FakeTable()
+    invalid_rows = InvalidRows(max_rows=10)
+    write_isolating(pa.table({"id": range(1024), "value": values}), table.insert, invalid_rows)
+
+    assert table.inserted == [i for i in range(1024) if i not in {100, 700}]
+    # Each invalid row costs about 2 log2(n) requests rather than n
+    assert table.requests <= 1 + 2 * 2 * 10
+    assert json.loads(invalid_rows.to_json().splitlines()[0]) == {
+        "id": 100,
+        "value": -1,
+        "vastdb.error": "invalid value",
+    }
+
+
+def test_write_isolating_raises_other_errors():
+    def write_batch(_rows):
+        error_message = "timed out"
+        raise TimeoutError(error_message)
+
+    with pytest.raises(TimeoutError):
+        write_isolating(
+            pa.table({"value": [1, 2]}),
+            write_batch,
+            InvalidRows(max_rows=10),
+            isolate=lambda error: not isinstance(error, TimeoutError),
+        )
+
+
+def test_write_isolating_limits_request_size():
+    requests = []
+    pa_table = pa.table({"value": range(1000)})
+    write_isolating(pa_table, requests.append, InvalidRows(max_rows=10), max_request_bytes=pa_table.nbytes // 4)
+    assert [rows.num_rows for rows in requests] == [250] * 4
+
+
+def test_too_many_invalid_rows():
+    table = FakeTable()
+    with pytest.raises(ValueError, match="More than 2 invalid rows"):
+        write_isolating(pa.table({"id": range(4), "value": [-1] * 4}), table.insert, InvalidRows(max_rows=2))
+
+
+def test_parse_isolating_diverts_malformed_lines():
+    lines = [json.dumps({"id": i}) for i in range(100)]
+    lines[10] = '{"id": 10,'
+    lines[99] = "not json"
+    invalid_rows = InvalidRows(max_rows=10)
+    content = "\n".join(lines).encode("utf-8") + b"\n"
+    tables = list(parse_isolating(pa.py_buffer(content), parse_json, invalid_rows))
+
+    assert pa.concat_tables(tables)["id"].to_pylist() == [i for i in range(99) if i != 10]
+    assert [json.loads(line)["vastdb.line"] for line in invalid_rows.to_json().splitlines()] == [
+        '{"id": 10,',
+        "not json",
+    ]
@@ -0,0 +1,57 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import datetime
+
+import pyarrow as pa
+import pytest
+
+from vastdb_nifi.processors.table_routing import TableNameTemplate
+
+
+def events():
+    return pa.table({
+        "id": range(6),
+        "tenant": ["a", "b", None, "a", "b", "a"],
+        "day": [datetime.date(2024, 1, 1 + i % 2) for i in range(6)],
+    })
+
+
+def test_template_without_placeholders():
+    template = TableNameTemplate("events")
+    assert template.columns == []
+    ((name, rows),) = template.split(events())
+    assert name == "events"
+    assert rows.num_rows == 6
+
+
+def test_split_by_column():
+    template = TableNameTemplate("events_{tenant}")
+    assert template.columns == ["tenant"]
+    tables = {name: rows["id"].to_pylist() for name, rows in template.split(events())}
+    assert tables == {"events_a": [0, 3, 5], "events_b": [1, 4], "events_null": [2]}
+
+
+def test_split_by_formatted_date():
+    template = TableNameTemplate("events_{tenant}_{day:%Y%m%d}")
+    assert template.columns == ["tenant", "day"]
+    tables = {name: rows["id"].to_pylist() for name, rows in template.split(events())}
+    assert tables == {
+        "events_a_20240101": [0],
+        "events_b_20240102": [1],
+        "events_null_20240101": [2],
+        "events_a_20240102": [3, 5],
+        "events_b_20240101": [4],
+    }
+
+
+def test_split_chunked_table():
+    table = pa.concat_tables([events(), events()])
+    tables = {name: rows.num_rows for name, rows in TableNameTemplate("events_{tenant}").split(table)}
+    assert tables == {"events_a": 6, "events_b": 4, "events_null": 2}
+
+
+def test_split_missing_column():
+    with pytest.raises(ValueError, match="'region'"):
+        list(TableNameTemplate("events_{region}").split(events()))
@@ -0,0 +1,41 @@
+# SPDX-FileCopyrightText: 2024-present VASTDATA <www.vastdata.com>
+#
+# SPDX-License-Identifier: MIT
+
+import gzip
+import sys
+
+import pyarrow as pa
+import pytest
+
+from benchmarks.nifi import load_processor
+from tests.vastdb_nifi.processors.processor_harness import BUCKET, SCHEMA, json_lines, run_processor, target
+
+UPDATES = json_lines([{"$row_id": 0, "v": 10}, {"$row_id": 2, "v": 30}])
+
+
+def update(table_name, content, **properties):
+    return run_processor("UpdateVastDB", {**target(table_name), "Data Type": "Json", **properties}, content)
+
+
+@pytest.fixture
+def rows(cluster, table_name):
+    cluster.create_table(BUCKET, SCHEMA, table_name, pa.table({"v": [1, 2, 3], "w": ["a", "b", "c"]}))
+    return lambda: cluster.table_data(BUCKET, SCHEMA, table_name).to_pylist()
+
+
+def test_compressed_json_is_parsed_as_a_stream(rows, table_name, monkeypatch):
+    load_processor("UpdateVastDB")
+    monkeypatch.setattr(sys.modules["UpdateVastDB"], "decompress", lambda *_: pytest.fail("decompressed in memory"))
+
+    (result,) = update(table_name, gzip.compress(UPDATES))
+
+    assert result.getRelationship() == "success"
+    assert rows() == [{"v": 10, "w": "a"}, {"v": 2, "w": "b"}, {"v": 30, "w": "c"}]
+
+
+def test_compressed_json_with_the_table_schema_updates_only_its_fields(rows, table_name):
+    (result,) = update(table_name, gzip.compress(UPDATES), **{"Json Schema": "Table Schema"})
+
+    assert result.getRelationship() == "success"
+    assert rows() == [{"v": 10, "w": "a"}, {"v": 2, "w": "b"}, {"v": 30, "w": "c"}]